@@ -0,0 +1,303 @@
+"""
+Pool compartilhado de conexões HTTP para as chamadas aos providers de IA.
+
+OpenAIProvider/AnthropicProvider/GeminiProvider/LocalLLMProvider
+(ai_providers), ClienteAPIMultimodal._enviar_* (anexos) e ChatClient._chat_*
+(chat_service) abriam um ``httpx.AsyncClient`` por chamada: cada etapa de
+cada aluno pagava DNS + TCP + TLS de novo para o mesmo host. Agora elas usam
+o cliente compartilhado do host:
+
+    async with ai_http.cliente(timeout=120.0) as client:
+        response = await client.post(url, headers=..., json=...)
+
+``cliente()`` devolve um proxy: cada requisição vai para o
+``httpx.AsyncClient`` do host da URL (keep-alive; HTTP/2 quando o pacote
+``h2`` está instalado, então chamadas concorrentes ao mesmo provider
+multiplexam na mesma conexão TLS) e o ``async with`` não fecha nada. O
+timeout do proxy só é repassado à requisição quando difere do padrão do pool.
+
+Clientes httpx ficam presos ao event loop em que abriram conexões, então o
+pool é por (loop, host):
+
+    API          o loop do uvicorn; o lifespan fecha os clientes no shutdown
+    pipelines    cada execução roda em ``asyncio.run`` numa thread/worker;
+                 ``ai_http.run`` fecha os clientes daquele loop no fim
+
+Métricas por host em ``stats()`` (GET /api/debug/ai-http): requisições,
+conexões TCP abertas, handshakes TLS, requisições por conexão, latência e
+versão HTTP negociada.
+
+Configuração (env):
+    AI_HTTP2=1
+    AI_POOL_MAX_CONNECTIONS=50          por host e por loop
+    AI_POOL_MAX_KEEPALIVE=20
+    AI_POOL_KEEPALIVE_EXPIRY_S=90       (> intervalo típico entre etapas de um aluno)
+    AI_HTTP_TIMEOUT_S=180
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+import weakref
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+try:
+    import h2  # noqa: F401 — httpx só fala HTTP/2 com o pacote h2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+logger = logging.getLogger("ai_http")
+
+_HTTP2_ENABLED = os.environ.get("AI_HTTP2", "1").lower() in ("1", "true", "yes")
+_MAX_CONNECTIONS = int(os.environ.get("AI_POOL_MAX_CONNECTIONS", "50"))
+_MAX_KEEPALIVE = int(os.environ.get("AI_POOL_MAX_KEEPALIVE", "20"))
+_KEEPALIVE_EXPIRY_S = float(os.environ.get("AI_POOL_KEEPALIVE_EXPIRY_S", "90"))
+_TIMEOUT_S = float(os.environ.get("AI_HTTP_TIMEOUT_S", "180"))
+
+
+# ============================================================
+# MÉTRICAS POR HOST
+# ============================================================
+
+class _MetricasHost:
+    def __init__(self):
+        self.requisicoes = 0
+        self.erros = 0
+        self.conexoes_tcp = 0
+        self.handshakes_tls = 0
+        self.latencia_total_s = 0.0
+        self.latencia_max_s = 0.0
+        self.versoes: Dict[str, int] = {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        concluidas = self.requisicoes - self.erros
+        return {
+            "requisicoes": self.requisicoes,
+            "erros": self.erros,
+            "conexoes_tcp": self.conexoes_tcp,
+            "handshakes_tls": self.handshakes_tls,
+            "requisicoes_por_conexao": round(self.requisicoes / self.conexoes_tcp, 2) if self.conexoes_tcp else None,
+            "latencia_media_ms": round(self.latencia_total_s / concluidas * 1000, 1) if concluidas else None,
+            "latencia_max_ms": round(self.latencia_max_s * 1000, 1),
+            "http_versions": dict(self.versoes),
+        }
+
+
+_lock = threading.Lock()
+_metricas: Dict[str, _MetricasHost] = {}
+
+
+def _metricas_de(host: str) -> _MetricasHost:
+    # Chamar com _lock
+    metricas = _metricas.get(host)
+    if metricas is None:
+        metricas = _metricas[host] = _MetricasHost()
+    return metricas
+
+
+def _trace_para(host: str):
+    async def trace(evento: str, info: Dict[str, Any]) -> None:
+        # Eventos do httpcore: só o "complete" conta (a conexão realmente abriu)
+        if evento == "connection.connect_tcp.complete":
+            with _lock:
+                _metricas_de(host).conexoes_tcp += 1
+        elif evento == "connection.start_tls.complete":
+            with _lock:
+                _metricas_de(host).handshakes_tls += 1
+    return trace
+
+
+async def _instrumentar(request: httpx.Request) -> None:
+    request.extensions["trace"] = _trace_para(request.url.host)
+
+
+# ============================================================
+# CLIENTES POR (LOOP, HOST)
+# ============================================================
+
+# loop -> {(fábrica, origem): (cliente bruto, cliente em uso)}. A fábrica entra
+# na chave para que um ``httpx.AsyncClient`` substituído (testes) não reaproveite
+# um cliente criado antes.
+_clientes: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[Any, str], Tuple[Any, Any]]]" = (
+    weakref.WeakKeyDictionary()
+)
+_locks_loop: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = weakref.WeakKeyDictionary()
+_criados = 0
+_fechados = 0
+
+
+def _novo_cliente():
+    return httpx.AsyncClient(
+        http2=_HTTP2_ENABLED and HTTP2_AVAILABLE,
+        timeout=_TIMEOUT_S,
+        limits=httpx.Limits(
+            max_connections=_MAX_CONNECTIONS,
+            max_keepalive_connections=_MAX_KEEPALIVE,
+            keepalive_expiry=_KEEPALIVE_EXPIRY_S,
+        ),
+        event_hooks={"request": [_instrumentar]},
+    )
+
+
+async def _cliente_para(url: str):
+    loop = asyncio.get_running_loop()
+    alvo = httpx.URL(url)
+    chave = (httpx.AsyncClient, f"{alvo.scheme}://{alvo.netloc.decode('ascii')}")
+    with _lock:
+        por_host = _clientes.setdefault(loop, {})
+        entrada = por_host.get(chave)
+        if entrada is not None:
+            return entrada[1]
+        lock_loop = _locks_loop.setdefault(loop, asyncio.Lock())
+
+    global _criados
+    async with lock_loop:
+        entrada = por_host.get(chave)
+        if entrada is None:
+            bruto = _novo_cliente()
+            entrada = (bruto, await bruto.__aenter__())
+            por_host[chave] = entrada
+            with _lock:
+                _criados += 1
+            logger.debug("[ai-http] cliente aberto para %s", chave[1])
+    return entrada[1]
+
+
+class ClientePool:
+    """Proxy com a interface de ``httpx.AsyncClient`` usada pelos providers.
+
+    Cada requisição usa o cliente compartilhado do host da URL; sair do
+    ``async with`` não fecha conexões.
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.timeout = timeout
+
+    async def __aenter__(self) -> "ClientePool":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        return None
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        return await self._enviar("request", url, (method, url), kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self._enviar("post", url, (url,), kwargs)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self._enviar("get", url, (url,), kwargs)
+
+    async def _enviar(self, metodo: str, url: str, args: tuple, kwargs: Dict[str, Any]) -> httpx.Response:
+        if self.timeout is not None and self.timeout != _TIMEOUT_S:
+            kwargs.setdefault("timeout", self.timeout)
+        client = await _cliente_para(url)
+        host = httpx.URL(url).host
+        inicio = time.perf_counter()
+        try:
+            response = await getattr(client, metodo)(*args, **kwargs)
+        except BaseException:
+            with _lock:
+                metricas = _metricas_de(host)
+                metricas.requisicoes += 1
+                metricas.erros += 1
+            raise
+        decorrido = time.perf_counter() - inicio
+        versao = getattr(response, "http_version", None)
+        with _lock:
+            metricas = _metricas_de(host)
+            metricas.requisicoes += 1
+            metricas.latencia_total_s += decorrido
+            metricas.latencia_max_s = max(metricas.latencia_max_s, decorrido)
+            if isinstance(versao, str):
+                metricas.versoes[versao] = metricas.versoes.get(versao, 0) + 1
+        return response
+
+
+def cliente(timeout: Optional[float] = None) -> ClientePool:
+    """Cliente HTTP para chamadas de IA (substitui ``httpx.AsyncClient(timeout=...)``)."""
+    return ClientePool(timeout)
+
+
+# ============================================================
+# CICLO DE VIDA
+# ============================================================
+
+def startup() -> None:
+    """Chamado pelo lifespan da API: registra a configuração do pool."""
+    logger.info(
+        "[ai-http] pool por host: http2=%s max_connections=%s keepalive=%s/%ss",
+        _HTTP2_ENABLED and HTTP2_AVAILABLE, _MAX_CONNECTIONS, _MAX_KEEPALIVE, _KEEPALIVE_EXPIRY_S,
+    )
+
+
+async def aclose() -> int:
+    """Fecha os clientes do loop corrente; devolve quantos foram fechados."""
+    global _fechados
+    loop = asyncio.get_running_loop()
+    with _lock:
+        por_host = _clientes.pop(loop, {})
+        _locks_loop.pop(loop, None)
+    for bruto, _ in por_host.values():
+        try:
+            await bruto.__aexit__(None, None, None)
+        except Exception as exc:
+            logger.warning("[ai-http] falha ao fechar cliente: %s", exc)
+    with _lock:
+        _fechados += len(por_host)
+    return len(por_host)
+
+
+def run(coro):
+    """``asyncio.run`` que fecha os clientes de IA do loop ao terminar."""
+    async def _rodar():
+        try:
+            return await coro
+        finally:
+            await aclose()
+    return asyncio.run(_rodar())
+
+
+def _conexoes_abertas(client) -> Optional[int]:
+    # httpx não expõe o pool do httpcore publicamente
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    conexoes = getattr(pool, "connections", None)
+    return len(conexoes) if isinstance(conexoes, list) else None
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        hosts = {host: metricas.to_dict() for host, metricas in _metricas.items()}
+        abertas: Dict[str, int] = {}
+        clientes_abertos = 0
+        for por_host in list(_clientes.values()):
+            for (_, origem), (bruto, _) in por_host.items():
+                clientes_abertos += 1
+                n = _conexoes_abertas(bruto)
+                if n is not None:
+                    abertas[origem] = abertas.get(origem, 0) + n
+        for origem, n in abertas.items():
+            host = httpx.URL(origem).host
+            if host in hosts:
+                hosts[host]["conexoes_abertas"] = n
+        return {
+            "http2": _HTTP2_ENABLED and HTTP2_AVAILABLE,
+            "max_connections": _MAX_CONNECTIONS,
+            "max_keepalive": _MAX_KEEPALIVE,
+            "keepalive_expiry_s": _KEEPALIVE_EXPIRY_S,
+            "clientes_abertos": clientes_abertos,
+            "clientes_criados": _criados,
+            "clientes_fechados": _fechados,
+            "hosts": hosts,
+        }
+
+
+def reset_stats() -> None:
+    with _lock:
+        _metricas.clear()
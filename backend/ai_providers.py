@@ -149,6 +149,7 @@ class OpenAIProvider(AIProvider):
                        max_tokens: int = 4096,
                        reasoning_effort: Optional[str] = None) -> AIResponse:
         import httpx
+        import ai_http
         import time
 
         start = time.time()
@@ -179,7 +180,7 @@ class OpenAIProvider(AIProvider):
             payload["max_tokens"] = max_tokens
 
         import asyncio
-        async with httpx.AsyncClient() as client:
+        async with ai_http.cliente() as client:
             max_retries = 3
             backoff = 1.0
             data = None
@@ -244,6 +245,7 @@ class OpenAIProvider(AIProvider):
                                file_path: str,
                                instruction: str) -> AIResponse:
         import httpx
+        import ai_http
         import base64
         import time
         
@@ -295,7 +297,7 @@ class OpenAIProvider(AIProvider):
         else:
             payload["max_tokens"] = 4096
 
-        async with httpx.AsyncClient() as client:
+        async with ai_http.cliente() as client:
             try:
                 response = await client.post(
                     f"{self.base_url}/chat/completions",
@@ -367,6 +369,7 @@ class AnthropicProvider(AIProvider):
                        tools: Optional[List[Dict[str, Any]]] = None,
                        tool_choice: Optional[Dict[str, Any]] = None) -> AIResponse:
         import httpx
+        import ai_http
         import time
 
         start = time.time()
@@ -384,7 +387,7 @@ class AnthropicProvider(AIProvider):
         if tool_choice:
             payload["tool_choice"] = tool_choice
 
-        async with httpx.AsyncClient() as client:
+        async with ai_http.cliente() as client:
             try:
                 response = await client.post(
                     f"{self.base_url}/messages",
@@ -427,6 +430,7 @@ class AnthropicProvider(AIProvider):
                                file_path: str,
                                instruction: str) -> AIResponse:
         import httpx
+        import ai_http
         import base64
         import time
         
@@ -476,7 +480,7 @@ class AnthropicProvider(AIProvider):
             text_content = await self._extract_text(file_path)
             content = [{"type": "text", "text": f"{instruction}\n\n---\n{text_content}"}]
         
-        async with httpx.AsyncClient() as client:
+        async with ai_http.cliente() as client:
             try:
                 response = await client.post(
                     f"{self.base_url}/messages",
@@ -540,6 +544,7 @@ class GeminiProvider(AIProvider):
                        max_tokens: int = 4096,
                        reasoning_effort: Optional[str] = None) -> AIResponse:
         import httpx
+        import ai_http
         import time
 
         start = time.time()
@@ -568,7 +573,7 @@ class GeminiProvider(AIProvider):
                 "parts": [{"text": system_prompt}]
             }
 
-        async with httpx.AsyncClient() as client:
+        async with ai_http.cliente() as client:
             try:
                 response = await client.post(
                     f"{self.base_url}/models/{self.model}:generateContent",
@@ -616,6 +621,7 @@ class GeminiProvider(AIProvider):
                                file_path: str,
                                instruction: str) -> AIResponse:
         import httpx
+        import ai_http
         import base64
         import time
 
@@ -678,7 +684,7 @@ class GeminiProvider(AIProvider):
             }
         }
 
-        async with httpx.AsyncClient() as client:
+        async with ai_http.cliente() as client:
             try:
                 response = await client.post(
                     f"{self.base_url}/models/{self.model}:generateContent",
@@ -748,7 +754,7 @@ class LocalLLMProvider(AIProvider):
                        temperature: float = 0.7,
                        max_tokens: int = 4096,
                        reasoning_effort: Optional[str] = None) -> AIResponse:
-        import httpx
+        import ai_http
         import time
         
         start = time.time()
@@ -757,7 +763,7 @@ class LocalLLMProvider(AIProvider):
         if system_prompt:
             full_prompt = f"{system_prompt}\n\n{prompt}"
         
-        async with httpx.AsyncClient() as client:
+        async with ai_http.cliente() as client:
             response = await client.post(
                 f"{self.base_url}/api/generate",
                 json={
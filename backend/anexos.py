@@ -21,8 +21,8 @@ from typing import List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass, field
 from datetime import datetime
 import json
-import httpx
 
+import ai_http
 from utils.retry import RetryConfig, retry_com_backoff
 
 logger = logging.getLogger(__name__)
@@ -864,7 +864,7 @@ class ClienteAPIMultimodal:
         if not is_reasoning and self.suporta_temperature and self.temperature is not None:
             params["temperature"] = self.temperature
 
-        async with httpx.AsyncClient(timeout=180.0) as client:
+        async with ai_http.cliente(timeout=180.0) as client:
             response = await client.post(
                 url,
                 headers={
@@ -987,7 +987,7 @@ class ClienteAPIMultimodal:
         if self.suporta_temperature and self.temperature is not None:
             params["temperature"] = self.temperature
 
-        async with httpx.AsyncClient(timeout=180.0) as client:
+        async with ai_http.cliente(timeout=180.0) as client:
             response = await client.post(
                 url,
                 headers={
@@ -1088,7 +1088,7 @@ class ClienteAPIMultimodal:
                 "parts": [{"text": system_prompt}]
             }
 
-        async with httpx.AsyncClient(timeout=180.0) as client:
+        async with ai_http.cliente(timeout=180.0) as client:
             response = await client.post(
                 url,
                 params={"key": self.api_key},
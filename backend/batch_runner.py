@@ -0,0 +1,129 @@
+"""
+Execução em lote com concorrência limitada.
+
+O pipeline por aluno é quase todo espera de I/O (chamadas ao LLM, storage),
+então rodar uma turma em sequência custa N vezes o tempo de um aluno. As
+entradas em lote (``/api/executar/lote``, pipeline-todos-os-alunos e o
+cascade de desempenho) passam por ``executar_em_lote``:
+
+    itens = await executar_em_lote(
+        alunos, lambda aluno: executor.executar_pipeline_completo(...),
+        chave=lambda aluno: aluno.id,
+        sucesso=pipeline_sucesso,
+        concorrencia=4,                 # None -> PARALLEL_WORKERS
+        politica=POLITICA_FALHA_RAPIDA,  # ou POLITICA_CONTINUAR (padrão)
+        task_id=task_id,                # progresso em task["batch"] (routes_tasks)
+    )
+
+Os resultados voltam na ordem de entrada, um ``ItemLote`` por item.
+
+Políticas:
+    continuar      falhas não interrompem o lote
+    falhar_rapido  a primeira falha impede novos itens de começar; os que já
+                   estão rodando terminam (cancelar no meio de uma etapa deixa
+                   documentos pela metade) e os restantes voltam "cancelled"
+
+Um ``cancel_requested`` na task também impede novos itens de começar.
+
+Env:
+    PARALLEL_WORKERS   concorrência padrão (default: 12)
+"""
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, List, Optional, Sequence
+
+logger = logging.getLogger("pipeline")
+
+POLITICA_CONTINUAR = "continuar"
+POLITICA_FALHA_RAPIDA = "falhar_rapido"
+POLITICAS_LOTE = (POLITICA_CONTINUAR, POLITICA_FALHA_RAPIDA)
+
+
+@dataclass
+class ItemLote:
+    """Resultado de um item do lote (status: completed, failed ou cancelled)."""
+    chave: str
+    status: str
+    resultado: Any = None
+    erro: Optional[BaseException] = None
+    duracao_ms: float = 0.0
+
+    @property
+    def sucesso(self) -> bool:
+        return self.status == "completed"
+
+
+def concorrencia_padrao() -> int:
+    return max(1, int(os.environ.get("PARALLEL_WORKERS", "12")))
+
+
+def pipeline_sucesso(resultados: Any) -> bool:
+    """Critério de sucesso de ``executar_pipeline_completo``: nenhuma etapa falhou."""
+    if not isinstance(resultados, dict):
+        return bool(resultados)
+    if "_pipeline_erro" in resultados:
+        return False
+    return all(getattr(r, "sucesso", True) for r in resultados.values())
+
+
+async def executar_em_lote(
+    itens: Sequence[Any],
+    executar: Callable[[Any], Awaitable[Any]],
+    *,
+    chave: Callable[[Any], str] = str,
+    sucesso: Callable[[Any], bool] = lambda resultado: True,
+    concorrencia: Optional[int] = None,
+    politica: str = POLITICA_CONTINUAR,
+    task_id: Optional[str] = None,
+) -> List[ItemLote]:
+    """Executa ``executar(item)`` para cada item com no máximo ``concorrencia`` ao mesmo tempo."""
+    from routes_tasks import is_cancel_requested, register_batch_progress, update_batch_item
+
+    if politica not in POLITICAS_LOTE:
+        raise ValueError(f"Política de lote inválida: {politica!r} (use {', '.join(POLITICAS_LOTE)})")
+    limite = max(1, concorrencia or concorrencia_padrao())
+    chaves = [chave(item) for item in itens]
+    if task_id:
+        register_batch_progress(task_id, chaves, limite, politica)
+
+    semaforo = asyncio.Semaphore(limite)
+    interrompido = False
+
+    def _deve_parar() -> bool:
+        if interrompido:
+            return True
+        return is_cancel_requested(task_id)
+
+    async def _rodar(item: Any, item_chave: str) -> ItemLote:
+        nonlocal interrompido
+        async with semaforo:
+            if _deve_parar():
+                if task_id:
+                    update_batch_item(task_id, item_chave, "cancelled")
+                return ItemLote(item_chave, "cancelled")
+
+            if task_id:
+                update_batch_item(task_id, item_chave, "running")
+            inicio = time.perf_counter()
+            try:
+                resultado = await executar(item)
+            except Exception as exc:
+                logger.exception(f"[lote] item {item_chave} falhou")
+                saida = ItemLote(item_chave, "failed", erro=exc)
+            else:
+                status = "completed" if sucesso(resultado) else "failed"
+                saida = ItemLote(item_chave, status, resultado=resultado)
+            saida.duracao_ms = round((time.perf_counter() - inicio) * 1000, 1)
+
+            if saida.status == "failed" and politica == POLITICA_FALHA_RAPIDA and not interrompido:
+                interrompido = True
+                logger.warning(f"[lote] falha rápida: {item_chave} falhou, novos itens não serão iniciados")
+            if task_id:
+                update_batch_item(task_id, item_chave, saida.status)
+            return saida
+
+    return list(await asyncio.gather(*[_rodar(item, c) for item, c in zip(itens, chaves)]))
@@ -0,0 +1,181 @@
+"""
+Armazenamento de arquivos endereçado por conteúdo (sha256).
+
+O mesmo gabarito enviado para várias atividades, atividades duplicadas e
+re-execuções que geram o mesmo JSON eram copiados (e enviados ao Supabase)
+de novo a cada ``salvar_documento``. Agora cada conteúdo distinto é guardado
+uma única vez em ``data/blobs/<ab>/<sha256>`` e o caminho legível do
+documento (``caminho_arquivo``) vira um hardlink para o blob:
+
+    arquivos/{materia}/{turma}/{atividade}/{aluno}/Correção - Ana_1a2b.json
+        └── mesmo inode de blobs/3f/3f9c...e1
+
+Materialização (``materialize``), na ordem:
+    1. hardlink (mesmo sistema de arquivos — custo zero de disco)
+    2. reflink/FICLONE (btrfs/xfs — cópia copy-on-write)
+    3. shutil.copy2 (qualquer outro caso; ex.: Windows em FAT, outro volume)
+
+Como o caminho do documento compartilha o inode do blob, nada pode reescrevê-lo
+no lugar (``open(caminho, "wb")`` corromperia todas as cópias): quem baixa ou
+regrava um caminho materializado grava num temporário no mesmo diretório e faz
+``os.replace`` (FileCache, ``supabase_storage.download``, ``fast_json.write_json``).
+
+Blobs não referenciados por nenhum documento são removidos por
+``StorageManager.coletar_blobs_orfaos`` (ver ``iter_blobs``/``remove``).
+
+Configuração (env):
+    STORAGE_BLOBS_ENABLED=1      (0 volta ao copy2 direto, sem hash)
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, Tuple, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+BLOBS_ENABLED = os.environ.get("STORAGE_BLOBS_ENABLED", "1").lower() in ("1", "true", "yes")
+
+_CHUNK_SIZE = 1024 * 1024
+# ioctl(dest_fd, FICLONE, src_fd) — linux/fs.h
+_FICLONE = 0x40049409
+
+
+def sha256_file(path: Union[str, Path]) -> str:
+    """sha256 hex do conteúdo do arquivo (lido em blocos de 1 MiB)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BlobStore:
+    """Diretório de blobs imutáveis, um arquivo por sha256."""
+
+    def __init__(self, root: Union[str, Path]):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {
+            "puts": 0,
+            "dedup_hits": 0,
+            "bytes_deduplicated": 0,
+            "hardlinks": 0,
+            "reflinks": 0,
+            "copies": 0,
+        }
+
+    def path_for(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+
+    def exists(self, digest: str) -> bool:
+        return self.path_for(digest).exists()
+
+    def put(self, source: Union[str, Path]) -> Tuple[str, Path, bool]:
+        """
+        Guarda o conteúdo de ``source`` (se ainda não existir).
+
+        Returns:
+            (sha256, caminho do blob, True se o blob foi criado agora)
+        """
+        digest = sha256_file(source)
+        blob = self.path_for(digest)
+        self._count("puts")
+        if blob.exists():
+            self._count("dedup_hits")
+            self._count("bytes_deduplicated", blob.stat().st_size)
+            return digest, blob, False
+
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        # Escreve num temporário do mesmo diretório e renomeia: um leitor
+        # concorrente nunca vê blob pela metade
+        fd, tmp_name = tempfile.mkstemp(dir=str(blob.parent), prefix=".tmp-")
+        os.close(fd)
+        try:
+            shutil.copy2(source, tmp_name)
+            os.replace(tmp_name, blob)
+        except BaseException:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+            raise
+        return digest, blob, True
+
+    def materialize(self, digest: str, destino: Union[str, Path]) -> str:
+        """
+        Cria ``destino`` com o conteúdo do blob.
+
+        Returns:
+            "hardlink", "reflink" ou "copy"
+        """
+        blob = self.path_for(digest)
+        destino = Path(destino)
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        if destino.exists():
+            destino.unlink()
+
+        try:
+            os.link(blob, destino)
+            self._count("hardlinks")
+            return "hardlink"
+        except OSError:
+            pass
+
+        if fcntl is not None:
+            try:
+                with open(blob, "rb") as src, open(destino, "wb") as dst:
+                    fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+                shutil.copystat(blob, destino)
+                self._count("reflinks")
+                return "reflink"
+            except OSError:
+                if destino.exists():
+                    destino.unlink()
+
+        shutil.copy2(blob, destino)
+        self._count("copies")
+        return "copy"
+
+    def iter_blobs(self) -> Iterator[Tuple[str, Path]]:
+        """(sha256, caminho) de cada blob no disco."""
+        for subdir in self.root.iterdir():
+            if not subdir.is_dir() or len(subdir.name) != 2:
+                continue
+            for blob in subdir.iterdir():
+                if blob.is_file() and not blob.name.startswith(".tmp-"):
+                    yield blob.name, blob
+
+    def remove(self, digest: str) -> int:
+        """Remove o blob; retorna os bytes liberados (0 se ainda havia hardlinks)."""
+        blob = self.path_for(digest)
+        try:
+            stat = blob.stat()
+        except FileNotFoundError:
+            return 0
+        blob.unlink()
+        # Com outros hardlinks vivos o inode continua ocupando espaço
+        return stat.st_size if stat.st_nlink <= 1 else 0
+
+    def age_seconds(self, digest: str) -> float:
+        """Tempo desde a última escrita/novo hardlink (copy2 preserva o mtime da origem)."""
+        try:
+            stat = self.path_for(digest).stat()
+        except FileNotFoundError:
+            return 0.0
+        return time.time() - max(stat.st_mtime, stat.st_ctime)
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._lock:
+            self._stats[key] += amount
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
@@ -20,6 +20,7 @@ import re
 import hashlib
 import httpx
 
+import ai_http
 from models import TipoDocumento
 from storage import storage
 from tools import ToolRegistry, ToolCall, ToolResult, ToolExecutionContext
@@ -905,10 +906,13 @@ class ChatClient:
         self.config = model_config
         self.api_key = api_key
         self.base_url = model_config.base_url or DEFAULT_URLS.get(model_config.tipo, "")
+        # Uso somado de todas as respostas recebidas por este cliente; permite
+        # registrar o custo parcial de um loop de tools interrompido no meio
+        self.uso_acumulado = self._usage_payload()
 
     async def _post_google_generate_content(
         self,
-        client: httpx.AsyncClient,
+        client: ai_http.ClientePool,
         request_body: Dict[str, Any],
         *,
         input_tokens_so_far: int = 0,
@@ -1131,6 +1135,13 @@ class ChatClient:
         except (TypeError, ValueError):
             return 0
 
+    def _contabilizar_uso(self, input_tokens: int, output_tokens: int, total_tokens: int) -> None:
+        self.uso_acumulado = self._usage_payload(
+            self.uso_acumulado["input_tokens"] + input_tokens,
+            self.uso_acumulado["output_tokens"] + output_tokens,
+            self.uso_acumulado["tokens"] + total_tokens,
+        )
+
     def _usage_payload(
         self,
         input_tokens: Any = 0,
@@ -1171,7 +1182,7 @@ class ChatClient:
         params = self._build_params()
         params["messages"] = messages
         
-        async with httpx.AsyncClient(timeout=120.0) as client:
+        async with ai_http.cliente(timeout=120.0) as client:
             response = await client.post(
                 f"{self.base_url}/chat/completions",
                 headers={
@@ -1231,7 +1242,7 @@ class ChatClient:
             if value is not None and key not in params:
                 params[key] = value
         
-        async with httpx.AsyncClient(timeout=120.0) as client:
+        async with ai_http.cliente(timeout=120.0) as client:
             response = await client.post(
                 f"{self.base_url}/messages",
                 headers={
@@ -1311,7 +1322,7 @@ class ChatClient:
             if self.config.suporta_temperature and self.config.temperature is not None:
                 params["temperature"] = self.config.temperature
 
-            async with httpx.AsyncClient(timeout=120.0) as client:
+            async with ai_http.cliente(timeout=120.0) as client:
                 response = await client.post(
                     f"{self.base_url}/messages",
                     headers={
@@ -1341,6 +1352,7 @@ class ChatClient:
             total_input_tokens += input_tokens
             total_output_tokens += output_tokens
             total_tokens += input_tokens + output_tokens
+            self._contabilizar_uso(input_tokens, output_tokens, input_tokens + output_tokens)
 
             stop_reason = data.get("stop_reason")
             content_blocks = data.get("content", [])
@@ -1547,7 +1559,7 @@ class ChatClient:
             if tool_choice is not None and iteration == 0:
                 params["tool_choice"] = tool_choice
 
-            async with httpx.AsyncClient(timeout=120.0) as client:
+            async with ai_http.cliente(timeout=120.0) as client:
                 response = await client.post(
                     f"{self.base_url}/chat/completions",
                     headers={
@@ -1577,6 +1589,7 @@ class ChatClient:
             total_input_tokens += input_tokens
             total_output_tokens += output_tokens
             total_tokens += request_total
+            self._contabilizar_uso(input_tokens, output_tokens, request_total)
 
             choice = data["choices"][0]
             finish_reason = choice.get("finish_reason")
@@ -1727,7 +1740,7 @@ class ChatClient:
                 tool_choice=tool_choice if iteration == 0 else None,
             )
 
-            async with httpx.AsyncClient(timeout=120.0) as client:
+            async with ai_http.cliente(timeout=120.0) as client:
                 response = await client.post(
                     f"{self.base_url}/responses",
                     headers={
@@ -1756,6 +1769,7 @@ class ChatClient:
             total_input_tokens += input_tokens
             total_output_tokens += output_tokens
             total_tokens += request_total
+            self._contabilizar_uso(input_tokens, output_tokens, request_total)
 
             output_items = data.get("output", []) or []
             function_calls = [item for item in output_items if item.get("type") == "function_call"]
@@ -1907,7 +1921,7 @@ class ChatClient:
             if system:
                 request_body["system_instruction"] = {"parts": [{"text": system}]}
 
-            async with httpx.AsyncClient(timeout=120.0) as client:
+            async with ai_http.cliente(timeout=120.0) as client:
                 response = await self._post_google_generate_content(
                     client,
                     request_body,
@@ -1926,6 +1940,7 @@ class ChatClient:
             total_input_tokens += input_tokens
             total_output_tokens += output_tokens
             total_tokens += request_total
+            self._contabilizar_uso(input_tokens, output_tokens, request_total)
 
             candidate = data.get("candidates", [{}])[0]
             parts = candidate.get("content", {}).get("parts", [])
@@ -2028,7 +2043,7 @@ class ChatClient:
                 "parts": [{"text": system}]
             }
 
-        async with httpx.AsyncClient(timeout=120.0) as client:
+        async with ai_http.cliente(timeout=120.0) as client:
             response = await self._post_google_generate_content(client, request_body)
 
             data = response.json()
@@ -2069,7 +2084,7 @@ class ChatClient:
             if value is not None:
                 options[key] = value
         
-        async with httpx.AsyncClient(timeout=300.0) as client:
+        async with ai_http.cliente(timeout=300.0) as client:
             response = await client.post(
                 f"{self.base_url}/api/chat",
                 headers={"Content-Type": "application/json"},
@@ -2115,7 +2130,7 @@ class ChatClient:
             headers["HTTP-Referer"] = "https://novocr.local"
             headers["X-Title"] = "NOVO CR"
         
-        async with httpx.AsyncClient(timeout=120.0) as client:
+        async with ai_http.cliente(timeout=120.0) as client:
             response = await client.post(
                 f"{self.base_url}/chat/completions",
                 headers=headers,
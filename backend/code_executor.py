@@ -213,6 +213,28 @@ class ExecutorInterface(ABC):
         """
         pass
 
+    async def _run_sandbox(self, func, *args) -> ExecutionResult:
+        """
+        Run the blocking sandbox call ``func(handle, *args)`` in a thread.
+
+        ``func`` stores the live sandbox in ``handle["sandbox"]``. If the
+        awaiting coroutine is cancelled (task cancel, see task_cancel.py) the
+        sandbox is torn down instead of running the code to completion.
+        """
+        handle: Dict[str, Any] = {}
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(None, func, handle, *args)
+        except asyncio.CancelledError:
+            sandbox = handle.get("sandbox")
+            if sandbox is not None:
+                logger.info("Execution cancelled, shutting down %s sandbox", type(self).__name__)
+                loop.run_in_executor(None, self._abort_sandbox, sandbox)
+            raise
+
+    def _abort_sandbox(self, sandbox: Any) -> None:
+        """Stop a running sandbox from another thread (best effort)."""
+
 
 # ============================================================
 # LOCAL DOCKER EXECUTOR
@@ -280,9 +302,7 @@ class LocalDockerExecutor(ExecutorInterface):
             execution_id = hashlib.md5(f"{time.time()}{code[:100]}".encode()).hexdigest()[:8]
 
             # Run in thread pool since llm-sandbox is synchronous
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                None,
+            result = await self._run_sandbox(
                 self._execute_sync,
                 code, libs, output_files, context_files, execution_id
             )
@@ -313,8 +333,16 @@ class LocalDockerExecutor(ExecutorInterface):
                 executor_mode="local"
             )
 
+    def _abort_sandbox(self, sandbox: Any) -> None:
+        """Remove the container; the blocked session.run() then fails in its thread"""
+        try:
+            sandbox.close()
+        except Exception as e:
+            logger.warning(f"Failed to stop Docker sandbox: {e}")
+
     def _execute_sync(
         self,
+        handle: Dict[str, Any],
         code: str,
         libraries: List[str],
         output_files: Optional[List[str]],
@@ -330,6 +358,7 @@ class LocalDockerExecutor(ExecutorInterface):
             keep_template=True,
             verbose=False
         ) as session:
+            handle["sandbox"] = session
 
             # Copy context files into sandbox
             if context_files:
@@ -482,9 +511,7 @@ class E2BExecutor(ExecutorInterface):
             libs = [l for l in libs if l in self.config.allowed_libraries]
 
             # Run in thread pool since e2b operations may be blocking
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                None,
+            result = await self._run_sandbox(
                 self._execute_sync,
                 code, libs, output_files, context_files
             )
@@ -501,8 +528,16 @@ class E2BExecutor(ExecutorInterface):
                 executor_mode="e2b"
             )
 
+    def _abort_sandbox(self, sandbox: Any) -> None:
+        """Kill the E2B sandbox so it stops running (and billing) right away"""
+        try:
+            sandbox.kill()
+        except Exception as e:
+            logger.warning(f"Failed to kill E2B sandbox: {e}")
+
     def _execute_sync(
         self,
+        handle: Dict[str, Any],
         code: str,
         libraries: List[str],
         output_files: Optional[List[str]],
@@ -513,6 +548,7 @@ class E2BExecutor(ExecutorInterface):
         from e2b_code_interpreter import Sandbox
 
         with Sandbox.create() as sandbox:
+            handle["sandbox"] = sandbox
             # Install required libraries using Jupyter magic command syntax
             if libraries:
                 pip_install = f"!pip install -q {' '.join(libraries)}"
@@ -13,7 +13,7 @@ import re
 from typing import Any, Dict, Iterable, Optional
 
 from model_catalog import model_catalog
-from models import Documento
+from models import Documento, DocumentoLeve
 from storage import storage
 from token_usage import TokenUsageRecord, token_usage_store
 
@@ -21,7 +21,7 @@ from token_usage import TokenUsageRecord, token_usage_store
 MAX_ERROR_SUMMARY_CHARS = 360
 
 
-def _metadata(doc: Documento) -> Dict[str, Any]:
+def _metadata(doc: Documento | DocumentoLeve) -> Dict[str, Any]:
     return doc.metadata if isinstance(doc.metadata, dict) else {}
 
 
@@ -88,7 +88,7 @@ def _error_public_fields(value: Any) -> Dict[str, Any]:
     }
 
 
-def _cost_for(doc: Documento, metadata: Dict[str, Any]) -> Dict[str, Any]:
+def _cost_for(doc: Documento | DocumentoLeve, metadata: Dict[str, Any]) -> Dict[str, Any]:
     input_tokens = _token_int(metadata.get("tokens_entrada"))
     output_tokens = _token_int(metadata.get("tokens_saida"))
     total_tokens = _token_int(metadata.get("tokens_total") or doc.tokens_usados)
@@ -266,11 +266,12 @@ def _blocked_reason(rows: list[Dict[str, Any]]) -> str:
 
 
 def build_cost_summary(
-    documentos: Optional[Iterable[Documento]] = None,
+    documentos: Optional[Iterable[Documento | DocumentoLeve]] = None,
     limit: int = 500,
     token_usage_records: Optional[Iterable[TokenUsageRecord]] = None,
 ) -> Dict[str, Any]:
-    docs = list(documentos if documentos is not None else storage.listar_todos_documentos(limit=limit))
+    # Só lê campos: a projeção leve evita hidratar um dataclass por linha
+    docs = list(documentos if documentos is not None else storage.listar_todos_documentos(limit=limit, leve=True))
     usage_records = list(
         token_usage_records
         if token_usage_records is not None
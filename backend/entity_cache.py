@@ -0,0 +1,128 @@
+"""
+Cache LRU+TTL para entidades de baixa rotatividade (matéria, turma, atividade, aluno).
+
+Cada ``executar_etapa`` faz get_atividade → get_turma → get_materia, o
+``salvar_documento`` repete as mesmas buscas para montar display names e
+``busca_global``/``dashboard_turma`` chamam get_materia dentro de loops. No
+Supabase cada uma dessas chamadas é um round-trip HTTPS.
+
+O cache guarda uma cópia da linha crua (dict) por (tabela, id) e devolve outra
+cópia a cada hit — quem altera o objeto retornado (ex.: metadata) não contamina
+o cache. Valores ausentes (None) não são cacheados.
+
+Invalidação (via eventos de storage_events.py, inclusive de outros processos):
+    - *.criada/*.atualizada invalidam a própria chave
+    - *.deletada limpam o cache inteiro (CASCADE remove filhos no banco)
+    - TTL limita a defasagem quando o banco muda sem passar pelo StorageManager
+
+Configuração (env):
+    STORAGE_ENTITY_CACHE_SIZE=2048      (0 desliga o cache)
+    STORAGE_ENTITY_CACHE_TTL_S=60
+"""
+
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+_DEFAULT_MAX_ENTRIES = int(os.environ.get("STORAGE_ENTITY_CACHE_SIZE", "2048"))
+_DEFAULT_TTL_S = float(os.environ.get("STORAGE_ENTITY_CACHE_TTL_S", "60"))
+
+
+class EntityCache:
+    """LRU limitado por número de entradas, com expiração por TTL."""
+
+    def __init__(self, max_entries: int = None, ttl_seconds: float = None):
+        self.max_entries = _DEFAULT_MAX_ENTRIES if max_entries is None else max_entries
+        self.ttl_seconds = _DEFAULT_TTL_S if ttl_seconds is None else ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits: Dict[str, int] = {}
+        self._misses: Dict[str, int] = {}
+        self._evictions = 0
+        self._invalidations = 0
+        self._generation = 0
+
+    @property
+    def generation(self) -> int:
+        """Muda a cada invalidação; ``put`` com geração antiga é descartado."""
+        return self._generation
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    def get(self, table: str, entity_id: str) -> Optional[Dict[str, Any]]:
+        """Retorna a linha cacheada ou None (conta hit/miss por tabela)."""
+        if not self.enabled:
+            return None
+        key = (table, entity_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._hits[table] = self._hits.get(table, 0) + 1
+                return copy.deepcopy(entry[1])
+            if entry is not None:
+                del self._entries[key]
+            self._misses[table] = self._misses.get(table, 0) + 1
+            return None
+
+    def put(self, table: str, entity_id: str, row: Dict[str, Any],
+            generation: int = None) -> None:
+        """Guarda a linha; ignora se houve invalidação desde ``generation``."""
+        if not self.enabled or not row:
+            return
+        key = (table, entity_id)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                # Leitura começou antes de um update/delete: pode estar velha
+                return
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, copy.deepcopy(row))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, table: str, entity_id: str) -> None:
+        with self._lock:
+            self._generation += 1
+            if self._entries.pop((table, entity_id), None) is not None:
+                self._invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tables = sorted(set(self._hits) | set(self._misses))
+            hits = sum(self._hits.values())
+            misses = sum(self._misses.values())
+            return {
+                "enabled": self.enabled,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "entries": len(self._entries),
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+                "by_table": {
+                    table: {"hits": self._hits.get(table, 0), "misses": self._misses.get(table, 0)}
+                    for table in tables
+                },
+            }
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._hits.clear()
+            self._misses.clear()
+            self._evictions = 0
+            self._invalidations = 0
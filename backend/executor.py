@@ -16,7 +16,10 @@ from typing import Optional, Dict, Any, List, Tuple, Union, Set
 from pathlib import Path
 import json
 import asyncio
+import concurrent.futures
 import contextvars
+import functools
+import threading
 import time
 import re
 import tempfile
@@ -29,10 +32,14 @@ import fitz  # PyMuPDF — extract text from binary PDFs (RELATORIO_FINAL)
 from models import (
     TipoDocumento, Documento, StatusProcessamento, criar_erro_pipeline,
     ERRO_DOCUMENTO_FALTANTE, ERRO_QUESTOES_FALTANTES,
-    ERRO_NOTA_FINAL_INDETERMINADA, SeveridadeErro,
+    ERRO_NOTA_FINAL_INDETERMINADA, SeveridadeErro, DEPENDENCIAS_DOCUMENTOS,
 )
 from prompts import PromptManager, PromptTemplate, EtapaProcessamento, prompt_manager
-from storage import StorageManager, storage
+from storage import AsyncStorageManager, StorageManager, storage
+from file_cache import pin_scope
+from batch_runner import executar_em_lote
+from task_cancel import TarefaCancelada, escopo_cancelavel
+import fast_json
 from ai_providers import ai_registry, AIResponse
 from ai_execution import CAPABILITY_MULTIMODAL, create_document_provider, resolve_ai_model
 from token_usage import record_token_usage
@@ -424,6 +431,163 @@ _source_document_ids_ctx: contextvars.ContextVar[Dict[str, str]] = contextvars.C
     "source_document_ids", default={}
 )
 
+# Tipos que alguma etapa do pipeline lê como entrada
+_TIPOS_ENTRADA_PIPELINE = {
+    tipo
+    for deps in DEPENDENCIAS_DOCUMENTOS.values()
+    for tipo in deps["obrigatorios"] + deps["opcionais"]
+}
+
+# Etapas do pipeline por aluno e o documento que cada uma produz (ordem de exibição)
+ETAPAS_PIPELINE_DOCUMENTO: Dict[EtapaProcessamento, TipoDocumento] = {
+    EtapaProcessamento.EXTRAIR_QUESTOES: TipoDocumento.EXTRACAO_QUESTOES,
+    EtapaProcessamento.EXTRAIR_GABARITO: TipoDocumento.EXTRACAO_GABARITO,
+    EtapaProcessamento.EXTRAIR_RESPOSTAS: TipoDocumento.EXTRACAO_RESPOSTAS,
+    EtapaProcessamento.CORRIGIR: TipoDocumento.CORRECAO,
+    EtapaProcessamento.ANALISAR_HABILIDADES: TipoDocumento.ANALISE_HABILIDADES,
+    EtapaProcessamento.GERAR_RELATORIO: TipoDocumento.RELATORIO_FINAL,
+}
+
+# Produzem um documento por atividade (os demais, um por aluno)
+ETAPAS_POR_ATIVIDADE = {EtapaProcessamento.EXTRAIR_QUESTOES, EtapaProcessamento.EXTRAIR_GABARITO}
+
+
+def _montar_grafo_etapas() -> Dict[EtapaProcessamento, List[EtapaProcessamento]]:
+    """
+    etapa -> etapas das quais ela depende, lido de DEPENDENCIAS_DOCUMENTOS.
+
+    Entradas opcionais também viram aresta: se a etapa que as produz está no
+    mesmo pipeline, vale esperar por ela em vez de rodar sem o documento.
+    """
+    produtor = {tipo: etapa for etapa, tipo in ETAPAS_PIPELINE_DOCUMENTO.items()}
+    grafo = {}
+    for etapa, tipo in ETAPAS_PIPELINE_DOCUMENTO.items():
+        deps = DEPENDENCIAS_DOCUMENTOS.get(tipo, {"obrigatorios": [], "opcionais": []})
+        grafo[etapa] = [
+            produtor[entrada]
+            for entrada in deps["obrigatorios"] + deps["opcionais"]
+            if entrada in produtor
+        ]
+    return grafo
+
+
+GRAFO_ETAPAS_PIPELINE = _montar_grafo_etapas()
+
+
+async def executar_grafo_etapas(grafo: Dict[Any, List[Any]], executar) -> Dict[Any, str]:
+    """
+    Roda ``executar(etapa)`` para cada nó assim que todas as dependências
+    terminaram com "ok"; etapas prontas rodam em paralelo.
+
+    ``executar`` devolve "ok" (concluída ou pulada), "falhou" ou "cancelado".
+    Depois de uma falha ou cancelamento nenhuma etapa nova começa; as que já
+    estão rodando terminam. Retorna o status de cada nó iniciado. Uma exceção
+    cancela as etapas em andamento e é propagada.
+    """
+    estado: Dict[Any, str] = {}
+    pendentes = list(grafo)
+    em_execucao: Dict[asyncio.Task, Any] = {}
+    parar = False
+    try:
+        while True:
+            if not parar:
+                for etapa in list(pendentes):
+                    if all(estado.get(dep) == "ok" for dep in grafo[etapa]):
+                        pendentes.remove(etapa)
+                        em_execucao[asyncio.create_task(executar(etapa))] = etapa
+            if not em_execucao:
+                return estado
+            concluidas, _ = await asyncio.wait(em_execucao, return_when=asyncio.FIRST_COMPLETED)
+            for tarefa in concluidas:
+                etapa = em_execucao.pop(tarefa)
+                estado[etapa] = tarefa.result()
+                if estado[etapa] != "ok":
+                    parar = True
+    finally:
+        for tarefa in em_execucao:
+            tarefa.cancel()
+        if em_execucao:
+            await asyncio.gather(*em_execucao, return_exceptions=True)
+
+
+class SingleFlight:
+    """
+    Execuções concorrentes com a mesma chave viram uma só.
+
+    O primeiro chamador executa; os que chegam enquanto ele roda aguardam e
+    recebem o mesmo resultado (ou a mesma exceção). Usado nas etapas por
+    atividade (extrair_questoes/extrair_gabarito), que o lote de alunos
+    dispararia uma vez por aluno contra a mesma lista de documentos vazia.
+
+    Só coalesce execuções em andamento: depois que a chave termina, a
+    próxima chamada executa de novo. Quem usa precisa conferir se o trabalho
+    ainda falta antes de executar (``executar_pipeline_completo`` relê os
+    documentos da atividade, já que o snapshot do início do pipeline não
+    enxerga o documento salvo por um líder que terminou depois).
+
+    A instância é compartilhada pelo processo, e execuções destacadas e
+    workers da fila rodam cada uma no seu loop (``asyncio.run`` em outra
+    thread): por isso o mapa guarda ``concurrent.futures.Future`` protegido
+    por um ``threading.Lock``, e cada seguidor espera com
+    ``asyncio.wrap_future`` no próprio loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._em_voo: Dict[Tuple, concurrent.futures.Future] = {}
+        self.coalescidos = 0
+
+    def em_andamento(self) -> List[Tuple]:
+        with self._lock:
+            return list(self._em_voo)
+
+    async def executar(self, chave: Tuple, fabrica) -> Tuple[Any, bool]:
+        """Retorna ``(resultado, coalescido)``; ``fabrica()`` cria a corrotina."""
+        while True:
+            with self._lock:
+                em_voo = self._em_voo.get(chave)
+                if em_voo is None:
+                    futuro = concurrent.futures.Future()
+                    self._em_voo[chave] = futuro
+                    break
+            try:
+                resultado = await asyncio.shield(asyncio.wrap_future(em_voo))
+            except asyncio.CancelledError:
+                # Só o líder foi cancelado: assumir a execução. Se a nossa task
+                # também foi (ex.: cancelar() da tarefa pega líder e seguidores
+                # juntos), propagar — senão a etapa rodaria de novo
+                if em_voo.cancelled() and not asyncio.current_task().cancelling():
+                    continue
+                raise
+            with self._lock:
+                self.coalescidos += 1
+            return resultado, True
+
+        try:
+            resultado = await fabrica()
+        except asyncio.CancelledError:
+            futuro.cancel()
+            raise
+        except BaseException as exc:
+            futuro.set_exception(exc)
+            raise
+        else:
+            futuro.set_result(resultado)
+            return resultado, False
+        finally:
+            with self._lock:
+                if self._em_voo.get(chave) is futuro:
+                    del self._em_voo[chave]
+
+
+def _fixar_arquivos_em_uso(func):
+    """Arquivos resolvidos durante a execução ficam pinados no FileCache até ela terminar."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with pin_scope():
+            return await func(*args, **kwargs)
+    return wrapper
+
 
 class PipelineExecutor:
     """
@@ -434,11 +598,19 @@ class PipelineExecutor:
     2. Modo multimodal (novo): envia PDFs e imagens nativamente para a API
     """
     
+    # Compartilhado pelo processo: a chave inclui atividade, etapa, prompt e modelo
+    _etapas_atividade = SingleFlight()
+
     def __init__(self):
         self.prompt_manager = prompt_manager
         self.storage = storage
         self.preparador = PreparadorArquivos() if HAS_MULTIMODAL else None
 
+    @property
+    def astorage(self) -> AsyncStorageManager:
+        """Fachada async sobre ``self.storage`` (resolvida a cada acesso, aceita mocks)."""
+        return AsyncStorageManager(resolver=lambda: self.storage)
+
     def _validar_consistencia_pdf_json_tool_outputs(
         self,
         docs_by_tool: Dict[str, List[Any]],
@@ -712,6 +884,7 @@ class PipelineExecutor:
     # MÉTODO PRINCIPAL - EXECUTAR ETAPA (LEGADO + MULTIMODAL)
     # ============================================================
     
+    @_fixar_arquivos_em_uso
     async def executar_etapa(
         self,
         etapa: EtapaProcessamento,
@@ -747,12 +920,12 @@ class PipelineExecutor:
 
         try:
             # 1. Buscar contexto
-            atividade = self.storage.get_atividade(atividade_id)
+            atividade = await self.astorage.get_atividade(atividade_id)
             if not atividade:
                 return self._erro(etapa, "Atividade não encontrada")
 
-            turma = self.storage.get_turma(atividade.turma_id)
-            materia = self.storage.get_materia(turma.materia_id) if turma else None
+            turma = await self.astorage.get_turma(atividade.turma_id)
+            materia = await self.astorage.get_materia(turma.materia_id) if turma else None
 
             # 2. Buscar prompt
             if prompt_id:
@@ -815,7 +988,7 @@ class PipelineExecutor:
             return self._erro(etapa, "Nenhum provider de IA disponível")
         
         # Preparar variáveis (extrai texto dos documentos)
-        variaveis = self._preparar_variaveis_texto(etapa, atividade_id, aluno_id, materia, atividade, usar_multimodal=False)
+        variaveis = await self.astorage.run(self._preparar_variaveis_texto, etapa, atividade_id, aluno_id, materia, atividade, usar_multimodal=False)
         if variaveis_extra:
             variaveis.update(variaveis_extra)
 
@@ -936,16 +1109,16 @@ class PipelineExecutor:
         cliente = ClienteAPIMultimodal(config)
         
         # Preparar variáveis com conteúdo de documentos (reutiliza lógica do modo texto)
-        variaveis = self._preparar_variaveis_texto(etapa, atividade_id, aluno_id, materia, atividade, usar_multimodal=True)
+        variaveis = await self.astorage.run(self._preparar_variaveis_texto, etapa, atividade_id, aluno_id, materia, atividade, usar_multimodal=True)
 
         if variaveis_extra:
             variaveis.update(variaveis_extra)
 
         # Coletar arquivos para anexar (multimodal envia arquivos como anexos)
-        arquivos = self._coletar_arquivos_para_etapa(etapa, atividade_id, aluno_id)
+        arquivos = await self.astorage.run(self._coletar_arquivos_para_etapa, etapa, atividade_id, aluno_id)
 
         # Adicionar contexto de arquivos JSON já processados
-        contexto_json = self._preparar_contexto_json(atividade_id, aluno_id, etapa)
+        contexto_json = await self.astorage.run(self._preparar_contexto_json, atividade_id, aluno_id, etapa)
 
         # Verificar documentos faltantes e falhar se etapa depende deles
         docs_faltantes = contexto_json.pop("_documentos_faltantes", [])
@@ -2079,7 +2252,8 @@ PROMPT ORIGINAL DE REFERENCIA, APENAS PARA TAREFA E SCHEMA:
         provider_id: str = None
     ) -> ResultadoExecucao:
         """Extrai respostas da prova do aluno usando visão multimodal"""
-        prova_valida, mensagem_erro, _ = self._validar_prova_respondida_para_extracao(
+        prova_valida, mensagem_erro, _ = await self.astorage.run(
+            self._validar_prova_respondida_para_extracao,
             atividade_id, aluno_id
         )
         if not prova_valida:
@@ -2109,12 +2283,12 @@ PROMPT ORIGINAL DE REFERENCIA, APENAS PARA TAREFA E SCHEMA:
         with create_document (JSON) + execute_python_code (PDF via E2B).
         """
         # Get context
-        atividade = self.storage.get_atividade(atividade_id)
+        atividade = await self.astorage.get_atividade(atividade_id)
         if not atividade:
             return self._erro(EtapaProcessamento.CORRIGIR, "Atividade não encontrada")
 
-        turma = self.storage.get_turma(atividade.turma_id)
-        materia = self.storage.get_materia(turma.materia_id) if turma else None
+        turma = await self.astorage.get_turma(atividade.turma_id)
+        materia = await self.astorage.get_materia(turma.materia_id) if turma else None
 
         # Get prompt
         prompt = self.prompt_manager.get_prompt_padrao(
@@ -2125,13 +2299,15 @@ PROMPT ORIGINAL DE REFERENCIA, APENAS PARA TAREFA E SCHEMA:
             return self._erro(EtapaProcessamento.CORRIGIR, "Prompt CORRIGIR não encontrado")
 
         # Prepare variables
-        variaveis = self._preparar_variaveis_texto(
+        variaveis = await self.astorage.run(
+            self._preparar_variaveis_texto,
             EtapaProcessamento.CORRIGIR, atividade_id, aluno_id,
             materia, atividade, usar_multimodal=True
         )
 
         # Prepare JSON context (extracted questions, answers, rubric)
-        contexto_json = self._preparar_contexto_json(
+        contexto_json = await self.astorage.run(
+            self._preparar_contexto_json,
             atividade_id, aluno_id, EtapaProcessamento.CORRIGIR
         )
         documentos_faltantes = contexto_json.pop("_documentos_faltantes", [])
@@ -2417,12 +2593,12 @@ PROMPT ORIGINAL DE REFERENCIA, APENAS PARA TAREFA E SCHEMA:
         with create_document (JSON) + execute_python_code (PDF via E2B).
         """
         # Get context
-        atividade = self.storage.get_atividade(atividade_id)
+        atividade = await self.astorage.get_atividade(atividade_id)
         if not atividade:
             return self._erro(EtapaProcessamento.ANALISAR_HABILIDADES, "Atividade não encontrada")
 
-        turma = self.storage.get_turma(atividade.turma_id)
-        materia = self.storage.get_materia(turma.materia_id) if turma else None
+        turma = await self.astorage.get_turma(atividade.turma_id)
+        materia = await self.astorage.get_materia(turma.materia_id) if turma else None
 
         # Get prompt
         prompt = self.prompt_manager.get_prompt_padrao(
@@ -2433,13 +2609,15 @@ PROMPT ORIGINAL DE REFERENCIA, APENAS PARA TAREFA E SCHEMA:
             return self._erro(EtapaProcessamento.ANALISAR_HABILIDADES, "Prompt ANALISAR_HABILIDADES não encontrado")
 
         # Prepare variables
-        variaveis = self._preparar_variaveis_texto(
+        variaveis = await self.astorage.run(
+            self._preparar_variaveis_texto,
             EtapaProcessamento.ANALISAR_HABILIDADES, atividade_id, aluno_id,
             materia, atividade, usar_multimodal=True
         )
 
         # Prepare JSON context
-        contexto_json = self._preparar_contexto_json(
+        contexto_json = await self.astorage.run(
+            self._preparar_contexto_json,
             atividade_id, aluno_id, EtapaProcessamento.ANALISAR_HABILIDADES
         )
         documentos_faltantes = contexto_json.pop("_documentos_faltantes", [])
@@ -2490,12 +2668,12 @@ PROMPT ORIGINAL DE REFERENCIA, APENAS PARA TAREFA E SCHEMA:
         with create_document (JSON) + execute_python_code (PDF via E2B).
         """
         # Get context
-        atividade = self.storage.get_atividade(atividade_id)
+        atividade = await self.astorage.get_atividade(atividade_id)
         if not atividade:
             return self._erro(EtapaProcessamento.GERAR_RELATORIO, "Atividade não encontrada")
 
-        turma = self.storage.get_turma(atividade.turma_id)
-        materia = self.storage.get_materia(turma.materia_id) if turma else None
+        turma = await self.astorage.get_turma(atividade.turma_id)
+        materia = await self.astorage.get_materia(turma.materia_id) if turma else None
 
         # Get prompt
         prompt = self.prompt_manager.get_prompt_padrao(
@@ -2506,13 +2684,15 @@ PROMPT ORIGINAL DE REFERENCIA, APENAS PARA TAREFA E SCHEMA:
             return self._erro(EtapaProcessamento.GERAR_RELATORIO, "Prompt GERAR_RELATORIO não encontrado")
 
         # Prepare variables
-        variaveis = self._preparar_variaveis_texto(
+        variaveis = await self.astorage.run(
+            self._preparar_variaveis_texto,
             EtapaProcessamento.GERAR_RELATORIO, atividade_id, aluno_id,
             materia, atividade, usar_multimodal=True
         )
 
         # Prepare JSON context
-        contexto_json = self._preparar_contexto_json(
+        contexto_json = await self.astorage.run(
+            self._preparar_contexto_json,
             atividade_id, aluno_id, EtapaProcessamento.GERAR_RELATORIO
         )
         documentos_faltantes = contexto_json.pop("_documentos_faltantes", [])
@@ -3683,7 +3863,7 @@ PROMPT ORIGINAL DE REFERENCIA, APENAS PARA TAREFA E SCHEMA:
         versao = 1
         documento_origem_id = None
         if criar_nova_versao:
-            docs_existentes = self.storage.listar_documentos(atividade_id, aluno_id)
+            docs_existentes = await self.astorage.listar_documentos(atividade_id, aluno_id)
             docs_tipo = [d for d in docs_existentes if d.tipo == tipo]
             if docs_tipo:
                 # Encontrar maior versão
@@ -3703,13 +3883,14 @@ PROMPT ORIGINAL DE REFERENCIA, APENAS PARA TAREFA E SCHEMA:
             "etapa": etapa.value if hasattr(etapa, "value") else str(etapa),
         }
 
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False, encoding='utf-8') as f:
-            json.dump(conteudo, f, ensure_ascii=False, indent=2)
+        # Indentado: o artefato também é baixado/aberto por professores
+        with tempfile.NamedTemporaryFile(mode='wb', suffix='.json', delete=False) as f:
+            f.write(fast_json.dumps_bytes(conteudo, indent=True))
             temp_path = f.name
 
         try:
             # Salvar documento JSON (sempre)
-            documento = self.storage.salvar_documento(
+            documento = await self.astorage.salvar_documento(
                 arquivo_origem=temp_path,
                 tipo=tipo,
                 atividade_id=atividade_id,
@@ -3833,7 +4014,7 @@ PROMPT ORIGINAL DE REFERENCIA, APENAS PARA TAREFA E SCHEMA:
                     tmp.write(pdf_bytes)
                     temp_pdf_path = tmp.name
 
-                doc = self.storage.salvar_documento(
+                doc = await self.astorage.salvar_documento(
                     arquivo_origem=temp_pdf_path,
                     tipo=tipo,
                     atividade_id=atividade_id,
@@ -3882,6 +4063,7 @@ PROMPT ORIGINAL DE REFERENCIA, APENAS PARA TAREFA E SCHEMA:
         formatos = get_output_formats(tipo_str)
 
         documentos_gerados = []
+        pendentes = []  # (fmt, tmp_path)
 
         for fmt in formatos:
             # Pular JSON (já foi salvo)
@@ -3901,7 +4083,6 @@ PROMPT ORIGINAL DE REFERENCIA, APENAS PARA TAREFA E SCHEMA:
                 
                 # Salvar
                 extensao = get_file_extension(fmt)
-                nome_arquivo = f"{tipo_str}{extensao}"
                 
                 with tempfile.NamedTemporaryFile(
                     delete=False, 
@@ -3910,25 +4091,36 @@ PROMPT ORIGINAL DE REFERENCIA, APENAS PARA TAREFA E SCHEMA:
                     encoding=None if isinstance(content, bytes) else 'utf-8'
                 ) as tmp:
                     tmp.write(content)
-                    tmp_path = tmp.name
-                
-                novo_doc = self.storage.salvar_documento(
-                    arquivo_origem=tmp_path,
-                    tipo=tipo,
-                    atividade_id=atividade_id,
-                    aluno_id=aluno_id,
-                    criado_por="sistema"
-                    # Nota: metadata não suportado no storage_v2
-                )
-                
-                os.unlink(tmp_path)
-                
-                if novo_doc:
-                    documentos_gerados.append(novo_doc.id)
-                    print(f"[DOC] Gerado {fmt.value}: {novo_doc.id}")
+                    pendentes.append((fmt, tmp.name))
                     
             except Exception as e:
                 print(f"[WARN] Falha ao gerar {fmt.value}: {e}")
+
+        if not pendentes:
+            return documentos_gerados
+
+        # Um único insert (e uploads em paralelo) para todos os formatos
+        try:
+            novos_docs = await self.astorage.salvar_documentos_lote([
+                {
+                    "arquivo_origem": tmp_path,
+                    "tipo": tipo,
+                    "atividade_id": atividade_id,
+                    "aluno_id": aluno_id,
+                    "criado_por": "sistema",
+                }
+                for _, tmp_path in pendentes
+            ])
+            for (fmt, _), novo_doc in zip(pendentes, novos_docs):
+                documentos_gerados.append(novo_doc.id)
+                print(f"[DOC] Gerado {fmt.value}: {novo_doc.id}")
+        except Exception as e:
+            formatos_falhos = ", ".join(fmt.value for fmt, _ in pendentes)
+            print(f"[WARN] Falha ao salvar formatos extras ({formatos_falhos}): {e}")
+        finally:
+            for _, tmp_path in pendentes:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
         
         return documentos_gerados
     
@@ -5559,7 +5751,7 @@ Seja preciso, educativo e construtivo em suas análises."""
             create_document_contract_errors = _create_document_contract_errors(tool_calls)
             for doc_id in dict.fromkeys(context.created_document_ids):
                 try:
-                    doc = self.storage.get_documento(doc_id)
+                    doc = await self.astorage.get_documento(doc_id)
                 except Exception:
                     doc = None
                 if not doc or _doc_is_error(doc):
@@ -5629,7 +5821,7 @@ Seja preciso, educativo e construtivo em suas análises."""
                     "deve produzir os artefatos obrigatórios dentro do limite."
                 )
                 for doc_id in context.created_document_ids:
-                    self.storage.atualizar_documento_processamento(
+                    await self.astorage.atualizar_documento_processamento(
                         doc_id,
                         ia_provider=model.tipo.value,
                         ia_modelo=model.modelo,
@@ -5708,7 +5900,7 @@ Seja preciso, educativo e construtivo em suas análises."""
                 if detalhes:
                     erro_msg += " Detalhes: " + "; ".join(detalhes) + "."
                 for doc_id in context.created_document_ids:
-                    self.storage.atualizar_documento_processamento(
+                    await self.astorage.atualizar_documento_processamento(
                         doc_id,
                         ia_provider=model.tipo.value,
                         ia_modelo=model.modelo,
@@ -5813,7 +6005,8 @@ Seja preciso, educativo e construtivo em suas análises."""
                 })
                 json_validation_errors = _validate_json_artifacts(final_state)
 
-            pdf_json_errors = self._validar_consistencia_pdf_json_tool_outputs(
+            pdf_json_errors = await self.astorage.run(
+                self._validar_consistencia_pdf_json_tool_outputs,
                 final_state.get("docs_by_tool", {}),
                 expected_document_type,
             )
@@ -5860,7 +6053,8 @@ Seja preciso, educativo e construtivo em suas análises."""
                 })
 
                 json_validation_errors = _validate_json_artifacts(final_state)
-                pdf_json_errors = self._validar_consistencia_pdf_json_tool_outputs(
+                pdf_json_errors = await self.astorage.run(
+                    self._validar_consistencia_pdf_json_tool_outputs,
                     final_state.get("docs_by_tool", {}),
                     expected_document_type,
                 )
@@ -5890,7 +6084,7 @@ Seja preciso, educativo e construtivo em suas análises."""
                     + "ou schema mínimo ausente."
                 )
                 for doc_id in context.created_document_ids:
-                    self.storage.atualizar_documento_processamento(
+                    await self.astorage.atualizar_documento_processamento(
                         doc_id,
                         ia_provider=model.tipo.value,
                         ia_modelo=model.modelo,
@@ -5960,7 +6154,7 @@ Seja preciso, educativo e construtivo em suas análises."""
                 })
 
             for doc_id in context.created_document_ids:
-                self.storage.atualizar_documento_processamento(
+                await self.astorage.atualizar_documento_processamento(
                     doc_id,
                     ia_provider=model.tipo.value,
                     ia_modelo=model.modelo,
@@ -6015,6 +6209,35 @@ Seja preciso, educativo e construtivo em suas análises."""
                 pdf_fallback_used=pdf_fallback_used,
             )
             
+        except asyncio.CancelledError:
+            # Tarefa cancelada (task_cancel): a chamada em curso foi abortada, mas as
+            # iterações do loop de tools que já responderam foram cobradas
+            created_context = locals().get("context")
+            uso = getattr(locals().get("client"), "uso_acumulado", None) or {}
+            tokens_entrada = int(uso.get("input_tokens", 0) or 0)
+            tokens_saida = int(uso.get("output_tokens", 0) or 0)
+            if tokens_entrada + tokens_saida > 0:
+                model_info = locals().get("model")
+                record_token_usage(
+                    cost_run_id=getattr(created_context, "cost_run_id", None) or f"cancelled_{uuid.uuid4().hex[:12]}",
+                    atividade_id=atividade_id,
+                    aluno_id=aluno_id,
+                    etapa=expected_document_type.value if expected_document_type else "tools",
+                    provider=getattr(getattr(model_info, "tipo", None), "value", ""),
+                    modelo=getattr(model_info, "modelo", ""),
+                    tokens_entrada=tokens_entrada,
+                    tokens_saida=tokens_saida,
+                    status="cancelado",
+                    erro="tarefa cancelada durante a execução",
+                    tempo_ms=(time.time() - inicio) * 1000,
+                    prompt_id=prompt_id,
+                    source="executar_com_tools_cancelled",
+                    metadata={
+                        "erro_tipo": "task_cancelled",
+                        "documentos_ids": list(getattr(created_context, "created_document_ids", []) or []),
+                    },
+                )
+            raise
         except ProviderAPIError as e:
             created_context = locals().get("context")
             responses_so_far = locals().get("respostas_tool", []) or []
@@ -6053,7 +6276,7 @@ Seja preciso, educativo e construtivo em suas análises."""
                     }
                 )
             for doc_id in getattr(created_context, "created_document_ids", []) or []:
-                self.storage.atualizar_documento_processamento(
+                await self.astorage.atualizar_documento_processamento(
                     doc_id,
                     ia_provider=model_provider or getattr(e, "provider", ""),
                     ia_modelo=model_name,
@@ -6114,7 +6337,7 @@ Seja preciso, educativo e construtivo em suas análises."""
         relatórios individuais em uma única chamada.
         """
         # Buscar alunos da turma
-        alunos = self.storage.listar_alunos(turma_id)
+        alunos = await self.astorage.listar_alunos(turma_id)
         
         if not alunos:
             return {"sucesso": False, "erro": "Nenhum aluno encontrado na turma"}
@@ -6122,7 +6345,7 @@ Seja preciso, educativo e construtivo em suas análises."""
         # Buscar dados de correção de cada aluno
         dados_alunos = []
         for aluno in alunos:
-            docs = self.storage.listar_documentos(atividade_id, aluno.id)
+            docs = await self.astorage.listar_documentos(atividade_id, aluno.id)
             correcao = next((d for d in docs if d.tipo == TipoDocumento.CORRECAO), None)
             
             if correcao:
@@ -6190,12 +6413,13 @@ Crie UM documento separado para cada aluno, nomeando como "relatorio_[nome_aluno
         """
         # Fetch context first so the aggregate uses enrolled students, not
         # historical document versions, as the denominator.
-        atividade = self.storage.get_atividade(atividade_id)
-        turma = self.storage.get_turma(atividade.turma_id) if atividade else None
-        materia = self.storage.get_materia(turma.materia_id) if turma else None
-        alunos = self._listar_alunos_seguro(atividade.turma_id if atividade else None)
+        atividade = await self.astorage.get_atividade(atividade_id)
+        turma = await self.astorage.get_turma(atividade.turma_id) if atividade else None
+        materia = await self.astorage.get_materia(turma.materia_id) if turma else None
+        alunos = await self.astorage.run(self._listar_alunos_seguro, atividade.turma_id if atividade else None)
 
-        coleta = self._coletar_relatorios_finais_legiveis_por_aluno(
+        coleta = await self.astorage.run(
+            self._coletar_relatorios_finais_legiveis_por_aluno,
             atividade or atividade_id,
             alunos,
         )
@@ -6296,7 +6520,7 @@ Crie UM documento separado para cada aluno, nomeando como "relatorio_[nome_aluno
         Busca todos os alunos da turma e um RELATORIO_FINAL por aluno em todas as
         atividades. Requer pelo menos 2 alunos com resultados.
         """
-        alunos = self.storage.listar_alunos(turma_id)
+        alunos = await self.astorage.listar_alunos(turma_id)
         if len(alunos) < 2:
             return {
                 "sucesso": False,
@@ -6307,11 +6531,11 @@ Crie UM documento separado para cada aluno, nomeando como "relatorio_[nome_aluno
             }
 
         # Fetch context
-        turma = self.storage.get_turma(turma_id)
-        materia = self.storage.get_materia(turma.materia_id) if turma else None
+        turma = await self.astorage.get_turma(turma_id)
+        materia = await self.astorage.get_materia(turma.materia_id) if turma else None
 
         # Fetch atividades for this turma
-        atividades = self.storage.listar_atividades(turma_id)
+        atividades = await self.astorage.listar_atividades(turma_id)
 
         # Gather one narrative per student/activity. Historical document versions
         # must not inflate aggregate coverage or cost.
@@ -6320,7 +6544,7 @@ Crie UM documento separado para cada aluno, nomeando como "relatorio_[nome_aluno
         atividades_cobertas = set()
         alunos_por_atividade = {}  # atividade_nome → set of aluno_ids with narratives
         for atividade in atividades:
-            coleta = self._coletar_relatorios_finais_legiveis_por_aluno(atividade, alunos)
+            coleta = await self.astorage.run(self._coletar_relatorios_finais_legiveis_por_aluno, atividade, alunos)
             alunos_com_narrativa = coleta["alunos_incluidos"]
             for conteudo in coleta["conteudos"]:
                 conteudos.append({
@@ -6418,7 +6642,7 @@ Crie UM documento separado para cada aluno, nomeando como "relatorio_[nome_aluno
         Busca todas as turmas da matéria. Requer pelo menos 2 turmas com
         resultados para uma comparação significativa.
         """
-        turmas = self.storage.listar_turmas(materia_id)
+        turmas = await self.astorage.listar_turmas(materia_id)
         if len(turmas) < 2:
             return {
                 "sucesso": False,
@@ -6429,7 +6653,7 @@ Crie UM documento separado para cada aluno, nomeando como "relatorio_[nome_aluno
             }
 
         # Fetch context
-        materia = self.storage.get_materia(materia_id)
+        materia = await self.astorage.get_materia(materia_id)
 
         # Gather one narrative per student/activity across all turmas.
         conteudos = []
@@ -6437,13 +6661,13 @@ Crie UM documento separado para cada aluno, nomeando como "relatorio_[nome_aluno
         cobertura = {}  # turma_id → {"turma": nome, "narrativas": count}
         atividade_ref = None
         for turma in turmas:
-            alunos = self.storage.listar_alunos(turma.id)
-            atividades = self.storage.listar_atividades(turma.id)
+            alunos = await self.astorage.listar_alunos(turma.id)
+            atividades = await self.astorage.listar_atividades(turma.id)
             narrativas_turma = 0
             for atividade in atividades:
                 if atividade_ref is None:
                     atividade_ref = atividade.id
-                coleta = self._coletar_relatorios_finais_legiveis_por_aluno(atividade, alunos)
+                coleta = await self.astorage.run(self._coletar_relatorios_finais_legiveis_por_aluno, atividade, alunos)
                 for conteudo in coleta["conteudos"]:
                     conteudos.append({
                         "turma_id": turma.id,
@@ -6541,6 +6765,55 @@ Crie UM documento separado para cada aluno, nomeando como "relatorio_[nome_aluno
             "erro": resultado.erro if not resultado.sucesso else None,
         }
 
+    # ============================================================
+    # PREFETCH DE DOCUMENTOS (antes do fan-out por aluno)
+    # ============================================================
+
+    async def prefetch_atividade(
+        self,
+        atividade_id: str,
+        aluno_ids: Optional[List[str]] = None,
+        incluir_gerados: bool = True,
+    ) -> Dict[str, Any]:
+        """
+        Baixa de uma vez os documentos que o lote vai ler.
+
+        Uma única consulta lista os documentos da atividade; ficam os tipos
+        que alguma etapa usa como entrada (DEPENDENCIAS_DOCUMENTOS), os de
+        nível atividade e os dos alunos em ``aluno_ids`` (None = todos). Com
+        ``incluir_gerados=False`` (force_rerun) só entram os enviados pelo
+        professor, já que os gerados serão refeitos.
+
+        Chame dentro de ``pin_scope()`` para que os arquivos não sejam
+        despejados do cache antes de as etapas os usarem. Erros só são
+        logados: cada etapa continua resolvendo seus arquivos sozinha.
+        """
+        import logging
+        logger = logging.getLogger("pipeline")
+
+        vazio = {"total": 0, "locais": 0, "baixados": 0, "falhas": [], "duracao_ms": 0.0}
+        alunos = set(aluno_ids) if aluno_ids is not None else None
+        try:
+            docs = [
+                d for d in await self.astorage.listar_documentos(atividade_id)
+                if d.tipo in _TIPOS_ENTRADA_PIPELINE
+                and (incluir_gerados or not d.is_documento_gerado)
+                and (d.aluno_id is None or alunos is None or d.aluno_id in alunos)
+            ]
+            if not docs:
+                return vazio
+            resumo = await self.astorage.prefetch_documentos(docs)
+        except Exception as exc:
+            logger.warning(f"[prefetch] atividade={atividade_id}: {exc}")
+            return vazio
+
+        logger.info(
+            f"[prefetch] atividade={atividade_id}: {resumo['total']} documento(s), "
+            f"{resumo['baixados']} baixado(s), {len(resumo['falhas'])} falha(s) "
+            f"em {resumo['duracao_ms']}ms"
+        )
+        return resumo
+
     # ============================================================
     # CASCADE PRE-PIPELINE (FC-T1 — F2-T4)
     # ============================================================
@@ -6579,12 +6852,12 @@ Crie UM documento separado para cada aluno, nomeando como "relatorio_[nome_aluno
         failed = []
 
         if level == "tarefa":
-            atividade = self.storage.get_atividade(entity_id)
+            atividade = await self.astorage.get_atividade(entity_id)
             if not atividade:
                 return {"created": created, "skipped": skipped, "failed": [f"atividade {entity_id} not found"]}
 
-            alunos = self.storage.listar_alunos(atividade.turma_id)
-            docs = self.storage.listar_documentos(entity_id)
+            alunos = await self.astorage.listar_alunos(atividade.turma_id)
+            docs = await self.astorage.listar_documentos(entity_id)
             alunos_com_relatorio = {
                 d.aluno_id for d in docs
                 if d.tipo == TipoDocumento.RELATORIO_FINAL
@@ -6593,38 +6866,48 @@ Crie UM documento separado para cada aluno, nomeando como "relatorio_[nome_aluno
             alunos_to_run = [a for a in alunos if force_reexec or a.id not in alunos_com_relatorio]
             skipped.extend([a.id for a in alunos if not force_reexec and a.id in alunos_com_relatorio])
 
-            _max_workers = int(os.environ.get("PARALLEL_WORKERS", "12"))
-            _sem = asyncio.Semaphore(_max_workers)
-
             async def _run_aluno(aluno):
-                async with _sem:
-                    resultado = await self.executar_pipeline_completo(
+                return await self.executar_pipeline_completo(
+                    entity_id,
+                    aluno.id,
+                    model_id=provider_id,
+                    provider_name=provider_id,
+                    models_per_stage=models_per_stage,
+                    force_rerun=force_reexec,
+                    task_id=task_id,
+                    isolate_provider=isolate_provider,
+                )
+
+            def _ultima_etapa_ok(resultado) -> bool:
+                last = list(resultado.values())[-1] if resultado else None
+                last_ok = getattr(last, "sucesso", None) if last else None
+                if last_ok is None and isinstance(last, dict):
+                    last_ok = last.get("sucesso")
+                return bool(last_ok)
+
+            if alunos_to_run:
+                # Arquivos baixados antes da primeira chamada ao LLM e pinados até o fim do lote
+                with pin_scope():
+                    await self.prefetch_atividade(
                         entity_id,
-                        aluno.id,
-                        model_id=provider_id,
-                        provider_name=provider_id,
-                        models_per_stage=models_per_stage,
-                        force_rerun=force_reexec,
-                        task_id=task_id,
-                        isolate_provider=isolate_provider,
+                        [a.id for a in alunos_to_run],
+                        incluir_gerados=not force_reexec,
                     )
-                    last = list(resultado.values())[-1] if resultado else None
-                    last_ok = getattr(last, "sucesso", None) if last else None
-                    if last_ok is None and isinstance(last, dict):
-                        last_ok = last.get("sucesso")
-                    if last_ok:
-                        created.append(aluno.id)
-                    else:
-                        failed.append(aluno.id)
-
-            await asyncio.gather(*[_run_aluno(a) for a in alunos_to_run])
+                    itens = await executar_em_lote(
+                        alunos_to_run,
+                        _run_aluno,
+                        chave=lambda aluno: aluno.id,
+                        sucesso=_ultima_etapa_ok,
+                    )
+                created.extend(item.chave for item in itens if item.sucesso)
+                failed.extend(item.chave for item in itens if not item.sucesso)
 
         elif level == "turma":
-            atividades = self.storage.listar_atividades(entity_id)
+            atividades = await self.astorage.listar_atividades(entity_id)
 
             for atividade in atividades:
                 # Query docs per-atividade (not turma_id) and check RELATORIO_FINAL
-                docs = self.storage.listar_documentos(atividade.id)
+                docs = await self.astorage.listar_documentos(atividade.id)
                 has_relatorio_final = any(
                     d.tipo == TipoDocumento.RELATORIO_FINAL for d in docs
                 )
@@ -6647,14 +6930,14 @@ Crie UM documento separado para cada aluno, nomeando como "relatorio_[nome_aluno
                     failed.append(atividade.id)
 
         elif level == "materia":
-            turmas = self.storage.listar_turmas(entity_id)
+            turmas = await self.astorage.listar_turmas(entity_id)
 
             for turma in turmas:
                 # Query docs per-atividade within each turma (not materia_id)
-                atividades = self.storage.listar_atividades(turma.id)
+                atividades = await self.astorage.listar_atividades(turma.id)
                 has_relatorio_final = False
                 for atividade in atividades:
-                    docs = self.storage.listar_documentos(atividade.id)
+                    docs = await self.astorage.listar_documentos(atividade.id)
                     if any(d.tipo == TipoDocumento.RELATORIO_FINAL for d in docs):
                         has_relatorio_final = True
                         break
@@ -6682,6 +6965,7 @@ Crie UM documento separado para cada aluno, nomeando como "relatorio_[nome_aluno
     # PIPELINE COMPLETO (mantido do original)
     # ============================================================
 
+    @_fixar_arquivos_em_uso
     async def executar_pipeline_completo(
         self,
         atividade_id: str,
@@ -6711,7 +6995,10 @@ Crie UM documento separado para cada aluno, nomeando como "relatorio_[nome_aluno
             task_id: Optional task registry ID for progress tracking.
         """
         import logging
-        from routes_tasks import update_stage_progress, complete_pipeline_task, task_registry
+        from routes_tasks import (
+            update_stage_progress, complete_pipeline_task, record_coalesced_stage,
+            get_task, is_cancel_requested, stage_completed_before,
+        )
         logger = logging.getLogger("pipeline")
 
         if isolate_provider and provider_name:
@@ -6731,10 +7018,7 @@ Crie UM documento separado para cada aluno, nomeando como "relatorio_[nome_aluno
         logger.info(f"Pipeline iniciado: atividade={atividade_id}, aluno={aluno_id}, model={model_id or provider_name}")
 
         # Todas as etapas disponíveis
-        ALL_STEPS = [
-            "extrair_questoes", "extrair_gabarito", "extrair_respostas",
-            "corrigir", "analisar_habilidades", "gerar_relatorio"
-        ]
+        ALL_STEPS = [etapa.value for etapa in ETAPAS_PIPELINE_DOCUMENTO]
 
         # Se não especificou etapas, executa todas
         steps_to_run = selected_steps if selected_steps else ALL_STEPS
@@ -6840,10 +7124,34 @@ Crie UM documento separado para cada aluno, nomeando como "relatorio_[nome_aluno
 
             return resultado
 
+        async def _executar_etapa_atividade(stage: EtapaProcessamento) -> Optional[ResultadoExecucao]:
+            """
+            Etapas por atividade rodam uma vez por (atividade, etapa, prompt, modelo)
+            mesmo com vários alunos do lote chegando juntos; os demais reusam o resultado.
+
+            None: outro aluno do lote terminou a etapa depois do snapshot ``docs``.
+            """
+            async def _executar_se_ainda_falta() -> Optional[ResultadoExecucao]:
+                atuais = await self.astorage.listar_documentos(atividade_id)
+                ainda_falta, _ = _should_run(stage.value, ETAPAS_PIPELINE_DOCUMENTO[stage], atuais)
+                if not ainda_falta:
+                    return None
+                return await _executar_com_retry(stage)
+
+            chave = (atividade_id, stage.value, _resolve_prompt(stage), _resolve_provider(stage))
+            resultado, coalescido = await self._etapas_atividade.executar(chave, _executar_se_ainda_falta)
+            if resultado is None:
+                return None
+            if coalescido:
+                logger.info(f"  -> {stage.value}: reusando execução concorrente da atividade {atividade_id}")
+                if task_id:
+                    record_coalesced_stage(task_id, aluno_id, stage.value)
+            return resultado
+
         try:
             # Carregar documentos existentes
-            docs = self.storage.listar_documentos(atividade_id)
-            docs_aluno = self.storage.listar_documentos(atividade_id, aluno_id)
+            docs = await self.astorage.listar_documentos(atividade_id)
+            docs_aluno = await self.astorage.listar_documentos(atividade_id, aluno_id)
             logger.info(f"Documentos encontrados: base={len(docs)}, aluno={len(docs_aluno)}")
             logger.debug(f"Tipos base: {[d.tipo.value for d in docs]}")
             logger.debug(f"Tipos aluno: {[d.tipo.value for d in docs_aluno]}")
@@ -6863,6 +7171,8 @@ Crie UM documento separado para cada aluno, nomeando como "relatorio_[nome_aluno
         
         def _marcar_erro_pipeline(resultado):
             """Add _pipeline_erro to results dict when pipeline halts due to failure."""
+            if "_pipeline_erro" in resultados:
+                return  # ramos paralelos: vale a primeira falha
             etapa_val = resultado.etapa.value if hasattr(resultado.etapa, 'value') else str(resultado.etapa)
             erro_pipeline = {
                 "etapa_falha": etapa_val,
@@ -6915,20 +7225,21 @@ Crie UM documento separado para cada aluno, nomeando como "relatorio_[nome_aluno
                     stage_name,
                     "skipped",
                     error={"mensagem": reason},
+                    atividade_id=atividade_id,
                 )
 
         def _finalizar_task_com_erro(resultado):
             if task_id:
                 etapa_falha = resultado.etapa.value if hasattr(resultado.etapa, 'value') else str(resultado.etapa)
                 if etapa_falha in ALL_STEPS:
-                    indice_falha = ALL_STEPS.index(etapa_falha)
-                    task = task_registry.get(task_id, {})
+                    task = get_task(task_id) or {}
                     stages = (
                         task.get("students", {})
                         .get(aluno_id, {})
                         .get("stages", {})
                     )
-                    for stage_name in ALL_STEPS[indice_falha + 1:]:
+                    # Etapas que não chegaram a começar (dependentes ou em ramos ainda não iniciados)
+                    for stage_name in ALL_STEPS:
                         if stages.get(stage_name) == "pending":
                             update_stage_progress(
                                 task_id,
@@ -6938,198 +7249,114 @@ Crie UM documento separado para cada aluno, nomeando como "relatorio_[nome_aluno
                                 error={
                                     "mensagem": f"bloqueado por falha em {etapa_falha}",
                                 },
+                                atividade_id=atividade_id,
                             )
                 complete_pipeline_task(task_id, "failed", error=_mensagem_erro_task(resultado))
 
-        # 1. Extrair questões
-        should_run, reason = _should_run("extrair_questoes", TipoDocumento.EXTRACAO_QUESTOES, docs)
-        logger.info(f"[1/6] extrair_questoes: run={should_run}, reason={reason}")
-        if should_run:
-            if task_id and task_registry.get(task_id, {}).get("cancel_requested"):
-                complete_pipeline_task(task_id, "cancelled")
-                return resultados
-            if task_id:
-                update_stage_progress(task_id, aluno_id, "extrair_questoes", "running")
-            resultado = await _executar_com_retry(EtapaProcessamento.EXTRAIR_QUESTOES)
-            if task_id:
-                update_stage_progress(
-                    task_id,
-                    aluno_id,
-                    "extrair_questoes",
-                    "completed" if resultado.sucesso else "failed",
-                    error=None if resultado.sucesso else _erro_stage_task(resultado),
-                )
-            resultados["extrair_questoes"] = resultado
-            logger.info(f"  -> sucesso={resultado.sucesso}, tentativas={resultado.tentativas}, erro={resultado.erro[:100] if resultado.erro else 'N/A'}")
-            if not resultado.sucesso:
-                logger.error(f"  -> FALHA DEFINITIVA: {resultado.erro} (código: {resultado.erro_codigo})")
-                _marcar_erro_pipeline(resultado)
-                _finalizar_task_com_erro(resultado)
-                return resultados
-        else:
-            _marcar_etapa_pulada("extrair_questoes", reason)
-
-        # 2. Extrair gabarito
-        should_run, reason = _should_run("extrair_gabarito", TipoDocumento.EXTRACAO_GABARITO, docs)
-        logger.info(f"[2/6] extrair_gabarito: run={should_run}, reason={reason}")
-        if should_run:
-            if task_id and task_registry.get(task_id, {}).get("cancel_requested"):
-                complete_pipeline_task(task_id, "cancelled")
-                return resultados
-            if task_id:
-                update_stage_progress(task_id, aluno_id, "extrair_gabarito", "running")
-            resultado = await _executar_com_retry(EtapaProcessamento.EXTRAIR_GABARITO)
-            if task_id:
-                update_stage_progress(
-                    task_id,
-                    aluno_id,
-                    "extrair_gabarito",
-                    "completed" if resultado.sucesso else "failed",
-                    error=None if resultado.sucesso else _erro_stage_task(resultado),
-                )
-            resultados["extrair_gabarito"] = resultado
-            logger.info(f"  -> sucesso={resultado.sucesso}, tentativas={resultado.tentativas}")
-            if not resultado.sucesso:
-                logger.error(f"  -> FALHA DEFINITIVA: {resultado.erro} (código: {resultado.erro_codigo})")
-                _marcar_erro_pipeline(resultado)
-                _finalizar_task_com_erro(resultado)
-                return resultados
-        else:
-            _marcar_etapa_pulada("extrair_gabarito", reason)
-
-        # 3. Extrair respostas do aluno
-        should_run, reason = _should_run("extrair_respostas", TipoDocumento.EXTRACAO_RESPOSTAS, docs_aluno)
-        logger.info(f"[3/6] extrair_respostas: run={should_run}, reason={reason}")
-        if should_run:
-            prova_valida, mensagem_erro, _ = self._validar_prova_respondida_para_extracao(
-                atividade_id, aluno_id, docs_aluno
+        falhas: List[ResultadoExecucao] = []
+
+        async def _rodar_etapa(stage: EtapaProcessamento) -> str:
+            """Um nó do grafo: decide, executa e reporta a etapa ("ok", "falhou" ou "cancelado")."""
+            step_name = stage.value
+            posicao = f"[{ALL_STEPS.index(step_name) + 1}/{len(ALL_STEPS)}]"
+            por_atividade = stage in ETAPAS_POR_ATIVIDADE
+            if (
+                task_id and step_name in steps_to_run
+                and stage_completed_before(task_id, atividade_id, aluno_id, step_name)
+            ):
+                # Execução retomada após restart: a unidade já terminou nesta tarefa
+                logger.info(f"{posicao} {step_name}: run=False, reason=já concluída nesta tarefa (retomada)")
+                update_stage_progress(task_id, aluno_id, step_name, "completed", atividade_id=atividade_id)
+                return "ok"
+            should_run, reason = _should_run(
+                step_name, ETAPAS_PIPELINE_DOCUMENTO[stage], docs if por_atividade else docs_aluno
             )
-            if not prova_valida:
-                logger.warning(f"[3/6] extrair_respostas: BLOQUEADO - {mensagem_erro}")
-                resultados["extrair_respostas"] = ResultadoExecucao(
-                    sucesso=False,
-                    etapa=EtapaProcessamento.EXTRAIR_RESPOSTAS,
-                    erro=mensagem_erro,
+            logger.info(f"{posicao} {step_name}: run={should_run}, reason={reason}")
+            if not should_run:
+                _marcar_etapa_pulada(step_name, reason)
+                return "ok"
+
+            if stage == EtapaProcessamento.EXTRAIR_RESPOSTAS:
+                prova_valida, mensagem_erro, _ = await self.astorage.run(
+                    self._validar_prova_respondida_para_extracao,
+                    atividade_id, aluno_id, docs_aluno
                 )
-                _marcar_erro_pipeline(resultados["extrair_respostas"])
-                if task_id:
-                    update_stage_progress(
-                        task_id,
-                        aluno_id,
-                        "extrair_respostas",
-                        "failed",
-                        error=_erro_stage_task(resultados["extrair_respostas"]),
+                if not prova_valida:
+                    logger.warning(f"{posicao} extrair_respostas: BLOQUEADO - {mensagem_erro}")
+                    resultado = ResultadoExecucao(
+                        sucesso=False,
+                        etapa=EtapaProcessamento.EXTRAIR_RESPOSTAS,
+                        erro=mensagem_erro,
                     )
-                _finalizar_task_com_erro(resultados["extrair_respostas"])
-                return resultados
+                    resultados[step_name] = resultado
+                    _marcar_erro_pipeline(resultado)
+                    if task_id:
+                        update_stage_progress(
+                            task_id, aluno_id, step_name, "failed", error=_erro_stage_task(resultado),
+                            atividade_id=atividade_id,
+                        )
+                    falhas.append(resultado)
+                    return "falhou"
 
-            if task_id and task_registry.get(task_id, {}).get("cancel_requested"):
-                complete_pipeline_task(task_id, "cancelled")
-                return resultados
-            if task_id:
-                update_stage_progress(task_id, aluno_id, "extrair_respostas", "running")
-            resultado = await _executar_com_retry(EtapaProcessamento.EXTRAIR_RESPOSTAS, aluno_id)
-            if task_id:
-                update_stage_progress(
-                    task_id,
-                    aluno_id,
-                    "extrair_respostas",
-                    "completed" if resultado.sucesso else "failed",
-                    error=None if resultado.sucesso else _erro_stage_task(resultado),
-                )
-            resultados["extrair_respostas"] = resultado
-            logger.info(f"  -> sucesso={resultado.sucesso}, tentativas={resultado.tentativas}")
-            if not resultado.sucesso:
-                logger.error(f"  -> FALHA DEFINITIVA: {resultado.erro} (código: {resultado.erro_codigo})")
-                _marcar_erro_pipeline(resultado)
-                _finalizar_task_com_erro(resultado)
-                return resultados
-        else:
-            _marcar_etapa_pulada("extrair_respostas", reason)
-
-        # 4. Corrigir
-        should_run, reason = _should_run("corrigir", TipoDocumento.CORRECAO, docs_aluno)
-        logger.info(f"[4/6] corrigir: run={should_run}, reason={reason}")
-        if should_run:
-            if task_id and task_registry.get(task_id, {}).get("cancel_requested"):
-                complete_pipeline_task(task_id, "cancelled")
-                return resultados
-            if task_id:
-                update_stage_progress(task_id, aluno_id, "corrigir", "running")
-            resultado = await _executar_com_retry(EtapaProcessamento.CORRIGIR, aluno_id)
-            if task_id:
-                update_stage_progress(
-                    task_id,
-                    aluno_id,
-                    "corrigir",
-                    "completed" if resultado.sucesso else "failed",
-                    error=None if resultado.sucesso else _erro_stage_task(resultado),
-                )
-            resultados["corrigir"] = resultado
-            logger.info(f"  -> sucesso={resultado.sucesso}, tentativas={resultado.tentativas}")
-            if not resultado.sucesso:
-                logger.error(f"  -> FALHA DEFINITIVA: {resultado.erro} (código: {resultado.erro_codigo})")
-                _marcar_erro_pipeline(resultado)
-                _finalizar_task_com_erro(resultado)
-                return resultados
-        else:
-            _marcar_etapa_pulada("corrigir", reason)
-
-        # 5. Analisar habilidades
-        should_run, reason = _should_run("analisar_habilidades", TipoDocumento.ANALISE_HABILIDADES, docs_aluno)
-        logger.info(f"[5/6] analisar_habilidades: run={should_run}, reason={reason}")
-        if should_run:
-            if task_id and task_registry.get(task_id, {}).get("cancel_requested"):
-                complete_pipeline_task(task_id, "cancelled")
-                return resultados
-            if task_id:
-                update_stage_progress(task_id, aluno_id, "analisar_habilidades", "running")
-            resultado = await _executar_com_retry(EtapaProcessamento.ANALISAR_HABILIDADES, aluno_id)
+            if is_cancel_requested(task_id):
+                return "cancelado"
             if task_id:
+                update_stage_progress(task_id, aluno_id, step_name, "running", atividade_id=atividade_id)
+            try:
+                # Cancelar a tarefa aborta a etapa no meio (chamada ao LLM, backoff, sandbox)
+                async with escopo_cancelavel(task_id):
+                    if por_atividade:
+                        resultado = await _executar_etapa_atividade(stage)
+                    else:
+                        resultado = await _executar_com_retry(stage, aluno_id)
+            except TarefaCancelada:
+                logger.info(f"  -> {step_name}: interrompida pelo cancelamento da tarefa")
                 update_stage_progress(
-                    task_id,
-                    aluno_id,
-                    "analisar_habilidades",
-                    "completed" if resultado.sucesso else "failed",
-                    error=None if resultado.sucesso else _erro_stage_task(resultado),
+                    task_id, aluno_id, step_name, "skipped",
+                    error={"mensagem": "Interrompida: tarefa cancelada", "tipo": "task_cancelled"},
+                    atividade_id=atividade_id,
                 )
-            resultados["analisar_habilidades"] = resultado
-            logger.info(f"  -> sucesso={resultado.sucesso}, tentativas={resultado.tentativas}")
-            if not resultado.sucesso:
-                logger.error(f"  -> FALHA DEFINITIVA: {resultado.erro} (código: {resultado.erro_codigo})")
-                _marcar_erro_pipeline(resultado)
-                _finalizar_task_com_erro(resultado)
-                return resultados
-        else:
-            _marcar_etapa_pulada("analisar_habilidades", reason)
-
-        # 6. Gerar relatório
-        should_run, reason = _should_run("gerar_relatorio", TipoDocumento.RELATORIO_FINAL, docs_aluno)
-        logger.info(f"[6/6] gerar_relatorio: run={should_run}, reason={reason}")
-        if should_run:
-            if task_id and task_registry.get(task_id, {}).get("cancel_requested"):
-                complete_pipeline_task(task_id, "cancelled")
-                return resultados
-            if task_id:
-                update_stage_progress(task_id, aluno_id, "gerar_relatorio", "running")
-            resultado = await _executar_com_retry(EtapaProcessamento.GERAR_RELATORIO, aluno_id)
+                return "cancelado"
+            if resultado is None:
+                motivo = "documento salvo por outro aluno do lote"
+                logger.info(f"  -> {step_name}: {motivo}")
+                _marcar_etapa_pulada(step_name, motivo)
+                return "ok"
             if task_id:
                 update_stage_progress(
                     task_id,
                     aluno_id,
-                    "gerar_relatorio",
+                    step_name,
                     "completed" if resultado.sucesso else "failed",
                     error=None if resultado.sucesso else _erro_stage_task(resultado),
+                    atividade_id=atividade_id,
                 )
-            resultados["gerar_relatorio"] = resultado
-            logger.info(f"  -> sucesso={resultado.sucesso}, tentativas={resultado.tentativas}")
+            resultados[step_name] = resultado
+            logger.info(f"  -> {step_name}: sucesso={resultado.sucesso}, tentativas={resultado.tentativas}")
             if not resultado.sucesso:
                 logger.error(f"  -> FALHA DEFINITIVA: {resultado.erro} (código: {resultado.erro_codigo})")
                 _marcar_erro_pipeline(resultado)
-                _finalizar_task_com_erro(resultado)
-                return resultados
-        else:
-            _marcar_etapa_pulada("gerar_relatorio", reason)
+                falhas.append(resultado)
+                return "falhou"
+            return "ok"
+
+        def _resultados_ordenados() -> Dict[str, Any]:
+            # Ramos paralelos terminam fora de ordem; quem lê o dict espera a ordem das etapas
+            ordenados = {nome: resultados[nome] for nome in ALL_STEPS if nome in resultados}
+            ordenados.update((k, v) for k, v in resultados.items() if k not in ordenados)
+            return ordenados
+
+        # Etapas prontas (dependências concluídas ou puladas) rodam em paralelo:
+        # extrair_gabarito corre junto de extrair_questoes -> extrair_respostas.
+        estado_etapas = await executar_grafo_etapas(GRAFO_ETAPAS_PIPELINE, _rodar_etapa)
+
+        if falhas:
+            _finalizar_task_com_erro(falhas[0])
+            return _resultados_ordenados()
+        if "cancelado" in estado_etapas.values():
+            complete_pipeline_task(task_id, "cancelled")
+            return _resultados_ordenados()
+        resultados = _resultados_ordenados()
 
         # Log final summary
         logger.info(f"Pipeline concluído: {len(resultados)} etapas executadas, {len(etapas_puladas)} puladas")
@@ -0,0 +1,127 @@
+"""
+Serialização JSON rápida compartilhada (orjson quando instalado).
+
+O encoder da stdlib é o gargalo de CPU nas respostas grandes (árvore de
+navegação, listagens de documentos, custos, tasks) e nas gravações de
+artefatos do pipeline. Este módulo concentra o JSON do backend:
+
+    from fast_json import dumps, loads, write_json
+    texto = dumps(dados)                  # compacto
+    texto = dumps(dados, indent=True)     # 2 espaços (arquivos para humanos)
+    dados = loads(texto_ou_bytes)
+    write_json(caminho, dados)            # atômico (tmp + replace)
+
+Com orjson: saída UTF-8 (equivale a ``ensure_ascii=False``), chaves não-str
+convertidas, datetime/date em ISO 8601. Sem orjson (ou se o orjson recusar
+o objeto: inteiro > 64 bits, NaN ao ler, ...) cai no ``json`` da stdlib com
+o mesmo resultado lógico.
+
+``FastJSONResponse`` é a response class padrão do app (main_v2); rotas com
+payload grande a devolvem diretamente para pular também o
+``jsonable_encoder`` do FastAPI.
+"""
+
+import json
+from datetime import date, datetime
+from enum import Enum
+from pathlib import Path
+from typing import Any, Callable, Optional, Union
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+
+JSONDecodeError = json.JSONDecodeError  # orjson.JSONDecodeError herda dele
+
+# Sem OPT_SERIALIZE_NUMPY: a opção faz o orjson importar numpy na primeira
+# falha de serialização; arrays numpy (raros aqui) vão pelo fallback.
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS if ORJSON_AVAILABLE else 0
+
+
+def _stdlib_default(obj: Any) -> Any:
+    """Tipos que o orjson serializa nativamente, para o fallback da stdlib."""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Enum):
+        return obj.value
+    if type(obj).__module__ == "numpy" and hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj: Any, *, indent: bool = False,
+                default: Optional[Callable[[Any], Any]] = None) -> bytes:
+    """JSON em bytes UTF-8 (``indent=True``: 2 espaços)."""
+    if ORJSON_AVAILABLE:
+        options = _ORJSON_OPTIONS | (orjson.OPT_INDENT_2 if indent else 0)
+        try:
+            return orjson.dumps(obj, default=default, option=options)
+        except orjson.JSONEncodeError:
+            pass
+    return _stdlib_dumps(obj, indent, default).encode("utf-8")
+
+
+def dumps(obj: Any, *, indent: bool = False,
+          default: Optional[Callable[[Any], Any]] = None) -> str:
+    """JSON em str (``indent=True``: 2 espaços)."""
+    if ORJSON_AVAILABLE:
+        return dumps_bytes(obj, indent=indent, default=default).decode("utf-8")
+    return _stdlib_dumps(obj, indent, default)
+
+
+def _stdlib_dumps(obj: Any, indent: bool, default: Optional[Callable[[Any], Any]]) -> str:
+    def _default(value: Any) -> Any:
+        try:
+            return _stdlib_default(value)
+        except TypeError:
+            if default is None:
+                raise
+            return default(value)
+
+    return json.dumps(
+        obj,
+        ensure_ascii=False,
+        indent=2 if indent else None,
+        separators=None if indent else (",", ":"),
+        default=_default,
+    )
+
+
+def loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+    """Decodifica JSON; erros levantam ``json.JSONDecodeError``."""
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # NaN/Infinity e afins: a stdlib aceita (e dá a mensagem de erro final)
+            pass
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = bytes(data).decode("utf-8")
+    return json.loads(data)
+
+
+def read_json(path: Union[str, Path]) -> Any:
+    """Lê e decodifica um arquivo JSON."""
+    return loads(Path(path).read_bytes())
+
+
+def write_json(path: Union[str, Path], obj: Any, *, indent: bool = False,
+               default: Optional[Callable[[Any], Any]] = None) -> None:
+    """Grava ``obj`` de forma atômica (arquivo temporário + replace)."""
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_bytes(dumps_bytes(obj, indent=indent, default=default))
+    tmp_path.replace(path)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse que serializa com ``dumps_bytes`` (orjson quando disponível)."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps_bytes(content)
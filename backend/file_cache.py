@@ -0,0 +1,412 @@
+"""
+Cache local limitado para arquivos baixados do Supabase Storage.
+
+``resolver_caminho_documento`` usa ``data/`` como cache de tudo o que já
+baixou do bucket. Sem limite, o disco efêmero do Render enche. Este módulo
+controla só os arquivos que vieram do bucket (o que foi criado localmente e
+ainda não subiu continua sendo a fonte da verdade e nunca é removido):
+
+    - orçamento em bytes com despejo LRU (o menos acessado sai primeiro)
+    - pinagem: arquivos em uso por um pipeline em andamento não são despejados
+    - checksum: sha256 gravado no download e comparado com
+      ``Documento.content_hash``; arquivo adulterado/truncado é baixado de novo
+    - single-flight: requisições simultâneas pelo mesmo arquivo esperam um
+      único download (inclusive ``lookup``, que não conta um arquivo como hit
+      enquanto ele está sendo baixado)
+    - download atômico: o arquivo é baixado para ``.<nome>.<id>.part`` no
+      mesmo diretório e só entra no lugar (``os.replace``) depois de
+      conferido; falha no meio não deixa arquivo truncado no caminho final
+    - métricas de hit/miss (``stats()``)
+
+O índice fica em ``data/file_cache.db`` para que o orçamento sobreviva a
+restarts.
+
+Pinagem por escopo:
+    with pin_scope():
+        caminho = storage.resolver_caminho_documento(doc)   # fica pinado
+        ...
+    # ao sair do escopo os arquivos voltam a poder ser despejados
+
+Configuração (env):
+    STORAGE_FILE_CACHE_MAX_MB=2048    (0 desliga o limite)
+"""
+
+import contextlib
+import contextvars
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional, Set, Tuple, Union
+
+from sqlite_pool import sqlite_pool
+
+
+logger = logging.getLogger("file_cache")
+
+_MAX_BYTES = int(float(os.environ.get("STORAGE_FILE_CACHE_MAX_MB", "2048")) * 1024 * 1024)
+
+# Caminhos resolvidos dentro do pin_scope() atual (None = sem escopo)
+_pin_scope_ctx: contextvars.ContextVar[Optional[Set[Tuple["FileCache", str]]]] = contextvars.ContextVar(
+    "file_cache_pin_scope", default=None
+)
+
+
+@contextlib.contextmanager
+def pin_scope() -> Iterator[None]:
+    """Pina todo arquivo resolvido dentro do bloco até o bloco terminar (aninhável)."""
+    if _pin_scope_ctx.get() is not None:
+        yield
+        return
+    pinned: Set[Tuple["FileCache", str]] = set()
+    token = _pin_scope_ctx.set(pinned)
+    try:
+        yield
+    finally:
+        _pin_scope_ctx.reset(token)
+        for cache, key in pinned:
+            cache.unpin(key)
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FileCache:
+    """Índice LRU dos arquivos baixados sob ``root``."""
+
+    def __init__(self, root: Union[str, Path], index_path: Union[str, Path] = None,
+                 max_bytes: int = None):
+        self.root = Path(root)
+        self.index_path = Path(index_path) if index_path else self.root / "file_cache.db"
+        self.max_bytes = _MAX_BYTES if max_bytes is None else max_bytes
+
+        self._lock = threading.Lock()
+        # chave (caminho relativo) -> (tamanho, sha256); ordem = LRU
+        self._entries: "OrderedDict[str, Tuple[int, Optional[str]]]" = OrderedDict()
+        self._used_bytes = 0
+        self._pins: Dict[str, int] = {}
+        # chave -> Future[bool] do download em curso (single-flight)
+        self._inflight: Dict[str, Future] = {}
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "downloads": 0,
+            "download_failures": 0,
+            "bytes_downloaded": 0,
+            "coalesced": 0,
+            "evictions": 0,
+            "bytes_evicted": 0,
+            "checksum_failures": 0,
+        }
+        self._load_index()
+
+    # ------------------------------------------------------------
+    # Índice persistente
+    # ------------------------------------------------------------
+
+    def _load_index(self) -> None:
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite_pool.get(self.index_path)
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS file_cache (
+                    caminho TEXT PRIMARY KEY,
+                    tamanho_bytes INTEGER NOT NULL,
+                    sha256 TEXT,
+                    ultimo_acesso REAL NOT NULL
+                )
+            ''')
+            conn.commit()
+            rows = conn.execute(
+                "SELECT caminho, tamanho_bytes, sha256 FROM file_cache ORDER BY ultimo_acesso"
+            ).fetchall()
+        finally:
+            conn.close()
+
+        stale = []
+        for row in rows:
+            if (self.root / row["caminho"]).exists():
+                self._entries[row["caminho"]] = (row["tamanho_bytes"], row["sha256"])
+                self._used_bytes += row["tamanho_bytes"]
+            else:
+                stale.append(row["caminho"])
+        if stale:
+            self._delete_rows(stale)
+
+    def _upsert_row(self, key: str, size: int, sha: Optional[str]) -> None:
+        conn = sqlite_pool.get(self.index_path)
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO file_cache (caminho, tamanho_bytes, sha256, ultimo_acesso) "
+                "VALUES (?, ?, ?, ?)",
+                (key, size, sha, time.time()),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _touch_row(self, key: str) -> None:
+        conn = sqlite_pool.get(self.index_path)
+        try:
+            conn.execute("UPDATE file_cache SET ultimo_acesso = ? WHERE caminho = ?", (time.time(), key))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _delete_rows(self, keys) -> None:
+        conn = sqlite_pool.get(self.index_path)
+        try:
+            conn.executemany("DELETE FROM file_cache WHERE caminho = ?", [(key,) for key in keys])
+            conn.commit()
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------
+
+    def key_for(self, path: Union[str, Path]) -> str:
+        path = Path(path)
+        try:
+            return path.relative_to(self.root).as_posix()
+        except ValueError:
+            return path.as_posix()
+
+    def lookup(self, path: Path, expected_sha256: str = None) -> bool:
+        """
+        True se ``path`` existe e está íntegro (conta hit/miss e atualiza o LRU).
+
+        Arquivos criados localmente (fora do índice) contam como hit sem
+        verificação. Para arquivos baixados, tamanho diferente do registrado
+        ou sha256 diferente de ``expected_sha256`` invalidam a entrada. O
+        arquivo só é apagado se ainda tiver os bytes que o cache gravou;
+        reescrito por outro caminho (ex.: ``salvar_documento`` com o mesmo
+        nome), perde só a entrada do índice e continua local.
+        """
+        key = self.key_for(path)
+        self._wait_inflight(key)
+        if not path.exists():
+            self._forget(key, unlink=False)
+            self._count("misses")
+            return False
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None:
+            size, sha = entry
+            corrupted = path.stat().st_size != size or (
+                expected_sha256 is not None and sha is not None and sha != expected_sha256
+            )
+            if corrupted:
+                atual = _sha256(path)
+                if sha is not None and atual == sha:
+                    # Versão antiga que o próprio cache baixou: pode sair
+                    logger.warning("[file-cache] arquivo inválido no cache, baixando de novo: %s", key)
+                    self._count("checksum_failures")
+                    self._forget(key, unlink=True)
+                    self._count("misses")
+                    return False
+                # Não são os bytes que o cache gravou: a entrada é que está velha
+                logger.info("[file-cache] arquivo reescrito fora do cache, entrada descartada: %s", key)
+                self._forget(key, unlink=False)
+                if expected_sha256 is not None and atual != expected_sha256:
+                    self._count("misses")
+                    return False
+            else:
+                self._touch_row(key)
+
+        self._count("hits")
+        self._pin_in_scope(key)
+        return True
+
+    def fetch(self, path: Path, download: Callable[[Path], bool],
+              expected_sha256: str = None) -> bool:
+        """
+        Baixa ``path`` com ``download(path) -> bool`` (single-flight por caminho).
+
+        Só um thread baixa; os demais esperam e reaproveitam o resultado.
+        """
+        key = self.key_for(path)
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+        if not leader:
+            self._count("coalesced")
+            ok = future.result()
+            if ok:
+                self._pin_in_scope(key)
+            return ok
+
+        ok = False
+        try:
+            ok = self._download(key, path, download, expected_sha256)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_result(ok)
+        if ok:
+            self._pin_in_scope(key)
+        return ok
+
+    def wait(self, path: Union[str, Path]) -> None:
+        """Bloqueia enquanto ``path`` estiver sendo baixado por outro thread."""
+        self._wait_inflight(self.key_for(path))
+
+    def _wait_inflight(self, key: str) -> None:
+        with self._lock:
+            future = self._inflight.get(key)
+        if future is not None:
+            future.result()
+
+    def _download(self, key: str, path: Path, download: Callable[[Path], bool],
+                  expected_sha256: Optional[str]) -> bool:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Mesmo diretório: os.replace é atômico e nunca reescreve o inode que
+        # estava no caminho (pode ser um hardlink de data/blobs)
+        tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.part")
+        try:
+            ok = False
+            try:
+                ok = bool(download(tmp))
+            except Exception as exc:
+                logger.warning("[file-cache] download falhou para %s: %s", key, exc)
+            if not ok or not tmp.exists():
+                self._count("download_failures")
+                return False
+
+            sha = _sha256(tmp)
+            if expected_sha256 and sha != expected_sha256:
+                logger.error("[file-cache] checksum não confere para %s (esperado %s, recebido %s)",
+                             key, expected_sha256[:12], sha[:12])
+                self._count("checksum_failures")
+                return False
+
+            size = tmp.stat().st_size
+            os.replace(tmp, path)
+        finally:
+            try:
+                tmp.unlink()
+            except FileNotFoundError:
+                pass
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._used_bytes -= previous[0]
+            self._entries[key] = (size, sha)
+            self._used_bytes += size
+            self._stats["downloads"] += 1
+            self._stats["bytes_downloaded"] += size
+        self._upsert_row(key, size, sha)
+        # O recém-baixado é pinado durante o despejo para não sair na hora
+        self.pin(key)
+        try:
+            self._evict()
+        finally:
+            self.unpin(key)
+        return True
+
+    def _evict(self) -> None:
+        if self.max_bytes <= 0:
+            return
+        removed = []
+        with self._lock:
+            for key in list(self._entries):
+                if self._used_bytes <= self.max_bytes:
+                    break
+                if self._pins.get(key):
+                    continue
+                size, _ = self._entries.pop(key)
+                self._used_bytes -= size
+                self._stats["evictions"] += 1
+                self._stats["bytes_evicted"] += size
+                removed.append((key, size))
+        for key, size in removed:
+            path = self.root / key
+            try:
+                # Tamanho diferente: reescrito fora do cache, não é nosso para apagar
+                if path.stat().st_size == size:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
+        if removed:
+            self._delete_rows([key for key, _ in removed])
+            logger.info("[file-cache] %s arquivo(s) despejado(s); em uso %.1f MB",
+                        len(removed), self._used_bytes / (1024 * 1024))
+
+    def forget(self, path: Union[str, Path]) -> None:
+        """Remove do índice (ex.: documento deletado); não apaga o arquivo."""
+        self._forget(self.key_for(path), unlink=False)
+
+    def _forget(self, key: str, unlink: bool) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._used_bytes -= entry[0]
+        if entry is None:
+            return
+        if unlink:
+            try:
+                (self.root / key).unlink()
+            except FileNotFoundError:
+                pass
+        self._delete_rows([key])
+
+    # ------------------------------------------------------------
+    # Pinagem
+    # ------------------------------------------------------------
+
+    def pin(self, key: str) -> None:
+        with self._lock:
+            self._pins[key] = self._pins.get(key, 0) + 1
+
+    def unpin(self, key: str) -> None:
+        with self._lock:
+            count = self._pins.get(key, 0) - 1
+            if count > 0:
+                self._pins[key] = count
+            else:
+                self._pins.pop(key, None)
+
+    def _pin_in_scope(self, key: str) -> None:
+        scope = _pin_scope_ctx.get()
+        if scope is None or (self, key) in scope:
+            return
+        scope.add((self, key))
+        self.pin(key)
+
+    # ------------------------------------------------------------
+    # Métricas
+    # ------------------------------------------------------------
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += amount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+            stats.update({
+                "entries": len(self._entries),
+                "used_bytes": self._used_bytes,
+                "max_bytes": self.max_bytes,
+                "pinned": len(self._pins),
+            })
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / total, 4) if total else None
+        return stats
@@ -12,7 +12,7 @@ Endpoints organizados por recurso:
 - /api/status
 """
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query, Request
+from fastapi import FastAPI, UploadFile, File, Form, Header, HTTPException, Query, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
@@ -36,7 +36,12 @@ from models import (
     TipoDocumento, StatusProcessamento, NivelEnsino,
     verificar_dependencias
 )
-from storage import StorageManager, storage
+from storage import StorageManager, AsyncStorageManager, storage
+from streaming import ndjson_response, wants_ndjson
+import ai_http
+import task_cancel
+import task_queue
+from fast_json import FastJSONResponse
 from ai_providers import (
     ai_registry,
     setup_providers_from_env,
@@ -221,13 +226,14 @@ async def lifespan(app: FastAPI):
         print(f"[ERROR] Erro ao carregar providers: {e}")
         import traceback
         traceback.print_exc()
+    ai_http.startup()
 
     # Demo seeding is opt-in only. Production/Supabase must never mutate data on startup.
     initialize_fantasy_data_if_empty()
 
     if _demo_seeding_enabled():
         try:
-            report = storage.cleanup_duplicate_materias()
+            report = await astorage.cleanup_duplicate_materias()
             if report["duplicates_removed"] > 0:
                 print(f"[CLEANUP] Removed {report['duplicates_removed']} duplicate matérias, reassigned {report['turmas_reassigned']} turmas")
         except Exception as e:
@@ -235,13 +241,45 @@ async def lifespan(app: FastAPI):
     else:
         print("[OK] Startup matéria dedup disabled; skipping destructive cleanup")
 
+    # Fila durável de tarefas: retoma execuções interrompidas por deploy/crash.
+    # inline: threads neste processo; local: processos worker.py; external: só enfileira
+    worker_pool = None
+    try:
+        from routes_tasks import prune_tasks
+        prune_tasks()
+        mode = task_queue.worker_mode()
+        if mode == "inline" and task_queue.start_worker():
+            print(f"[OK] Task queue (inline): {task_queue.queue_stats().get('runs')}")
+        elif mode == "local":
+            from worker import start_local_pool
+            worker_pool = start_local_pool()
+            if worker_pool:
+                print(f"[OK] Task queue (local): {worker_pool.processes} processo(s) worker")
+        elif mode == "external":
+            print("[OK] Task queue (external): execuções ficam para `python -m worker`")
+    except Exception as e:
+        print(f"[ERROR] Task queue não iniciou: {e}")
+    app.state.worker_pool = worker_pool
+
     yield
 
+    task_queue.stop_worker()
+    if worker_pool is not None:
+        worker_pool.close()
+    await ai_http.aclose()
+
+    # Dá uma chance aos uploads em segundo plano; o que sobrar fica no journal
+    if not await astorage.flush_uploads(10.0):
+        print(f"[WARN] Uploads pendentes no shutdown: {storage.get_upload_queue_stats().get('depth')}")
+    storage.close()
+    storage.events.close()
+
 app = FastAPI(
     title="NOVO CR - Sistema de Correção v2.0",
     description="Sistema de correção automatizada de provas com IA",
     version="2.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
 )
 
 # CORS
@@ -355,6 +393,9 @@ if HAS_COSTS:
 
 # Storage já importado diretamente de storage.py
 
+# Fachada async: resolve `storage` a cada chamada (mantém patch("main_v2.storage") nos testes)
+astorage = AsyncStorageManager(resolver=lambda: storage)
+
 
 # ============================================================
 # MODELOS PYDANTIC (Request/Response)
@@ -463,26 +504,26 @@ class VerificacaoRequest(BaseModel):
 async def criar_materia(data: MateriaCreate):
     """Cria uma nova matéria"""
     nivel = NivelEnsino(data.nivel) if data.nivel else NivelEnsino.OUTRO
-    materia = storage.criar_materia(data.nome, data.descricao, nivel)
+    materia = await astorage.criar_materia(data.nome, data.descricao, nivel)
     return {"success": True, "materia": materia.to_dict()}
 
 
 @app.get("/api/materias", tags=["Matérias"])
 async def listar_materias():
     """Lista todas as matérias"""
-    materias = storage.listar_materias()
+    materias = await astorage.listar_materias()
     return {"materias": [m.to_dict() for m in materias]}
 
 
 @app.get("/api/materias/{materia_id}", tags=["Matérias"])
 async def get_materia(materia_id: str):
     """Busca matéria por ID"""
-    materia = storage.get_materia(materia_id)
+    materia = await astorage.get_materia(materia_id)
     if not materia:
         raise HTTPException(404, "Matéria não encontrada")
     
     # Incluir turmas
-    turmas = storage.listar_turmas(materia_id)
+    turmas = await astorage.listar_turmas(materia_id)
     
     return {
         "materia": materia.to_dict(),
@@ -495,16 +536,18 @@ async def get_materia(materia_id: str):
 async def atualizar_materia(materia_id: str, data: MateriaUpdate):
     """Atualiza uma matéria"""
     updates = {k: v for k, v in data.dict().items() if v is not None}
-    materia = storage.atualizar_materia(materia_id, **updates)
+    materia = await astorage.atualizar_materia(materia_id, **updates)
     if not materia:
         raise HTTPException(404, "Matéria não encontrada")
     return {"success": True, "materia": materia.to_dict()}
 
 
 @app.delete("/api/materias/{materia_id}", tags=["Matérias"])
-async def deletar_materia(materia_id: str):
-    """Deleta uma matéria e todos os dados relacionados"""
-    success = storage.deletar_materia(materia_id)
+async def deletar_materia(materia_id: str, dry_run: bool = False):
+    """Deleta uma matéria e todos os dados relacionados (``dry_run=true`` só conta o que seria apagado)"""
+    if dry_run:
+        return await astorage.excluir_em_cascata("materia", materia_id, dry_run=True)
+    success = await astorage.deletar_materia(materia_id)
     if not success:
         raise HTTPException(404, "Matéria não encontrada")
     return {"success": True, "deleted": materia_id}
@@ -517,7 +560,7 @@ async def deletar_materia(materia_id: str):
 @app.post("/api/turmas", tags=["Turmas"])
 async def criar_turma(data: TurmaCreate):
     """Cria uma nova turma dentro de uma matéria"""
-    turma = storage.criar_turma(
+    turma = await astorage.criar_turma(
         materia_id=data.materia_id,
         nome=data.nome,
         ano_letivo=data.ano_letivo,
@@ -532,20 +575,20 @@ async def criar_turma(data: TurmaCreate):
 @app.get("/api/turmas", tags=["Turmas"])
 async def listar_turmas(materia_id: Optional[str] = None):
     """Lista turmas, opcionalmente filtradas por matéria"""
-    turmas = storage.listar_turmas(materia_id)
+    turmas = await astorage.listar_turmas(materia_id)
     return {"turmas": [t.to_dict() for t in turmas]}
 
 
 @app.get("/api/turmas/{turma_id}", tags=["Turmas"])
 async def get_turma(turma_id: str):
     """Busca turma por ID com detalhes"""
-    turma = storage.get_turma(turma_id)
+    turma = await astorage.get_turma(turma_id)
     if not turma:
         raise HTTPException(404, "Turma não encontrada")
     
-    materia = storage.get_materia(turma.materia_id)
-    alunos = storage.listar_alunos(turma_id)
-    atividades = storage.listar_atividades(turma_id)
+    materia = await astorage.get_materia(turma.materia_id)
+    alunos = await astorage.listar_alunos(turma_id)
+    atividades = await astorage.listar_atividades(turma_id)
     
     return {
         "turma": turma.to_dict(),
@@ -558,9 +601,11 @@ async def get_turma(turma_id: str):
 
 
 @app.delete("/api/turmas/{turma_id}", tags=["Turmas"])
-async def deletar_turma(turma_id: str):
-    """Deleta uma turma e todos os dados relacionados"""
-    success = storage.deletar_turma(turma_id)
+async def deletar_turma(turma_id: str, dry_run: bool = False):
+    """Deleta uma turma e todos os dados relacionados (``dry_run=true`` só conta o que seria apagado)"""
+    if dry_run:
+        return await astorage.excluir_em_cascata("turma", turma_id, dry_run=True)
+    success = await astorage.deletar_turma(turma_id)
     if not success:
         raise HTTPException(404, "Turma não encontrada")
     return {"success": True, "deleted": turma_id}
@@ -573,21 +618,21 @@ async def deletar_turma(turma_id: str):
 @app.post("/api/alunos", tags=["Alunos"])
 async def criar_aluno(data: AlunoCreate):
     """Cria um novo aluno"""
-    aluno = storage.criar_aluno(data.nome, data.email, data.matricula)
+    aluno = await astorage.criar_aluno(data.nome, data.email, data.matricula)
     return {"success": True, "aluno": aluno.to_dict()}
 
 
 @app.get("/api/alunos", tags=["Alunos"])
 async def listar_alunos(turma_id: Optional[str] = None):
     """Lista alunos, opcionalmente filtrados por turma"""
-    alunos = storage.listar_alunos(turma_id)
+    alunos = await astorage.listar_alunos(turma_id)
     return {"alunos": [a.to_dict() for a in alunos]}
 
 
 @app.get("/api/alunos/{aluno_id}", tags=["Alunos"])
 async def get_aluno(aluno_id: str):
     """Busca aluno por ID com suas turmas"""
-    data = storage.get_aluno_detalhes_fast(aluno_id)
+    data = await astorage.get_aluno_detalhes_fast(aluno_id)
     if not data:
         raise HTTPException(404, "Aluno não encontrado")
     return data
@@ -596,16 +641,18 @@ async def get_aluno(aluno_id: str):
 @app.get("/api/alunos/{aluno_id}/visao", tags=["Alunos"])
 async def get_visao_aluno(aluno_id: str):
     """Visão aluno > matéria > turma > atividade."""
-    data = storage.get_visao_aluno(aluno_id)
+    data = await astorage.get_visao_aluno(aluno_id)
     if not data:
         raise HTTPException(404, "Aluno não encontrado")
     return data
 
 
 @app.delete("/api/alunos/{aluno_id}", tags=["Alunos"])
-async def deletar_aluno(aluno_id: str):
-    """Deleta um aluno"""
-    success = storage.deletar_aluno(aluno_id)
+async def deletar_aluno(aluno_id: str, dry_run: bool = False):
+    """Deleta um aluno (``dry_run=true`` só conta o que seria apagado)"""
+    if dry_run:
+        return await astorage.excluir_em_cascata("aluno", aluno_id, dry_run=True)
+    success = await astorage.deletar_aluno(aluno_id)
     if not success:
         raise HTTPException(404, "Aluno não encontrado")
     return {"success": True, "deleted": aluno_id}
@@ -614,7 +661,7 @@ async def deletar_aluno(aluno_id: str):
 @app.post("/api/alunos/vincular", tags=["Alunos"])
 async def vincular_aluno_turma(data: VinculoAlunoTurma):
     """Vincula um aluno a uma turma"""
-    vinculo = storage.vincular_aluno_turma(data.aluno_id, data.turma_id, data.observacoes)
+    vinculo = await astorage.vincular_aluno_turma(data.aluno_id, data.turma_id, data.observacoes)
     if not vinculo:
         raise HTTPException(400, "Aluno ou turma não encontrados, ou vínculo já existe")
     return {"success": True, "vinculo": vinculo.to_dict()}
@@ -623,7 +670,7 @@ async def vincular_aluno_turma(data: VinculoAlunoTurma):
 @app.post("/api/alunos/desvincular", tags=["Alunos"])
 async def desvincular_aluno_turma(data: VinculoAlunoTurma):
     """Remove vínculo aluno-turma"""
-    success = storage.desvincular_aluno_turma(data.aluno_id, data.turma_id)
+    success = await astorage.desvincular_aluno_turma(data.aluno_id, data.turma_id)
     if not success:
         raise HTTPException(404, "Vínculo não encontrado")
     return {"success": True}
@@ -640,7 +687,7 @@ async def criar_atividade(data: AtividadeCreate):
     if data.data_aplicacao:
         data_aplicacao = datetime.fromisoformat(data.data_aplicacao)
     
-    atividade = storage.criar_atividade(
+    atividade = await astorage.criar_atividade(
         turma_id=data.turma_id,
         nome=data.nome,
         tipo=data.tipo,
@@ -656,26 +703,28 @@ async def criar_atividade(data: AtividadeCreate):
 @app.get("/api/atividades", tags=["Atividades"])
 async def listar_atividades(turma_id: str):
     """Lista atividades de uma turma"""
-    atividades = storage.listar_atividades(turma_id)
+    atividades = await astorage.listar_atividades(turma_id)
     return {"atividades": [a.to_dict() for a in atividades]}
 
 
 @app.get("/api/atividades/{atividade_id}", tags=["Atividades"])
 async def get_atividade(atividade_id: str):
     """Busca atividade por ID com status completo"""
-    atividade = storage.get_atividade(atividade_id)
+    atividade = await astorage.get_atividade(atividade_id)
     if not atividade:
         raise HTTPException(404, "Atividade não encontrada")
     
-    status = storage.get_status_atividade(atividade_id)
+    status = await astorage.get_status_atividade(atividade_id)
     
     return status
 
 
 @app.delete("/api/atividades/{atividade_id}", tags=["Atividades"])
-async def deletar_atividade(atividade_id: str):
-    """Deleta uma atividade e todos os documentos"""
-    success = storage.deletar_atividade(atividade_id)
+async def deletar_atividade(atividade_id: str, dry_run: bool = False):
+    """Deleta uma atividade e todos os documentos (``dry_run=true`` só conta o que seria apagado)"""
+    if dry_run:
+        return await astorage.excluir_em_cascata("atividade", atividade_id, dry_run=True)
+    success = await astorage.deletar_atividade(atividade_id)
     if not success:
         raise HTTPException(404, "Atividade não encontrada")
     return {"success": True, "deleted": atividade_id}
@@ -721,7 +770,7 @@ async def upload_documento(
     
     try:
         # Salvar documento
-        documento = storage.salvar_documento(
+        documento = await astorage.salvar_documento(
             arquivo_origem=tmp_path,
             tipo=tipo_doc,
             atividade_id=atividade_id,
@@ -749,18 +798,44 @@ async def upload_documento(
 async def listar_documentos(
     atividade_id: str,
     aluno_id: Optional[str] = None,
-    tipo: Optional[str] = None
+    tipo: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    formato: Optional[str] = None,
+    accept: Optional[str] = Header(None),
 ):
-    """Lista documentos com filtros"""
+    """Lista documentos com filtros.
+
+    ``cursor``/``limit`` paginam (keyset, mais recentes primeiro, devolve
+    ``next_cursor``); ``formato=ndjson`` transmite um documento por linha.
+    """
     tipo_doc = TipoDocumento(tipo) if tipo else None
-    documentos = storage.listar_documentos(atividade_id, aluno_id, tipo_doc)
-    return {"documentos": [d.to_dict() for d in documentos]}
+
+    async def _pagina(page_cursor: Optional[str]) -> Dict[str, Any]:
+        return await astorage.listar_documentos_pagina(
+            atividade_id, aluno_id, tipo_doc, cursor=page_cursor, limit=limit or 500, leve=True,
+        )
+
+    if wants_ndjson(formato, accept) or cursor or limit:
+        try:
+            pagina = await _pagina(cursor)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        if wants_ndjson(formato, accept):
+            return ndjson_response(pagina, _pagina, "documentos", serializar=lambda d: d.to_dict())
+        return FastJSONResponse({
+            "documentos": [d.to_dict() for d in pagina["documentos"]],
+            "next_cursor": pagina["next_cursor"],
+        })
+
+    documentos = await astorage.listar_documentos(atividade_id, aluno_id, tipo_doc)
+    return FastJSONResponse({"documentos": [d.to_dict() for d in documentos]})
 
 
 @app.get("/api/documentos/{documento_id}", tags=["Documentos"])
 async def get_documento(documento_id: str):
     """Busca documento por ID"""
-    documento = storage.get_documento(documento_id)
+    documento = await astorage.get_documento(documento_id)
     if not documento:
         raise HTTPException(404, "Documento não encontrado")
     return {"documento": documento.to_dict()}
@@ -769,12 +844,12 @@ async def get_documento(documento_id: str):
 @app.get("/api/documentos/{documento_id}/download", tags=["Documentos"])
 async def download_documento(documento_id: str):
     """Faz download do arquivo (baixa do Supabase se necessário)"""
-    documento = storage.get_documento(documento_id)
+    documento = await astorage.get_documento(documento_id)
     if not documento:
         raise HTTPException(404, "Documento não encontrado")
 
     # Usar resolver_caminho_documento para baixar do Supabase se necessário
-    arquivo = storage.resolver_caminho_documento(documento)
+    arquivo = await astorage.resolver_caminho_documento(documento)
     if arquivo is None or not arquivo.exists():
         raise HTTPException(404, "Arquivo não encontrado no sistema")
 
@@ -788,37 +863,39 @@ async def download_documento(documento_id: str):
 @app.delete("/api/documentos/{documento_id}", tags=["Documentos"])
 async def deletar_documento(documento_id: str):
     """Deleta um documento"""
-    success = storage.deletar_documento(documento_id)
+    success = await astorage.deletar_documento(documento_id)
     if not success:
         raise HTTPException(404, "Documento não encontrado")
     return {"success": True, "deleted": documento_id}
 
 
 @app.delete("/api/atividades/{atividade_id}/alunos/{aluno_id}/documentos", tags=["Documentos"])
-async def deletar_documentos_aluno_atividade(atividade_id: str, aluno_id: str):
+async def deletar_documentos_aluno_atividade(atividade_id: str, aluno_id: str, dry_run: bool = False):
     """Deleta todos os documentos de um aluno em uma atividade específica"""
-    count = storage.deletar_documentos_aluno_atividade(atividade_id, aluno_id)
+    if dry_run:
+        return await astorage.excluir_em_cascata("aluno_atividade", (atividade_id, aluno_id), dry_run=True)
+    count = await astorage.deletar_documentos_aluno_atividade(atividade_id, aluno_id)
     return {"success": True, "deleted_count": count, "atividade_id": atividade_id, "aluno_id": aluno_id}
 
 
 @app.delete("/api/atividades/{atividade_id}/alunos/{aluno_id}/documentos/ai", tags=["Documentos"])
 async def deletar_documentos_ai_aluno_atividade(atividade_id: str, aluno_id: str):
     """Deleta apenas os documentos gerados por IA de um aluno em uma atividade específica"""
-    count = storage.excluir_documentos_ai_aluno_atividade(atividade_id, aluno_id)
+    count = await astorage.excluir_documentos_ai_aluno_atividade(atividade_id, aluno_id)
     return {"success": True, "deleted_count": count, "atividade_id": atividade_id, "aluno_id": aluno_id}
 
 
 @app.delete("/api/atividades/{atividade_id}/alunos/{aluno_id}/documentos/questoes", tags=["Documentos"])
 async def resetar_extracoes_questoes_aluno_atividade(atividade_id: str, aluno_id: str):
     """Reseta as extrações de questões de um aluno em uma atividade específica"""
-    count = storage.resetar_extracoes_questoes_aluno_atividade(atividade_id, aluno_id)
+    count = await astorage.resetar_extracoes_questoes_aluno_atividade(atividade_id, aluno_id)
     return {"success": True, "deleted_count": count, "atividade_id": atividade_id, "aluno_id": aluno_id}
 
 
 @app.put("/api/documentos/{documento_id}/renomear", tags=["Documentos"])
 async def renomear_documento(documento_id: str, novo_nome: str = Form(...)):
     """Renomeia um documento"""
-    documento = storage.renomear_documento(documento_id, novo_nome)
+    documento = await astorage.renomear_documento(documento_id, novo_nome)
     if not documento:
         raise HTTPException(404, "Documento não encontrado")
     return {"success": True, "documento": documento.to_dict()}
@@ -827,7 +904,7 @@ async def renomear_documento(documento_id: str, novo_nome: str = Form(...)):
 @app.get("/api/documentos/verificar-integridade", tags=["Documentos"])
 async def verificar_integridade_documentos(atividade_id: str):
     """Verifica quais documentos existem no disco vs banco de dados"""
-    documentos = storage.listar_documentos(atividade_id)
+    documentos = await astorage.listar_documentos(atividade_id)
     resultado = []
     for doc in documentos:
         arquivo = Path(doc.caminho_arquivo) if doc.caminho_arquivo else None
@@ -862,7 +939,7 @@ async def verificar_pode_processar(data: VerificacaoRequest):
     except ValueError:
         raise HTTPException(400, f"Tipo inválido: {data.tipo_alvo}")
     
-    resultado = storage.verificar_pode_processar(data.atividade_id, data.aluno_id, tipo_alvo)
+    resultado = await astorage.verificar_pode_processar(data.atividade_id, data.aluno_id, tipo_alvo)
     
     return {
         "tipo_alvo": data.tipo_alvo,
@@ -879,7 +956,7 @@ async def get_status_atividade(atividade_id: str):
     Retorna status completo de uma atividade.
     Inclui documentos existentes, faltantes, e status por aluno.
     """
-    status = storage.get_status_atividade(atividade_id)
+    status = await astorage.get_status_atividade(atividade_id)
     if "erro" in status:
         raise HTTPException(404, status["erro"])
     return status
@@ -896,7 +973,7 @@ async def get_arvore_navegacao():
     Estrutura: Matérias → Turmas → Atividades
     """
     try:
-        return storage.get_arvore_navegacao()
+        return FastJSONResponse(await astorage.get_arvore_navegacao())
     except Exception as e:
         logging.exception("Error in /api/navegacao/arvore")
         return {"materias": [], "_error": str(e)}
@@ -905,7 +982,7 @@ async def get_arvore_navegacao():
 @app.get("/api/navegacao/tree", tags=["Navegação"], include_in_schema=False)
 async def get_tree_navegacao():
     """Alias em inglês para /api/navegacao/arvore."""
-    return storage.get_arvore_navegacao()
+    return FastJSONResponse(await astorage.get_arvore_navegacao())
 
 
 @app.get("/api/navegacao/breadcrumb/{tipo}/{id}", tags=["Navegação"])
@@ -917,24 +994,24 @@ async def get_breadcrumb(tipo: str, id: str):
     breadcrumb = []
     
     if tipo == "materia":
-        materia = storage.get_materia(id)
+        materia = await astorage.get_materia(id)
         if materia:
             breadcrumb = [{"tipo": "materia", "id": materia.id, "nome": materia.nome}]
     
     elif tipo == "turma":
-        turma = storage.get_turma(id)
+        turma = await astorage.get_turma(id)
         if turma:
-            materia = storage.get_materia(turma.materia_id)
+            materia = await astorage.get_materia(turma.materia_id)
             breadcrumb = [
                 {"tipo": "materia", "id": materia.id, "nome": materia.nome},
                 {"tipo": "turma", "id": turma.id, "nome": turma.nome}
             ]
     
     elif tipo == "atividade":
-        atividade = storage.get_atividade(id)
+        atividade = await astorage.get_atividade(id)
         if atividade:
-            turma = storage.get_turma(atividade.turma_id)
-            materia = storage.get_materia(turma.materia_id) if turma else None
+            turma = await astorage.get_turma(atividade.turma_id)
+            materia = await astorage.get_materia(turma.materia_id) if turma else None
             breadcrumb = [
                 {"tipo": "materia", "id": materia.id, "nome": materia.nome} if materia else None,
                 {"tipo": "turma", "id": turma.id, "nome": turma.nome} if turma else None,
@@ -943,11 +1020,11 @@ async def get_breadcrumb(tipo: str, id: str):
             breadcrumb = [b for b in breadcrumb if b]
     
     elif tipo == "documento":
-        documento = storage.get_documento(id)
+        documento = await astorage.get_documento(id)
         if documento:
-            atividade = storage.get_atividade(documento.atividade_id)
-            turma = storage.get_turma(atividade.turma_id) if atividade else None
-            materia = storage.get_materia(turma.materia_id) if turma else None
+            atividade = await astorage.get_atividade(documento.atividade_id)
+            turma = await astorage.get_turma(atividade.turma_id) if atividade else None
+            materia = await astorage.get_materia(turma.materia_id) if turma else None
             breadcrumb = [
                 {"tipo": "materia", "id": materia.id, "nome": materia.nome} if materia else None,
                 {"tipo": "turma", "id": turma.id, "nome": turma.nome} if turma else None,
@@ -1151,12 +1228,53 @@ async def debug_supabase(prefix: str = ""):
     return result
 
 
+@app.get("/api/debug/storage-cache", tags=["Debug"])
+async def debug_storage_cache():
+    """Hit/miss do cache de entidades do StorageManager"""
+    return {
+        "backend": storage._backend_label(),
+        "entity_cache": storage.get_entity_cache_stats(),
+        "events": storage.events.stats(),
+        "blobs": storage.get_blob_stats(),
+        "uploads": storage.get_upload_queue_stats(),
+        "file_cache": storage.get_file_cache_stats(),
+        "database_pool": storage.get_database_pool_stats(),
+    }
+
+
+@app.get("/api/debug/task-queue", tags=["Debug"])
+async def debug_task_queue():
+    """Execuções da fila durável de tarefas por status e métricas do worker"""
+    stats = task_queue.queue_stats()
+    pool = getattr(app.state, "worker_pool", None)
+    if pool is not None:
+        stats["pool"] = pool.stats()
+    stats["cancel"] = task_cancel.stats()
+    return stats
+
+
+@app.get("/api/debug/ai-http", tags=["Debug"])
+async def debug_ai_http(reset_stats: bool = False):
+    """Conexões e latência por host do pool HTTP dos providers de IA"""
+    stats = ai_http.stats()
+    if reset_stats:
+        ai_http.reset_stats()
+    return stats
+
+
+@app.delete("/api/debug/storage-cache", tags=["Debug"])
+async def debug_storage_cache_clear(reset_stats: bool = False):
+    """Esvazia o cache de entidades (ex.: após editar o banco manualmente)"""
+    storage.clear_entity_cache(reset_stats=reset_stats)
+    return {"success": True, "entity_cache": storage.get_entity_cache_stats()}
+
+
 @app.get("/api/debug/documento/{documento_id}", tags=["Debug"])
 async def debug_documento(documento_id: str):
     """Debug de um documento específico"""
     from supabase_storage import supabase_storage
 
-    doc = storage.get_documento(documento_id)
+    doc = await astorage.get_documento(documento_id)
     if not doc:
         raise HTTPException(404, "Documento não encontrado")
 
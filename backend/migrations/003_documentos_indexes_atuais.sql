@@ -0,0 +1,31 @@
+-- =================================================================
+-- NOVO CR - Composite indexes + "current version" view for documentos
+-- =================================================================
+-- listar_documentos, _correcoes_concluidas_por_aluno,
+-- _documentos_da_ultima_execucao and get_status_atividade all filter
+-- documentos by (atividade_id, aluno_id, tipo, status) ordered by
+-- criado_em DESC. The single-column indexes from 001 force a scan of
+-- every historical version of an atividade.
+--
+-- documentos_atuais keeps only the newest row per
+-- (atividade_id, aluno_id, tipo, extensao, status) so callers can fetch
+-- current artifacts (StorageManager.listar_documentos_atuais) instead of
+-- every retry ever produced. status is part of the key so "latest
+-- concluido" stays answerable after a newer attempt failed.
+--
+-- Safe to re-run.
+-- =================================================================
+
+CREATE INDEX IF NOT EXISTS idx_documentos_ativ_aluno_tipo_criado
+    ON documentos(atividade_id, aluno_id, tipo, criado_em DESC);
+
+CREATE INDEX IF NOT EXISTS idx_documentos_ativ_tipo_status_criado
+    ON documentos(atividade_id, tipo, status, criado_em DESC);
+
+CREATE OR REPLACE VIEW documentos_atuais AS
+SELECT DISTINCT ON (atividade_id, aluno_id, tipo, extensao, status) *
+FROM documentos
+ORDER BY atividade_id, aluno_id, tipo, extensao, status, criado_em DESC, id DESC;
+
+-- PostgREST only exposes new relations after a schema reload
+NOTIFY pgrst, 'reload schema';
@@ -0,0 +1,32 @@
+-- =================================================================
+-- NOVO CR - Content-addressed file storage (sha256)
+-- =================================================================
+-- salvar_documento now stores each distinct file content once
+-- (backend/blob_store.py) and records its sha256 on the documento row.
+--
+-- blobs maps a content hash to the bucket path where that content was
+-- first uploaded. Later documentos with the same hash skip the upload and
+-- download from that path instead. StorageManager.coletar_blobs_orfaos
+-- (POST /api/manutencao/blobs/gc) deletes rows/objects whose hash is no
+-- longer referenced by any documento.
+--
+-- Until this runs, content_hash is silently dropped on insert and every
+-- file is uploaded as before.
+--
+-- Safe to re-run.
+-- =================================================================
+
+ALTER TABLE documentos ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_documentos_content_hash
+    ON documentos(content_hash);
+
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    remote_path TEXT NOT NULL,
+    tamanho_bytes BIGINT DEFAULT 0,
+    criado_em TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- PostgREST only exposes new relations after a schema reload
+NOTIFY pgrst, 'reload schema';
@@ -0,0 +1,94 @@
+-- =================================================================
+-- NOVO CR - Server-side aggregation for dashboard statistics
+-- =================================================================
+-- GET /api/estatisticas used to pull one (atividade_id, tipo) row per
+-- documento over PostgREST just to count them and find atividades
+-- without a gabarito.
+--
+-- documento_contadores keeps, per atividade, the number of documentos
+-- and of gabaritos. Triggers maintain it on insert/delete (and on
+-- updates that move a documento to another atividade/tipo).
+--
+-- estatisticas_gerais() returns every dashboard total as one JSON object
+-- (StorageManager.get_estatisticas_gerais_fast calls it via RPC). Until
+-- this runs, the backend keeps using the old row-by-row path.
+--
+-- Safe to re-run (the backfill recomputes every counter).
+-- =================================================================
+
+CREATE TABLE IF NOT EXISTS documento_contadores (
+    atividade_id TEXT PRIMARY KEY,
+    total BIGINT NOT NULL DEFAULT 0,
+    gabaritos BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE OR REPLACE FUNCTION documento_contadores_trigger()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE documento_contadores SET
+            total = total - 1,
+            gabaritos = gabaritos - (OLD.tipo = 'gabarito')::int
+        WHERE atividade_id = OLD.atividade_id;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO documento_contadores (atividade_id, total, gabaritos)
+        VALUES (NEW.atividade_id, 1, (NEW.tipo = 'gabarito')::int)
+        ON CONFLICT (atividade_id) DO UPDATE SET
+            total = documento_contadores.total + 1,
+            gabaritos = documento_contadores.gabaritos + EXCLUDED.gabaritos;
+    END IF;
+
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_documento_contadores_insert ON documentos;
+CREATE TRIGGER trg_documento_contadores_insert
+    AFTER INSERT ON documentos
+    FOR EACH ROW EXECUTE FUNCTION documento_contadores_trigger();
+
+DROP TRIGGER IF EXISTS trg_documento_contadores_delete ON documentos;
+CREATE TRIGGER trg_documento_contadores_delete
+    AFTER DELETE ON documentos
+    FOR EACH ROW EXECUTE FUNCTION documento_contadores_trigger();
+
+DROP TRIGGER IF EXISTS trg_documento_contadores_update ON documentos;
+CREATE TRIGGER trg_documento_contadores_update
+    AFTER UPDATE OF atividade_id, tipo ON documentos
+    FOR EACH ROW
+    WHEN (OLD.atividade_id IS DISTINCT FROM NEW.atividade_id OR OLD.tipo IS DISTINCT FROM NEW.tipo)
+    EXECUTE FUNCTION documento_contadores_trigger();
+
+-- Backfill (LOCK: no insert/delete between the recount and the triggers)
+BEGIN;
+LOCK TABLE documentos IN SHARE MODE;
+DELETE FROM documento_contadores;
+INSERT INTO documento_contadores (atividade_id, total, gabaritos)
+SELECT atividade_id, COUNT(*), COUNT(*) FILTER (WHERE tipo = 'gabarito')
+FROM documentos
+GROUP BY atividade_id;
+COMMIT;
+
+CREATE OR REPLACE FUNCTION estatisticas_gerais()
+RETURNS json
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT json_build_object(
+        'total_materias', (SELECT COUNT(*) FROM materias),
+        'total_turmas', (SELECT COUNT(*) FROM turmas),
+        'total_alunos', (SELECT COUNT(*) FROM alunos),
+        'total_atividades', COUNT(a.id),
+        'total_documentos', COALESCE(SUM(c.total), 0),
+        'atividades_sem_gabarito', COUNT(a.id) FILTER (WHERE COALESCE(c.gabaritos, 0) = 0)
+    )
+    FROM atividades a
+    LEFT JOIN documento_contadores c ON c.atividade_id = a.id;
+$$;
+
+-- PostgREST only exposes new relations/functions after a schema reload
+NOTIFY pgrst, 'reload schema';
@@ -0,0 +1,40 @@
+-- =================================================================
+-- NOVO CR - Atomic metadata patch for documentos
+-- =================================================================
+-- StorageManager.atualizar_documento_processamento used to read the
+-- documento, rewrite the whole metadata object and read it again: three
+-- round-trips per cost/status patch, and two pipeline stages patching
+-- the same documento could overwrite each other's keys.
+--
+-- documento_patch() does it in one UPDATE ... RETURNING:
+--   p_campos   - column values to set (ia_provider, ia_modelo,
+--                prompt_usado, tokens_usados, tempo_processamento_ms,
+--                status); absent keys keep the current value
+--   p_metadata - merged into metadata with jsonb || (top-level keys
+--                replaced, the others kept)
+--
+-- Returns the updated row (empty set if the id does not exist). Until
+-- this runs, the backend keeps using the read-modify-write path.
+--
+-- Safe to re-run.
+-- =================================================================
+
+CREATE OR REPLACE FUNCTION documento_patch(p_id TEXT, p_campos JSONB, p_metadata JSONB)
+RETURNS SETOF documentos
+LANGUAGE sql
+AS $$
+    UPDATE documentos SET
+        ia_provider = COALESCE(p_campos->>'ia_provider', ia_provider),
+        ia_modelo = COALESCE(p_campos->>'ia_modelo', ia_modelo),
+        prompt_usado = COALESCE(p_campos->>'prompt_usado', prompt_usado),
+        tokens_usados = COALESCE((p_campos->>'tokens_usados')::INTEGER, tokens_usados),
+        tempo_processamento_ms = COALESCE((p_campos->>'tempo_processamento_ms')::REAL, tempo_processamento_ms),
+        status = COALESCE(p_campos->>'status', status),
+        metadata = COALESCE(metadata, '{}'::jsonb) || COALESCE(p_metadata, '{}'::jsonb),
+        atualizado_em = NOW()
+    WHERE id = p_id
+    RETURNING *;
+$$;
+
+-- PostgREST only exposes new functions after a schema reload
+NOTIFY pgrst, 'reload schema';
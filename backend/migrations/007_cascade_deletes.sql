@@ -0,0 +1,58 @@
+-- =================================================================
+-- NOVO CR - ON DELETE CASCADE for the whole hierarchy
+-- =================================================================
+-- StorageManager.excluir_em_cascata deletes a matéria, turma, atividade
+-- or aluno with ONE PostgREST DELETE on the root row and lets Postgres
+-- remove the children in the same statement (= one transaction).
+--
+-- Databases created before 001 declared the foreign keys (or edited by
+-- hand in the dashboard) may miss the CASCADE clause; this re-creates
+-- every foreign key of the hierarchy with it. documentos.aluno_id moves
+-- from SET NULL to CASCADE: deletar_aluno already removed the aluno's
+-- documentos explicitly, now the database does it.
+--
+-- Also indexes resultados on the FK columns (cascades scan them).
+--
+-- Safe to re-run.
+-- =================================================================
+
+BEGIN;
+
+ALTER TABLE turmas
+    DROP CONSTRAINT IF EXISTS turmas_materia_id_fkey,
+    ADD CONSTRAINT turmas_materia_id_fkey
+        FOREIGN KEY (materia_id) REFERENCES materias(id) ON DELETE CASCADE;
+
+ALTER TABLE alunos_turmas
+    DROP CONSTRAINT IF EXISTS alunos_turmas_aluno_id_fkey,
+    ADD CONSTRAINT alunos_turmas_aluno_id_fkey
+        FOREIGN KEY (aluno_id) REFERENCES alunos(id) ON DELETE CASCADE,
+    DROP CONSTRAINT IF EXISTS alunos_turmas_turma_id_fkey,
+    ADD CONSTRAINT alunos_turmas_turma_id_fkey
+        FOREIGN KEY (turma_id) REFERENCES turmas(id) ON DELETE CASCADE;
+
+ALTER TABLE atividades
+    DROP CONSTRAINT IF EXISTS atividades_turma_id_fkey,
+    ADD CONSTRAINT atividades_turma_id_fkey
+        FOREIGN KEY (turma_id) REFERENCES turmas(id) ON DELETE CASCADE;
+
+ALTER TABLE documentos
+    DROP CONSTRAINT IF EXISTS documentos_atividade_id_fkey,
+    ADD CONSTRAINT documentos_atividade_id_fkey
+        FOREIGN KEY (atividade_id) REFERENCES atividades(id) ON DELETE CASCADE,
+    DROP CONSTRAINT IF EXISTS documentos_aluno_id_fkey,
+    ADD CONSTRAINT documentos_aluno_id_fkey
+        FOREIGN KEY (aluno_id) REFERENCES alunos(id) ON DELETE CASCADE;
+
+ALTER TABLE resultados
+    DROP CONSTRAINT IF EXISTS resultados_aluno_id_fkey,
+    ADD CONSTRAINT resultados_aluno_id_fkey
+        FOREIGN KEY (aluno_id) REFERENCES alunos(id) ON DELETE CASCADE,
+    DROP CONSTRAINT IF EXISTS resultados_atividade_id_fkey,
+    ADD CONSTRAINT resultados_atividade_id_fkey
+        FOREIGN KEY (atividade_id) REFERENCES atividades(id) ON DELETE CASCADE;
+
+CREATE INDEX IF NOT EXISTS idx_resultados_aluno ON resultados(aluno_id);
+CREATE INDEX IF NOT EXISTS idx_resultados_atividade ON resultados(atividade_id);
+
+COMMIT;
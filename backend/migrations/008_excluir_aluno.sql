@@ -0,0 +1,37 @@
+-- =================================================================
+-- NOVO CR - Transactional delete of an aluno
+-- =================================================================
+-- StorageManager.excluir_em_cascata("aluno") deleted the aluno's
+-- documentos and then the aluno row with two PostgREST requests: a
+-- failure between them left a half-deleted aluno. The other scopes are
+-- already one DELETE on the root row (ON DELETE CASCADE, migration 007).
+--
+-- excluir_aluno_cascata() runs both deletes in one function call (= one
+-- transaction). The documentos are deleted explicitly because databases
+-- without 007 still declare documentos.aluno_id as SET NULL; vínculos and
+-- resultados go with the aluno row through their CASCADE keys.
+--
+-- Returns {"documentos": n, "alunos": n}. Until this runs, the backend
+-- falls back to the two requests (both idempotent, root delete retried).
+--
+-- Safe to re-run.
+-- =================================================================
+
+CREATE OR REPLACE FUNCTION excluir_aluno_cascata(p_aluno_id TEXT)
+RETURNS JSON
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_documentos BIGINT;
+    v_alunos BIGINT;
+BEGIN
+    DELETE FROM documentos WHERE aluno_id = p_aluno_id;
+    GET DIAGNOSTICS v_documentos = ROW_COUNT;
+    DELETE FROM alunos WHERE id = p_aluno_id;
+    GET DIAGNOSTICS v_alunos = ROW_COUNT;
+    RETURN json_build_object('documentos', v_documentos, 'alunos', v_alunos);
+END;
+$$;
+
+-- PostgREST only exposes new functions after a schema reload
+NOTIFY pgrst, 'reload schema';
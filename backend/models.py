@@ -422,6 +422,9 @@ class Documento:
     
     # Dados extras
     metadata: Dict[str, Any] = field(default_factory=dict)
+
+    # sha256 do conteúdo (blob_store.py); None para documentos antigos
+    content_hash: Optional[str] = None
     
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -446,7 +449,8 @@ class Documento:
             "criado_por": self.criado_por,
             "versao": self.versao,
             "documento_origem_id": self.documento_origem_id,
-            "metadata": self.metadata
+            "metadata": self.metadata,
+            "content_hash": self.content_hash,
         }
     
     @classmethod
@@ -473,7 +477,8 @@ class Documento:
             criado_por=data.get("criado_por"),
             versao=data.get("versao", 1),
             documento_origem_id=data.get("documento_origem_id"),
-            metadata=_normalize_metadata(data.get("metadata"))
+            metadata=_normalize_metadata(data.get("metadata")),
+            content_hash=data.get("content_hash"),
         )
     
     @property
@@ -492,6 +497,132 @@ class Documento:
         return self.tipo in TipoDocumento.documentos_gerados()
 
 
+def _iso_timestamp(value: Any) -> Optional[str]:
+    """
+    Timestamp do banco como string ISO 8601, no formato de ``datetime.isoformat``.
+
+    Só passa por ``datetime`` quando a fração de segundo não está no formato
+    dele (6 dígitos, omitida se zero): o PostgreSQL corta zeros à direita
+    ("10:00:00.12+00:00") e ``Documento.to_dict`` devolveria "10:00:00.120000+00:00".
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.isoformat()
+    value = str(value)
+    # SQLite pode guardar "AAAA-MM-DD HH:MM:SS"
+    if len(value) > 10 and value[10] == " ":
+        value = value[:10] + "T" + value[11:]
+    ponto = value.find(".", 19)
+    if ponto != -1:
+        fim = ponto + 1
+        while fim < len(value) and value[fim].isdigit():
+            fim += 1
+        fracao = value[ponto + 1:fim]
+        if len(fracao) != 6 or fracao == "000000":
+            return datetime.fromisoformat(value).isoformat()
+    return value
+
+
+class DocumentoLeve:
+    """
+    Projeção somente-leitura de uma linha de ``documentos`` para listagens.
+
+    ``Documento.from_dict`` + ``to_dict`` custam caro por linha (dataclass,
+    dois ``datetime.fromisoformat``/``isoformat``, metadata normalizado).
+    Aqui: ``__slots__``, timestamps ficam como string ISO e o metadata só é
+    decodificado se for lido. Expõe os mesmos atributos de ``Documento``
+    (``tipo``/``status`` continuam enums; ``criado_em``/``atualizado_em``
+    são strings) e ``to_dict()`` devolve o mesmo formato.
+    """
+
+    __slots__ = (
+        "id", "tipo", "atividade_id", "aluno_id", "display_name", "nome_arquivo",
+        "caminho_arquivo", "extensao", "tamanho_bytes", "ia_provider", "ia_modelo",
+        "prompt_usado", "prompt_versao", "tokens_usados", "tempo_processamento_ms",
+        "status", "criado_em", "atualizado_em", "criado_por", "versao",
+        "documento_origem_id", "content_hash", "_metadata",
+    )
+
+    def __init__(self, row: Dict[str, Any]):
+        get = row.get
+        self.id = row["id"]
+        self.tipo = TipoDocumento(row["tipo"])
+        self.atividade_id = row["atividade_id"]
+        self.aluno_id = get("aluno_id")
+        self.display_name = get("display_name") or ""
+        self.nome_arquivo = get("nome_arquivo") or ""
+        self.caminho_arquivo = get("caminho_arquivo") or ""
+        self.extensao = get("extensao") or ""
+        self.tamanho_bytes = get("tamanho_bytes") or 0
+        self.ia_provider = get("ia_provider")
+        self.ia_modelo = get("ia_modelo")
+        self.prompt_usado = get("prompt_usado")
+        self.prompt_versao = get("prompt_versao")
+        self.tokens_usados = get("tokens_usados") or 0
+        self.tempo_processamento_ms = get("tempo_processamento_ms") or 0
+        self.status = StatusProcessamento(get("status") or "concluido")
+        self.criado_em = _iso_timestamp(get("criado_em"))
+        self.atualizado_em = _iso_timestamp(get("atualizado_em"))
+        self.criado_por = get("criado_por")
+        self.versao = get("versao") or 1
+        self.documento_origem_id = get("documento_origem_id")
+        self.content_hash = get("content_hash")
+        self._metadata = get("metadata")
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        if not isinstance(self._metadata, dict):
+            self._metadata = _normalize_metadata(self._metadata)
+        return self._metadata
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "tipo": self.tipo.value,
+            "atividade_id": self.atividade_id,
+            "aluno_id": self.aluno_id,
+            "display_name": self.display_name,
+            "nome_arquivo": self.nome_arquivo,
+            "caminho_arquivo": self.caminho_arquivo,
+            "extensao": self.extensao,
+            "tamanho_bytes": self.tamanho_bytes,
+            "ia_provider": self.ia_provider,
+            "ia_modelo": self.ia_modelo,
+            "prompt_usado": self.prompt_usado,
+            "prompt_versao": self.prompt_versao,
+            "tokens_usados": self.tokens_usados,
+            "tempo_processamento_ms": self.tempo_processamento_ms,
+            "status": self.status.value,
+            "criado_em": self.criado_em,
+            "atualizado_em": self.atualizado_em,
+            "criado_por": self.criado_por,
+            "versao": self.versao,
+            "documento_origem_id": self.documento_origem_id,
+            "metadata": self.metadata,
+            "content_hash": self.content_hash,
+        }
+
+    def to_documento(self) -> Documento:
+        """Hidrata o ``Documento`` completo (quando for preciso alterar/salvar)."""
+        return Documento.from_dict(self.to_dict())
+
+    @property
+    def is_documento_base(self) -> bool:
+        return self.tipo in TipoDocumento.documentos_base()
+
+    @property
+    def is_documento_aluno(self) -> bool:
+        return self.tipo in TipoDocumento.documentos_aluno()
+
+    @property
+    def is_documento_gerado(self) -> bool:
+        return self.tipo in TipoDocumento.documentos_gerados()
+
+    def __repr__(self) -> str:
+        return f"DocumentoLeve(id={self.id!r}, tipo={self.tipo.value!r}, atividade_id={self.atividade_id!r})"
+
+
 # ============================================================
 # MODELOS DE SUPORTE
 # ============================================================
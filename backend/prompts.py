@@ -13,6 +13,9 @@ import json
 import sqlite3
 from pathlib import Path
 
+from sqlite_pool import sqlite_pool
+from storage_events import StorageEventBus, StorageEventType, process_bus
+
 
 class EtapaProcessamento(Enum):
     """Etapas do pipeline de correção"""
@@ -975,68 +978,72 @@ def render_narrativa_prompt(prompt_id: str, **kwargs) -> Optional[Dict[str, str]
 class PromptManager:
     """Gerenciador de prompts com persistência em SQLite"""
     
-    def __init__(self, db_path: str = "./data/database.db"):
+    def __init__(self, db_path: str = "./data/database.db", events: Optional[StorageEventBus] = None):
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # Mudanças de prompt (criado/atualizado/deletado) no barramento do
+        # processo, o mesmo do StorageManager: quem cacheia prompts se inscreve lá
+        self.events = events if events is not None else process_bus(self.db_path.parent)
         self._setup_database()
         self._seed_prompts_padrao()
     
     def _get_connection(self) -> sqlite3.Connection:
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+        # Conexão pooled compartilhada com o StorageManager (WAL + busy_timeout)
+        return sqlite_pool.get(self.db_path)
     
     def _setup_database(self):
         conn = self._get_connection()
-        c = conn.cursor()
+        try:
+            c = conn.cursor()
         
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS prompts (
-                id TEXT PRIMARY KEY,
-                nome TEXT NOT NULL,
-                etapa TEXT NOT NULL,
-                texto TEXT NOT NULL,
-                texto_sistema TEXT,
-                descricao TEXT,
-                is_padrao INTEGER DEFAULT 0,
-                is_ativo INTEGER DEFAULT 1,
-                materia_id TEXT,
-                variaveis TEXT,
-                versao INTEGER DEFAULT 1,
-                criado_em TEXT,
-                atualizado_em TEXT,
-                criado_por TEXT
-            )
-        ''')
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS prompts (
+                    id TEXT PRIMARY KEY,
+                    nome TEXT NOT NULL,
+                    etapa TEXT NOT NULL,
+                    texto TEXT NOT NULL,
+                    texto_sistema TEXT,
+                    descricao TEXT,
+                    is_padrao INTEGER DEFAULT 0,
+                    is_ativo INTEGER DEFAULT 1,
+                    materia_id TEXT,
+                    variaveis TEXT,
+                    versao INTEGER DEFAULT 1,
+                    criado_em TEXT,
+                    atualizado_em TEXT,
+                    criado_por TEXT
+                )
+            ''')
         
-        # Histórico de versões
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS prompts_historico (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                prompt_id TEXT NOT NULL,
-                versao INTEGER NOT NULL,
-                texto TEXT NOT NULL,
-                modificado_em TEXT,
-                modificado_por TEXT,
-                FOREIGN KEY (prompt_id) REFERENCES prompts(id)
-            )
-        ''')
+            # Histórico de versões
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS prompts_historico (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    prompt_id TEXT NOT NULL,
+                    versao INTEGER NOT NULL,
+                    texto TEXT NOT NULL,
+                    modificado_em TEXT,
+                    modificado_por TEXT,
+                    FOREIGN KEY (prompt_id) REFERENCES prompts(id)
+                )
+            ''')
         
-        conn.commit()
-        for column, col_type in [
-            ("texto_sistema", "TEXT"),
-            ("descricao", "TEXT"),
-            ("is_padrao", "INTEGER DEFAULT 0"),
-            ("is_ativo", "INTEGER DEFAULT 1"),
-            ("materia_id", "TEXT"),
-            ("variaveis", "TEXT"),
-            ("versao", "INTEGER DEFAULT 1"),
-            ("criado_em", "TEXT"),
-            ("atualizado_em", "TEXT"),
-            ("criado_por", "TEXT"),
-        ]:
-            self._ensure_column(conn, "prompts", column, col_type)
-        conn.close()
+            conn.commit()
+            for column, col_type in [
+                ("texto_sistema", "TEXT"),
+                ("descricao", "TEXT"),
+                ("is_padrao", "INTEGER DEFAULT 0"),
+                ("is_ativo", "INTEGER DEFAULT 1"),
+                ("materia_id", "TEXT"),
+                ("variaveis", "TEXT"),
+                ("versao", "INTEGER DEFAULT 1"),
+                ("criado_em", "TEXT"),
+                ("atualizado_em", "TEXT"),
+                ("criado_por", "TEXT"),
+            ]:
+                self._ensure_column(conn, "prompts", column, col_type)
+        finally:
+            conn.close()
 
     def _ensure_column(self, conn: sqlite3.Connection, table: str, column: str, col_type: str) -> None:
         c = conn.cursor()
@@ -1049,29 +1056,31 @@ class PromptManager:
     def _seed_prompts_padrao(self):
         """Insere prompts padrão se não existirem; atualiza texto e texto_sistema se já existirem."""
         conn = self._get_connection()
-        c = conn.cursor()
+        try:
+            c = conn.cursor()
+
+            for prompt in PROMPTS_PADRAO.values():
+                c.execute('SELECT id FROM prompts WHERE id = ?', (prompt.id,))
+                if not c.fetchone():
+                    c.execute('''
+                        INSERT INTO prompts (id, nome, etapa, texto, texto_sistema, descricao, is_padrao, is_ativo, materia_id, variaveis, versao, criado_em, atualizado_em, criado_por)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', (
+                        prompt.id, prompt.nome, prompt.etapa.value, prompt.texto, prompt.texto_sistema,
+                        prompt.descricao, 1, 1, None, json.dumps(prompt.variaveis),
+                        1, prompt.criado_em.isoformat(), prompt.atualizado_em.isoformat(), "sistema"
+                    ))
+                else:
+                    # Sincroniza texto e texto_sistema do PROMPTS_PADRAO — garante que restarts
+                    # após atualizações de código propaguem novos prompts para o banco existente.
+                    c.execute(
+                        'UPDATE prompts SET texto = ?, texto_sistema = ?, atualizado_em = ? WHERE id = ?',
+                        (prompt.texto, prompt.texto_sistema, datetime.now().isoformat(), prompt.id)
+                    )
 
-        for prompt in PROMPTS_PADRAO.values():
-            c.execute('SELECT id FROM prompts WHERE id = ?', (prompt.id,))
-            if not c.fetchone():
-                c.execute('''
-                    INSERT INTO prompts (id, nome, etapa, texto, texto_sistema, descricao, is_padrao, is_ativo, materia_id, variaveis, versao, criado_em, atualizado_em, criado_por)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    prompt.id, prompt.nome, prompt.etapa.value, prompt.texto, prompt.texto_sistema,
-                    prompt.descricao, 1, 1, None, json.dumps(prompt.variaveis),
-                    1, prompt.criado_em.isoformat(), prompt.atualizado_em.isoformat(), "sistema"
-                ))
-            else:
-                # Sincroniza texto e texto_sistema do PROMPTS_PADRAO — garante que restarts
-                # após atualizações de código propaguem novos prompts para o banco existente.
-                c.execute(
-                    'UPDATE prompts SET texto = ?, texto_sistema = ?, atualizado_em = ? WHERE id = ?',
-                    (prompt.texto, prompt.texto_sistema, datetime.now().isoformat(), prompt.id)
-                )
-
-        conn.commit()
-        conn.close()
+            conn.commit()
+        finally:
+            conn.close()
     
     def criar_prompt(self, nome: str, etapa: EtapaProcessamento, texto: str,
                      texto_sistema: str = None,
@@ -1095,27 +1104,33 @@ class PromptManager:
         )
         
         conn = self._get_connection()
-        c = conn.cursor()
-        c.execute('''
-            INSERT INTO prompts (id, nome, etapa, texto, texto_sistema, descricao, is_padrao, is_ativo, materia_id, variaveis, versao, criado_em, atualizado_em, criado_por)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            prompt.id, prompt.nome, prompt.etapa.value, prompt.texto, prompt.texto_sistema,
-            prompt.descricao, 0, 1, prompt.materia_id, json.dumps(prompt.variaveis),
-            1, prompt.criado_em.isoformat(), prompt.atualizado_em.isoformat(), prompt.criado_por
-        ))
-        conn.commit()
-        conn.close()
-        
+        try:
+            c = conn.cursor()
+            c.execute('''
+                INSERT INTO prompts (id, nome, etapa, texto, texto_sistema, descricao, is_padrao, is_ativo, materia_id, variaveis, versao, criado_em, atualizado_em, criado_por)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                prompt.id, prompt.nome, prompt.etapa.value, prompt.texto, prompt.texto_sistema,
+                prompt.descricao, 0, 1, prompt.materia_id, json.dumps(prompt.variaveis),
+                1, prompt.criado_em.isoformat(), prompt.atualizado_em.isoformat(), prompt.criado_por
+            ))
+            conn.commit()
+        finally:
+            conn.close()
+
+        self.events.emit(StorageEventType.PROMPT_CRIADO, prompt.id, materia_id=materia_id,
+                         dados={"etapa": etapa.value})
         return prompt
     
     def get_prompt(self, prompt_id: str) -> Optional[PromptTemplate]:
         """Busca prompt por ID"""
         conn = self._get_connection()
-        c = conn.cursor()
-        c.execute('SELECT * FROM prompts WHERE id = ?', (prompt_id,))
-        row = c.fetchone()
-        conn.close()
+        try:
+            c = conn.cursor()
+            c.execute('SELECT * FROM prompts WHERE id = ?', (prompt_id,))
+            row = c.fetchone()
+        finally:
+            conn.close()
         
         if not row:
             return None
@@ -1129,30 +1144,31 @@ class PromptManager:
     def get_prompt_padrao(self, etapa: EtapaProcessamento, materia_id: str = None) -> Optional[PromptTemplate]:
         """Busca o prompt padrão para uma etapa"""
         conn = self._get_connection()
-        c = conn.cursor()
-        
-        # Primeiro tenta prompt específico da matéria
-        if materia_id:
+        try:
+            c = conn.cursor()
+
+            # Primeiro tenta prompt específico da matéria
+            if materia_id:
+                c.execute('''
+                    SELECT * FROM prompts 
+                    WHERE etapa = ? AND materia_id = ? AND is_padrao = 1 AND is_ativo = 1
+                    ORDER BY versao DESC LIMIT 1
+                ''', (etapa.value, materia_id))
+                row = c.fetchone()
+                if row:
+                    data = dict(row)
+                    data['variaveis'] = json.loads(data['variaveis']) if data['variaveis'] else []
+                    return PromptTemplate.from_dict(data)
+
+            # Senão, busca o global
             c.execute('''
                 SELECT * FROM prompts 
-                WHERE etapa = ? AND materia_id = ? AND is_padrao = 1 AND is_ativo = 1
+                WHERE etapa = ? AND materia_id IS NULL AND is_padrao = 1 AND is_ativo = 1
                 ORDER BY versao DESC LIMIT 1
-            ''', (etapa.value, materia_id))
+            ''', (etapa.value,))
             row = c.fetchone()
-            if row:
-                conn.close()
-                data = dict(row)
-                data['variaveis'] = json.loads(data['variaveis']) if data['variaveis'] else []
-                return PromptTemplate.from_dict(data)
-        
-        # Senão, busca o global
-        c.execute('''
-            SELECT * FROM prompts 
-            WHERE etapa = ? AND materia_id IS NULL AND is_padrao = 1 AND is_ativo = 1
-            ORDER BY versao DESC LIMIT 1
-        ''', (etapa.value,))
-        row = c.fetchone()
-        conn.close()
+        finally:
+            conn.close()
         
         if not row:
             return None
@@ -1165,27 +1181,29 @@ class PromptManager:
                        apenas_ativos: bool = True) -> List[PromptTemplate]:
         """Lista prompts com filtros"""
         conn = self._get_connection()
-        c = conn.cursor()
+        try:
+            c = conn.cursor()
         
-        query = 'SELECT * FROM prompts WHERE 1=1'
-        params = []
+            query = 'SELECT * FROM prompts WHERE 1=1'
+            params = []
         
-        if etapa:
-            query += ' AND etapa = ?'
-            params.append(etapa.value)
+            if etapa:
+                query += ' AND etapa = ?'
+                params.append(etapa.value)
         
-        if materia_id:
-            query += ' AND (materia_id = ? OR materia_id IS NULL)'
-            params.append(materia_id)
+            if materia_id:
+                query += ' AND (materia_id = ? OR materia_id IS NULL)'
+                params.append(materia_id)
         
-        if apenas_ativos:
-            query += ' AND is_ativo = 1'
+            if apenas_ativos:
+                query += ' AND is_ativo = 1'
         
-        query += ' ORDER BY is_padrao DESC, nome'
+            query += ' ORDER BY is_padrao DESC, nome'
         
-        c.execute(query, params)
-        rows = c.fetchall()
-        conn.close()
+            c.execute(query, params)
+            rows = c.fetchall()
+        finally:
+            conn.close()
         
         prompts = []
         for row in rows:
@@ -1206,80 +1224,96 @@ class PromptManager:
             return None
         
         conn = self._get_connection()
-        c = conn.cursor()
+        try:
+            c = conn.cursor()
         
-        # Salvar no histórico
-        c.execute('''
-            INSERT INTO prompts_historico (prompt_id, versao, texto, modificado_em, modificado_por)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (prompt_id, prompt_atual.versao, prompt_atual.texto, datetime.now().isoformat(), modificado_por))
-        
-        # Atualizar prompt
-        nova_versao = prompt_atual.versao + 1
-        updates = ['versao = ?', 'atualizado_em = ?']
-        params = [nova_versao, datetime.now().isoformat()]
+            # Salvar no histórico
+            c.execute('''
+                INSERT INTO prompts_historico (prompt_id, versao, texto, modificado_em, modificado_por)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (prompt_id, prompt_atual.versao, prompt_atual.texto, datetime.now().isoformat(), modificado_por))
         
-        if texto:
-            updates.append('texto = ?')
-            params.append(texto)
-        if texto_sistema is not None:
-            updates.append('texto_sistema = ?')
-            params.append(texto_sistema)
-        if nome:
-            updates.append('nome = ?')
-            params.append(nome)
-        if descricao is not None:
-            updates.append('descricao = ?')
-            params.append(descricao)
+            # Atualizar prompt
+            nova_versao = prompt_atual.versao + 1
+            updates = ['versao = ?', 'atualizado_em = ?']
+            params = [nova_versao, datetime.now().isoformat()]
         
-        params.append(prompt_id)
+            if texto:
+                updates.append('texto = ?')
+                params.append(texto)
+            if texto_sistema is not None:
+                updates.append('texto_sistema = ?')
+                params.append(texto_sistema)
+            if nome:
+                updates.append('nome = ?')
+                params.append(nome)
+            if descricao is not None:
+                updates.append('descricao = ?')
+                params.append(descricao)
         
-        c.execute(f"UPDATE prompts SET {', '.join(updates)} WHERE id = ?", params)
-        conn.commit()
-        conn.close()
+            params.append(prompt_id)
         
+            c.execute(f"UPDATE prompts SET {', '.join(updates)} WHERE id = ?", params)
+            conn.commit()
+        finally:
+            conn.close()
+
+        self.events.emit(StorageEventType.PROMPT_ATUALIZADO, prompt_id,
+                         materia_id=prompt_atual.materia_id,
+                         dados={"etapa": prompt_atual.etapa.value, "versao": nova_versao})
         return self.get_prompt(prompt_id)
     
     def get_historico(self, prompt_id: str) -> List[Dict[str, Any]]:
         """Retorna histórico de versões de um prompt"""
         conn = self._get_connection()
-        c = conn.cursor()
-        c.execute('''
-            SELECT * FROM prompts_historico 
-            WHERE prompt_id = ? 
-            ORDER BY versao DESC
-        ''', (prompt_id,))
-        rows = c.fetchall()
-        conn.close()
+        try:
+            c = conn.cursor()
+            c.execute('''
+                SELECT * FROM prompts_historico 
+                WHERE prompt_id = ? 
+                ORDER BY versao DESC
+            ''', (prompt_id,))
+            rows = c.fetchall()
+        finally:
+            conn.close()
         
         return [dict(row) for row in rows]
     
     def definir_padrao(self, prompt_id: str, etapa: EtapaProcessamento, materia_id: str = None) -> bool:
         """Define um prompt como padrão para uma etapa"""
         conn = self._get_connection()
-        c = conn.cursor()
+        try:
+            c = conn.cursor()
         
-        # Remove padrão anterior
-        if materia_id:
-            c.execute('UPDATE prompts SET is_padrao = 0 WHERE etapa = ? AND materia_id = ?', (etapa.value, materia_id))
-        else:
-            c.execute('UPDATE prompts SET is_padrao = 0 WHERE etapa = ? AND materia_id IS NULL', (etapa.value,))
+            # Remove padrão anterior
+            if materia_id:
+                c.execute('UPDATE prompts SET is_padrao = 0 WHERE etapa = ? AND materia_id = ?', (etapa.value, materia_id))
+            else:
+                c.execute('UPDATE prompts SET is_padrao = 0 WHERE etapa = ? AND materia_id IS NULL', (etapa.value,))
         
-        # Define novo padrão
-        c.execute('UPDATE prompts SET is_padrao = 1 WHERE id = ?', (prompt_id,))
+            # Define novo padrão
+            c.execute('UPDATE prompts SET is_padrao = 1 WHERE id = ?', (prompt_id,))
         
-        conn.commit()
-        conn.close()
+            conn.commit()
+        finally:
+            conn.close()
+
+        self.events.emit(StorageEventType.PROMPT_ATUALIZADO, prompt_id, materia_id=materia_id,
+                         dados={"etapa": etapa.value, "is_padrao": True})
         return True
     
     def deletar_prompt(self, prompt_id: str) -> bool:
         """Deleta um prompt (soft delete - marca como inativo)"""
         conn = self._get_connection()
-        c = conn.cursor()
-        c.execute('UPDATE prompts SET is_ativo = 0 WHERE id = ? AND is_padrao = 0', (prompt_id,))
-        affected = c.rowcount
-        conn.commit()
-        conn.close()
+        try:
+            c = conn.cursor()
+            c.execute('UPDATE prompts SET is_ativo = 0 WHERE id = ? AND is_padrao = 0', (prompt_id,))
+            affected = c.rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        if affected > 0:
+            self.events.emit(StorageEventType.PROMPT_DELETADO, prompt_id)
         return affected > 0
     
     def duplicar_prompt(self, prompt_id: str, novo_nome: str, materia_id: str = None) -> Optional[PromptTemplate]:
@@ -8,6 +8,7 @@ catalog pricing are available. Missing data is returned as a blocking reason.
 from fastapi import APIRouter
 
 from cost_tracking import build_cost_summary
+from fast_json import FastJSONResponse
 
 
 router = APIRouter()
@@ -35,4 +36,4 @@ async def get_cost_status(limit: int = 500):
 
 @router.get("/api/custos/resumo", tags=["Custos"])
 async def get_cost_summary(limit: int = 500):
-    return build_cost_summary(limit=limit)
+    return FastJSONResponse(build_cost_summary(limit=limit))
@@ -7,7 +7,7 @@ Este arquivo contém endpoints extras que são importados pelo main_v2.py:
 - Estatísticas e relatórios
 """
 
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query
+from fastapi import APIRouter, UploadFile, File, Form, Header, HTTPException, Query
 from typing import Optional, List, Dict, Any, Tuple
 from pydantic import BaseModel
 from datetime import datetime
@@ -22,12 +22,17 @@ import unicodedata
 from pathlib import Path
 
 from models import StatusProcessamento, TipoDocumento
-from storage import storage
+from storage import AsyncStorageManager, storage
+from streaming import ndjson_response, wants_ndjson
+from fast_json import FastJSONResponse
 
 
 # Router para endpoints adicionais
 router = APIRouter()
 
+# Fachada async: resolve `storage` a cada chamada (mantém patch("routes_extras.storage") nos testes)
+astorage = AsyncStorageManager(resolver=lambda: storage)
+
 
 # ============================================================
 # MODELOS
@@ -511,7 +516,7 @@ async def importar_alunos(data: ImportarAlunosRequest):
     
     for aluno_data in data.alunos:
         try:
-            aluno = storage.criar_aluno(
+            aluno = await astorage.criar_aluno(
                 nome=aluno_data.nome,
                 email=aluno_data.email,
                 matricula=aluno_data.matricula
@@ -520,7 +525,7 @@ async def importar_alunos(data: ImportarAlunosRequest):
             
             # Vincular à turma se especificado
             if data.turma_id:
-                storage.vincular_aluno_turma(aluno.id, data.turma_id)
+                await astorage.vincular_aluno_turma(aluno.id, data.turma_id)
                 
         except Exception as e:
             erros.append({"aluno": aluno_data.nome, "erro": str(e)})
@@ -568,11 +573,11 @@ async def importar_alunos_csv(
             matricula = row.get('matricula', '').strip() or None
             
             try:
-                aluno = storage.criar_aluno(nome, email, matricula)
+                aluno = await astorage.criar_aluno(nome, email, matricula)
                 criados.append(aluno.to_dict())
                 
                 if turma_id:
-                    storage.vincular_aluno_turma(aluno.id, turma_id)
+                    await astorage.vincular_aluno_turma(aluno.id, turma_id)
                     
             except Exception as e:
                 erros.append({"nome": nome, "erro": str(e)})
@@ -605,7 +610,7 @@ async def preview_importar_alunos_tabela(
     mapeamento e uma prévia já mapeada para nome/e-mail/matrícula.
     """
     content = await file.read()
-    return _build_table_preview(content, file.filename or "alunos", sheet_name, mapping, turma_id, row_overrides)
+    return await astorage.run(_build_table_preview, content, file.filename or "alunos", sheet_name, mapping, turma_id, row_overrides)
 
 
 @router.post("/api/alunos/importar-tabela", tags=["Lote"])
@@ -623,7 +628,7 @@ async def importar_alunos_tabela(
     matrícula, e-mail ou nome normalizado. Quando turma_id é enviado, alunos
     novos ou existentes são vinculados à turma quando ainda não estiverem nela.
     """
-    if turma_id and not storage.get_turma(turma_id):
+    if turma_id and not await astorage.get_turma(turma_id):
         raise HTTPException(404, "Turma não encontrada")
 
     content = await file.read()
@@ -635,8 +640,8 @@ async def importar_alunos_tabela(
     if resolved_mapping.get("nome") is None:
         raise HTTPException(400, "Mapeie a coluna de nome antes de importar.")
 
-    indexes = _student_indexes()
-    turma_student_ids = {aluno.id for aluno in storage.listar_alunos(turma_id)} if turma_id else set()
+    indexes = await astorage.run(_student_indexes)
+    turma_student_ids = {aluno.id for aluno in await astorage.listar_alunos(turma_id)} if turma_id else set()
     seen = set()
 
     criados = []
@@ -677,7 +682,7 @@ async def importar_alunos_tabela(
                     "aluno": aluno.to_dict(),
                 })
             else:
-                aluno = storage.criar_aluno(nome=nome, email=email, matricula=matricula)
+                aluno = await astorage.criar_aluno(nome=nome, email=email, matricula=matricula)
                 _add_student_to_indexes(aluno, indexes)
                 criados.append({"linha": row_number, "aluno": aluno.to_dict()})
 
@@ -687,7 +692,7 @@ async def importar_alunos_tabela(
                     vinculo_status = "ja_vinculado"
                     ja_vinculados.append({"linha": row_number, "aluno": aluno.to_dict()})
                 else:
-                    vinculo = storage.vincular_aluno_turma(aluno.id, turma_id)
+                    vinculo = await astorage.vincular_aluno_turma(aluno.id, turma_id)
                     if vinculo:
                         turma_student_ids.add(aluno.id)
                         vinculo_status = "vinculado"
@@ -698,7 +703,7 @@ async def importar_alunos_tabela(
                         })
                     else:
                         # Provável corrida/duplicidade; se passou a aparecer na turma, trate como já vinculado.
-                        refreshed_ids = {a.id for a in storage.listar_alunos(turma_id)}
+                        refreshed_ids = {a.id for a in await astorage.listar_alunos(turma_id)}
                         if aluno.id in refreshed_ids:
                             turma_student_ids.add(aluno.id)
                             vinculo_status = "ja_vinculado"
@@ -758,7 +763,7 @@ async def vincular_alunos_lote(
     
     for aluno_id in ids:
         try:
-            vinculo = storage.vincular_aluno_turma(aluno_id, turma_id)
+            vinculo = await astorage.vincular_aluno_turma(aluno_id, turma_id)
             if vinculo:
                 sucesso.append(aluno_id)
             else:
@@ -778,6 +783,41 @@ async def vincular_alunos_lote(
 # UPLOAD EM LOTE: DOCUMENTOS
 # ============================================================
 
+async def _salvar_lote_com_fallback(
+    pendentes: List[Tuple[str, Dict[str, Any]]],
+) -> Tuple[List[Tuple[int, Any]], List[Dict[str, Any]]]:
+    """
+    Salva ``(filename, item)`` via salvar_documentos_lote e remove os temporários.
+
+    O lote é tudo-ou-nada; se falhar, salva arquivo a arquivo para que só os
+    arquivos realmente problemáticos apareçam em ``detalhes_erros``.
+
+    Returns:
+        ([(índice em pendentes, Documento)], erros por arquivo)
+    """
+    salvos: List[Tuple[int, Any]] = []
+    erros: List[Dict[str, Any]] = []
+    if not pendentes:
+        return salvos, erros
+
+    try:
+        try:
+            documentos = await astorage.salvar_documentos_lote([item for _, item in pendentes])
+            salvos.extend(enumerate(documentos))
+        except Exception:
+            for i, (filename, item) in enumerate(pendentes):
+                try:
+                    salvos.append((i, await astorage.salvar_documento(**item)))
+                except Exception as e:
+                    erros.append({"arquivo": filename, "erro": str(e)})
+    finally:
+        for _, item in pendentes:
+            if os.path.exists(item["arquivo_origem"]):
+                os.unlink(item["arquivo_origem"])
+
+    return salvos, erros
+
+
 @router.post("/api/documentos/upload-lote", tags=["Lote"])
 async def upload_documentos_lote(
     files: List[UploadFile] = File(...),
@@ -808,8 +848,8 @@ async def upload_documentos_lote(
         except (json.JSONDecodeError, TypeError):
             names_list = []
 
-    salvos = []
     erros = []
+    pendentes = []  # (filename, item de salvar_documentos_lote)
 
     for i, file in enumerate(files):
         try:
@@ -822,21 +862,22 @@ async def upload_documentos_lote(
             # Use per-file display_name if provided, else None (auto-generate)
             file_display_name = names_list[i] if i < len(names_list) else None
 
-            # Salvar documento
-            documento = storage.salvar_documento(
-                arquivo_origem=tmp_path,
-                tipo=tipo_doc,
-                atividade_id=atividade_id,
-                aluno_id=aluno_id,
-                display_name=file_display_name,
-                criado_por="usuario"
-            )
-
-            os.unlink(tmp_path)
-            salvos.append(documento.to_dict())
+            pendentes.append((file.filename, {
+                "arquivo_origem": tmp_path,
+                "tipo": tipo_doc,
+                "atividade_id": atividade_id,
+                "aluno_id": aluno_id,
+                "display_name": file_display_name,
+                "criado_por": "usuario",
+            }))
                 
         except Exception as e:
             erros.append({"arquivo": file.filename, "erro": str(e)})
+
+    # Salvar documentos (uma transação para o lote inteiro)
+    resultados, erros_lote = await _salvar_lote_com_fallback(pendentes)
+    salvos = [documento.to_dict() for _, documento in resultados]
+    erros.extend(erros_lote)
     
     return {
         "success": True,
@@ -865,12 +906,12 @@ async def upload_provas_alunos(
     
     modo_nome: "matricula" ou "nome"
     """
-    atividade = storage.get_atividade(atividade_id)
+    atividade = await astorage.get_atividade(atividade_id)
     if not atividade:
         raise HTTPException(404, "Atividade não encontrada")
 
-    turma = storage.get_turma(atividade.turma_id)
-    alunos_turma = storage.listar_alunos(turma.id)
+    turma = await astorage.get_turma(atividade.turma_id)
+    alunos_turma = await astorage.listar_alunos(turma.id)
     alunos_by_id = {aluno.id: aluno for aluno in alunos_turma}
 
     # Parse display_names JSON array (if provided)
@@ -950,7 +991,7 @@ async def upload_provas_alunos(
                 continue
             selected_students.add(aluno_encontrado.id)
 
-            existentes = storage.listar_documentos(
+            existentes = await astorage.listar_documentos(
                 atividade_id,
                 aluno_id=aluno_encontrado.id,
                 tipo=TipoDocumento.PROVA_RESPONDIDA,
@@ -981,6 +1022,8 @@ async def upload_provas_alunos(
     erros = []
     pulados = []
     substituidos = 0
+    pendentes = []  # (filename, item de salvar_documentos_lote)
+    contexto = []   # (nome do aluno, action), alinhado com pendentes
 
     for i, file in enumerate(files):
         tmp_path = None
@@ -999,7 +1042,7 @@ async def upload_provas_alunos(
                 file_display_name = assignment["display_name"] or file_display_name
                 if action == "substituir":
                     for doc in assignment["existentes"]:
-                        if storage.deletar_documento(doc.id):
+                        if await astorage.deletar_documento(doc.id):
                             substituidos += 1
             else:
                 # Modo legado: tenta identificar pelo nome ou matrícula no arquivo.
@@ -1031,23 +1074,15 @@ async def upload_provas_alunos(
                 tmp.write(content)
                 tmp_path = tmp.name
 
-            # Salvar documento
-            documento = storage.salvar_documento(
-                arquivo_origem=tmp_path,
-                tipo=TipoDocumento.PROVA_RESPONDIDA,
-                atividade_id=atividade_id,
-                aluno_id=aluno_encontrado.id,
-                display_name=file_display_name,
-                criado_por="usuario"
-            )
-
-            if tmp_path and os.path.exists(tmp_path):
-                os.unlink(tmp_path)
-            salvos.append({
-                "documento": documento.to_dict(),
-                "aluno": aluno_encontrado.nome,
-                "action": action,
-            })
+            pendentes.append((file.filename, {
+                "arquivo_origem": tmp_path,
+                "tipo": TipoDocumento.PROVA_RESPONDIDA,
+                "atividade_id": atividade_id,
+                "aluno_id": aluno_encontrado.id,
+                "display_name": file_display_name,
+                "criado_por": "usuario",
+            }))
+            contexto.append((aluno_encontrado.nome, action))
                 
         except Exception as e:
             erros.append({"arquivo": file.filename, "erro": str(e)})
@@ -1056,6 +1091,17 @@ async def upload_provas_alunos(
                     os.unlink(tmp_path)
                 except OSError:
                     pass
+
+    # Salvar documentos (uma transação para o lote inteiro)
+    resultados, erros_lote = await _salvar_lote_com_fallback(pendentes)
+    for i, documento in resultados:
+        aluno_nome, action = contexto[i]
+        salvos.append({
+            "documento": documento.to_dict(),
+            "aluno": aluno_nome,
+            "action": action,
+        })
+    erros.extend(erros_lote)
     
     return {
         "success": True,
@@ -1093,7 +1139,7 @@ async def busca_global(
     
     # Buscar alunos
     if not tipo or tipo == "aluno":
-        for aluno in storage.listar_alunos():
+        for aluno in await astorage.listar_alunos():
             if termo in aluno.nome.lower() or (aluno.matricula and termo in aluno.matricula.lower()):
                 resultados["alunos"].append({
                     "id": aluno.id,
@@ -1104,7 +1150,7 @@ async def busca_global(
     
     # Buscar matérias
     if not tipo or tipo == "materia":
-        for materia in storage.listar_materias():
+        for materia in await astorage.listar_materias():
             if termo in materia.nome.lower():
                 resultados["materias"].append({
                     "id": materia.id,
@@ -1114,9 +1160,9 @@ async def busca_global(
     
     # Buscar turmas
     if not tipo or tipo == "turma":
-        for turma in storage.listar_turmas():
+        for turma in await astorage.listar_turmas():
             if termo in turma.nome.lower():
-                materia = storage.get_materia(turma.materia_id)
+                materia = await astorage.get_materia(turma.materia_id)
                 resultados["turmas"].append({
                     "id": turma.id,
                     "nome": turma.nome,
@@ -1126,8 +1172,8 @@ async def busca_global(
     
     # Buscar atividades
     if not tipo or tipo == "atividade":
-        for turma in storage.listar_turmas():
-            for atividade in storage.listar_atividades(turma.id):
+        for turma in await astorage.listar_turmas():
+            for atividade in await astorage.listar_atividades(turma.id):
                 if termo in atividade.nome.lower():
                     resultados["atividades"].append({
                         "id": atividade.id,
@@ -1153,7 +1199,7 @@ async def busca_global(
 async def get_estatisticas_gerais():
     """Retorna estatísticas gerais do sistema"""
     try:
-        return storage.get_estatisticas_gerais_fast()
+        return await astorage.get_estatisticas_gerais_fast()
     except Exception as e:
         logging.exception("Error in /api/estatisticas")
         return {
@@ -1171,16 +1217,16 @@ async def get_estatisticas_gerais():
 async def get_estatisticas_turma(turma_id: str):
     """Retorna estatísticas de uma turma específica"""
     
-    turma = storage.get_turma(turma_id)
+    turma = await astorage.get_turma(turma_id)
     if not turma:
         raise HTTPException(404, "Turma não encontrada")
     
-    alunos = storage.listar_alunos(turma_id)
-    atividades = storage.listar_atividades(turma_id)
+    alunos = await astorage.listar_alunos(turma_id)
+    atividades = await astorage.listar_atividades(turma_id)
     
     stats_atividades = []
     for ativ in atividades:
-        status = storage.get_status_atividade(ativ.id)
+        status = await astorage.get_status_atividade(ativ.id)
         stats_atividades.append({
             "id": ativ.id,
             "nome": ativ.nome,
@@ -1205,7 +1251,7 @@ async def get_estatisticas_turma(turma_id: str):
 async def exportar_alunos_csv(turma_id: Optional[str] = None):
     """Exporta lista de alunos em CSV"""
     
-    alunos = storage.listar_alunos(turma_id)
+    alunos = await astorage.listar_alunos(turma_id)
     
     output = io.StringIO()
     writer = csv.writer(output)
@@ -1237,12 +1283,12 @@ async def duplicar_atividade(
     Duplica uma atividade para outra turma.
     Copia os documentos base (enunciado, gabarito, critérios).
     """
-    atividade_original = storage.get_atividade(atividade_id)
+    atividade_original = await astorage.get_atividade(atividade_id)
     if not atividade_original:
         raise HTTPException(404, "Atividade não encontrada")
     
     # Criar nova atividade
-    nova_atividade = storage.criar_atividade(
+    nova_atividade = await astorage.criar_atividade(
         turma_id=nova_turma_id,
         nome=novo_nome or f"{atividade_original.nome} (cópia)",
         tipo=atividade_original.tipo,
@@ -1255,12 +1301,12 @@ async def duplicar_atividade(
     
     # Copiar documentos base
     docs_copiados = 0
-    docs_originais = storage.listar_documentos(atividade_id)
+    docs_originais = await astorage.listar_documentos(atividade_id)
     
     for doc in docs_originais:
         if doc.is_documento_base and Path(doc.caminho_arquivo).exists():
             try:
-                novo_doc = storage.salvar_documento(
+                novo_doc = await astorage.salvar_documento(
                     arquivo_origem=doc.caminho_arquivo,
                     tipo=doc.tipo,
                     atividade_id=nova_atividade.id,
@@ -1489,27 +1535,27 @@ async def get_desempenho_aluno_turma(aluno_id: str, turma_id: str):
     aluno + turma, lista atividades e documentos individuais, e informa se ha
     base minima para uma futura geracao aluno-turma.
     """
-    aluno = storage.get_aluno(aluno_id)
+    aluno = await astorage.get_aluno(aluno_id)
     if not aluno:
         raise HTTPException(status_code=404, detail="Aluno não encontrado")
 
-    turma = storage.get_turma(turma_id)
+    turma = await astorage.get_turma(turma_id)
     if not turma:
         raise HTTPException(status_code=404, detail="Turma não encontrada")
 
-    turmas_do_aluno = storage.get_turmas_do_aluno(aluno_id, apenas_ativas=False)
+    turmas_do_aluno = await astorage.get_turmas_do_aluno(aluno_id, apenas_ativas=False)
     turma_info = next((item for item in turmas_do_aluno if item.get("id") == turma_id), None)
     if not turma_info:
         raise HTTPException(status_code=404, detail="Aluno não vinculado a esta turma")
 
-    materia = storage.get_materia(turma.materia_id) if getattr(turma, "materia_id", None) else None
+    materia = await astorage.get_materia(turma.materia_id) if getattr(turma, "materia_id", None) else None
     atividades_payload = []
     atividades_com_correcao = 0
     atividades_com_relatorio = 0
     total_documentos_aluno = 0
 
-    for atividade in storage.listar_atividades(turma_id):
-        documentos_contexto = storage.listar_documentos(atividade.id, aluno_id)
+    for atividade in await astorage.listar_atividades(turma_id):
+        documentos_contexto = await astorage.listar_documentos(atividade.id, aluno_id)
         docs_aluno = [
             doc for doc in documentos_contexto
             if getattr(doc, "aluno_id", None) == aluno_id
@@ -1574,9 +1620,9 @@ async def get_desempenho(level: str, entity_id: str):
         raise HTTPException(status_code=400, detail=f"Invalid level: {level}. Must be tarefa, turma, or materia.")
 
     tipo = DESEMPENHO_TIPO_MAP[level]
-    unique_docs = _collect_desempenho_docs(level, entity_id, tipo)
-    has_atividades = _check_has_atividades(level, entity_id)
-    runs = _group_docs_into_runs(unique_docs)
+    unique_docs = await astorage.run(_collect_desempenho_docs, level, entity_id, tipo)
+    has_atividades = await astorage.run(_check_has_atividades, level, entity_id)
+    runs = await astorage.run(_group_docs_into_runs, unique_docs)
 
     return {
         "runs": runs,
@@ -1630,8 +1676,8 @@ async def delete_desempenho_run(
         raise HTTPException(status_code=400, detail=f"Invalid level: {level}. Must be tarefa, turma, or materia.")
 
     tipo = DESEMPENHO_TIPO_MAP[level]
-    all_docs = _collect_desempenho_docs(level, entity_id, tipo)
-    runs = _group_docs_into_runs(all_docs)
+    all_docs = await astorage.run(_collect_desempenho_docs, level, entity_id, tipo)
+    runs = await astorage.run(_group_docs_into_runs, all_docs)
 
     # Find the run matching run_id
     target_run = None
@@ -1646,7 +1692,7 @@ async def delete_desempenho_run(
     # Delete all docs in the run
     deleted = 0
     for doc_dict in target_run["docs"]:
-        if storage.deletar_documento(doc_dict["id"]):
+        if await astorage.deletar_documento(doc_dict["id"]):
             deleted += 1
 
     return {"deleted_count": deleted, "run_id": run_id}
@@ -1662,20 +1708,45 @@ async def listar_todos_documentos(
     turma_ids: Optional[str] = None,
     atividade_ids: Optional[str] = None,
     aluno_ids: Optional[str] = None,
-    tipos: Optional[str] = None
+    tipos: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    formato: Optional[str] = None,
+    accept: Optional[str] = Header(None),
 ):
-    """Lista todos os documentos do sistema com metadados completos."""
-    try:
-        filters = {
-            "materia_ids": materia_ids.split(",") if materia_ids else None,
-            "turma_ids": turma_ids.split(",") if turma_ids else None,
-            "atividade_ids": atividade_ids.split(",") if atividade_ids else None,
-            "aluno_ids": aluno_ids.split(",") if aluno_ids else None,
-            "tipos": tipos.split(",") if tipos else None,
-        }
+    """
+    Lista todos os documentos do sistema com metadados completos.
+
+    Sem ``cursor``/``limit`` devolve a lista inteira (formato antigo). Com eles
+    devolve uma página (mais recentes primeiro) e ``next_cursor``. Com
+    ``formato=ndjson`` (ou Accept: application/x-ndjson) transmite um
+    documento por linha, página a página.
+    """
+    filters = {
+        "materia_ids": materia_ids.split(",") if materia_ids else None,
+        "turma_ids": turma_ids.split(",") if turma_ids else None,
+        "atividade_ids": atividade_ids.split(",") if atividade_ids else None,
+        "aluno_ids": aluno_ids.split(",") if aluno_ids else None,
+        "tipos": tipos.split(",") if tipos else None,
+    }
 
-        documentos = storage.listar_documentos_com_contexto_fast(filters)
-        return {"documentos": documentos, "total": len(documentos)}
+    async def _pagina(page_cursor: Optional[str]) -> Dict[str, Any]:
+        return await astorage.listar_documentos_com_contexto_pagina(
+            filters, cursor=page_cursor, limit=limit or 500,
+        )
+
+    if wants_ndjson(formato, accept) or cursor or limit:
+        try:
+            pagina = await _pagina(cursor)
+        except ValueError as e:  # cursor inválido
+            raise HTTPException(400, str(e))
+        if wants_ndjson(formato, accept):
+            return ndjson_response(pagina, _pagina, "documentos")
+        return FastJSONResponse({**pagina, "total": len(pagina["documentos"])})
+
+    try:
+        documentos = await astorage.listar_documentos_com_contexto_fast(filters)
+        return FastJSONResponse({"documentos": documentos, "total": len(documentos)})
     except Exception as e:
         logging.exception("Error in /api/documentos/todos")
         return {"documentos": [], "total": 0, "_error": str(e)}
@@ -1702,7 +1773,7 @@ async def debug_documento(documento_id: str):
     }
 
     # 1. Verificar se existe no banco
-    doc = storage.get_documento(documento_id)
+    doc = await astorage.get_documento(documento_id)
     result["etapas"]["1_banco_dados"] = {
         "encontrado": doc is not None,
         "nome_arquivo": doc.nome_arquivo if doc else None,
@@ -1735,7 +1806,7 @@ async def debug_documento(documento_id: str):
 
     # 4. Tentar resolver caminho
     try:
-        arquivo_resolvido = storage.resolver_caminho_documento(doc)
+        arquivo_resolvido = await astorage.resolver_caminho_documento(doc)
         result["etapas"]["4_resolver_caminho"] = {
             "sucesso": arquivo_resolvido is not None and arquivo_resolvido.exists(),
             "caminho_resolvido": str(arquivo_resolvido) if arquivo_resolvido else None,
@@ -1795,7 +1866,7 @@ async def sync_materia_to_remote(materia_id: str):
     from sync_service import sync_service
 
     try:
-        materia = storage.get_materia(materia_id)
+        materia = await astorage.get_materia(materia_id)
         if not materia:
             raise HTTPException(404, "Matéria não encontrada")
 
@@ -1821,12 +1892,12 @@ async def sync_turma_to_remote(turma_id: str):
     from sync_service import sync_service
 
     try:
-        turma = storage.get_turma(turma_id)
+        turma = await astorage.get_turma(turma_id)
         if not turma:
             raise HTTPException(404, "Turma não encontrada")
 
         # Buscar matéria relacionada
-        materia = storage.get_materia(turma.materia_id)
+        materia = await astorage.get_materia(turma.materia_id)
         if not materia:
             raise HTTPException(404, "Matéria da turma não encontrada")
 
@@ -1875,7 +1946,7 @@ async def sync_documentos_to_remote(documento_ids: List[str]):
 
     for doc_id in documento_ids:
         try:
-            documento = storage.get_documento(doc_id)
+            documento = await astorage.get_documento(doc_id)
             if not documento:
                 errors.append(f"Documento {doc_id} não encontrado")
                 continue
@@ -1951,10 +2022,10 @@ async def listar_documentos_orfaos():
     verificados = 0
 
     # Iterar por todas as matérias/turmas/atividades para pegar todos os docs
-    for materia in storage.listar_materias():
-        for turma in storage.listar_turmas(materia.id):
-            for atividade in storage.listar_atividades(turma.id):
-                docs = storage.listar_documentos(atividade.id)
+    for materia in await astorage.listar_materias():
+        for turma in await astorage.listar_turmas(materia.id):
+            for atividade in await astorage.listar_atividades(turma.id):
+                docs = await astorage.listar_documentos(atividade.id)
                 for doc in docs:
                     verificados += 1
 
@@ -1964,8 +2035,9 @@ async def listar_documentos_orfaos():
                     if remote_path.startswith("data/"):
                         remote_path = remote_path[5:]  # Remove "data/"
 
-                    # Verificar se existe no Supabase
-                    if not supabase_storage.exists(remote_path):
+                    # Verificar se existe no Supabase (caminho próprio ou blob deduplicado)
+                    caminhos = await astorage.caminhos_remotos_documento(doc)
+                    if not any(supabase_storage.exists(caminho) for caminho in caminhos):
                         orfaos.append({
                             "id": doc.id,
                             "tipo": doc.tipo.value,
@@ -2004,10 +2076,10 @@ async def limpar_documentos_orfaos(dry_run: bool = True):
     verificados = 0
 
     # Iterar por todas as matérias/turmas/atividades
-    for materia in storage.listar_materias():
-        for turma in storage.listar_turmas(materia.id):
-            for atividade in storage.listar_atividades(turma.id):
-                docs = storage.listar_documentos(atividade.id)
+    for materia in await astorage.listar_materias():
+        for turma in await astorage.listar_turmas(materia.id):
+            for atividade in await astorage.listar_atividades(turma.id):
+                docs = await astorage.listar_documentos(atividade.id)
                 for doc in docs:
                     verificados += 1
 
@@ -2017,8 +2089,9 @@ async def limpar_documentos_orfaos(dry_run: bool = True):
                     if remote_path.startswith("data/"):
                         remote_path = remote_path[5:]
 
-                    # Verificar se existe no Supabase
-                    if not supabase_storage.exists(remote_path):
+                    # Verificar se existe no Supabase (caminho próprio ou blob deduplicado)
+                    caminhos = await astorage.caminhos_remotos_documento(doc)
+                    if not any(supabase_storage.exists(caminho) for caminho in caminhos):
                         orfao_info = {
                             "id": doc.id,
                             "tipo": doc.tipo.value,
@@ -2031,7 +2104,7 @@ async def limpar_documentos_orfaos(dry_run: bool = True):
                         if not dry_run:
                             try:
                                 # Deletar diretamente do banco (sem tentar deletar arquivo)
-                                conn = storage._get_connection()
+                                conn = await astorage._get_connection()
                                 c = conn.cursor()
                                 c.execute('DELETE FROM documentos WHERE id = ?', [doc.id])
                                 conn.commit()
@@ -2054,6 +2127,20 @@ async def limpar_documentos_orfaos(dry_run: bool = True):
         "mensagem": "Simulação - use dry_run=false para deletar" if dry_run else f"Deletados {len(deletados)} documentos órfãos"
     }
 
+@router.post("/api/manutencao/blobs/gc", tags=["Manutenção"])
+async def coletar_blobs_orfaos_endpoint(dry_run: bool = True, grace_seconds: float = 3600):
+    """
+    Remove blobs (conteúdo deduplicado por sha256) sem nenhum documento apontando.
+
+    Args:
+        dry_run: Se True (padrão), apenas lista o que seria removido.
+        grace_seconds: Blobs locais mais novos que isso são preservados.
+    """
+    resultado = await astorage.coletar_blobs_orfaos(dry_run=dry_run, grace_seconds=grace_seconds)
+    resultado["stats"] = await astorage.get_blob_stats()
+    return resultado
+
+
 # ============================================================
 # BACKFILL: DISPLAY NAMES
 # ============================================================
@@ -2129,10 +2216,10 @@ async def backfill_display_names_v2(dry_run: bool = True):
     errors = 0
     total = 0
 
-    for materia in storage.listar_materias():
-        for turma in storage.listar_turmas(materia.id):
-            for atividade in storage.listar_atividades(turma.id):
-                for doc in storage.listar_documentos(atividade.id):
+    for materia in await astorage.listar_materias():
+        for turma in await astorage.listar_turmas(materia.id):
+            for atividade in await astorage.listar_atividades(turma.id):
+                for doc in await astorage.listar_documentos(atividade.id):
                     total += 1
 
                     if doc.display_name:
@@ -2141,7 +2228,7 @@ async def backfill_display_names_v2(dry_run: bool = True):
 
                     aluno_nome = None
                     if doc.aluno_id:
-                        aluno = storage.get_aluno(doc.aluno_id)
+                        aluno = await astorage.get_aluno(doc.aluno_id)
                         aluno_nome = aluno.nome if aluno else "[Aluno desconhecido]"
 
                     new_name = build_display_name(
@@ -2197,10 +2284,10 @@ async def supabase_debug():
 
     # Try to get one doc from DB to get a real ID
     doc_id = None
-    for materia in storage.listar_materias():
-        for turma in storage.listar_turmas(materia.id):
-            for atividade in storage.listar_atividades(turma.id):
-                docs = storage.listar_documentos(atividade.id)
+    for materia in await astorage.listar_materias():
+        for turma in await astorage.listar_turmas(materia.id):
+            for atividade in await astorage.listar_atividades(turma.id):
+                docs = await astorage.listar_documentos(atividade.id)
                 if docs:
                     doc_id = docs[0].id
                     break
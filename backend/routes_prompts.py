@@ -15,17 +15,20 @@ from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from pathlib import Path
-import asyncio
 import inspect
 import json
 import logging
 import tempfile
 import threading
 
+import ai_http
+import task_queue
 from prompts import PromptManager, PromptTemplate, EtapaProcessamento, prompt_manager
-from storage import storage
+from storage import AsyncStorageManager, storage
 from models import TipoDocumento, Documento, StatusProcessamento
 from routes_tasks import register_pipeline_task, complete_pipeline_task
+from batch_runner import POLITICA_CONTINUAR, POLITICAS_LOTE, executar_em_lote, pipeline_sucesso
+from task_cancel import TarefaCancelada, escopo_cancelavel
 from ai_execution import (
     CAPABILITY_DOCUMENT_READ,
     create_document_provider,
@@ -36,6 +39,9 @@ from ai_execution import (
 
 logger = logging.getLogger(__name__)
 
+# Fachada async: resolve `storage` a cada chamada (mantém patch("routes_prompts.storage") nos testes)
+astorage = AsyncStorageManager(resolver=lambda: storage)
+
 
 def _resolve_names_from_atividade(atividade_id):
     """Look up matéria/turma/atividade names for task_registry.
@@ -76,14 +82,24 @@ def _start_detached_task(func, *args, **kwargs):
     so running it there can keep the Render worker unresponsive. A daemon thread
     gives the HTTP response a clean break: task progress is tracked through
     task_registry, not through the request connection.
+
+    With the durable task queue enabled (task_queue.py) the call is enqueued
+    instead and a leased worker runs it, so a restart resumes it rather than
+    losing it. Returns the thread, or None when the run was enqueued.
     """
+    task_id = kwargs.get("task_id")
+    if task_id and not args:
+        try:
+            if task_queue.enqueue(task_id, getattr(func, "__name__", ""), kwargs):
+                return None
+        except TypeError as exc:
+            logger.warning("Task %s not enqueued (kwargs not JSON-serializable): %s", task_id, exc)
 
     def _runner():
-        task_id = kwargs.get("task_id")
         try:
             result = func(*args, **kwargs)
             if inspect.isawaitable(result):
-                asyncio.run(result)
+                ai_http.run(result)
         except Exception as exc:
             logger.exception("Detached pipeline task failed")
             if task_id:
@@ -297,7 +313,7 @@ FALHA_LEITURA_DOCUMENTO: <motivo>
 
 
 async def _analyze_aluno_turma_report_doc(provider, doc: Documento, aluno, turma, materia, atividade) -> Dict[str, Any]:
-    path = storage.resolver_caminho_documento(doc)
+    path = await astorage.resolver_caminho_documento(doc)
     if not path.exists():
         raise HTTPException(
             status_code=500,
@@ -432,7 +448,8 @@ async def _gerar_aluno_turma_para_modelo(
 ) -> Dict[str, Any]:
     resolution, provider = _resolve_document_read_provider(model_id=model_id, provider_id=provider_id)
 
-    existente = _existing_aluno_turma_report(
+    existente = await astorage.run(
+        _existing_aluno_turma_report,
         aluno.id,
         turma.id,
         requested_model_id=resolution.requested_model_id,
@@ -447,7 +464,7 @@ async def _gerar_aluno_turma_para_modelo(
             **resolution.metadata(),
         }
 
-    docs_origem = _collect_aluno_turma_report_docs(aluno.id, turma.id, source_document_ids)
+    docs_origem = await astorage.run(_collect_aluno_turma_report_docs, aluno.id, turma.id, source_document_ids)
     if not docs_origem:
         raise HTTPException(
             status_code=400,
@@ -463,7 +480,7 @@ async def _gerar_aluno_turma_para_modelo(
 
     entradas = []
     for doc in docs_origem:
-        atividade = storage.get_atividade(doc.atividade_id)
+        atividade = await astorage.get_atividade(doc.atividade_id)
         if not atividade:
             continue
         entradas.append(
@@ -524,7 +541,7 @@ async def _gerar_aluno_turma_para_modelo(
             tmp.write(report_text)
             tmp_path = Path(tmp.name)
 
-        documento = storage.salvar_documento(
+        documento = await astorage.salvar_documento(
             str(tmp_path),
             TipoDocumento.RELATORIO_DESEMPENHO_ALUNO_TURMA,
             entradas[0]["atividade_id"],
@@ -834,11 +851,11 @@ async def status_processamento(atividade_id: str, aluno_id: Optional[str] = None
     Retorna status de processamento de uma atividade.
     Mostra o que já foi gerado e o que falta.
     """
-    atividade = storage.get_atividade(atividade_id)
+    atividade = await astorage.get_atividade(atividade_id)
     if not atividade:
         raise HTTPException(404, "Atividade não encontrada")
     
-    documentos = storage.listar_documentos(atividade_id, aluno_id)
+    documentos = await astorage.listar_documentos(atividade_id, aluno_id)
     
     # Mapear tipos de documentos presentes
     tipos_presentes = {d.tipo for d in documentos}
@@ -917,14 +934,14 @@ async def preparar_etapa(etapa: str, atividade_id: str, aluno_id: Optional[str]
         raise HTTPException(404, f"Nenhum prompt padrão para etapa {etapa}")
     
     # Carregar documentos disponíveis
-    documentos = storage.listar_documentos(atividade_id, aluno_id)
+    documentos = await astorage.listar_documentos(atividade_id, aluno_id)
     
     # Preparar variáveis disponíveis
     variaveis_disponiveis = {}
     
     for doc in documentos:
         # Ler conteúdo do documento
-        conteudo = _ler_conteudo_documento(doc)
+        conteudo = await astorage.run(_ler_conteudo_documento, doc)
         
         # Mapear para variáveis
         if doc.tipo == TipoDocumento.ENUNCIADO:
@@ -943,16 +960,16 @@ async def preparar_etapa(etapa: str, atividade_id: str, aluno_id: Optional[str]
             variaveis_disponiveis["prova_aluno"] = conteudo
     
     # Info da atividade
-    atividade = storage.get_atividade(atividade_id)
+    atividade = await astorage.get_atividade(atividade_id)
     if atividade:
-        turma = storage.get_turma(atividade.turma_id)
-        materia = storage.get_materia(turma.materia_id) if turma else None
+        turma = await astorage.get_turma(atividade.turma_id)
+        materia = await astorage.get_materia(turma.materia_id) if turma else None
         variaveis_disponiveis["materia"] = materia.nome if materia else "Não definida"
         variaveis_disponiveis["atividade"] = atividade.nome
     
     # Info do aluno
     if aluno_id:
-        aluno = storage.get_aluno(aluno_id)
+        aluno = await astorage.get_aluno(aluno_id)
         if aluno:
             variaveis_disponiveis["nome_aluno"] = aluno.nome
     
@@ -1007,11 +1024,11 @@ async def get_conteudo_documento(documento_id: str):
     - Different error handling for unsupported file types
     - JSON parsing errors not handled in other endpoints
     """
-    documento = storage.get_documento(documento_id)
+    documento = await astorage.get_documento(documento_id)
     if not documento:
         raise HTTPException(404, "Documento não encontrado")
     
-    arquivo = storage.resolver_caminho_documento(documento)
+    arquivo = await astorage.resolver_caminho_documento(documento)
 
     if not arquivo.exists():
         # File doesn't exist - return info about the missing file
@@ -1225,12 +1242,12 @@ async def _executar_com_chat_service(
     # Carregar variáveis usando o executor (mesma lógica do pipeline-completo)
     from executor import executor
 
-    atividade = storage.get_atividade(atividade_id)
+    atividade = await astorage.get_atividade(atividade_id)
     if not atividade:
         raise HTTPException(404, f"Atividade não encontrada: {atividade_id}")
 
-    turma = storage.get_turma(atividade.turma_id)
-    materia = storage.get_materia(turma.materia_id) if turma else None
+    turma = await astorage.get_turma(atividade.turma_id)
+    materia = await astorage.get_materia(turma.materia_id) if turma else None
 
     variaveis = executor._preparar_variaveis_texto(
         etapa, atividade_id, aluno_id, materia, atividade, usar_multimodal=True
@@ -1359,12 +1376,12 @@ async def executar_pipeline_completo(
 
     # Register the task in task_registry synchronously so the task_id
     # exists before the response is returned and polling can start immediately.
-    names = _resolve_names_from_atividade(atividade_id)
+    names = await astorage.run(_resolve_names_from_atividade, atividade_id)
     task_id = register_pipeline_task(
         task_type="pipeline",
         atividade_id=atividade_id,
         aluno_ids=[aluno_id],
-        student_names=_resolve_student_names([aluno_id]),
+        student_names=await astorage.run(_resolve_student_names, [aluno_id]),
         **names,
     )
 
@@ -1410,8 +1427,8 @@ async def status_etapas_pipeline(atividade_id: str, aluno_id: str):
     etapas_atividade = ["extrair_questoes", "extrair_gabarito"]
     
     # Buscar documentos
-    docs_base = storage.listar_documentos(atividade_id)
-    docs_aluno = storage.listar_documentos(atividade_id, aluno_id)
+    docs_base = await astorage.listar_documentos(atividade_id)
+    docs_aluno = await astorage.listar_documentos(atividade_id, aluno_id)
     
     status = {}
     for etapa_nome, tipo_doc in etapa_tipo_map.items():
@@ -1465,10 +1482,10 @@ async def listar_versoes_documentos(
     # Buscar documentos base da atividade e documentos estritamente do aluno.
     # storage.listar_documentos(atividade_id) retorna o historico inteiro da
     # atividade; filtrar aluno_id aqui evita vazar versoes de outros alunos.
-    docs_atividade = storage.listar_documentos(atividade_id)
+    docs_atividade = await astorage.listar_documentos(atividade_id)
     docs_base = [d for d in docs_atividade if not getattr(d, "aluno_id", None)]
     docs_aluno = [
-        d for d in storage.listar_documentos(atividade_id, aluno_id)
+        d for d in await astorage.listar_documentos(atividade_id, aluno_id)
         if getattr(d, "aluno_id", None) == aluno_id
     ]
 
@@ -1524,24 +1541,27 @@ async def executar_lote(
     providers: Optional[str] = Form(None),
     models_per_stage: Optional[str] = Form(None),
     source_document_ids: Optional[str] = Form(None),
+    max_concorrencia: Optional[int] = Form(None),
+    politica_falha: str = Form(POLITICA_CONTINUAR),
 ):
     """
     Executa o pipeline completo para múltiplos alunos.
+
+    Os alunos rodam em paralelo (até ``max_concorrencia``, padrão
+    PARALLEL_WORKERS). ``politica_falha``: "continuar" ou "falhar_rapido"
+    (a primeira falha impede os alunos restantes de começar).
     """
     from executor import executor
-    
+
+    _validar_opcoes_lote(max_concorrencia, politica_falha)
     ids = [id.strip() for id in aluno_ids.split(',') if id.strip()]
     
     providers_map = _parse_form_map(providers, "providers")
     models_stage_map = _parse_models_per_stage(models_per_stage=models_per_stage)
     source_map = _parse_form_map(source_document_ids, "source_document_ids")
-    
-    resultados_por_aluno = {}
-    for aluno_id in ids:
-        aluno = storage.get_aluno(aluno_id)
-        nome = aluno.nome if aluno else aluno_id
-        
-        resultados = await executor.executar_pipeline_completo(
+
+    async def _executar_aluno(aluno_id: str):
+        return await executor.executar_pipeline_completo(
             atividade_id=atividade_id,
             aluno_id=aluno_id,
             model_id=model_id,
@@ -1550,25 +1570,46 @@ async def executar_lote(
             models_per_stage=models_stage_map,
             source_document_ids=source_map,
         )
-        
-        sucesso = all(r.sucesso for r in resultados.values())
-        resultados_por_aluno[aluno_id] = {
-            "nome": nome,
-            "sucesso": sucesso,
-            "etapas": list(resultados.keys())
+
+    itens = await executar_em_lote(
+        ids,
+        _executar_aluno,
+        sucesso=pipeline_sucesso,
+        concorrencia=max_concorrencia,
+        politica=politica_falha,
+    )
+    nomes = await astorage.run(_resolve_student_names, ids)
+
+    resultados_por_aluno = {}
+    for item in itens:
+        resultados_por_aluno[item.chave] = {
+            "nome": nomes.get(item.chave) or item.chave,
+            "sucesso": item.sucesso,
+            "status": item.status,
+            "etapas": list((item.resultado or {}).keys()),
         }
+        if item.erro is not None:
+            resultados_por_aluno[item.chave]["erro"] = str(item.erro)
     
     return {
         "total_alunos": len(ids),
         "sucesso": sum(1 for r in resultados_por_aluno.values() if r["sucesso"]),
-        "falhas": sum(1 for r in resultados_por_aluno.values() if not r["sucesso"]),
+        "falhas": sum(1 for r in resultados_por_aluno.values() if r["status"] == "failed"),
+        "cancelados": sum(1 for r in resultados_por_aluno.values() if r["status"] == "cancelled"),
         "resultados": resultados_por_aluno
     }
 
 
+def _validar_opcoes_lote(max_concorrencia: Optional[int], politica_falha: str) -> None:
+    if max_concorrencia is not None and max_concorrencia < 1:
+        raise HTTPException(400, "max_concorrencia deve ser >= 1")
+    if politica_falha not in POLITICAS_LOTE:
+        raise HTTPException(400, f"politica_falha inválida. Use: {', '.join(POLITICAS_LOTE)}")
+
+
 async def _executar_pipeline_todos_os_alunos_background(
     task_id: str,
-    alunos_para_processar: list,
+    aluno_ids: list,
     atividade_id: str,
     model_id,
     provider: str,
@@ -1579,31 +1620,66 @@ async def _executar_pipeline_todos_os_alunos_background(
     prompts_map,
     steps_list,
     force_rerun: bool,
+    max_concorrencia: Optional[int] = None,
+    politica_falha: str = POLITICA_CONTINUAR,
 ):
-    """Background helper: runs pipeline for every student in the turma sequentially."""
+    """Background helper: runs the pipeline for every student, up to max_concorrencia at a time."""
     from executor import executor
-    from routes_tasks import complete_pipeline_task, task_registry, update_stage_progress
+    from file_cache import pin_scope
+    from routes_tasks import complete_pipeline_task, get_task, is_cancel_requested, update_stage_progress
 
-    for aluno in alunos_para_processar:
+    async def _executar_aluno(aluno_id):
+        return await executor.executar_pipeline_completo(
+            task_id=task_id,
+            atividade_id=atividade_id,
+            aluno_id=aluno_id,
+            model_id=model_id,
+            provider_name=provider,
+            providers_map=providers_map,
+            models_per_stage=models_per_stage,
+            source_document_ids=source_document_ids,
+            prompt_id=prompt_id,
+            prompts_map=prompts_map,
+            selected_steps=steps_list,
+            force_rerun=force_rerun,
+        )
+
+    # Documentos baixados antes da primeira chamada ao LLM e pinados até o fim do lote
+    with pin_scope():
         try:
-            await executor.executar_pipeline_completo(
-                task_id=task_id,
-                atividade_id=atividade_id,
-                aluno_id=aluno.id,
-                model_id=model_id,
-                provider_name=provider,
-                providers_map=providers_map,
-                models_per_stage=models_per_stage,
-                source_document_ids=source_document_ids,
-                prompt_id=prompt_id,
-                prompts_map=prompts_map,
-                selected_steps=steps_list,
-                force_rerun=force_rerun,
+            await executor.prefetch_atividade(
+                atividade_id,
+                aluno_ids,
+                incluir_gerados=not force_rerun,
             )
         except Exception as exc:
-            task = task_registry.get(task_id) or {}
-            student = (task.get("students") or {}).get(aluno.id, {})
-            stages = student.get("stages") or {}
+            logger.warning(f"[prefetch] falhou para atividade {atividade_id}: {exc}")
+
+        itens = await executar_em_lote(
+            aluno_ids,
+            _executar_aluno,
+            sucesso=pipeline_sucesso,
+            concorrencia=max_concorrencia,
+            politica=politica_falha,
+            task_id=task_id,
+        )
+
+    for item in itens:
+        task = get_task(task_id) or {}
+        student = (task.get("students") or {}).get(item.chave, {})
+        stages = student.get("stages") or {}
+        if item.status == "cancelled":
+            # Nunca começou (falha rápida ou cancelamento): não deixar etapas pendentes
+            for stage, status in list(stages.items()):
+                if status == "pending":
+                    update_stage_progress(
+                        task_id,
+                        item.chave,
+                        stage,
+                        "skipped",
+                        error={"mensagem": "Aluno não iniciado: lote interrompido", "tipo": "batch_not_started"},
+                    )
+        elif item.erro is not None:
             failed_stage = next(
                 (stage for stage, status in stages.items() if status == "running"),
                 None,
@@ -1613,16 +1689,19 @@ async def _executar_pipeline_todos_os_alunos_background(
             )
             update_stage_progress(
                 task_id,
-                aluno.id,
+                item.chave,
                 failed_stage,
                 "failed",
                 error={
-                    "mensagem": f"Excecao no processamento em lote: {exc}",
+                    "mensagem": f"Excecao no processamento em lote: {item.erro}",
                     "tipo": "batch_student_exception",
                 },
             )
 
-    complete_pipeline_task(task_id, "completed")
+    if is_cancel_requested(task_id):
+        complete_pipeline_task(task_id, "cancelled")
+    else:
+        complete_pipeline_task(task_id, "completed")
 
 
 @router.post("/api/executar/pipeline-todos-os-alunos", tags=["Execução"])
@@ -1638,7 +1717,9 @@ async def executar_pipeline_todos_os_alunos(
     prompts_per_stage: Optional[str] = Form(None),
     selected_steps: Optional[str] = Form(None),
     force_rerun: bool = Form(False),
-    apenas_com_prova: bool = Form(True)  # Apenas alunos que têm prova enviada
+    apenas_com_prova: bool = Form(True),  # Apenas alunos que têm prova enviada
+    max_concorrencia: Optional[int] = Form(None),
+    politica_falha: str = Form(POLITICA_CONTINUAR),
 ):
     """
     [LEGACY - CONSIDER UNIFICATION] Executa o pipeline completo para TODOS os alunos de uma turma.
@@ -1646,14 +1727,19 @@ async def executar_pipeline_todos_os_alunos(
     Retorna task_id imediatamente para polling via /api/task-progress/{task_id}.
 
     ⚠️  UNIFICATION CANDIDATE: See /api/pipeline/executar in routes_pipeline.py for details
+
+    Os alunos rodam em paralelo (até ``max_concorrencia``, padrão PARALLEL_WORKERS);
+    ``politica_falha`` = "continuar" | "falhar_rapido".
     """
+    _validar_opcoes_lote(max_concorrencia, politica_falha)
+
     # Buscar atividade e turma
-    atividade = storage.get_atividade(atividade_id)
+    atividade = await astorage.get_atividade(atividade_id)
     if not atividade:
         raise HTTPException(404, "Atividade não encontrada")
 
     # Buscar todos os alunos da turma
-    alunos = storage.listar_alunos(atividade.turma_id)
+    alunos = await astorage.listar_alunos(atividade.turma_id)
     if not alunos:
         raise HTTPException(400, "Nenhum aluno encontrado na turma")
 
@@ -1661,7 +1747,7 @@ async def executar_pipeline_todos_os_alunos(
     alunos_para_processar = []
     for aluno in alunos:
         if apenas_com_prova:
-            docs_aluno = storage.listar_documentos(atividade_id, aluno.id)
+            docs_aluno = await astorage.listar_documentos(atividade_id, aluno.id)
             tem_prova = any(d.tipo == TipoDocumento.PROVA_RESPONDIDA for d in docs_aluno)
             if tem_prova:
                 alunos_para_processar.append(aluno)
@@ -1695,14 +1781,14 @@ async def executar_pipeline_todos_os_alunos(
             raise HTTPException(400, "Formato inválido para selected_steps. Use JSON array.")
 
     # Register all students synchronously so task_id exists before response is returned.
-    names = _resolve_names_from_atividade(atividade_id)
+    names = await astorage.run(_resolve_names_from_atividade, atividade_id)
     aluno_ids_para_processar = [aluno.id for aluno in alunos_para_processar]
     task_id = register_pipeline_task(
         task_type="pipeline_todos_os_alunos",
         atividade_id=atividade_id,
         aluno_ids=aluno_ids_para_processar,
         turma_id=atividade.turma_id,
-        student_names=_resolve_student_names(aluno_ids_para_processar),
+        student_names=await astorage.run(_resolve_student_names, aluno_ids_para_processar),
         **names,
     )
 
@@ -1710,7 +1796,7 @@ async def executar_pipeline_todos_os_alunos(
     _start_detached_task(
         _executar_pipeline_todos_os_alunos_background,
         task_id=task_id,
-        alunos_para_processar=alunos_para_processar,
+        aluno_ids=aluno_ids_para_processar,
         atividade_id=atividade_id,
         model_id=model_id,
         provider=provider,
@@ -1721,6 +1807,8 @@ async def executar_pipeline_todos_os_alunos(
         prompts_map=prompts_map,
         steps_list=steps_list,
         force_rerun=force_rerun,
+        max_concorrencia=max_concorrencia,
+        politica_falha=politica_falha,
     )
 
     return {"task_id": task_id, "status": "started"}
@@ -1763,28 +1851,28 @@ async def executar_pipeline_desempenho_aluno_turma(
     salva um Markdown consolidado. Se o provider nao conseguir ler o documento,
     a execucao falha em vez de criar placeholder.
     """
-    aluno = storage.get_aluno(aluno_id)
+    aluno = await astorage.get_aluno(aluno_id)
     if not aluno:
         raise HTTPException(404, "Aluno não encontrado")
 
-    turma = storage.get_turma(turma_id)
+    turma = await astorage.get_turma(turma_id)
     if not turma:
         raise HTTPException(404, "Turma não encontrada")
 
-    turmas_do_aluno = storage.get_turmas_do_aluno(aluno_id, apenas_ativas=False)
+    turmas_do_aluno = await astorage.get_turmas_do_aluno(aluno_id, apenas_ativas=False)
     if not any(item.get("id") == turma_id for item in turmas_do_aluno):
         raise HTTPException(404, "Aluno não vinculado a esta turma")
 
-    materia = storage.get_materia(turma.materia_id) if turma.materia_id else None
+    materia = await astorage.get_materia(turma.materia_id) if turma.materia_id else None
     source_map = _parse_form_map(source_document_ids, "source_document_ids")
     requests = _model_requests(model_id, model_ids, provider_id)
 
     atividade_ref = None
-    for doc in _collect_aluno_turma_report_docs(aluno_id, turma_id, source_map):
+    for doc in await astorage.run(_collect_aluno_turma_report_docs, aluno_id, turma_id, source_map):
         atividade_ref = doc.atividade_id
         break
     if atividade_ref is None:
-        atividades = storage.listar_atividades(turma_id)
+        atividades = await astorage.listar_atividades(turma_id)
         atividade_ref = atividades[0].id if atividades else turma_id
 
     task_id = register_pipeline_task(
@@ -1828,7 +1916,8 @@ async def executar_pipeline_desempenho_aluno_turma(
                     "legacy_provider_id": request.get("provider_id"),
                     "erro": exc.detail,
                 }
-                saved_error = _salvar_documento_erro_ia(
+                saved_error = await astorage.run(
+                    _salvar_documento_erro_ia,
                     TipoDocumento.RELATORIO_DESEMPENHO_ALUNO_TURMA,
                     atividade_ref,
                     aluno.id,
@@ -1861,7 +1950,8 @@ async def executar_pipeline_desempenho_aluno_turma(
                 "legacy_provider_id": request.get("provider_id"),
                 "erro": erro,
             }
-            saved_error = _salvar_documento_erro_ia(
+            saved_error = await astorage.run(
+                _salvar_documento_erro_ia,
                 TipoDocumento.RELATORIO_DESEMPENHO_ALUNO_TURMA,
                 atividade_ref,
                 aluno.id,
@@ -1911,11 +2001,11 @@ async def executar_documento_multi_ia(
     salvam `analise_documento_ia`; falhas ficam no retorno, sem fallback para
     outro modelo.
     """
-    doc = storage.get_documento(documento_id)
+    doc = await astorage.get_documento(documento_id)
     if not doc:
         raise HTTPException(404, "Documento não encontrado")
 
-    path = storage.resolver_caminho_documento(doc)
+    path = await astorage.resolver_caminho_documento(doc)
     if not path.exists():
         raise HTTPException(404, "Arquivo do documento não encontrado")
 
@@ -1971,7 +2061,7 @@ async def executar_documento_multi_ia(
                     tmp.write(content + "\n")
                     tmp_path = Path(tmp.name)
 
-                saved = storage.salvar_documento(
+                saved = await astorage.salvar_documento(
                     str(tmp_path),
                     TipoDocumento.ANALISE_DOCUMENTO_IA,
                     doc.atividade_id,
@@ -2010,7 +2100,8 @@ async def executar_documento_multi_ia(
                 **resolution_metadata,
                 "erro": exc.detail,
             }
-            saved_error = _salvar_documento_erro_ia(
+            saved_error = await astorage.run(
+                _salvar_documento_erro_ia,
                 TipoDocumento.ANALISE_DOCUMENTO_IA,
                 doc.atividade_id,
                 doc.aluno_id,
@@ -2043,7 +2134,8 @@ async def executar_documento_multi_ia(
                 **resolution_metadata,
                 "erro": erro,
             }
-            saved_error = _salvar_documento_erro_ia(
+            saved_error = await astorage.run(
+                _salvar_documento_erro_ia,
                 TipoDocumento.ANALISE_DOCUMENTO_IA,
                 doc.atividade_id,
                 doc.aluno_id,
@@ -2088,7 +2180,7 @@ async def executar_pipeline_desempenho_tarefa(
     coletivo questão-a-questão com exemplos concretos de alunos.
     Requer pelo menos 2 alunos com narrativas completas.
     """
-    atividade = storage.get_atividade(atividade_id)
+    atividade = await astorage.get_atividade(atividade_id)
     if not atividade:
         raise HTTPException(404, "Atividade não encontrada")
 
@@ -2097,7 +2189,7 @@ async def executar_pipeline_desempenho_tarefa(
         models_per_stage=models_per_stage,
         phase_models=phase_models,
     )
-    names = _resolve_names_from_atividade(atividade_id)
+    names = await astorage.run(_resolve_names_from_atividade, atividade_id)
     task_id = register_pipeline_task(
         task_type="pipeline_desempenho_tarefa",
         atividade_id=atividade_id,
@@ -2129,42 +2221,36 @@ async def _executar_desempenho_tarefa_background(
     isolate_provider: bool = False,
 ):
     from executor import executor
-    from routes_tasks import task_registry, PIPELINE_STAGES
+    from routes_tasks import add_task_students
     try:
-        # Pre-populate students for the UI progress panel
-        try:
-            atividade = storage.get_atividade(atividade_id)
-            alunos = storage.listar_alunos(atividade.turma_id) if atividade else []
-            task = task_registry.get(task_id)
-            if task is not None:
-                students = task.setdefault("students", {})
-                for aluno in (alunos or []):
-                    if aluno.id not in students:
-                        students[aluno.id] = {
-                            "nome": aluno.nome or "",
-                            "stages": {s: "pending" for s in PIPELINE_STAGES},
-                            "stage_errors": {},
-                        }
-        except Exception:
-            pass
-
-        await executor._cascade_prereqs(
-            level="tarefa",
-            entity_id=atividade_id,
-            provider_id=model_id or provider_id,
-            models_per_stage=models_per_stage,
-            force_reexec=force_reexec,
-            task_id=task_id,
-            isolate_provider=isolate_provider,
-        )
-        resultado = await executor.gerar_relatorio_desempenho_tarefa(
-            atividade_id=atividade_id,
-            provider_id=model_id or provider_id,
-        )
-        if resultado.get("sucesso"):
-            complete_pipeline_task(task_id, "completed", result=resultado)
-        else:
-            complete_pipeline_task(task_id, "failed", error=resultado.get("erro"))
+        async with escopo_cancelavel(task_id):
+            # Pre-populate students for the UI progress panel
+            try:
+                atividade = await astorage.get_atividade(atividade_id)
+                alunos = await astorage.listar_alunos(atividade.turma_id) if atividade else []
+                add_task_students(task_id, {aluno.id: aluno.nome for aluno in (alunos or [])})
+            except Exception:
+                pass
+
+            await executor._cascade_prereqs(
+                level="tarefa",
+                entity_id=atividade_id,
+                provider_id=model_id or provider_id,
+                models_per_stage=models_per_stage,
+                force_reexec=force_reexec,
+                task_id=task_id,
+                isolate_provider=isolate_provider,
+            )
+            resultado = await executor.gerar_relatorio_desempenho_tarefa(
+                atividade_id=atividade_id,
+                provider_id=model_id or provider_id,
+            )
+            if resultado.get("sucesso"):
+                complete_pipeline_task(task_id, "completed", result=resultado)
+            else:
+                complete_pipeline_task(task_id, "failed", error=resultado.get("erro"))
+    except TarefaCancelada:
+        complete_pipeline_task(task_id, "cancelled")
     except Exception as e:
         complete_pipeline_task(task_id, "failed", error=str(e))
 
@@ -2189,7 +2275,7 @@ async def executar_pipeline_desempenho_turma(
     coletivo e evolução individual.
     Requer pelo menos 2 alunos na turma.
     """
-    turma = storage.get_turma(turma_id)
+    turma = await astorage.get_turma(turma_id)
     if not turma:
         raise HTTPException(404, "Turma não encontrada")
 
@@ -2198,7 +2284,7 @@ async def executar_pipeline_desempenho_turma(
         models_per_stage=models_per_stage,
         phase_models=phase_models,
     )
-    materia = storage.get_materia(turma.materia_id) if turma else None
+    materia = await astorage.get_materia(turma.materia_id) if turma else None
     task_id = register_pipeline_task(
         task_type="pipeline_desempenho_turma",
         atividade_id=turma_id,
@@ -2232,43 +2318,37 @@ async def _executar_desempenho_turma_background(
     isolate_provider: bool = False,
 ):
     from executor import executor
-    from routes_tasks import task_registry, PIPELINE_STAGES
+    from routes_tasks import add_task_students
     try:
-        # Pre-populate students in task_registry so the UI progress panel
-        # can show names from the first poll, before the cascade has touched
-        # any aluno yet.
-        try:
-            alunos = storage.listar_alunos(turma_id) or []
-            task = task_registry.get(task_id)
-            if task is not None:
-                students = task.setdefault("students", {})
-                for aluno in alunos:
-                    if aluno.id not in students:
-                        students[aluno.id] = {
-                            "nome": aluno.nome or "",
-                            "stages": {s: "pending" for s in PIPELINE_STAGES},
-                            "stage_errors": {},
-                        }
-        except Exception:
-            pass  # progress pre-population is best-effort; cascade still works
-
-        await executor._cascade_prereqs(
-            level="turma",
-            entity_id=turma_id,
-            provider_id=model_id or provider_id,
-            models_per_stage=models_per_stage,
-            force_reexec=force_reexec,
-            task_id=task_id,
-            isolate_provider=isolate_provider,
-        )
-        resultado = await executor.gerar_relatorio_desempenho_turma(
-            turma_id=turma_id,
-            provider_id=model_id or provider_id,
-        )
-        if resultado.get("sucesso"):
-            complete_pipeline_task(task_id, "completed", result=resultado)
-        else:
-            complete_pipeline_task(task_id, "failed", error=resultado.get("erro"))
+        async with escopo_cancelavel(task_id):
+            # Pre-populate students in task_registry so the UI progress panel
+            # can show names from the first poll, before the cascade has touched
+            # any aluno yet.
+            try:
+                alunos = await astorage.listar_alunos(turma_id) or []
+                add_task_students(task_id, {aluno.id: aluno.nome for aluno in alunos})
+            except Exception:
+                pass  # progress pre-population is best-effort; cascade still works
+
+            await executor._cascade_prereqs(
+                level="turma",
+                entity_id=turma_id,
+                provider_id=model_id or provider_id,
+                models_per_stage=models_per_stage,
+                force_reexec=force_reexec,
+                task_id=task_id,
+                isolate_provider=isolate_provider,
+            )
+            resultado = await executor.gerar_relatorio_desempenho_turma(
+                turma_id=turma_id,
+                provider_id=model_id or provider_id,
+            )
+            if resultado.get("sucesso"):
+                complete_pipeline_task(task_id, "completed", result=resultado)
+            else:
+                complete_pipeline_task(task_id, "failed", error=resultado.get("erro"))
+    except TarefaCancelada:
+        complete_pipeline_task(task_id, "cancelled")
     except Exception as e:
         complete_pipeline_task(task_id, "failed", error=str(e))
 
@@ -2292,7 +2372,7 @@ async def executar_pipeline_desempenho_materia(
     padrões cross-turma e efetividade curricular.
     Requer pelo menos 2 turmas com resultados.
     """
-    materia = storage.get_materia(materia_id)
+    materia = await astorage.get_materia(materia_id)
     if not materia:
         raise HTTPException(404, "Matéria não encontrada")
 
@@ -2334,23 +2414,26 @@ async def _executar_desempenho_materia_background(
 ):
     from executor import executor
     try:
-        await executor._cascade_prereqs(
-            level="materia",
-            entity_id=materia_id,
-            provider_id=model_id or provider_id,
-            models_per_stage=models_per_stage,
-            force_reexec=force_reexec,
-            task_id=task_id,
-            isolate_provider=isolate_provider,
-        )
-        resultado = await executor.gerar_relatorio_desempenho_materia(
-            materia_id=materia_id,
-            provider_id=model_id or provider_id,
-        )
-        if resultado.get("sucesso"):
-            complete_pipeline_task(task_id, "completed", result=resultado)
-        else:
-            complete_pipeline_task(task_id, "failed", error=resultado.get("erro"))
+        async with escopo_cancelavel(task_id):
+            await executor._cascade_prereqs(
+                level="materia",
+                entity_id=materia_id,
+                provider_id=model_id or provider_id,
+                models_per_stage=models_per_stage,
+                force_reexec=force_reexec,
+                task_id=task_id,
+                isolate_provider=isolate_provider,
+            )
+            resultado = await executor.gerar_relatorio_desempenho_materia(
+                materia_id=materia_id,
+                provider_id=model_id or provider_id,
+            )
+            if resultado.get("sucesso"):
+                complete_pipeline_task(task_id, "completed", result=resultado)
+            else:
+                complete_pipeline_task(task_id, "failed", error=resultado.get("erro"))
+    except TarefaCancelada:
+        complete_pipeline_task(task_id, "cancelled")
     except Exception as e:
         complete_pipeline_task(task_id, "failed", error=str(e))
 
@@ -2366,7 +2449,7 @@ async def executar_desempenho_tarefa_sync(
 ):
     """Synchronous desempenho tarefa — awaits result instead of background task."""
     from executor import executor
-    atividade = storage.get_atividade(atividade_id)
+    atividade = await astorage.get_atividade(atividade_id)
     if not atividade:
         raise HTTPException(404, "Atividade não encontrada")
     resultado = await executor.gerar_relatorio_desempenho_tarefa(
@@ -2382,7 +2465,7 @@ async def executar_desempenho_turma_sync(
 ):
     """Synchronous desempenho turma — awaits result instead of background task."""
     from executor import executor
-    turma = storage.get_turma(turma_id)
+    turma = await astorage.get_turma(turma_id)
     if not turma:
         raise HTTPException(404, "Turma não encontrada")
     resultado = await executor.gerar_relatorio_desempenho_turma(
@@ -2398,10 +2481,31 @@ async def executar_desempenho_materia_sync(
 ):
     """Synchronous desempenho materia — awaits result instead of background task."""
     from executor import executor
-    materia = storage.get_materia(materia_id)
+    materia = await astorage.get_materia(materia_id)
     if not materia:
         raise HTTPException(404, "Matéria não encontrada")
     resultado = await executor.gerar_relatorio_desempenho_materia(
         materia_id=materia_id, provider_id=provider_id,
     )
     return resultado
+
+
+# ============================================================
+# DURABLE TASK HANDLERS (task_queue: runs enqueued by _start_detached_task)
+# ============================================================
+
+
+async def _executar_pipeline_completo_job(**kwargs):
+    from executor import executor
+    return await executor.executar_pipeline_completo(**kwargs)
+
+
+# Same name as executor.executar_pipeline_completo.__name__ (what the endpoint enqueues)
+task_queue.register_handler("executar_pipeline_completo", _executar_pipeline_completo_job)
+for _handler in (
+    _executar_pipeline_todos_os_alunos_background,
+    _executar_desempenho_tarefa_background,
+    _executar_desempenho_turma_background,
+    _executar_desempenho_materia_background,
+):
+    task_queue.register_handler(_handler.__name__, _handler)
@@ -16,11 +16,14 @@ from enum import Enum
 from typing import Any, Dict, Optional
 
 from visualizador import VisualizadorResultados, visualizador
-from storage import storage
+from storage import AsyncStorageManager, storage
 
 
 router = APIRouter()
 
+# Fachada async: resolve `storage` a cada chamada (mantém patch("routes_resultados.storage") nos testes)
+astorage = AsyncStorageManager(resolver=lambda: storage)
+
 
 def _enum_or_string_value(value: Any) -> Optional[str]:
     """Normaliza Enums reais e mocks simples sem deixar MagicMock virar status."""
@@ -209,7 +212,7 @@ async def get_ranking_turma_static(atividade_id: str):
 
 @router.get("/api/resultados/{atividade_id}/estatisticas", tags=["Resultados"])
 async def get_estatisticas_atividade_static(atividade_id: str):
-    return _estatisticas_response(atividade_id)
+    return await astorage.run(_estatisticas_response, atividade_id)
 
 
 @router.get("/api/resultados/{atividade_id}/{aluno_id}", tags=["Resultados"])
@@ -233,7 +236,7 @@ async def get_resultado_aluno(atividade_id: str, aluno_id: str):
     
     # Sem resultado final - retornar status parcial do pipeline
     # Buscar documentos disponíveis para mostrar progresso
-    docs_contexto = storage.listar_documentos(atividade_id, aluno_id)
+    docs_contexto = await astorage.listar_documentos(atividade_id, aluno_id)
     docs_aluno = [doc for doc in docs_contexto if doc.aluno_id == aluno_id]
     docs_base = [doc for doc in docs_contexto if not doc.aluno_id]
     
@@ -273,10 +276,10 @@ async def get_resultado_aluno(atividade_id: str, aluno_id: str):
         "relatorio_final",
     ]:
         if etapas[tipo]["doc_id"]:
-            doc = docs_por_id.get(etapas[tipo]["doc_id"]) or storage.get_documento(etapas[tipo]["doc_id"])
+            doc = docs_por_id.get(etapas[tipo]["doc_id"]) or await astorage.get_documento(etapas[tipo]["doc_id"])
             if doc and doc.extensao == ".json":
                 try:
-                    arquivo_path = storage.resolver_caminho_documento(doc)
+                    arquivo_path = await astorage.resolver_caminho_documento(doc)
                     if arquivo_path.exists():
                         with open(arquivo_path, 'r', encoding='utf-8') as f:
                             dados_parciais[tipo] = json.load(f)
@@ -377,7 +380,7 @@ async def get_estatisticas_atividade(atividade_id: str):
     Retorna estatísticas agregadas de uma atividade.
     Inclui média, mediana, distribuição de notas, etc.
     """
-    return _estatisticas_response(atividade_id)
+    return await astorage.run(_estatisticas_response, atividade_id)
 
 
 # ============================================================
@@ -390,7 +393,7 @@ async def get_historico_aluno(aluno_id: str):
     Retorna histórico de todas as atividades de um aluno.
     Inclui notas de todas as matérias e turmas.
     """
-    aluno = storage.get_aluno(aluno_id)
+    aluno = await astorage.get_aluno(aluno_id)
     if not aluno:
         raise HTTPException(404, "Aluno não encontrado")
     
@@ -453,8 +456,8 @@ async def exportar_pdf(atividade_id: str, aluno_id: str):
         raise HTTPException(500, f"Erro ao converter resultado: {str(e)}")
 
     # Buscar info do aluno e atividade para o título
-    aluno = storage.get_aluno(aluno_id)
-    atividade = storage.get_atividade(atividade_id)
+    aluno = await astorage.get_aluno(aluno_id)
+    atividade = await astorage.get_atividade(atividade_id)
 
     titulo = f"Relatorio - {aluno.nome if aluno else aluno_id}"
     if atividade:
@@ -505,13 +508,13 @@ async def dashboard_turma(turma_id: str):
     Dashboard completo de uma turma.
     Inclui estatísticas de todas as atividades.
     """
-    turma = storage.get_turma(turma_id)
+    turma = await astorage.get_turma(turma_id)
     if not turma:
         raise HTTPException(404, "Turma não encontrada")
     
-    materia = storage.get_materia(turma.materia_id)
-    alunos = storage.listar_alunos(turma_id)
-    atividades = storage.listar_atividades(turma_id)
+    materia = await astorage.get_materia(turma.materia_id)
+    alunos = await astorage.listar_alunos(turma_id)
+    atividades = await astorage.listar_atividades(turma_id)
     
     # Estatísticas por atividade
     atividades_stats = []
@@ -591,11 +594,11 @@ async def get_turmas_aluno_detalhado(aluno_id: str):
     Retorna todas as turmas de um aluno com detalhes completos.
     Inclui caso de aluno repetente em múltiplas turmas da mesma matéria.
     """
-    aluno = storage.get_aluno(aluno_id)
+    aluno = await astorage.get_aluno(aluno_id)
     if not aluno:
         raise HTTPException(404, "Aluno não encontrado")
     
-    turmas_info = storage.get_turmas_do_aluno(aluno_id, apenas_ativas=False)
+    turmas_info = await astorage.get_turmas_do_aluno(aluno_id, apenas_ativas=False)
     
     # Agrupar por matéria para detectar repetência
     por_materia = {}
@@ -611,8 +614,8 @@ async def get_turmas_aluno_detalhado(aluno_id: str):
         is_repetente = len(turmas_mat) > 1
         
         for t in turmas_mat:
-            turma = storage.get_turma(t["id"])
-            atividades = storage.listar_atividades(t["id"]) if turma else []
+            turma = await astorage.get_turma(t["id"])
+            atividades = await astorage.listar_atividades(t["id"]) if turma else []
             
             # Contar atividades corrigidas
             atividades_corrigidas = 0
@@ -658,24 +661,24 @@ async def get_atividades_pendentes_aluno(aluno_id: str):
     """
     Retorna todas as atividades pendentes de correção para um aluno.
     """
-    aluno = storage.get_aluno(aluno_id)
+    aluno = await astorage.get_aluno(aluno_id)
     if not aluno:
         raise HTTPException(404, "Aluno não encontrado")
     
-    turmas = storage.get_turmas_do_aluno(aluno_id)
+    turmas = await astorage.get_turmas_do_aluno(aluno_id)
     pendentes = []
     
     for turma_info in turmas:
-        turma = storage.get_turma(turma_info["id"])
+        turma = await astorage.get_turma(turma_info["id"])
         if not turma:
             continue
         
-        materia = storage.get_materia(turma.materia_id)
-        atividades = storage.listar_atividades(turma.id)
+        materia = await astorage.get_materia(turma.materia_id)
+        atividades = await astorage.listar_atividades(turma.id)
         
         for ativ in atividades:
             # Verificar se tem prova mas não tem correção
-            docs = storage.listar_documentos(ativ.id, aluno_id)
+            docs = await astorage.listar_documentos(ativ.id, aluno_id)
             tem_prova = any(d.tipo == TipoDocumento.PROVA_RESPONDIDA for d in docs)
             tem_correcao = visualizador.get_resultado_aluno(ativ.id, aluno_id) is not None
             
@@ -713,15 +716,15 @@ async def get_comparativo_turmas_aluno(aluno_id: str, materia_id: Optional[str]
     Compara desempenho do aluno entre diferentes turmas.
     Útil para ver evolução de aluno repetente.
     """
-    aluno = storage.get_aluno(aluno_id)
+    aluno = await astorage.get_aluno(aluno_id)
     if not aluno:
         raise HTTPException(404, "Aluno não encontrado")
     
-    turmas = storage.get_turmas_do_aluno(aluno_id)
+    turmas = await astorage.get_turmas_do_aluno(aluno_id)
     
     comparativo = []
     for turma_info in turmas:
-        turma = storage.get_turma(turma_info["id"])
+        turma = await astorage.get_turma(turma_info["id"])
         if not turma:
             continue
         
@@ -729,8 +732,8 @@ async def get_comparativo_turmas_aluno(aluno_id: str, materia_id: Optional[str]
         if materia_id and turma.materia_id != materia_id:
             continue
         
-        materia = storage.get_materia(turma.materia_id)
-        atividades = storage.listar_atividades(turma.id)
+        materia = await astorage.get_materia(turma.materia_id)
+        atividades = await astorage.listar_atividades(turma.id)
         
         notas = []
         for ativ in atividades:
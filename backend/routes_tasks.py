@@ -2,31 +2,53 @@
 NOVO CR - Task Progress Tracking API
 
 Provides endpoints to track background task progress.
+- GET /api/tasks (?since=<seq>: deltas only)
 - GET /api/task-progress/{task_id}
+- GET /api/task-events, /api/task-events/{task_id} (SSE deltas, resumable)
 - POST /api/task-cancel/{task_id}
 
 Helper functions for pipeline integration:
-- register_pipeline_task()
+- register_pipeline_task() / add_task_students()
 - update_stage_progress()
+- record_coalesced_stage()
+- register_batch_progress() / update_batch_item()
 - complete_pipeline_task()
+- is_cancel_requested() / stage_completed_before()
+
+Every helper persists the task snapshot to the durable queue
+(task_queue.TaskStore) when it is enabled, so the endpoints keep working
+across restarts and from a separate worker process; task_registry is then
+just this process's cache. Each mutation also publishes a delta on
+task_events.bus for the SSE stream.
 
 F1-T1, F1-T2, F1-T3 from PLAN_Task_Panel_Sidebar_UI.md
 """
 
+import copy
+import os
+import time
 import uuid
 from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 
-from fastapi import APIRouter
-from fastapi.responses import JSONResponse
+import fast_json
+import task_cancel
+import task_events
+from task_queue import RETENTION_SECONDS, TERMINAL_STATUSES, current_worker_id, get_task_store
 
 router = APIRouter()
 
-# In-memory registry of running/completed tasks.
+# In-memory registry of running/completed tasks (cache of the task store).
 # Keyed by task_id. Each entry is a dict with:
 # task_id, type, atividade_id, turma_id, status,
-# cancel_requested, students, created_at
+# cancel_requested, students, created_at, finished_at
 task_registry = {}
 
+SSE_HEARTBEAT_S = float(os.environ.get("TASK_EVENTS_HEARTBEAT_S", "15"))
+
 PIPELINE_STAGES = [
     "extrair_questoes",
     "extrair_gabarito",
@@ -41,15 +63,30 @@ PIPELINE_STAGES = [
 
 
 @router.get("/api/tasks")
-async def list_all_tasks():
-    """Returns all tasks currently in the registry (for sidebar restore-on-load)."""
-    return list(task_registry.values())
+async def list_all_tasks(since: Optional[int] = None):
+    """Returns all tasks currently in the registry (for sidebar restore-on-load).
+
+    With ?since=<seq> returns only the deltas after that seq:
+    {"seq", "resync": false, "events": [...]}. When the deltas are no longer
+    available the answer is {"seq", "resync": true, "tasks": [...]}.
+    """
+    if since is None:
+        return list_tasks()
+    events, gap = task_events.bus.since(since)
+    if gap:
+        seq = task_events.bus.last_seq()
+        return {"seq": seq, "resync": True, "tasks": list_tasks()}
+    return {
+        "seq": events[-1].seq if events else since,
+        "resync": False,
+        "events": [event.to_dict() for event in events],
+    }
 
 
 @router.get("/api/task-progress/{task_id}")
 async def get_task_progress(task_id: str):
     """Returns progress for a task by task_id."""
-    task = task_registry.get(task_id)
+    task = get_task(task_id)
     if task is None:
         return JSONResponse(
             status_code=404,
@@ -60,17 +97,253 @@ async def get_task_progress(task_id: str):
 
 @router.post("/api/task-cancel/{task_id}")
 async def cancel_task(task_id: str):
-    """Sets cancel_requested flag on a running task."""
-    task = task_registry.get(task_id)
+    """Sets cancel_requested and interrupts the task's in-flight work (task_cancel).
+
+    Work running in this process stops right away; worker processes pick
+    the flag up on their next poll (TASK_CANCEL_POLL_S).
+    """
+    task = get_task(task_id)
     if task is None:
         return JSONResponse(
             status_code=404,
             content={"detail": f"Tarefa '{task_id}' não encontrada"},
         )
-    task["cancel_requested"] = True
+    if task_id in task_registry:
+        task_registry[task_id]["cancel_requested"] = True
+    delta = {"cancel_requested": True}
+    store = get_task_store()
+    seq = None
+    if store is not None:
+        # Separate column: the worker's next snapshot save cannot undo it
+        seq = store.request_cancel(task_id, event=("cancel", delta, task_events.PROCESS_ORIGIN))
+    task_events.bus.publish(task_id, "cancel", delta, seq=seq)
+    task_cancel.cancelar(task_id)
     return {"task_id": task_id, "cancel_requested": True}
 
 
+@router.get("/api/task-events")
+async def stream_all_task_events(request: Request, after: Optional[int] = None):
+    """SSE stream of deltas for every task (see task_events for the kinds)."""
+    return _sse_response(request, None, after)
+
+
+@router.get("/api/task-events/{task_id}")
+async def stream_task_events(request: Request, task_id: str, after: Optional[int] = None):
+    """SSE stream of one task's deltas; ends after its terminal status."""
+    if get_task(task_id) is None:
+        return JSONResponse(
+            status_code=404,
+            content={"detail": f"Tarefa '{task_id}' não encontrada"},
+        )
+    return _sse_response(request, task_id, after)
+
+
+def _sse(event, data, seq=None):
+    head = f"id: {seq}\n" if seq is not None else ""
+    return f"{head}event: {event}\n".encode() + b"data: " + fast_json.dumps_bytes(data, default=str) + b"\n\n"
+
+
+def _sse_response(request, task_id, after):
+    """Snapshot (or the missed deltas when resuming), then live deltas.
+
+    Resume point: ?after=<seq> or the Last-Event-ID header that EventSource
+    sends on reconnect. Events are "snapshot" (the task, or {"tasks": [...]})
+    and "delta" (task_events.TaskEvent.to_dict()).
+    """
+    last_event_id = request.headers.get("last-event-id", "")
+    if after is None and last_event_id.isdigit():
+        after = int(last_event_id)
+    # Subscribe before reading the snapshot/backlog so nothing falls in between
+    subscription = task_events.bus.subscribe(task_id)
+
+    def _snapshot():
+        seq = task_events.bus.last_seq()
+        data = get_task(task_id) if task_id else {"tasks": list_tasks()}
+        return seq, data.get("status"), _sse("snapshot", data, seq)
+
+    async def _body():
+        try:
+            # Decide on the state the client received, not on a later read:
+            # a status that turns terminal after this still has its delta queued
+            status = (get_task(task_id) or {}).get("status") if task_id else None
+            backlog, gap = task_events.bus.since(after, task_id) if after is not None else ([], True)
+            if gap:
+                delivered, status, chunk = _snapshot()
+                yield chunk
+            else:
+                # Terminal before the backlog read: its delta is <= after or in the backlog
+                for event in backlog:
+                    yield _sse("delta", event.to_dict(), event.seq)
+                delivered = backlog[-1].seq if backlog else after
+            if task_id and status in TERMINAL_STATUSES:
+                return
+            while not await request.is_disconnected():
+                event = await subscription.get(SSE_HEARTBEAT_S)
+                if subscription.overflowed:
+                    # Slow client: drop the queued deltas and resend the state
+                    subscription.overflowed = False
+                    while not subscription.queue.empty():
+                        subscription.queue.get_nowait()
+                    delivered, status, chunk = _snapshot()
+                    yield chunk
+                    if task_id and status in TERMINAL_STATUSES:
+                        return
+                    continue
+                if event is None:
+                    yield b": ping\n\n"
+                    continue
+                if event.seq <= delivered:
+                    continue  # already in the snapshot/backlog
+                yield _sse("delta", event.to_dict(), event.seq)
+                if task_id and event.kind == "status" and event.data.get("status") in TERMINAL_STATUSES:
+                    return
+        finally:
+            subscription.close()
+
+    return StreamingResponse(
+        _body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ── Store access ─────────────────────────────────────────────
+
+
+# High-frequency progress deltas: written by the store's writer thread
+# (batched, latest snapshot per task) instead of a commit on the event loop.
+_WRITE_BEHIND_KINDS = frozenset({"stage", "coalesced", "batch_item"})
+
+
+def _persist(task, kind=None, delta=None, unit=None):
+    """Save the snapshot and publish ``delta`` (same transaction when the store is on).
+
+    Progress kinds (_WRITE_BEHIND_KINDS) are queued on the store and published
+    once committed; ``unit`` is the task_units row saved along with them.
+    Everything else is written synchronously, after the queued progress.
+    """
+    store = get_task_store()
+    seq = None
+    if kind:
+        delta = copy.deepcopy(delta)  # the task keeps mutating after this event
+    if store is not None:
+        event = (kind, delta, task_events.PROCESS_ORIGIN) if kind else None
+        if kind in _WRITE_BEHIND_KINDS:
+            task_id = task["task_id"]
+            store.save_task_later(
+                task, event=event, unit=unit,
+                on_saved=lambda seq: task_events.bus.publish(task_id, kind, delta, seq=seq),
+            )
+            return
+        seq = store.save_task(task, event=event)
+    if kind:
+        task_events.bus.publish(task["task_id"], kind, delta, seq=seq)
+
+
+def _status_delta(task):
+    keys = ("status", "error", "last_error", "result", "summary", "finished_at", "resumed")
+    return {key: task.get(key) for key in keys}
+
+
+def _task_for_update(task_id):
+    """The cached task, loaded from the store when this process has not seen it
+    (worker process, or a run resumed after a restart)."""
+    task = task_registry.get(task_id)
+    if task is None:
+        store = get_task_store()
+        if store is not None:
+            task = store.load_task(task_id)
+            if task is not None:
+                task_registry[task_id] = task
+    return task
+
+
+def get_task(task_id):
+    """Current snapshot of a task (store first: another process may own it).
+
+    While this process still has progress queued for the task its cached
+    copy is the newest one, so it is served without waiting on the writer.
+    """
+    store = get_task_store()
+    if store is not None and not (task_id in task_registry and store.has_pending_writes(task_id)):
+        task = store.load_task(task_id)
+        if task is not None:
+            return task
+    return task_registry.get(task_id)
+
+
+def list_tasks():
+    """All known tasks, oldest first."""
+    store = get_task_store()
+    if store is None:
+        return list(task_registry.values())
+    # Not flushed on the request path: tasks with queued progress come from the cache
+    tasks = [
+        task_registry.get(task["task_id"], task) if store.has_pending_writes(task["task_id"]) else task
+        for task in store.list_tasks(flush=False)
+    ]
+    known = {task["task_id"] for task in tasks}
+    tasks.extend(task for task_id, task in task_registry.items() if task_id not in known)
+    return tasks
+
+
+def is_cancel_requested(task_id):
+    """True once /api/task-cancel was called for the task (in any process)."""
+    if not task_id:
+        return False
+    if (task_registry.get(task_id) or {}).get("cancel_requested"):
+        return True
+    store = get_task_store()
+    return bool(store is not None and store.is_cancel_requested(task_id))
+
+
+def stage_completed_before(task_id, atividade_id, aluno_id, stage):
+    """True if this task already completed the (atividade, aluno, stage) unit.
+
+    Only the durable store remembers units, so this is what lets a run
+    resumed after a restart skip the stages it had finished.
+    """
+    store = get_task_store()
+    if not task_id or store is None:
+        return False
+    return store.unit_completed(task_id, atividade_id, aluno_id, stage)
+
+
+def prepare_task_resume(task_id):
+    """Reload a task from the store before its run is resumed by a worker."""
+    store = get_task_store()
+    task = store.load_task(task_id) if store is not None else None
+    if task is not None:
+        task["status"] = "running"
+        task["resumed"] = task.get("resumed", 0) + 1
+        task.pop("finished_at", None)
+        task_registry[task_id] = task
+        _persist(task, "status", _status_delta(task))
+    return task
+
+
+def prune_tasks(retention_seconds=None):
+    """Drop finished tasks older than TASK_RETENTION_HOURS (store and cache)."""
+    if retention_seconds is None:
+        retention_seconds = RETENTION_SECONDS
+    limit = datetime.fromtimestamp(time.time() - retention_seconds).isoformat()
+    removed = set()
+    for task_id, task in list(task_registry.items()):
+        if task.get("status") in TERMINAL_STATUSES and task.get("finished_at", limit) < limit:
+            task_registry.pop(task_id, None)
+            removed.add(task_id)
+    store = get_task_store()
+    if store is not None:
+        for task_id in store.prune(retention_seconds):
+            task_registry.pop(task_id, None)
+            removed.add(task_id)
+    for task_id in sorted(removed):
+        # Durable mode: journal it so the seq comes from the store like every other event
+        seq = store.append_event(task_id, "removed", {}, task_events.PROCESS_ORIGIN) if store is not None else None
+        task_events.bus.publish(task_id, "removed", {}, seq=seq)
+    return sorted(removed)
+
+
 # ── Helper functions for pipeline integration ────────────────
 
 
@@ -95,16 +368,13 @@ def register_pipeline_task(
 
     Returns the generated task_id.
     """
+    prune_tasks()
     task_id = f"task_{uuid.uuid4().hex[:12]}"
     names = student_names or {}
     students = {}
     for aluno_id in aluno_ids:
-        students[aluno_id] = {
-            "nome": names.get(aluno_id, ""),
-            "stages": {stage: "pending" for stage in PIPELINE_STAGES},
-            "stage_errors": {},
-        }
-    task_registry[task_id] = {
+        students[aluno_id] = _new_student(names.get(aluno_id, ""))
+    task = task_registry[task_id] = {
         "task_id": task_id,
         "type": task_type,
         "atividade_id": atividade_id,
@@ -118,25 +388,45 @@ def register_pipeline_task(
         "students": students,
         "created_at": datetime.now().isoformat(),
     }
+    _persist(task, "task", task)
     return task_id
 
 
-def update_stage_progress(task_id, aluno_id, stage, status, error=None):
+def _new_student(nome=""):
+    return {
+        "nome": nome,
+        "stages": {stage: "pending" for stage in PIPELINE_STAGES},
+        "stage_errors": {},
+    }
+
+
+def add_task_students(task_id, student_names):
+    """Pre-populate students discovered after registration ({aluno_id: nome})."""
+    task = _task_for_update(task_id)
+    if task:
+        students = task.setdefault("students", {})
+        added = {}
+        for aluno_id, nome in student_names.items():
+            if aluno_id not in students:
+                students[aluno_id] = added[aluno_id] = _new_student(nome or "")
+        _persist(task, "students", {"students": added})
+
+
+def update_stage_progress(task_id, aluno_id, stage, status, error=None, atividade_id=None):
     """Update a specific stage status for a student in a task.
 
     Auto-creates a student entry if missing so background cascades
     (desempenho_turma/materia) that discover alunos at runtime can
     still report progress without pre-populating aluno_ids upfront.
+
+    atividade_id identifies the durable unit (defaults to the task's own
+    atividade; cascades over several atividades pass it explicitly).
     """
-    task = task_registry.get(task_id)
+    task = _task_for_update(task_id)
     if task:
         students = task.setdefault("students", {})
         if aluno_id not in students:
-            students[aluno_id] = {
-                "nome": "",
-                "stages": {s: "pending" for s in PIPELINE_STAGES},
-                "stage_errors": {},
-            }
+            students[aluno_id] = _new_student()
         student = students[aluno_id]
         student["stages"][stage] = status
         stage_errors = student.setdefault("stage_errors", {})
@@ -162,6 +452,71 @@ def update_stage_progress(task_id, aluno_id, stage, status, error=None):
         elif status in {"running", "completed", "pending"}:
             stage_errors.pop(stage, None)
             stage_skips.pop(stage, None)
+        _persist(task, "stage", {
+            "aluno_id": aluno_id,
+            "nome": student.get("nome", ""),
+            "stage": stage,
+            "status": status,
+            "error": stage_errors.get(stage),
+            "skip": stage_skips.get(stage),
+        }, unit=(atividade_id or task.get("atividade_id"), aluno_id, stage, status, current_worker_id()))
+
+
+def record_coalesced_stage(task_id, aluno_id, stage):
+    """Record that a student reused a concurrent run of an atividade-level stage.
+
+    The stage still reports its own running/completed status; this only
+    counts the executions saved (task["coalesced"] = {stage: count}).
+    """
+    task = _task_for_update(task_id)
+    if task:
+        coalesced = task.setdefault("coalesced", {})
+        coalesced[stage] = coalesced.get(stage, 0) + 1
+        student = task.setdefault("students", {}).get(aluno_id)
+        if student is not None:
+            student.setdefault("stage_coalesced", [])
+            if stage not in student["stage_coalesced"]:
+                student["stage_coalesced"].append(stage)
+        _persist(task, "coalesced", {
+            "aluno_id": aluno_id,
+            "stage": stage,
+            "coalesced": coalesced,
+            "stage_coalesced": (student or {}).get("stage_coalesced"),
+        })
+
+
+def register_batch_progress(task_id, item_ids, concurrency, policy):
+    """Attach batch-runner progress to a task (batch_runner.executar_em_lote).
+
+    task["batch"]["items"] keeps the submission order, so the sidebar can list
+    students in order while they finish out of order; counters are by status.
+    """
+    task = _task_for_update(task_id)
+    if task:
+        task["batch"] = {
+            "concurrency": concurrency,
+            "policy": policy,
+            "total": len(item_ids),
+            "counts": {"pending": len(item_ids), "running": 0, "completed": 0, "failed": 0, "cancelled": 0},
+            "items": [{"id": item_id, "status": "pending"} for item_id in item_ids],
+        }
+        _persist(task, "batch", {"batch": task["batch"]})
+
+
+def update_batch_item(task_id, item_id, status):
+    """Move one batch item to a new status and keep the counters in sync."""
+    task = _task_for_update(task_id) or {}
+    batch = task.get("batch")
+    if not batch:
+        return
+    for item in batch["items"]:
+        if item["id"] == item_id:
+            counts = batch["counts"]
+            counts[item["status"]] = counts.get(item["status"], 1) - 1
+            counts[status] = counts.get(status, 0) + 1
+            item["status"] = status
+            _persist(task, "batch_item", {"id": item_id, "status": status, "counts": counts})
+            return
 
 
 def _summarize_task_stages(task):
@@ -174,6 +529,7 @@ def _summarize_task_stages(task):
         "skipped_stages": 0,
         "pending_stages": 0,
         "running_stages": 0,
+        "coalesced_stages": sum((task.get("coalesced") or {}).values()),
         "students_failed": [],
         "students_pending": [],
     }
@@ -206,41 +562,48 @@ def _summarize_task_stages(task):
 
 def complete_pipeline_task(task_id, status="completed", error=None, result=None):
     """Mark a pipeline task as completed or failed."""
-    task = task_registry.get(task_id)
+    task = _task_for_update(task_id)
+    if task:
+        _apply_completion(task, status, error, result)
+        if task.get("status") in TERMINAL_STATUSES:
+            task.setdefault("finished_at", datetime.now().isoformat())
+        _persist(task, "status", _status_delta(task))
+
+
+def _apply_completion(task, status, error, result):
     BATCH_TYPES = {
         "pipeline_todos_os_alunos",
         "pipeline_desempenho_tarefa",
         "pipeline_desempenho_turma",
         "pipeline_desempenho_materia",
     }
-    if task:
-        if task.get("type") in BATCH_TYPES and status in {"completed", "failed"}:
-            summary = _summarize_task_stages(task)
-            task["summary"] = summary
-            has_incomplete = bool(summary["pending_stages"] or summary["running_stages"])
-            has_failed = bool(summary["failed_stages"])
-
-            if has_incomplete and not (status == "failed" and not has_failed):
-                task["status"] = "running"
-                if error:
-                    task["last_error"] = error
-                if result:
-                    task["result"] = result
-                return
-
-            if has_failed or status == "failed":
-                task["status"] = "failed"
-                task["error"] = error or (
-                    "Pipeline em lote terminou com falhas: "
-                    f"{summary['failed_stages']} etapa(s) falharam em "
-                    f"{len(summary['students_failed'])} aluno(s)."
-                )
-                if result:
-                    task["result"] = result
-                return
-
-        task["status"] = status
-        if error:
-            task["error"] = error
-        if result:
-            task["result"] = result
+    if task.get("type") in BATCH_TYPES and status in {"completed", "failed"}:
+        summary = _summarize_task_stages(task)
+        task["summary"] = summary
+        has_incomplete = bool(summary["pending_stages"] or summary["running_stages"])
+        has_failed = bool(summary["failed_stages"])
+
+        if has_incomplete and not (status == "failed" and not has_failed):
+            task["status"] = "running"
+            if error:
+                task["last_error"] = error
+            if result:
+                task["result"] = result
+            return
+
+        if has_failed or status == "failed":
+            task["status"] = "failed"
+            task["error"] = error or (
+                "Pipeline em lote terminou com falhas: "
+                f"{summary['failed_stages']} etapa(s) falharam em "
+                f"{len(summary['students_failed'])} aluno(s)."
+            )
+            if result:
+                task["result"] = result
+            return
+
+    task["status"] = status
+    if error:
+        task["error"] = error
+    if result:
+        task["result"] = result
@@ -39,6 +39,9 @@ def backfill_display_names(storage: StorageManager, dry_run: bool = False) -> Di
     errors = 0
     total = 0
 
+    # Script de manutenção: o banco pode ter sido editado fora do StorageManager
+    storage.clear_entity_cache()
+
     # Build a cache for metadata lookups to avoid repeated DB hits
     atividade_cache = {}
     turma_cache = {}
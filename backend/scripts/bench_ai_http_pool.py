@@ -0,0 +1,193 @@
+"""
+Benchmark: httpx.AsyncClient por chamada (legado) vs pool por host (ai_http).
+
+Sobe um servidor mock no formato da API OpenAI (HTTPS com certificado
+autoassinado quando o ``openssl`` está disponível) e roda etapas de
+pipeline (``ChatClient._chat_openai``) em sequência e em paralelo,
+medindo a latência por etapa e as conexões TCP/TLS abertas.
+
+``--rtt-ms`` soma um atraso no accept de cada conexão nova, para
+aproximar os round trips de TCP+TLS até um provider remoto (o servidor
+local responde em microssegundos, então sem ele só aparece o custo de CPU
+do handshake).
+
+Usage:
+    cd IA_Educacao_V2/backend
+    python scripts/bench_ai_http_pool.py [--stages 50] [--concurrency 8] [--rtt-ms 0]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import functools
+import json
+import shutil
+import ssl
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from unittest.mock import patch
+
+os.environ.setdefault("PROVA_AI_TESTING", "1")
+os.environ.setdefault("PROVA_AI_DISABLE_LOCAL_LLM", "1")
+
+import httpx
+
+import ai_http
+from chat_service import ChatClient, ModelConfig, ProviderType
+
+
+_RESPOSTA = json.dumps({
+    "choices": [{"message": {"content": "ok"}}],
+    "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12},
+}).encode()
+
+
+class _MockServer:
+    """Servidor HTTP/1.1 keep-alive mínimo num loop próprio; conta conexões aceitas."""
+
+    def __init__(self, ssl_ctx: Optional[ssl.SSLContext], rtt_s: float):
+        self.ssl_ctx = ssl_ctx
+        self.rtt_s = rtt_s
+        self.conexoes = 0
+        self.port = 0
+        self._loop = asyncio.new_event_loop()
+        self._pronto = threading.Event()
+
+    async def _atender(self, reader, writer):
+        self.conexoes += 1
+        if self.rtt_s:
+            await asyncio.sleep(self.rtt_s)
+        try:
+            while True:
+                cabecalho = await reader.readuntil(b"\r\n\r\n")
+                tamanho = 0
+                for linha in cabecalho.split(b"\r\n"):
+                    if linha.lower().startswith(b"content-length:"):
+                        tamanho = int(linha.split(b":", 1)[1])
+                if tamanho:
+                    await reader.readexactly(tamanho)
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    b"Content-Length: " + str(len(_RESPOSTA)).encode() + b"\r\n\r\n" + _RESPOSTA
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            writer.close()
+
+    def start(self) -> None:
+        async def _subir():
+            server = await asyncio.start_server(self._atender, "127.0.0.1", 0, ssl=self.ssl_ctx)
+            self.port = server.sockets[0].getsockname()[1]
+            self._pronto.set()
+
+        def _rodar():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(_subir())
+            self._loop.run_forever()
+
+        threading.Thread(target=_rodar, daemon=True).start()
+        self._pronto.wait(10)
+
+    def stop(self) -> None:
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+def _certificado(pasta: str) -> Optional[Tuple[str, str]]:
+    if not shutil.which("openssl"):
+        return None
+    cert, key = os.path.join(pasta, "cert.pem"), os.path.join(pasta, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1",
+         "-nodes", "-keyout", key, "-out", cert, "-days", "1", "-subj", "/CN=127.0.0.1",
+         "-addext", "subjectAltName=IP:127.0.0.1"],
+        check=True, capture_output=True,
+    )
+    return cert, key
+
+
+def _legado(verify, timeout: Optional[float] = None):
+    """Reproduz o código antigo: um httpx.AsyncClient novo por chamada."""
+    return httpx.AsyncClient(timeout=timeout or 120.0, verify=verify)
+
+
+async def _etapas(client: ChatClient, stages: int, concurrency: int) -> list:
+    semaforo = asyncio.Semaphore(concurrency)
+    latencias = []
+
+    async def _etapa():
+        async with semaforo:
+            inicio = time.perf_counter()
+            await client._chat_openai("oi", [], "sistema")
+            latencias.append(time.perf_counter() - inicio)
+
+    await asyncio.gather(*(_etapa() for _ in range(stages)))
+    return latencias
+
+
+def _medir(modo: str, base_url: str, verify, server: _MockServer, stages: int, concurrency: int) -> Dict:
+    config = ModelConfig(id="bench", nome="bench", tipo=ProviderType.OPENAI, modelo="gpt-4o", base_url=base_url)
+    client = ChatClient(config, "sk-bench")
+    conexoes_antes = server.conexoes
+    fabrica = functools.partial(httpx.AsyncClient, verify=verify)
+
+    with patch.object(ai_http.httpx, "AsyncClient", fabrica):
+        if modo == "legado":
+            with patch.object(ai_http, "cliente", functools.partial(_legado, verify)):
+                latencias = ai_http.run(_etapas(client, stages, concurrency))
+        else:
+            latencias = ai_http.run(_etapas(client, stages, concurrency))
+
+    return {
+        "media_ms": statistics.mean(latencias) * 1000,
+        "p95_ms": sorted(latencias)[int(len(latencias) * 0.95) - 1] * 1000,
+        "conexoes": server.conexoes - conexoes_antes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", type=int, default=50, help="etapas (chamadas) por rodada")
+    parser.add_argument("--concurrency", default="1,8", help="etapas simultâneas, separadas por vírgula")
+    parser.add_argument("--rtt-ms", type=float, default=0.0, help="atraso simulado por conexão nova")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        par = _certificado(pasta)
+        if par:
+            server_ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            server_ctx.load_cert_chain(*par)
+            verify = ssl.create_default_context(cafile=par[0])
+            esquema = "https"
+        else:
+            server_ctx, verify, esquema = None, True, "http"
+
+        server = _MockServer(server_ctx, args.rtt_ms / 1000)
+        server.start()
+        base_url = f"{esquema}://127.0.0.1:{server.port}/v1"
+        print(f"Mock OpenAI em {base_url} (rtt simulado {args.rtt_ms} ms por conexão nova)\n")
+        print(f"{'concorrência':>12} {'modo':>8} {'média ms':>10} {'p95 ms':>9} {'conexões':>9}")
+        try:
+            for concurrency in (int(c) for c in args.concurrency.split(",")):
+                _medir("pool", base_url, verify, server, 5, concurrency)  # aquece imports/caches
+                resultados = {}
+                for modo in ("legado", "pool"):
+                    resultados[modo] = r = _medir(modo, base_url, verify, server, args.stages, concurrency)
+                    print(f"{concurrency:>12} {modo:>8} {r['media_ms']:>10.2f} {r['p95_ms']:>9.2f} {r['conexoes']:>9}")
+                ganho = resultados["legado"]["media_ms"] - resultados["pool"]["media_ms"]
+                print(f"{'':>12} {'ganho':>8} {ganho:>10.2f} ms por etapa\n")
+        finally:
+            server.stop()
+
+    print("Stats do pool:", json.dumps(ai_http.stats()["hosts"], indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark: Documento.from_dict + to_dict vs DocumentoLeve para listagens.
+
+Monta N linhas como vêm do banco (SQLite: metadata em JSON texto) e mede
+tempo e memória de pico de:
+    - hidratar a lista de modelos (from_dict / DocumentoLeve)
+    - serializar para a resposta (to_dict)
+    - build_cost_summary sobre a lista
+
+Usage:
+    cd IA_Educacao_V2/backend
+    python scripts/bench_documento_leve.py [--rows 100000] [--repeat 3]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+from models import Documento, DocumentoLeve
+
+
+def _rows(n: int) -> List[Dict[str, Any]]:
+    rows = []
+    for i in range(n):
+        rows.append({
+            "id": f"doc-{i:06d}",
+            "tipo": "correcao" if i % 3 else "relatorio_final",
+            "atividade_id": f"ativ-{i % 200}",
+            "aluno_id": f"aluno-{i % 3000}",
+            "display_name": f"Correção {i}",
+            "nome_arquivo": f"correcao_{i}.json",
+            "caminho_arquivo": f"arquivos/m/t/a/correcao_{i}.json",
+            "extensao": ".json",
+            "tamanho_bytes": 2048,
+            "ia_provider": "openai",
+            "ia_modelo": "gpt-5-nano",
+            "prompt_usado": "default_correcao",
+            "prompt_versao": None,
+            "tokens_usados": 1500,
+            "tempo_processamento_ms": 830.0,
+            "status": "concluido",
+            "criado_em": "2026-03-14 12:00:00",
+            "atualizado_em": "2026-03-14 12:00:05",
+            "criado_por": "sistema",
+            "versao": 1,
+            "documento_origem_id": None,
+            "metadata": json.dumps({"tokens_entrada": 1000, "tokens_saida": 500, "cost_run_id": f"run-{i}"}),
+            "content_hash": None,
+        })
+    return rows
+
+
+def _measure(fn: Callable[[], Any], repeat: int) -> Tuple[float, float]:
+    """(melhor tempo em ms, pico de memória em MB da primeira execução)."""
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, peak / (1024 * 1024)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    from cost_tracking import build_cost_summary
+
+    rows = _rows(args.rows)
+    cenarios = [
+        ("hidratar", lambda: [Documento.from_dict(r) for r in rows], lambda: [DocumentoLeve(r) for r in rows]),
+        ("hidratar+to_dict",
+         lambda: [Documento.from_dict(r).to_dict() for r in rows],
+         lambda: [DocumentoLeve(r).to_dict() for r in rows]),
+        ("cost_summary",
+         lambda: build_cost_summary(documentos=[Documento.from_dict(r) for r in rows], token_usage_records=[]),
+         lambda: build_cost_summary(documentos=[DocumentoLeve(r) for r in rows], token_usage_records=[])),
+    ]
+
+    print(f"rows={args.rows} repeat={args.repeat}")
+    for nome, completo, leve in cenarios:
+        ms_completo, mb_completo = _measure(completo, args.repeat)
+        ms_leve, mb_leve = _measure(leve, args.repeat)
+        print(
+            f"{nome:<17} Documento={ms_completo:>9.1f} ms ({mb_completo:>6.1f} MB)  "
+            f"DocumentoLeve={ms_leve:>9.1f} ms ({mb_leve:>6.1f} MB)  "
+            f"speedup={ms_completo / ms_leve:>4.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark: serialização das respostas grandes, stdlib vs fast_json (orjson).
+
+Monta payloads com o formato real de três endpoints e mede o caminho da
+resposta:
+    - antes:  jsonable_encoder + json.dumps (JSONResponse padrão do FastAPI)
+    - depois: FastJSONResponse direto (fast_json.dumps_bytes)
+
+    /api/navegacao/arvore   200 matérias x 5 turmas x 20 atividades
+    /api/documentos/todos   N documentos com contexto
+    /api/custos/resumo      build_cost_summary sobre N documentos
+
+Usage:
+    cd IA_Educacao_V2/backend
+    python scripts/bench_fast_json.py [--rows 20000] [--repeat 5]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import time
+from typing import Any, Callable, Dict, List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import fast_json
+from fast_json import FastJSONResponse
+from models import DocumentoLeve
+
+
+def _arvore() -> Dict[str, Any]:
+    materias = []
+    for m in range(200):
+        turmas = []
+        for t in range(5):
+            atividades = [
+                {"id": f"ativ-{m}-{t}-{a}", "nome": f"Prova {a}", "turma_id": f"turma-{m}-{t}",
+                 "total_documentos": a * 3, "criado_em": "2026-03-14T12:00:00"}
+                for a in range(20)
+            ]
+            turmas.append({"id": f"turma-{m}-{t}", "nome": f"{t + 6}º ano", "ano_letivo": 2026,
+                           "total_alunos": 32, "atividades": atividades})
+        materias.append({"id": f"mat-{m}", "nome": f"Matéria {m}", "turmas": turmas})
+    return {"materias": materias}
+
+
+def _documentos(n: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            "id": f"doc-{i:06d}", "tipo": "correcao", "atividade_id": f"ativ-{i % 200}",
+            "aluno_id": f"aluno-{i % 3000}", "nome_arquivo": f"correcao_{i}.json",
+            "display_name": f"Correção {i}", "status": "concluido", "extensao": ".json",
+            "criado_em": "2026-03-14T12:00:00", "tamanho_bytes": 2048,
+            "atividade_nome": "Prova 1", "turma_nome": "9º A", "materia_nome": "Matemática",
+            "aluno_nome": f"Aluno {i % 3000}", "metadata": {"tokens_entrada": 1000, "tokens_saida": 500},
+        }
+        for i in range(n)
+    ]
+
+
+def _cost_summary(n: int) -> Dict[str, Any]:
+    from cost_tracking import build_cost_summary
+
+    rows = [
+        {**doc, "ia_provider": "openai", "ia_modelo": "gpt-5-nano", "tokens_usados": 1500,
+         "metadata": json.dumps({**doc["metadata"], "cost_run_id": f"run-{i}"})}
+        for i, doc in enumerate(_documentos(n))
+    ]
+    return build_cost_summary(documentos=[DocumentoLeve(r) for r in rows], token_usage_records=[])
+
+
+def _best_ms(fn: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    payloads = [
+        ("arvore", _arvore()),
+        ("documentos/todos", {"documentos": _documentos(args.rows), "total": args.rows}),
+        ("custos/resumo", _cost_summary(args.rows)),
+    ]
+
+    print(f"orjson={fast_json.ORJSON_AVAILABLE} rows={args.rows} repeat={args.repeat}")
+    for nome, payload in payloads:
+        antes = _best_ms(lambda: JSONResponse(jsonable_encoder(payload)), args.repeat)
+        depois = _best_ms(lambda: FastJSONResponse(payload), args.repeat)
+        tamanho = len(FastJSONResponse(payload).body) / (1024 * 1024)
+        print(
+            f"{nome:<17} {tamanho:>6.1f} MB  stdlib={antes:>8.1f} ms  "
+            f"fast_json={depois:>8.1f} ms  speedup={antes / depois:>5.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
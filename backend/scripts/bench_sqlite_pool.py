@@ -0,0 +1,120 @@
+"""
+Benchmark: conexão SQLite por chamada (legado) vs pool WAL (sqlite_pool).
+
+Mede leituras/s (get_atividade) e escritas/s (criar_aluno) do
+StorageManager com 1, 8 e 32 workers concorrentes, contando também os
+erros "database is locked".
+
+Usage:
+    cd IA_Educacao_V2/backend
+    python scripts/bench_sqlite_pool.py [--seconds 3] [--workers 1,8,32]
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+from unittest.mock import patch
+
+import storage as storage_module
+from models import TipoDocumento
+from sqlite_pool import sqlite_pool
+
+
+def _legacy_connection(self) -> sqlite3.Connection:
+    """Reproduz o _get_connection antigo: connect novo, sem WAL nem busy_timeout."""
+    conn = sqlite3.connect(self.db_path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _seed(manager, n_docs: int = 200) -> str:
+    materia = manager.criar_materia("Bench")
+    turma = manager.criar_turma(materia.id, "Turma Bench")
+    atividade = manager.criar_atividade(turma.id, "Prova Bench")
+    origem = manager.base_path / "seed.json"
+    origem.write_text("{}", encoding="utf-8")
+    for _ in range(n_docs):
+        manager.salvar_documento(str(origem), TipoDocumento.ENUNCIADO, atividade.id, display_name="Seed")
+    return atividade.id
+
+
+def _run(op: Callable[[], None], workers: int, seconds: float) -> Dict[str, float]:
+    stop_at = time.perf_counter() + seconds
+    counts = {"ok": 0, "locked": 0}
+    lock = threading.Lock()
+
+    def _worker():
+        ok = locked = 0
+        while time.perf_counter() < stop_at:
+            try:
+                op()
+                ok += 1
+            except sqlite3.OperationalError as exc:
+                if "locked" not in str(exc):
+                    raise
+                locked += 1
+        with lock:
+            counts["ok"] += ok
+            counts["locked"] += locked
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for _ in range(workers):
+            pool.submit(_worker)
+    return {"ops_s": counts["ok"] / seconds, "locked": counts["locked"]}
+
+
+def _bench_mode(label: str, legacy: bool, workers_list, seconds: float) -> None:
+    tmp = tempfile.mkdtemp(prefix="bench_sqlite_")
+    try:
+        with patch("storage.SUPABASE_DB_AVAILABLE", False), \
+             patch("storage.SUPABASE_STORAGE_AVAILABLE", False):
+            if legacy:
+                ctx = patch.object(storage_module.StorageManager, "_get_connection", _legacy_connection)
+            else:
+                ctx = patch.object(storage_module.StorageManager, "_get_connection",
+                                   storage_module.StorageManager._get_connection)
+            with ctx:
+                manager = storage_module.StorageManager(base_path=tmp)
+                atividade_id = _seed(manager)
+                counter = iter(range(10**9))
+
+                def _read():
+                    manager.get_atividade(atividade_id)
+
+                def _write():
+                    manager.criar_aluno(f"Aluno {next(counter)}")
+
+                for workers in workers_list:
+                    reads = _run(_read, workers, seconds)
+                    writes = _run(_write, workers, seconds)
+                    print(
+                        f"{label:<8} workers={workers:<3} "
+                        f"reads/s={reads['ops_s']:>9.1f} (locked={reads['locked']:<4}) "
+                        f"writes/s={writes['ops_s']:>9.1f} (locked={writes['locked']})"
+                    )
+    finally:
+        sqlite_pool.close_all()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--workers", default="1,8,32")
+    args = parser.parse_args()
+    workers_list = [int(w) for w in args.workers.split(",") if w.strip()]
+
+    _bench_mode("legacy", True, workers_list, args.seconds)
+    _bench_mode("pooled", False, workers_list, args.seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Pool de conexões SQLite compartilhado por StorageManager e PromptManager.
+
+Antes cada leitura/escrita abria um ``sqlite3.connect`` novo, em modo
+rollback-journal e sem busy_timeout. Com escritas concorrentes do pipeline
+(salvar_documento) e leituras do dashboard isso gerava "database is locked"
+e pagava o setup da conexão em toda chamada.
+
+O pool mantém UMA conexão por (thread, arquivo). Cada conexão é configurada
+uma única vez com:
+    - journal_mode=WAL     (leitores não bloqueiam o escritor)
+    - busy_timeout         (SQLITE_BUSY_TIMEOUT_MS, padrão 5000)
+    - synchronous=NORMAL   (seguro com WAL, muito menos fsync)
+    - mmap_size / cache_size / temp_store=MEMORY
+e com cache de statements ampliado, então consultas repetidas reutilizam o
+statement preparado.
+
+``close()`` numa conexão do pool NÃO fecha o arquivo: desfaz transação
+pendente e devolve a conexão ao pool. Como a conexão sobrevive a quem a
+usou, o ``close()`` vai num ``finally`` (uma exceção no meio deixaria a
+transação de escrita aberta e o banco travado para as outras threads); por
+garantia, ``get()`` também desfaz transação esquecida antes de entregar a
+conexão.
+
+Configuração (env):
+    SQLITE_BUSY_TIMEOUT_MS=5000
+    SQLITE_MMAP_SIZE=268435456
+    SQLITE_CACHE_SIZE_KB=20000
+"""
+
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Union
+
+
+_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+_CACHE_SIZE_KB = int(os.environ.get("SQLITE_CACHE_SIZE_KB", "20000"))
+_CACHED_STATEMENTS = 256
+
+# Limite de bancos distintos por thread (testes criam muitos StorageManager temporários)
+_MAX_DATABASES_PER_THREAD = 8
+
+
+class PooledConnection(sqlite3.Connection):
+    """Conexão SQLite cujo ``close()`` devolve a conexão ao pool."""
+
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+
+    def close_for_real(self):
+        """Fecha de fato a conexão (usado pelo pool ao descartar)."""
+        super().close()
+
+
+class SQLiteConnectionPool:
+    """Pool de conexões SQLite por thread com PRAGMAs ajustados."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all: Dict[int, PooledConnection] = {}
+        self._journal_modes: Dict[str, str] = {}
+
+    def _thread_connections(self) -> "OrderedDict[str, PooledConnection]":
+        conns = getattr(self._local, "conns", None)
+        if conns is None:
+            conns = OrderedDict()
+            self._local.conns = conns
+        return conns
+
+    def _open(self, key: str) -> PooledConnection:
+        conn = sqlite3.connect(
+            key,
+            timeout=_BUSY_TIMEOUT_MS / 1000,
+            factory=PooledConnection,
+            cached_statements=_CACHED_STATEMENTS,
+            # Cada conexão só é usada pela thread dona; liberado para close_all()
+            check_same_thread=False,
+        )
+        conn.row_factory = sqlite3.Row
+        if key not in self._journal_modes:
+            row = conn.execute("PRAGMA journal_mode=WAL").fetchone()
+            self._journal_modes[key] = str(row[0]).lower() if row else "unknown"
+        conn.execute(f"PRAGMA busy_timeout={_BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA mmap_size={_MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size=-{_CACHE_SIZE_KB}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        with self._lock:
+            self._all[id(conn)] = conn
+        return conn
+
+    def _discard(self, conn: PooledConnection) -> None:
+        with self._lock:
+            self._all.pop(id(conn), None)
+        try:
+            conn.close_for_real()
+        except sqlite3.Error:
+            pass
+
+    def get(self, db_path: Union[str, Path]) -> PooledConnection:
+        """Retorna a conexão da thread atual para ``db_path`` (abre se necessário)."""
+        key = os.path.abspath(db_path)
+        conns = self._thread_connections()
+        conn = conns.get(key)
+        if conn is not None and not os.path.exists(key):
+            # Arquivo removido (ex.: diretório temporário de teste) — reabrir
+            conns.pop(key, None)
+            self._journal_modes.pop(key, None)
+            self._discard(conn)
+            conn = None
+        if conn is None:
+            conn = self._open(key)
+            conns[key] = conn
+            while len(conns) > _MAX_DATABASES_PER_THREAD:
+                _, oldest = conns.popitem(last=False)
+                self._discard(oldest)
+        else:
+            conns.move_to_end(key)
+            if conn.in_transaction:
+                # Quem usou antes saiu por exceção sem close(): não herdar o lock de escrita
+                conn.rollback()
+        return conn
+
+    def journal_mode(self, db_path: Union[str, Path]) -> str:
+        """Modo de journal observado ao abrir ``db_path`` (para diagnóstico)."""
+        return self._journal_modes.get(os.path.abspath(db_path), "unknown")
+
+    def close_all(self) -> None:
+        """Fecha todas as conexões de todas as threads."""
+        with self._lock:
+            conns = list(self._all.values())
+            self._all.clear()
+        for conn in conns:
+            try:
+                conn.close_for_real()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"open_connections": len(self._all)}
+
+
+# Instância global compartilhada
+sqlite_pool = SQLiteConnectionPool()
@@ -18,19 +18,32 @@ O antigo storage.py (legado) foi removido em 2026-01-30.
 
 import os
 import re
+import base64
 import sqlite3
+import asyncio
+import copy
+import contextvars
+import functools
+import threading
 import hashlib
 import shutil
-import json
 import logging
 import time
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
-from typing import Optional, List, Dict, Any, Tuple
-
+from typing import Optional, List, Dict, Any, Iterator, Tuple, Callable
+
+import fast_json
+from blob_store import BLOBS_ENABLED, BlobStore
+from entity_cache import EntityCache
+from file_cache import FileCache
+from upload_queue import UploadQueue, upload_mode
+from storage_events import StorageEvent, StorageEventBus, StorageEventType, process_bus
+from sqlite_pool import sqlite_pool
 from models import (
-    Materia, Turma, Aluno, AlunoTurma, Atividade, Documento, Prompt, ResultadoAluno,
+    Materia, Turma, Aluno, AlunoTurma, Atividade, Documento, DocumentoLeve, Prompt, ResultadoAluno,
     TipoDocumento, StatusProcessamento, NivelEnsino,
     verificar_dependencias, DEPENDENCIAS_DOCUMENTOS
 )
@@ -134,6 +147,92 @@ def build_storage_filename(display_name: str, extension: str) -> str:
     return f"{sanitized}_{hash_suffix}{extension}"
 
 
+_ARVORE_CACHE_TTL_S = float(os.environ.get("STORAGE_ARVORE_CACHE_TTL_S", "30"))
+_STATUS_CACHE_TTL_S = float(os.environ.get("STORAGE_STATUS_CACHE_TTL_S", "30"))
+_UPLOAD_WORKERS = int(os.environ.get("SUPABASE_UPLOAD_WORKERS", "8"))
+_PREFETCH_WORKERS = int(os.environ.get("STORAGE_PREFETCH_WORKERS", "8"))
+_CASCATA_TENTATIVAS = 3
+
+_PAGE_SIZE_MAX = 1000
+_DOCUMENTO_CONTEXTO_COLUMNS = ["id", "nome_arquivo", "tipo", "atividade_id", "aluno_id", "criado_em"]
+
+
+def _encode_cursor(row: Dict[str, Any]) -> str:
+    """Cursor opaco com o par (criado_em, id) da última linha da página."""
+    raw = fast_json.dumps_bytes([row.get("criado_em"), row.get("id")])
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: Optional[str]) -> Optional[Tuple[Any, Any]]:
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        criado_em, doc_id = fast_json.loads(raw)
+    except (ValueError, TypeError) as exc:
+        raise ValueError(f"cursor inválido: {cursor}") from exc
+    return criado_em, doc_id
+
+
+_DOCUMENTO_INSERT_SQL = '''
+    INSERT INTO documentos (
+        id, tipo, atividade_id, aluno_id, display_name,
+        nome_arquivo, caminho_arquivo, extensao,
+        tamanho_bytes, ia_provider, ia_modelo, prompt_usado, prompt_versao,
+        tokens_usados, tempo_processamento_ms, status, criado_em, atualizado_em,
+        criado_por, versao, documento_origem_id, metadata, content_hash
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Entidade do evento -> tabela no cache de entidades
+_ENTITY_TABLES = {
+    "materia": "materias",
+    "turma": "turmas",
+    "aluno": "alunos",
+    "atividade": "atividades",
+}
+
+# Exclusão em cascata (SQLite): por escopo, (tabela, WHERE) na ordem em que
+# as linhas são apagadas — filhos antes dos pais. Os "?" recebem os ids do
+# escopo. Não depende de PRAGMA foreign_keys (desligado nas conexões).
+_ATIVIDADES_DA_MATERIA = (
+    "atividade_id IN (SELECT a.id FROM atividades a JOIN turmas t ON t.id = a.turma_id "
+    "WHERE t.materia_id = ?)"
+)
+_ATIVIDADES_DA_TURMA = "atividade_id IN (SELECT id FROM atividades WHERE turma_id = ?)"
+_CASCATA_SQLITE: Dict[str, List[Tuple[str, str]]] = {
+    "materia": [
+        ("documentos", _ATIVIDADES_DA_MATERIA),
+        ("resultados", _ATIVIDADES_DA_MATERIA),
+        ("alunos_turmas", "turma_id IN (SELECT id FROM turmas WHERE materia_id = ?)"),
+        ("atividades", "turma_id IN (SELECT id FROM turmas WHERE materia_id = ?)"),
+        ("turmas", "materia_id = ?"),
+        ("materias", "id = ?"),
+    ],
+    "turma": [
+        ("documentos", _ATIVIDADES_DA_TURMA),
+        ("resultados", _ATIVIDADES_DA_TURMA),
+        ("alunos_turmas", "turma_id = ?"),
+        ("atividades", "turma_id = ?"),
+        ("turmas", "id = ?"),
+    ],
+    "atividade": [
+        ("documentos", "atividade_id = ?"),
+        ("resultados", "atividade_id = ?"),
+        ("atividades", "id = ?"),
+    ],
+    "aluno": [
+        ("alunos_turmas", "aluno_id = ?"),
+        ("documentos", "aluno_id = ?"),
+        ("resultados", "aluno_id = ?"),
+        ("alunos", "id = ?"),
+    ],
+    "aluno_atividade": [
+        ("documentos", "atividade_id = ? AND aluno_id = ?"),
+    ],
+}
+
+
 class StorageManager:
     """
     Gerenciador de armazenamento unificado.
@@ -162,13 +261,24 @@ class StorageManager:
         └── database.db                      # SQLite (apenas para dev local)
     """
 
-    def __init__(self, base_path: str = None):
+    def __init__(self, base_path: str = None, events: Optional[StorageEventBus] = None):
         # Usar path absoluto baseado em __file__ para compatibilidade com Render
         if base_path is None:
             base_path = str(BASE_DIR / "data")
         self.base_path = Path(base_path)
         self.arquivos_path = self.base_path / "arquivos"
         self.db_path = self.base_path / "database.db"
+        # Matérias/turmas/atividades/alunos mudam pouco: evita round-trips repetidos
+        self._entity_cache = EntityCache()
+        self._arvore_cache: Optional[Tuple[float, Dict[str, Any]]] = None
+        self._arvore_generation = 0
+        # get_status_atividade por atividade (invalidado pelos eventos abaixo)
+        self._status_cache = EntityCache(ttl_seconds=_STATUS_CACHE_TTL_S)
+
+        # Eventos de mudança pós-commit no barramento do processo (o mesmo do
+        # PromptManager e dos caches de leitura): caches se inscrevem para invalidar
+        self.events = events if events is not None else process_bus(self.base_path)
+        self._unsubscribe_events = self.events.subscribe(self._on_storage_event)
 
         # Determinar backend: PostgreSQL ou SQLite
         self.use_postgresql = SUPABASE_DB_AVAILABLE
@@ -181,6 +291,24 @@ class StorageManager:
         if not self.use_postgresql:
             # SQLite precisa de setup local
             self._setup_database()
+
+        # Conteúdo deduplicado por sha256; caminho_arquivo vira hardlink para o blob
+        self.blobs = BlobStore(self.base_path / "blobs") if BLOBS_ENABLED else None
+        self._remote_blobs: Dict[str, str] = {}
+        self._remote_blob_stats = {"uploads": 0, "uploads_skipped": 0, "bytes_skipped": 0}
+        self._remote_blob_lock = threading.Lock()
+        self._remote_blob_uploading: Dict[str, threading.Lock] = {}
+
+        # Arquivos baixados do bucket: orçamento em bytes + LRU (data/file_cache.db)
+        self.file_cache = FileCache(self.base_path)
+
+        # Uploads ao bucket em segundo plano (journal em data/upload_queue.db)
+        self.upload_mode = upload_mode()
+        self._upload_queue: Optional[UploadQueue] = None
+        self._upload_queue_lock = threading.Lock()
+        if self.upload_mode != "sync" and SUPABASE_STORAGE_AVAILABLE and supabase_storage:
+            # Retoma envios que ficaram pendentes antes de um restart
+            self._get_upload_queue()
     
     # ============================================================
     # SETUP
@@ -193,154 +321,183 @@ class StorageManager:
     
     def _setup_database(self):
         """Inicializa banco de dados SQLite"""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
+        conn = self._get_connection()
+        try:
+            c = conn.cursor()
         
-        # Tabela: Matérias
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS materias (
-                id TEXT PRIMARY KEY,
-                nome TEXT NOT NULL,
-                descricao TEXT,
-                nivel TEXT DEFAULT 'outro',
-                criado_em TEXT,
-                atualizado_em TEXT,
-                metadata TEXT
-            )
-        ''')
+            # Tabela: Matérias
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS materias (
+                    id TEXT PRIMARY KEY,
+                    nome TEXT NOT NULL,
+                    descricao TEXT,
+                    nivel TEXT DEFAULT 'outro',
+                    criado_em TEXT,
+                    atualizado_em TEXT,
+                    metadata TEXT
+                )
+            ''')
         
-        # Tabela: Turmas
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS turmas (
-                id TEXT PRIMARY KEY,
-                materia_id TEXT NOT NULL,
-                nome TEXT NOT NULL,
-                ano_letivo INTEGER,
-                periodo TEXT,
-                descricao TEXT,
-                criado_em TEXT,
-                atualizado_em TEXT,
-                metadata TEXT,
-                FOREIGN KEY (materia_id) REFERENCES materias(id) ON DELETE CASCADE
-            )
-        ''')
+            # Tabela: Turmas
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS turmas (
+                    id TEXT PRIMARY KEY,
+                    materia_id TEXT NOT NULL,
+                    nome TEXT NOT NULL,
+                    ano_letivo INTEGER,
+                    periodo TEXT,
+                    descricao TEXT,
+                    criado_em TEXT,
+                    atualizado_em TEXT,
+                    metadata TEXT,
+                    FOREIGN KEY (materia_id) REFERENCES materias(id) ON DELETE CASCADE
+                )
+            ''')
         
-        # Tabela: Alunos
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS alunos (
-                id TEXT PRIMARY KEY,
-                nome TEXT NOT NULL,
-                email TEXT,
-                matricula TEXT,
-                criado_em TEXT,
-                atualizado_em TEXT,
-                metadata TEXT
-            )
-        ''')
+            # Tabela: Alunos
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS alunos (
+                    id TEXT PRIMARY KEY,
+                    nome TEXT NOT NULL,
+                    email TEXT,
+                    matricula TEXT,
+                    criado_em TEXT,
+                    atualizado_em TEXT,
+                    metadata TEXT
+                )
+            ''')
         
-        # Tabela: Vínculo Aluno-Turma (many-to-many)
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS alunos_turmas (
-                id TEXT PRIMARY KEY,
-                aluno_id TEXT NOT NULL,
-                turma_id TEXT NOT NULL,
-                ativo INTEGER DEFAULT 1,
-                data_entrada TEXT,
-                data_saida TEXT,
-                observacoes TEXT,
-                FOREIGN KEY (aluno_id) REFERENCES alunos(id) ON DELETE CASCADE,
-                FOREIGN KEY (turma_id) REFERENCES turmas(id) ON DELETE CASCADE,
-                UNIQUE(aluno_id, turma_id)
-            )
-        ''')
+            # Tabela: Vínculo Aluno-Turma (many-to-many)
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS alunos_turmas (
+                    id TEXT PRIMARY KEY,
+                    aluno_id TEXT NOT NULL,
+                    turma_id TEXT NOT NULL,
+                    ativo INTEGER DEFAULT 1,
+                    data_entrada TEXT,
+                    data_saida TEXT,
+                    observacoes TEXT,
+                    FOREIGN KEY (aluno_id) REFERENCES alunos(id) ON DELETE CASCADE,
+                    FOREIGN KEY (turma_id) REFERENCES turmas(id) ON DELETE CASCADE,
+                    UNIQUE(aluno_id, turma_id)
+                )
+            ''')
         
-        # Tabela: Atividades
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS atividades (
-                id TEXT PRIMARY KEY,
-                turma_id TEXT NOT NULL,
-                nome TEXT NOT NULL,
-                tipo TEXT,
-                data_aplicacao TEXT,
-                data_entrega TEXT,
-                peso REAL DEFAULT 1.0,
-                nota_maxima REAL DEFAULT 10.0,
-                descricao TEXT,
-                criado_em TEXT,
-                atualizado_em TEXT,
-                metadata TEXT,
-                FOREIGN KEY (turma_id) REFERENCES turmas(id) ON DELETE CASCADE
-            )
-        ''')
+            # Tabela: Atividades
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS atividades (
+                    id TEXT PRIMARY KEY,
+                    turma_id TEXT NOT NULL,
+                    nome TEXT NOT NULL,
+                    tipo TEXT,
+                    data_aplicacao TEXT,
+                    data_entrega TEXT,
+                    peso REAL DEFAULT 1.0,
+                    nota_maxima REAL DEFAULT 10.0,
+                    descricao TEXT,
+                    criado_em TEXT,
+                    atualizado_em TEXT,
+                    metadata TEXT,
+                    FOREIGN KEY (turma_id) REFERENCES turmas(id) ON DELETE CASCADE
+                )
+            ''')
         
-        # Tabela: Documentos
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS documentos (
-                id TEXT PRIMARY KEY,
-                tipo TEXT NOT NULL,
-                atividade_id TEXT NOT NULL,
-                aluno_id TEXT,
-                display_name TEXT DEFAULT '',
-                nome_arquivo TEXT,
-                caminho_arquivo TEXT,
-                extensao TEXT,
-                tamanho_bytes INTEGER DEFAULT 0,
-                ia_provider TEXT,
-                ia_modelo TEXT,
-                prompt_usado TEXT,
-                prompt_versao TEXT,
-                tokens_usados INTEGER DEFAULT 0,
-                tempo_processamento_ms REAL DEFAULT 0,
-                status TEXT DEFAULT 'concluido',
-                criado_em TEXT,
-                atualizado_em TEXT,
-                criado_por TEXT,
-                versao INTEGER DEFAULT 1,
-                documento_origem_id TEXT,
-                metadata TEXT,
-                FOREIGN KEY (atividade_id) REFERENCES atividades(id) ON DELETE CASCADE,
-                FOREIGN KEY (aluno_id) REFERENCES alunos(id) ON DELETE SET NULL
-            )
-        ''')
+            # Tabela: Documentos
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS documentos (
+                    id TEXT PRIMARY KEY,
+                    tipo TEXT NOT NULL,
+                    atividade_id TEXT NOT NULL,
+                    aluno_id TEXT,
+                    display_name TEXT DEFAULT '',
+                    nome_arquivo TEXT,
+                    caminho_arquivo TEXT,
+                    extensao TEXT,
+                    tamanho_bytes INTEGER DEFAULT 0,
+                    ia_provider TEXT,
+                    ia_modelo TEXT,
+                    prompt_usado TEXT,
+                    prompt_versao TEXT,
+                    tokens_usados INTEGER DEFAULT 0,
+                    tempo_processamento_ms REAL DEFAULT 0,
+                    status TEXT DEFAULT 'concluido',
+                    criado_em TEXT,
+                    atualizado_em TEXT,
+                    criado_por TEXT,
+                    versao INTEGER DEFAULT 1,
+                    documento_origem_id TEXT,
+                    metadata TEXT,
+                    content_hash TEXT,
+                    FOREIGN KEY (atividade_id) REFERENCES atividades(id) ON DELETE CASCADE,
+                    FOREIGN KEY (aluno_id) REFERENCES alunos(id) ON DELETE SET NULL
+                )
+            ''')
         
-        # Tabela: Resultados (agregação)
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS resultados (
-                id TEXT PRIMARY KEY,
-                aluno_id TEXT NOT NULL,
-                atividade_id TEXT NOT NULL,
-                nota_obtida REAL,
-                nota_maxima REAL DEFAULT 10.0,
-                percentual REAL,
-                total_questoes INTEGER DEFAULT 0,
-                questoes_corretas INTEGER DEFAULT 0,
-                questoes_parciais INTEGER DEFAULT 0,
-                questoes_incorretas INTEGER DEFAULT 0,
-                habilidades_demonstradas TEXT,
-                habilidades_faltantes TEXT,
-                feedback_geral TEXT,
-                corrigido_em TEXT,
-                corrigido_por_ia TEXT,
-                metadata TEXT,
-                FOREIGN KEY (aluno_id) REFERENCES alunos(id) ON DELETE CASCADE,
-                FOREIGN KEY (atividade_id) REFERENCES atividades(id) ON DELETE CASCADE,
-                UNIQUE(aluno_id, atividade_id)
-            )
-        ''')
+            # Tabela: Resultados (agregação)
+            c.execute('''
+                CREATE TABLE IF NOT EXISTS resultados (
+                    id TEXT PRIMARY KEY,
+                    aluno_id TEXT NOT NULL,
+                    atividade_id TEXT NOT NULL,
+                    nota_obtida REAL,
+                    nota_maxima REAL DEFAULT 10.0,
+                    percentual REAL,
+                    total_questoes INTEGER DEFAULT 0,
+                    questoes_corretas INTEGER DEFAULT 0,
+                    questoes_parciais INTEGER DEFAULT 0,
+                    questoes_incorretas INTEGER DEFAULT 0,
+                    habilidades_demonstradas TEXT,
+                    habilidades_faltantes TEXT,
+                    feedback_geral TEXT,
+                    corrigido_em TEXT,
+                    corrigido_por_ia TEXT,
+                    metadata TEXT,
+                    FOREIGN KEY (aluno_id) REFERENCES alunos(id) ON DELETE CASCADE,
+                    FOREIGN KEY (atividade_id) REFERENCES atividades(id) ON DELETE CASCADE,
+                    UNIQUE(aluno_id, atividade_id)
+                )
+            ''')
         
-        # Índices para performance
-        c.execute('CREATE INDEX IF NOT EXISTS idx_turmas_materia ON turmas(materia_id)')
-        c.execute('CREATE INDEX IF NOT EXISTS idx_atividades_turma ON atividades(turma_id)')
-        c.execute('CREATE INDEX IF NOT EXISTS idx_documentos_atividade ON documentos(atividade_id)')
-        c.execute('CREATE INDEX IF NOT EXISTS idx_documentos_aluno ON documentos(aluno_id)')
-        c.execute('CREATE INDEX IF NOT EXISTS idx_alunos_turmas_aluno ON alunos_turmas(aluno_id)')
-        c.execute('CREATE INDEX IF NOT EXISTS idx_alunos_turmas_turma ON alunos_turmas(turma_id)')
+            # Índices para performance
+            c.execute('CREATE INDEX IF NOT EXISTS idx_turmas_materia ON turmas(materia_id)')
+            c.execute('CREATE INDEX IF NOT EXISTS idx_atividades_turma ON atividades(turma_id)')
+            c.execute('CREATE INDEX IF NOT EXISTS idx_documentos_atividade ON documentos(atividade_id)')
+            c.execute('CREATE INDEX IF NOT EXISTS idx_documentos_aluno ON documentos(aluno_id)')
+            c.execute('CREATE INDEX IF NOT EXISTS idx_alunos_turmas_aluno ON alunos_turmas(aluno_id)')
+            c.execute('CREATE INDEX IF NOT EXISTS idx_alunos_turmas_turma ON alunos_turmas(turma_id)')
+            # Compostos: filtros (atividade, aluno, tipo, status) + ORDER BY criado_em DESC
+            # (ver migrations/003_documentos_indexes_atuais.sql)
+            c.execute('''
+                CREATE INDEX IF NOT EXISTS idx_documentos_ativ_aluno_tipo_criado
+                ON documentos(atividade_id, aluno_id, tipo, criado_em DESC)
+            ''')
+            c.execute('''
+                CREATE INDEX IF NOT EXISTS idx_documentos_ativ_tipo_status_criado
+                ON documentos(atividade_id, tipo, status, criado_em DESC)
+            ''')
+
+            # View: versão mais recente por (atividade, aluno, tipo, extensao, status)
+            c.execute('''
+                CREATE VIEW IF NOT EXISTS documentos_atuais AS
+                SELECT d.* FROM documentos d
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM documentos n
+                    WHERE n.atividade_id = d.atividade_id
+                      AND n.aluno_id IS d.aluno_id
+                      AND n.tipo = d.tipo
+                      AND n.extensao IS d.extensao
+                      AND n.status IS d.status
+                      AND (n.criado_em > d.criado_em
+                           OR (n.criado_em = d.criado_em AND n.id > d.id))
+                )
+            ''')
         
-        # Migrations for existing databases
-        self._run_migrations(c)
+            # Migrations for existing databases
+            self._run_migrations(c)
 
-        conn.commit()
-        conn.close()
+            conn.commit()
+        finally:
+            conn.close()
 
     def _run_migrations(self, cursor):
         """Run ALTER TABLE migrations for existing databases."""
@@ -352,6 +509,76 @@ class StorageManager:
         if "display_name" not in existing_columns:
             cursor.execute("ALTER TABLE documentos ADD COLUMN display_name TEXT DEFAULT ''")
 
+        # Migration: sha256 do conteúdo (blob_store.py)
+        if "content_hash" not in existing_columns:
+            cursor.execute("ALTER TABLE documentos ADD COLUMN content_hash TEXT")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_documentos_content_hash ON documentos(content_hash)")
+
+        # Onde cada conteúdo já está no Supabase Storage (upload pulado para repetidos)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha256 TEXT PRIMARY KEY,
+                remote_path TEXT NOT NULL,
+                tamanho_bytes INTEGER DEFAULT 0,
+                criado_em TEXT
+            )
+        ''')
+
+        # Contadores por atividade mantidos por triggers: o dashboard não lê
+        # mais uma linha por documento (ver migrations/005_estatisticas_agregadas.sql)
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'documento_contadores'")
+        contadores_novos = cursor.fetchone() is None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS documento_contadores (
+                atividade_id TEXT PRIMARY KEY,
+                total INTEGER NOT NULL DEFAULT 0,
+                gabaritos INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_documento_contadores_insert
+            AFTER INSERT ON documentos
+            BEGIN
+                INSERT INTO documento_contadores (atividade_id, total, gabaritos)
+                VALUES (NEW.atividade_id, 1, NEW.tipo = 'gabarito')
+                ON CONFLICT(atividade_id) DO UPDATE SET
+                    total = total + 1,
+                    gabaritos = gabaritos + excluded.gabaritos;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_documento_contadores_delete
+            AFTER DELETE ON documentos
+            BEGIN
+                UPDATE documento_contadores SET
+                    total = total - 1,
+                    gabaritos = gabaritos - (OLD.tipo = 'gabarito')
+                WHERE atividade_id = OLD.atividade_id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_documento_contadores_update
+            AFTER UPDATE OF atividade_id, tipo ON documentos
+            BEGIN
+                UPDATE documento_contadores SET
+                    total = total - 1,
+                    gabaritos = gabaritos - (OLD.tipo = 'gabarito')
+                WHERE atividade_id = OLD.atividade_id;
+                INSERT INTO documento_contadores (atividade_id, total, gabaritos)
+                VALUES (NEW.atividade_id, 1, NEW.tipo = 'gabarito')
+                ON CONFLICT(atividade_id) DO UPDATE SET
+                    total = total + 1,
+                    gabaritos = gabaritos + excluded.gabaritos;
+            END
+        ''')
+        if contadores_novos:
+            cursor.execute('''
+                INSERT INTO documento_contadores (atividade_id, total, gabaritos)
+                SELECT atividade_id, COUNT(*), SUM(tipo = 'gabarito')
+                FROM documentos
+                GROUP BY atividade_id
+            ''')
+
     # ============================================================
     # UTILITÁRIOS
     # ============================================================
@@ -363,10 +590,11 @@ class StorageManager:
         return hashlib.sha256(content.encode()).hexdigest()[:16]
     
     def _get_connection(self) -> sqlite3.Connection:
-        """Retorna conexão com o banco"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+        """Retorna a conexão pooled (WAL, busy_timeout) da thread atual.
+
+        ``conn.close()`` devolve a conexão ao pool — ver sqlite_pool.py.
+        """
+        return sqlite_pool.get(self.db_path)
     
     def _sanitize_filename(self, name: str) -> str:
         """Remove caracteres inválidos de nomes de arquivo"""
@@ -390,6 +618,14 @@ class StorageManager:
     def _build_sql_filter_clause(self, key: str, value: Any) -> Tuple[str, List[Any]]:
         """Builds a SQLite WHERE clause for eq/null/in filters."""
         if isinstance(value, dict):
+            if "or_null" in value:
+                # {"or_null": x} / {"or_null": [x, y]}: valor(es) OU NULL (documentos base)
+                values = value["or_null"]
+                values = list(values) if isinstance(values, (list, tuple, set)) else [values]
+                if not values:
+                    return f"{key} IS NULL", []
+                placeholders = ", ".join("?" for _ in values)
+                return f"({key} IN ({placeholders}) OR {key} IS NULL)", values
             if "in" in value:
                 value = list(value["in"])
             elif "eq" in value:
@@ -417,8 +653,15 @@ class StorageManager:
                      order_by: str = None,
                      order_desc: bool = False,
                      limit: int = None,
-                     columns: Any = None) -> List[Dict[str, Any]]:
-        """Returns raw rows with projection support for both backends."""
+                     columns: Any = None,
+                     after: Tuple[Any, Any] = None,
+                     keyset: bool = False) -> List[Dict[str, Any]]:
+        """Returns raw rows with projection support for both backends.
+
+        Keyset pagination: ``keyset=True`` orders by (order_by, id) and
+        ``after=(valor, id)`` — the last row of the previous page — returns
+        only rows after it. Cost stays constant however deep the page is.
+        """
         if self.use_postgresql:
             return supabase_db.select(
                 table,
@@ -427,6 +670,8 @@ class StorageManager:
                 order_desc=order_desc,
                 limit=limit,
                 columns=columns,
+                after=after,
+                keyset=keyset,
             )
 
         conn = self._get_connection()
@@ -441,6 +686,11 @@ class StorageManager:
                 clauses.append(clause)
                 params.extend(clause_params)
 
+            if after is not None:
+                op = "<" if order_desc else ">"
+                clauses.append(f"({order_by} {op} ? OR ({order_by} = ? AND id {op} ?))")
+                params.extend([after[0], after[0], after[1]])
+
             if clauses:
                 query += " WHERE " + " AND ".join(clauses)
 
@@ -450,6 +700,8 @@ class StorageManager:
                 else:
                     direction = " DESC" if order_desc else ""
                     query += f" ORDER BY {order_by}{direction}"
+                    if keyset or after is not None:
+                        query += f", id{direction}"
 
             if limit is not None:
                 query += " LIMIT ?"
@@ -486,22 +738,114 @@ class StorageManager:
         finally:
             conn.close()
 
+    def _select_many(self, queries: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """Runs independent ``_select_rows`` calls (concurrently on PostgreSQL).
+
+        Each item holds ``_select_rows`` kwargs, ``table`` included; results
+        keep the order of ``queries``.
+        """
+        if self.use_postgresql:
+            return supabase_db.select_many(queries)
+        return [self._select_rows(**query) for query in queries]
+
+    def _usar_contadores_documentos(self) -> bool:
+        """True when documento_contadores (migration 005) can replace a documentos scan."""
+        if not self.use_postgresql:
+            return True
+        return supabase_db.relation_available("documento_contadores")
+
     def _log_hot_endpoint_profile(self,
                                   endpoint: str,
                                   started_at: float,
                                   row_counts: Dict[str, int],
                                   payload_counts: Dict[str, int] = None) -> None:
-        """Logs the duration and cardinality of a hot endpoint helper."""
+        """Logs the duration and cardinality of a hot endpoint helper.
+
+        On PostgreSQL it also logs the PostgREST requests made since
+        ``started_at`` (count, summed time and the slowest one).
+        """
         duration_ms = round((time.perf_counter() - started_at) * 1000, 2)
+        requests = {}
+        if self.use_postgresql:
+            timings = list(supabase_db.request_timings(started_at))
+            if timings:
+                slowest = max(timings, key=lambda timing: timing[2])
+                requests = {
+                    "count": len(timings),
+                    "total_ms": round(sum(timing[2] for timing in timings), 2),
+                    "slowest": f"{slowest[0]}.{slowest[1]}={slowest[2]}ms",
+                }
         logging.info(
-            "[hot-endpoint] endpoint=%s duration_ms=%.2f backend=%s rows=%s payload=%s",
+            "[hot-endpoint] endpoint=%s duration_ms=%.2f backend=%s rows=%s payload=%s requests=%s",
             endpoint,
             duration_ms,
             self._backend_label(),
             row_counts,
             payload_counts or {},
+            requests,
         )
     
+    def _get_entity_row(self, table: str, entity_id: str) -> Optional[Dict[str, Any]]:
+        """Busca uma linha por ID passando pelo cache de entidades."""
+        row = self._entity_cache.get(table, entity_id)
+        if row is not None:
+            return row
+
+        generation = self._entity_cache.generation
+        if self.use_postgresql:
+            row = supabase_db.select_one(table, entity_id)
+        else:
+            conn = self._get_connection()
+            try:
+                c = conn.cursor()
+                c.execute(f'SELECT * FROM {table} WHERE id = ?', (entity_id,))
+                found = c.fetchone()
+            finally:
+                conn.close()
+            row = dict(found) if found else None
+
+        if row:
+            self._entity_cache.put(table, entity_id, row, generation=generation)
+        return row
+
+    def _emit(self, tipo: StorageEventType, entity_id: str, **kwargs: Any) -> None:
+        """Publica uma mudança já commitada (ver storage_events.py)."""
+        self.events.emit(tipo, entity_id, **kwargs)
+
+    def _on_storage_event(self, event: StorageEvent) -> None:
+        """Invalida os caches internos (também para eventos de outros processos)."""
+        if event.tipo.entidade == "prompt":
+            return
+        atividades = event.atividades_afetadas()
+        if atividades is None:
+            self._status_cache.clear()
+        for atividade_id in atividades or ():
+            self._status_cache.invalidate("status_atividade", atividade_id)
+
+        # A árvore de navegação conta turmas, alunos e documentos: qualquer mudança a invalida
+        self._arvore_generation += 1
+        self._arvore_cache = None
+
+        table = _ENTITY_TABLES.get(event.tipo.entidade)
+        if table is None:
+            return
+        if event.tipo.value.endswith(("deletada", "deletado")):
+            # CASCADE leva turmas/atividades/vínculos junto: descarta o cache inteiro
+            self._entity_cache.clear()
+        else:
+            self._entity_cache.invalidate(table, event.entity_id)
+
+    def get_entity_cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss do cache de entidades (exposto em /api/debug/storage-cache)."""
+        return self._entity_cache.stats()
+
+    def clear_entity_cache(self, reset_stats: bool = False) -> None:
+        self._arvore_cache = None
+        self._status_cache.clear()
+        self._entity_cache.clear()
+        if reset_stats:
+            self._entity_cache.reset_stats()
+
     # ============================================================
     # CRUD: MATÉRIAS
     # ============================================================
@@ -533,17 +877,21 @@ class StorageManager:
             supabase_db.insert("materias", data)
         else:
             conn = self._get_connection()
-            c = conn.cursor()
-            c.execute('''
-                INSERT INTO materias (id, nome, descricao, nivel, criado_em, atualizado_em, metadata)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                materia.id, materia.nome, materia.descricao, materia.nivel.value,
-                materia.criado_em.isoformat(), materia.atualizado_em.isoformat(),
-                json.dumps(materia.metadata)
-            ))
-            conn.commit()
-            conn.close()
+            try:
+                c = conn.cursor()
+                c.execute('''
+                    INSERT INTO materias (id, nome, descricao, nivel, criado_em, atualizado_em, metadata)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    materia.id, materia.nome, materia.descricao, materia.nivel.value,
+                    materia.criado_em.isoformat(), materia.atualizado_em.isoformat(),
+                    fast_json.dumps(materia.metadata)
+                ))
+                conn.commit()
+            finally:
+                conn.close()
+
+        self._emit(StorageEventType.MATERIA_CRIADA, materia.id, materia_id=materia.id)
 
         # Criar diretório da matéria
         (self.arquivos_path / materia.id).mkdir(exist_ok=True)
@@ -552,22 +900,10 @@ class StorageManager:
 
     def get_materia(self, materia_id: str) -> Optional[Materia]:
         """Busca matéria por ID"""
-        if self.use_postgresql:
-            row = supabase_db.select_one("materias", materia_id)
-            if not row:
-                return None
-            return Materia.from_dict(row)
-        else:
-            conn = self._get_connection()
-            c = conn.cursor()
-            c.execute('SELECT * FROM materias WHERE id = ?', (materia_id,))
-            row = c.fetchone()
-            conn.close()
-
-            if not row:
-                return None
-
-            return Materia.from_dict(dict(row))
+        row = self._get_entity_row("materias", materia_id)
+        if not row:
+            return None
+        return Materia.from_dict(row)
 
     def listar_materias(self) -> List[Materia]:
         """Lista todas as matérias"""
@@ -576,10 +912,12 @@ class StorageManager:
             return [Materia.from_dict(row) for row in rows]
         else:
             conn = self._get_connection()
-            c = conn.cursor()
-            c.execute('SELECT * FROM materias ORDER BY nome')
-            rows = c.fetchall()
-            conn.close()
+            try:
+                c = conn.cursor()
+                c.execute('SELECT * FROM materias ORDER BY nome')
+                rows = c.fetchall()
+            finally:
+                conn.close()
 
             return [Materia.from_dict(dict(row)) for row in rows]
 
@@ -609,7 +947,7 @@ class StorageManager:
 
             for campo, valor in update_data.items():
                 if campo == 'metadata':
-                    valor = json.dumps(valor)
+                    valor = fast_json.dumps(valor)
                 updates.append(f"{campo} = ?")
                 valores.append(valor)
 
@@ -618,31 +956,19 @@ class StorageManager:
             valores.append(materia_id)
 
             conn = self._get_connection()
-            c = conn.cursor()
-            c.execute(f"UPDATE materias SET {', '.join(updates)} WHERE id = ?", valores)
-            conn.commit()
-            conn.close()
+            try:
+                c = conn.cursor()
+                c.execute(f"UPDATE materias SET {', '.join(updates)} WHERE id = ?", valores)
+                conn.commit()
+            finally:
+                conn.close()
 
+        self._emit(StorageEventType.MATERIA_ATUALIZADA, materia_id, materia_id=materia_id)
         return self.get_materia(materia_id)
 
     def deletar_materia(self, materia_id: str) -> bool:
-        """Deleta matéria e todos os dados relacionados"""
-        if self.use_postgresql:
-            success = supabase_db.delete("materias", materia_id)
-        else:
-            conn = self._get_connection()
-            c = conn.cursor()
-            c.execute('DELETE FROM materias WHERE id = ?', (materia_id,))
-            success = c.rowcount > 0
-            conn.commit()
-            conn.close()
-
-        # Remover diretório
-        dir_path = self.arquivos_path / materia_id
-        if dir_path.exists():
-            shutil.rmtree(dir_path)
-
-        return success
+        """Deleta matéria e todos os dados relacionados (ver excluir_em_cascata)"""
+        return self.excluir_em_cascata("materia", materia_id)["encontrado"]
 
     def cleanup_duplicate_materias(self) -> Dict[str, int]:
         """Remove duplicate matérias (same nome), merging turmas into the survivor.
@@ -681,13 +1007,19 @@ class StorageManager:
                         supabase_db.update("turmas", turma.id, {"materia_id": survivor.id})
                     else:
                         conn = self._get_connection()
-                        c = conn.cursor()
-                        c.execute(
-                            'UPDATE turmas SET materia_id = ? WHERE id = ?',
-                            (survivor.id, turma.id),
-                        )
-                        conn.commit()
-                        conn.close()
+                        try:
+                            c = conn.cursor()
+                            c.execute(
+                                'UPDATE turmas SET materia_id = ? WHERE id = ?',
+                                (survivor.id, turma.id),
+                            )
+                            conn.commit()
+                        finally:
+                            conn.close()
+                    self._emit(
+                        StorageEventType.TURMA_ATUALIZADA, turma.id,
+                        turma_id=turma.id, materia_id=survivor.id,
+                    )
                     turmas_reassigned += 1
 
                 # Delete the duplicate matéria
@@ -730,17 +1062,21 @@ class StorageManager:
             supabase_db.insert("turmas", data)
         else:
             conn = self._get_connection()
-            c = conn.cursor()
-            c.execute('''
-                INSERT INTO turmas (id, materia_id, nome, ano_letivo, periodo, descricao, criado_em, atualizado_em, metadata)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                turma.id, turma.materia_id, turma.nome, turma.ano_letivo, turma.periodo,
-                turma.descricao, turma.criado_em.isoformat(), turma.atualizado_em.isoformat(),
-                json.dumps(turma.metadata)
-            ))
-            conn.commit()
-            conn.close()
+            try:
+                c = conn.cursor()
+                c.execute('''
+                    INSERT INTO turmas (id, materia_id, nome, ano_letivo, periodo, descricao, criado_em, atualizado_em, metadata)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    turma.id, turma.materia_id, turma.nome, turma.ano_letivo, turma.periodo,
+                    turma.descricao, turma.criado_em.isoformat(), turma.atualizado_em.isoformat(),
+                    fast_json.dumps(turma.metadata)
+                ))
+                conn.commit()
+            finally:
+                conn.close()
+
+        self._emit(StorageEventType.TURMA_CRIADA, turma.id, turma_id=turma.id, materia_id=materia_id)
 
         # Criar diretório da turma
         (self.arquivos_path / materia_id / turma.id).mkdir(parents=True, exist_ok=True)
@@ -749,22 +1085,10 @@ class StorageManager:
 
     def get_turma(self, turma_id: str) -> Optional[Turma]:
         """Busca turma por ID"""
-        if self.use_postgresql:
-            row = supabase_db.select_one("turmas", turma_id)
-            if not row:
-                return None
-            return Turma.from_dict(row)
-        else:
-            conn = self._get_connection()
-            c = conn.cursor()
-            c.execute('SELECT * FROM turmas WHERE id = ?', (turma_id,))
-            row = c.fetchone()
-            conn.close()
-
-            if not row:
-                return None
-
-            return Turma.from_dict(dict(row))
+        row = self._get_entity_row("turmas", turma_id)
+        if not row:
+            return None
+        return Turma.from_dict(row)
 
     def listar_turmas(self, materia_id: str = None) -> List[Turma]:
         """Lista turmas, opcionalmente filtradas por matéria"""
@@ -774,39 +1098,23 @@ class StorageManager:
             return [Turma.from_dict(row) for row in rows]
         else:
             conn = self._get_connection()
-            c = conn.cursor()
+            try:
+                c = conn.cursor()
 
-            if materia_id:
-                c.execute('SELECT * FROM turmas WHERE materia_id = ? ORDER BY ano_letivo DESC, nome', (materia_id,))
-            else:
-                c.execute('SELECT * FROM turmas ORDER BY ano_letivo DESC, nome')
+                if materia_id:
+                    c.execute('SELECT * FROM turmas WHERE materia_id = ? ORDER BY ano_letivo DESC, nome', (materia_id,))
+                else:
+                    c.execute('SELECT * FROM turmas ORDER BY ano_letivo DESC, nome')
 
-            rows = c.fetchall()
-            conn.close()
+                rows = c.fetchall()
+            finally:
+                conn.close()
 
             return [Turma.from_dict(dict(row)) for row in rows]
 
     def deletar_turma(self, turma_id: str) -> bool:
-        """Deleta turma e todos os dados relacionados"""
-        turma = self.get_turma(turma_id)
-        if not turma:
-            return False
-
-        if self.use_postgresql:
-            supabase_db.delete("turmas", turma_id)
-        else:
-            conn = self._get_connection()
-            c = conn.cursor()
-            c.execute('DELETE FROM turmas WHERE id = ?', (turma_id,))
-            conn.commit()
-            conn.close()
-
-        # Remover diretório
-        dir_path = self.arquivos_path / turma.materia_id / turma_id
-        if dir_path.exists():
-            shutil.rmtree(dir_path)
-
-        return True
+        """Deleta turma e todos os dados relacionados (ver excluir_em_cascata)"""
+        return self.excluir_em_cascata("turma", turma_id)["encontrado"]
     
     # ============================================================
     # CRUD: ALUNOS
@@ -834,38 +1142,29 @@ class StorageManager:
             supabase_db.insert("alunos", data)
         else:
             conn = self._get_connection()
-            c = conn.cursor()
-            c.execute('''
-                INSERT INTO alunos (id, nome, email, matricula, criado_em, atualizado_em, metadata)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                aluno.id, aluno.nome, aluno.email, aluno.matricula,
-                aluno.criado_em.isoformat(), aluno.atualizado_em.isoformat(),
-                json.dumps(aluno.metadata)
-            ))
-            conn.commit()
-            conn.close()
+            try:
+                c = conn.cursor()
+                c.execute('''
+                    INSERT INTO alunos (id, nome, email, matricula, criado_em, atualizado_em, metadata)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    aluno.id, aluno.nome, aluno.email, aluno.matricula,
+                    aluno.criado_em.isoformat(), aluno.atualizado_em.isoformat(),
+                    fast_json.dumps(aluno.metadata)
+                ))
+                conn.commit()
+            finally:
+                conn.close()
 
+        self._emit(StorageEventType.ALUNO_CRIADO, aluno.id, aluno_id=aluno.id)
         return aluno
 
     def get_aluno(self, aluno_id: str) -> Optional[Aluno]:
         """Busca aluno por ID"""
-        if self.use_postgresql:
-            row = supabase_db.select_one("alunos", aluno_id)
-            if not row:
-                return None
-            return Aluno.from_dict(row)
-        else:
-            conn = self._get_connection()
-            c = conn.cursor()
-            c.execute('SELECT * FROM alunos WHERE id = ?', (aluno_id,))
-            row = c.fetchone()
-            conn.close()
-
-            if not row:
-                return None
-
-            return Aluno.from_dict(dict(row))
+        row = self._get_entity_row("alunos", aluno_id)
+        if not row:
+            return None
+        return Aluno.from_dict(row)
 
     def listar_alunos(self, turma_id: str = None) -> List[Aluno]:
         """Lista alunos, opcionalmente filtrados por turma"""
@@ -886,57 +1185,28 @@ class StorageManager:
             return [Aluno.from_dict(row) for row in rows]
         else:
             conn = self._get_connection()
-            c = conn.cursor()
-
-            if turma_id:
-                c.execute('''
-                    SELECT a.* FROM alunos a
-                    JOIN alunos_turmas at ON a.id = at.aluno_id
-                    WHERE at.turma_id = ? AND at.ativo = 1
-                    ORDER BY a.nome
-                ''', (turma_id,))
-            else:
-                c.execute('SELECT * FROM alunos ORDER BY nome')
+            try:
+                c = conn.cursor()
+
+                if turma_id:
+                    c.execute('''
+                        SELECT a.* FROM alunos a
+                        JOIN alunos_turmas at ON a.id = at.aluno_id
+                        WHERE at.turma_id = ? AND at.ativo = 1
+                        ORDER BY a.nome
+                    ''', (turma_id,))
+                else:
+                    c.execute('SELECT * FROM alunos ORDER BY nome')
 
-            rows = c.fetchall()
-            conn.close()
+                rows = c.fetchall()
+            finally:
+                conn.close()
 
             return [Aluno.from_dict(dict(row)) for row in rows]
 
     def deletar_aluno(self, aluno_id: str) -> bool:
-        """Deleta um aluno e todos os seus vínculos"""
-        aluno = self.get_aluno(aluno_id)
-        if not aluno:
-            return False
-
-        if self.use_postgresql:
-            # CASCADE should handle related records, but be explicit
-            supabase_db.delete_where("alunos_turmas", {"aluno_id": aluno_id})
-            supabase_db.delete_where("documentos", {"aluno_id": aluno_id})
-            supabase_db.delete_where("resultados", {"aluno_id": aluno_id})
-            supabase_db.delete("alunos", aluno_id)
-            return True
-        else:
-            conn = self._get_connection()
-            c = conn.cursor()
-
-            # Remove vínculos com turmas
-            c.execute('DELETE FROM alunos_turmas WHERE aluno_id = ?', (aluno_id,))
-
-            # Remove documentos do aluno (opcional: pode querer manter)
-            c.execute('DELETE FROM documentos WHERE aluno_id = ?', (aluno_id,))
-
-            # Remove resultados
-            c.execute('DELETE FROM resultados WHERE aluno_id = ?', (aluno_id,))
-
-            # Remove o aluno
-            c.execute('DELETE FROM alunos WHERE id = ?', (aluno_id,))
-            affected = c.rowcount
-
-            conn.commit()
-            conn.close()
-
-            return affected > 0
+        """Deleta um aluno, seus vínculos, documentos e resultados (ver excluir_em_cascata)"""
+        return self.excluir_em_cascata("aluno", aluno_id)["encontrado"]
 
     def atualizar_aluno(self, aluno_id: str, **kwargs) -> Optional[Aluno]:
         """Atualiza campos de um aluno"""
@@ -962,7 +1232,7 @@ class StorageManager:
 
             for campo, valor in update_data.items():
                 if campo == 'metadata':
-                    valor = json.dumps(valor)
+                    valor = fast_json.dumps(valor)
                 updates.append(f"{campo} = ?")
                 valores.append(valor)
 
@@ -971,11 +1241,14 @@ class StorageManager:
             valores.append(aluno_id)
 
             conn = self._get_connection()
-            c = conn.cursor()
-            c.execute(f"UPDATE alunos SET {', '.join(updates)} WHERE id = ?", valores)
-            conn.commit()
-            conn.close()
+            try:
+                c = conn.cursor()
+                c.execute(f"UPDATE alunos SET {', '.join(updates)} WHERE id = ?", valores)
+                conn.commit()
+            finally:
+                conn.close()
 
+        self._emit(StorageEventType.ALUNO_ATUALIZADO, aluno_id, aluno_id=aluno_id)
         return self.get_aluno(aluno_id)
 
     def vincular_aluno_turma(self, aluno_id: str, turma_id: str, observacoes: str = None) -> Optional[AlunoTurma]:
@@ -1017,11 +1290,11 @@ class StorageManager:
                 conn.commit()
             except sqlite3.IntegrityError:
                 # Vínculo já existe
-                conn.close()
                 return None
+            finally:
+                conn.close()
 
-            conn.close()
-
+        self._emit(StorageEventType.ALUNO_VINCULADO, vinculo.id, aluno_id=aluno_id, turma_id=turma_id)
         return vinculo
 
     def desvincular_aluno_turma(self, aluno_id: str, turma_id: str) -> bool:
@@ -1035,19 +1308,30 @@ class StorageManager:
                     "ativo": False,
                     "data_saida": datetime.now().isoformat()
                 })
+                self._emit(
+                    StorageEventType.ALUNO_DESVINCULADO, vinculos[0]["id"],
+                    aluno_id=aluno_id, turma_id=turma_id,
+                )
                 return True
             return False
         else:
             conn = self._get_connection()
-            c = conn.cursor()
-            c.execute('''
-                UPDATE alunos_turmas
-                SET ativo = 0, data_saida = ?
-                WHERE aluno_id = ? AND turma_id = ?
-            ''', (datetime.now().isoformat(), aluno_id, turma_id))
-            affected = c.rowcount
-            conn.commit()
-            conn.close()
+            try:
+                c = conn.cursor()
+                c.execute('''
+                    UPDATE alunos_turmas
+                    SET ativo = 0, data_saida = ?
+                    WHERE aluno_id = ? AND turma_id = ?
+                ''', (datetime.now().isoformat(), aluno_id, turma_id))
+                affected = c.rowcount
+                conn.commit()
+            finally:
+                conn.close()
+            if affected > 0:
+                self._emit(
+                    StorageEventType.ALUNO_DESVINCULADO, f"{aluno_id}:{turma_id}",
+                    aluno_id=aluno_id, turma_id=turma_id,
+                )
             return affected > 0
 
     def get_turmas_do_aluno(self, aluno_id: str, apenas_ativas: bool = True) -> List[Dict[str, Any]]:
@@ -1260,20 +1544,27 @@ class StorageManager:
             supabase_db.insert("atividades", data)
         else:
             conn = self._get_connection()
-            c = conn.cursor()
-            c.execute('''
-                INSERT INTO atividades (id, turma_id, nome, tipo, data_aplicacao, data_entrega, peso, nota_maxima, descricao, criado_em, atualizado_em, metadata)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                atividade.id, atividade.turma_id, atividade.nome, atividade.tipo,
-                atividade.data_aplicacao.isoformat() if atividade.data_aplicacao else None,
-                atividade.data_entrega.isoformat() if atividade.data_entrega else None,
-                atividade.peso, atividade.nota_maxima, atividade.descricao,
-                atividade.criado_em.isoformat(), atividade.atualizado_em.isoformat(),
-                json.dumps(atividade.metadata)
-            ))
-            conn.commit()
-            conn.close()
+            try:
+                c = conn.cursor()
+                c.execute('''
+                    INSERT INTO atividades (id, turma_id, nome, tipo, data_aplicacao, data_entrega, peso, nota_maxima, descricao, criado_em, atualizado_em, metadata)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    atividade.id, atividade.turma_id, atividade.nome, atividade.tipo,
+                    atividade.data_aplicacao.isoformat() if atividade.data_aplicacao else None,
+                    atividade.data_entrega.isoformat() if atividade.data_entrega else None,
+                    atividade.peso, atividade.nota_maxima, atividade.descricao,
+                    atividade.criado_em.isoformat(), atividade.atualizado_em.isoformat(),
+                    fast_json.dumps(atividade.metadata)
+                ))
+                conn.commit()
+            finally:
+                conn.close()
+
+        self._emit(
+            StorageEventType.ATIVIDADE_CRIADA, atividade.id,
+            atividade_id=atividade.id, turma_id=turma_id, materia_id=turma.materia_id,
+        )
 
         # Criar diretório da atividade
         materia_id = turma.materia_id
@@ -1285,22 +1576,10 @@ class StorageManager:
 
     def get_atividade(self, atividade_id: str) -> Optional[Atividade]:
         """Busca atividade por ID"""
-        if self.use_postgresql:
-            row = supabase_db.select_one("atividades", atividade_id)
-            if not row:
-                return None
-            return Atividade.from_dict(row)
-        else:
-            conn = self._get_connection()
-            c = conn.cursor()
-            c.execute('SELECT * FROM atividades WHERE id = ?', (atividade_id,))
-            row = c.fetchone()
-            conn.close()
-
-            if not row:
-                return None
-
-            return Atividade.from_dict(dict(row))
+        row = self._get_entity_row("atividades", atividade_id)
+        if not row:
+            return None
+        return Atividade.from_dict(row)
 
     def listar_atividades(self, turma_id: str) -> List[Atividade]:
         """Lista atividades de uma turma"""
@@ -1309,37 +1588,18 @@ class StorageManager:
             return [Atividade.from_dict(row) for row in rows]
         else:
             conn = self._get_connection()
-            c = conn.cursor()
-            c.execute('SELECT * FROM atividades WHERE turma_id = ? ORDER BY data_aplicacao DESC, nome', (turma_id,))
-            rows = c.fetchall()
-            conn.close()
+            try:
+                c = conn.cursor()
+                c.execute('SELECT * FROM atividades WHERE turma_id = ? ORDER BY data_aplicacao DESC, nome', (turma_id,))
+                rows = c.fetchall()
+            finally:
+                conn.close()
 
             return [Atividade.from_dict(dict(row)) for row in rows]
 
     def deletar_atividade(self, atividade_id: str) -> bool:
-        """Deleta atividade e todos os documentos"""
-        atividade = self.get_atividade(atividade_id)
-        if not atividade:
-            return False
-
-        turma = self.get_turma(atividade.turma_id)
-
-        if self.use_postgresql:
-            supabase_db.delete("atividades", atividade_id)
-        else:
-            conn = self._get_connection()
-            c = conn.cursor()
-            c.execute('DELETE FROM atividades WHERE id = ?', (atividade_id,))
-            conn.commit()
-            conn.close()
-
-        # Remover diretório
-        if turma:
-            dir_path = self.arquivos_path / turma.materia_id / turma.id / atividade_id
-            if dir_path.exists():
-                shutil.rmtree(dir_path)
-
-        return True
+        """Deleta atividade e todos os documentos (ver excluir_em_cascata)"""
+        return self.excluir_em_cascata("atividade", atividade_id)["encontrado"]
     
     # ============================================================
     # CRUD: DOCUMENTOS
@@ -1401,9 +1661,160 @@ class StorageManager:
             versao: Número da versão (1 = original, 2+ = re-processado)
             documento_origem_id: ID do documento original se for versão > 1
         """
-        atividade = self.get_atividade(atividade_id)
-        if not atividade:
-            raise ValueError(f"Atividade não encontrada: {atividade_id}")
+        atividade, aluno = self._validar_contexto_documento(tipo, atividade_id, aluno_id)
+        documento, destino, caminho_relativo = self._preparar_documento(
+            arquivo_origem, tipo, atividade, aluno,
+            display_name=display_name,
+            ia_provider=ia_provider,
+            ia_modelo=ia_modelo,
+            prompt_usado=prompt_usado,
+            tokens_usados=tokens_usados,
+            tempo_processamento_ms=tempo_processamento_ms,
+            status=status,
+            metadata=metadata,
+            criado_por=criado_por,
+            versao=versao,
+            documento_origem_id=documento_origem_id,
+        )
+
+        if self.use_postgresql:
+            data = self._documento_insert_data(documento)
+            result = supabase_db.insert("documentos", data)
+            if result is None:
+                import logging
+                logger = logging.getLogger("storage")
+                logger.error(f"[SupabaseDB] Failed to insert documento {documento.id} into Supabase. Data keys: {list(data.keys())}")
+                raise RuntimeError(f"Failed to insert documento {documento.id} into Supabase DB - insert returned None")
+        else:
+            conn = self._get_connection()
+            try:
+                c = conn.cursor()
+                c.execute(_DOCUMENTO_INSERT_SQL, self._documento_insert_params(documento))
+                conn.commit()
+            finally:
+                conn.close()
+
+        # Upload para Supabase Storage (persistência de arquivos em cloud)
+        self._upload_documento_remoto(destino, caminho_relativo, documento.content_hash)
+
+        self._emit(
+            StorageEventType.DOCUMENTO_SALVO, documento.id,
+            atividade_id=atividade_id, aluno_id=aluno_id,
+            dados={"tipo": documento.tipo.value, "status": documento.status.value},
+        )
+        return documento
+
+    def salvar_documentos_lote(self, items: List[Dict[str, Any]]) -> List[Documento]:
+        """
+        Salva vários documentos de uma vez (mesmos argumentos de salvar_documento).
+
+        Cada item é um dict com os kwargs de ``salvar_documento``
+        (arquivo_origem, tipo, atividade_id, aluno_id, display_name, ...).
+
+        - valida atividade/aluno/turma/matéria uma vez por id distinto, antes
+          de copiar qualquer arquivo
+        - grava todas as linhas numa única transação SQLite ou num único
+          bulk insert no PostgREST (tudo ou nada; cópias locais são
+          removidas se o insert falhar)
+        - envia os arquivos ao Supabase Storage em paralelo
+          (SUPABASE_UPLOAD_WORKERS, padrão 8)
+
+        Returns:
+            Documentos na mesma ordem dos itens.
+        """
+        if not items:
+            return []
+
+        atividades: Dict[str, Atividade] = {}
+        alunos: Dict[str, Aluno] = {}
+        contextos = [
+            self._validar_contexto_documento(
+                item["tipo"], item["atividade_id"], item.get("aluno_id"),
+                atividades=atividades, alunos=alunos,
+            )
+            for item in items
+        ]
+
+        preparados: List[Tuple[Documento, Path, Path]] = []
+        try:
+            for item, (atividade, aluno) in zip(items, contextos):
+                extras = {
+                    k: v for k, v in item.items()
+                    if k not in ("arquivo_origem", "tipo", "atividade_id", "aluno_id")
+                }
+                preparados.append(self._preparar_documento(
+                    item["arquivo_origem"], item["tipo"], atividade, aluno, **extras
+                ))
+
+            documentos = [documento for documento, _, _ in preparados]
+            if self.use_postgresql:
+                supabase_db.insert_many(
+                    "documentos",
+                    [self._documento_insert_data(documento) for documento in documentos],
+                )
+            else:
+                conn = self._get_connection()
+                try:
+                    conn.executemany(
+                        _DOCUMENTO_INSERT_SQL,
+                        [self._documento_insert_params(documento) for documento in documentos],
+                    )
+                    conn.commit()
+                finally:
+                    conn.close()
+        except Exception:
+            # Nada foi registrado no banco: não deixar cópias órfãs no disco
+            for _, destino, _ in preparados:
+                try:
+                    destino.unlink()
+                except OSError:
+                    pass
+            raise
+
+        if SUPABASE_STORAGE_AVAILABLE and supabase_storage:
+            # Conteúdo repetido dentro do lote: só o primeiro sobe, os demais
+            # (depois) encontram o blob já registrado e pulam o upload
+            primeiros, repetidos, vistos = [], [], set()
+            for documento, destino, caminho_relativo in preparados:
+                chave = documento.content_hash
+                alvo = repetidos if chave and chave in vistos else primeiros
+                alvo.append((destino, caminho_relativo, chave))
+                if chave:
+                    vistos.add(chave)
+
+            if self.upload_mode == "sync":
+                workers = min(len(primeiros), _UPLOAD_WORKERS)
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="storage-upload") as pool:
+                    list(pool.map(lambda p: self._upload_documento_remoto(*p), primeiros))
+            else:
+                # Enfileirar é barato; o paralelismo fica com os workers da fila
+                for upload in primeiros:
+                    self._upload_documento_remoto(*upload)
+            for upload in repetidos:
+                self._upload_documento_remoto(*upload)
+
+        for documento in documentos:
+            self._emit(
+                StorageEventType.DOCUMENTO_SALVO, documento.id,
+                atividade_id=documento.atividade_id, aluno_id=documento.aluno_id,
+                dados={"tipo": documento.tipo.value, "status": documento.status.value, "lote": True},
+            )
+        return documentos
+
+    def _validar_contexto_documento(self, tipo: TipoDocumento, atividade_id: str,
+                                    aluno_id: Optional[str],
+                                    atividades: Dict[str, Atividade] = None,
+                                    alunos: Dict[str, Aluno] = None) -> Tuple[Atividade, Optional[Aluno]]:
+        """Valida atividade/aluno de um documento (dicts opcionais evitam buscas repetidas)."""
+        atividades = {} if atividades is None else atividades
+        alunos = {} if alunos is None else alunos
+
+        atividade = atividades.get(atividade_id)
+        if atividade is None:
+            atividade = self.get_atividade(atividade_id)
+            if not atividade:
+                raise ValueError(f"Atividade não encontrada: {atividade_id}")
+            atividades[atividade_id] = atividade
 
         # Validar aluno_id para documentos que precisam
         if tipo not in TipoDocumento.documentos_sem_aluno() and not aluno_id:
@@ -1412,13 +1823,37 @@ class StorageManager:
         # Validar se aluno existe e está na turma
         aluno = None
         if aluno_id:
-            aluno = self.get_aluno(aluno_id)
-            if not aluno:
-                raise ValueError(f"Aluno não encontrado: {aluno_id}")
+            aluno = alunos.get(aluno_id)
+            if aluno is None:
+                aluno = self.get_aluno(aluno_id)
+                if not aluno:
+                    raise ValueError(f"Aluno não encontrado: {aluno_id}")
+                alunos[aluno_id] = aluno
+
+        return atividade, aluno
+
+    def _preparar_documento(self,
+                            arquivo_origem: str,
+                            tipo: TipoDocumento,
+                            atividade: Atividade,
+                            aluno: Optional[Aluno],
+                            display_name: str = None,
+                            ia_provider: str = None,
+                            ia_modelo: str = None,
+                            prompt_usado: str = None,
+                            tokens_usados: int = 0,
+                            tempo_processamento_ms: float = 0,
+                            status: StatusProcessamento = StatusProcessamento.CONCLUIDO,
+                            metadata: Dict[str, Any] = None,
+                            criado_por: str = "usuario",
+                            versao: int = 1,
+                            documento_origem_id: str = None) -> Tuple[Documento, Path, Path]:
+        """Copia o arquivo para o destino final e monta o Documento (sem gravar no banco)."""
+        atividade_id = atividade.id
+        aluno_id = aluno.id if aluno else None
 
         # Info do arquivo
         arquivo_path = Path(arquivo_origem)
-        nome_original = arquivo_path.name
         extensao = arquivo_path.suffix
         tamanho = arquivo_path.stat().st_size if arquivo_path.exists() else 0
 
@@ -1440,8 +1875,16 @@ class StorageManager:
         destino = self._get_caminho_documento(atividade, tipo, aluno_id, nome_arquivo)
         destino.parent.mkdir(parents=True, exist_ok=True)
 
-        # Copiar arquivo
-        shutil.copy2(arquivo_origem, destino)
+        # Copiar arquivo (via blob deduplicado quando habilitado)
+        content_hash = None
+        if self.blobs is not None:
+            content_hash, _, _ = self.blobs.put(arquivo_origem)
+            self.blobs.materialize(content_hash, destino)
+        else:
+            shutil.copy2(arquivo_origem, destino)
+        # Mesmo caminho de um arquivo baixado antes (ex.: mesmo display_name):
+        # o arquivo agora é local e ainda pode não ter subido — sai do FileCache
+        self.file_cache.forget(destino)
 
         # Calcular caminho relativo para compatibilidade cross-platform
         caminho_relativo = destino.relative_to(self.base_path)
@@ -1466,77 +1909,293 @@ class StorageManager:
             criado_por=criado_por,
             versao=versao,
             documento_origem_id=documento_origem_id,
-            metadata=metadata or {}
+            metadata=metadata or {},
+            content_hash=content_hash,
         )
+        return documento, destino, caminho_relativo
+
+    def _documento_insert_data(self, documento: Documento) -> Dict[str, Any]:
+        """Linha de documentos para o PostgREST."""
+        return {
+            "id": documento.id,
+            "tipo": documento.tipo.value,
+            "atividade_id": documento.atividade_id,
+            "aluno_id": documento.aluno_id,
+            # display_name omitido — coluna foi removida do schema Supabase 2026-05-20
+            "nome_arquivo": documento.nome_arquivo,
+            "caminho_arquivo": documento.caminho_arquivo,
+            "extensao": documento.extensao,
+            "tamanho_bytes": documento.tamanho_bytes,
+            "ia_provider": documento.ia_provider,
+            "ia_modelo": documento.ia_modelo,
+            "prompt_usado": documento.prompt_usado,
+            "prompt_versao": documento.prompt_versao,
+            "tokens_usados": documento.tokens_usados,
+            "tempo_processamento_ms": documento.tempo_processamento_ms,
+            "status": documento.status.value,
+            "criado_em": documento.criado_em.isoformat(),
+            "atualizado_em": documento.atualizado_em.isoformat(),
+            "criado_por": documento.criado_por,
+            "versao": documento.versao,
+            "documento_origem_id": documento.documento_origem_id,
+            "metadata": documento.metadata,
+            # Descartado por _filter_allowed_columns até rodar a migration 004
+            **({"content_hash": documento.content_hash} if documento.content_hash else {}),
+        }
+
+    def _documento_insert_params(self, documento: Documento) -> Tuple[Any, ...]:
+        """Parâmetros de _DOCUMENTO_INSERT_SQL (SQLite)."""
+        return (
+            documento.id, documento.tipo.value, documento.atividade_id, documento.aluno_id,
+            documento.display_name,
+            documento.nome_arquivo, documento.caminho_arquivo, documento.extensao,
+            documento.tamanho_bytes, documento.ia_provider, documento.ia_modelo,
+            documento.prompt_usado, documento.prompt_versao, documento.tokens_usados,
+            documento.tempo_processamento_ms, documento.status.value,
+            documento.criado_em.isoformat(), documento.atualizado_em.isoformat(),
+            documento.criado_por, documento.versao, documento.documento_origem_id,
+            fast_json.dumps(documento.metadata), documento.content_hash
+        )
+
+    def _upload_documento_remoto(self, destino: Path, caminho_relativo: Path,
+                                 content_hash: str = None) -> None:
+        """Envia o arquivo ao Supabase Storage (falha só é logada; o local continua valendo).
+
+        No modo ``background`` (padrão) só agenda na UploadQueue e retorna;
+        ``SUPABASE_UPLOAD_MODE=sync`` envia inline.
+        """
+        if not (SUPABASE_STORAGE_AVAILABLE and supabase_storage):
+            return
+        remote_path = str(caminho_relativo).replace("\\", "/")
+        if self.upload_mode == "sync":
+            self._enviar_para_bucket(str(destino), remote_path, content_hash)
+        else:
+            self._get_upload_queue().enqueue(destino, remote_path, content_hash)
+
+    def _enviar_para_bucket(self, local_path: str, remote_path: str,
+                            content_hash: str = None) -> Tuple[bool, str]:
+        """Upload propriamente dito (inline ou num worker da UploadQueue).
 
+        Conteúdo que já está no bucket (mesmo sha256) não é reenviado: o
+        download cai no caminho registrado em ``blobs`` (ver resolver_caminho_documento).
+        """
+        if content_hash:
+            # Mesmo conteúdo em dois jobs simultâneos: o segundo espera e pula
+            with self._remote_blob_lock:
+                hash_lock = self._remote_blob_uploading.setdefault(content_hash, threading.Lock())
+            with hash_lock:
+                try:
+                    return self._enviar_conteudo(local_path, remote_path, content_hash)
+                finally:
+                    with self._remote_blob_lock:
+                        self._remote_blob_uploading.pop(content_hash, None)
+        return self._enviar_conteudo(local_path, remote_path, None)
+
+    def _enviar_conteudo(self, local_path: str, remote_path: str,
+                         content_hash: Optional[str]) -> Tuple[bool, str]:
+        if content_hash and self._blob_remote_path(content_hash):
+            with self._remote_blob_lock:
+                self._remote_blob_stats["uploads_skipped"] += 1
+                self._remote_blob_stats["bytes_skipped"] += (
+                    os.path.getsize(local_path) if os.path.exists(local_path) else 0
+                )
+            logging.getLogger("storage").debug(f"[Supabase] Upload pulado (conteúdo já enviado): {remote_path}")
+            return True, "conteúdo já enviado"
+
+        success, msg = supabase_storage.upload(local_path, remote_path)
+        if success:
+            print(f"[Supabase] Upload OK: {remote_path}")
+            with self._remote_blob_lock:
+                self._remote_blob_stats["uploads"] += 1
+            if content_hash:
+                self._registrar_blob_remoto(content_hash, remote_path, Path(local_path))
+        else:
+            print(f"[Supabase] ERRO Upload: {msg}")
+            logging.getLogger("storage").error(f"[Supabase] Storage upload failed for {remote_path}: {msg}")
+        return success, msg
+
+    def _get_upload_queue(self) -> UploadQueue:
+        with self._upload_queue_lock:
+            if self._upload_queue is None:
+                self._upload_queue = UploadQueue(
+                    self.base_path / "upload_queue.db",
+                    uploader=lambda job: self._enviar_para_bucket(
+                        job.local_path, job.remote_path, job.content_hash
+                    ),
+                    workers=_UPLOAD_WORKERS,
+                )
+                self._upload_queue.start()
+            return self._upload_queue
+
+    def get_file_cache_stats(self) -> Dict[str, Any]:
+        """Hit rate, bytes em uso e despejos do cache de arquivos baixados."""
+        return self.file_cache.stats()
+
+    def get_database_pool_stats(self) -> Optional[Dict[str, Any]]:
+        """Requisições, tempo médio e limites do pool HTTP do Supabase (None no SQLite)."""
+        if not self.use_postgresql:
+            return None
+        return supabase_db.pool_stats()
+
+    def get_upload_queue_stats(self) -> Dict[str, Any]:
+        """Profundidade, lag e falhas da fila de uploads (vazio se nunca usada)."""
+        stats: Dict[str, Any] = {"mode": self.upload_mode}
+        if self._upload_queue is not None:
+            stats.update(self._upload_queue.stats())
+        return stats
+
+    def flush_uploads(self, timeout: float = 30.0) -> bool:
+        """Espera os uploads agendados terminarem (shutdown, scripts, testes)."""
+        if self._upload_queue is None:
+            return True
+        return self._upload_queue.flush(timeout)
+
+    def close(self) -> None:
+        """Para threads de fundo; uploads pendentes continuam no journal.
+
+        O barramento de eventos é do processo: aqui só sai a inscrição deste storage.
+        """
+        if self._upload_queue is not None:
+            self._upload_queue.close()
+        self._unsubscribe_events()
+
+    # ============================================================
+    # BLOBS (conteúdo deduplicado por sha256)
+    # ============================================================
+
+    def _blobs_table_available(self) -> bool:
+        return not self.use_postgresql or supabase_db.relation_available("blobs")
+
+    def _blob_remote_path(self, content_hash: str) -> Optional[str]:
+        """Caminho no bucket onde o conteúdo ``content_hash`` já foi enviado (ou None)."""
+        with self._remote_blob_lock:
+            cached = self._remote_blobs.get(content_hash)
+        if cached:
+            return cached
+        if not self._blobs_table_available():
+            return None
+        rows = self._select_rows("blobs", filters={"sha256": content_hash}, limit=1)
+        if not rows:
+            return None
+        remote_path = rows[0]["remote_path"]
+        with self._remote_blob_lock:
+            self._remote_blobs[content_hash] = remote_path
+        return remote_path
+
+    def _registrar_blob_remoto(self, content_hash: str, remote_path: str, arquivo: Path) -> None:
+        if not self._blobs_table_available():
+            return
+        row = {
+            "sha256": content_hash,
+            "remote_path": remote_path,
+            "tamanho_bytes": arquivo.stat().st_size if arquivo.exists() else 0,
+            "criado_em": datetime.now().isoformat(),
+        }
         if self.use_postgresql:
-            data = {
-                "id": documento.id,
-                "tipo": documento.tipo.value,
-                "atividade_id": documento.atividade_id,
-                "aluno_id": documento.aluno_id,
-                # display_name omitido — coluna foi removida do schema Supabase 2026-05-20
-                "nome_arquivo": documento.nome_arquivo,
-                "caminho_arquivo": documento.caminho_arquivo,
-                "extensao": documento.extensao,
-                "tamanho_bytes": documento.tamanho_bytes,
-                "ia_provider": documento.ia_provider,
-                "ia_modelo": documento.ia_modelo,
-                "prompt_usado": documento.prompt_usado,
-                "prompt_versao": documento.prompt_versao,
-                "tokens_usados": documento.tokens_usados,
-                "tempo_processamento_ms": documento.tempo_processamento_ms,
-                "status": documento.status.value,
-                "criado_em": documento.criado_em.isoformat(),
-                "atualizado_em": documento.atualizado_em.isoformat(),
-                "criado_por": documento.criado_por,
-                "versao": documento.versao,
-                "documento_origem_id": documento.documento_origem_id,
-                "metadata": documento.metadata
-            }
-            result = supabase_db.insert("documentos", data)
-            if result is None:
-                import logging
-                logger = logging.getLogger("storage")
-                logger.error(f"[SupabaseDB] Failed to insert documento {documento.id} into Supabase. Data keys: {list(data.keys())}")
-                raise RuntimeError(f"Failed to insert documento {documento.id} into Supabase DB - insert returned None")
+            supabase_db.upsert("blobs", row, on_conflict="sha256")
         else:
             conn = self._get_connection()
-            c = conn.cursor()
-            c.execute('''
-                INSERT INTO documentos (
-                    id, tipo, atividade_id, aluno_id, display_name,
-                    nome_arquivo, caminho_arquivo, extensao,
-                    tamanho_bytes, ia_provider, ia_modelo, prompt_usado, prompt_versao,
-                    tokens_usados, tempo_processamento_ms, status, criado_em, atualizado_em,
-                    criado_por, versao, documento_origem_id, metadata
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                documento.id, documento.tipo.value, documento.atividade_id, documento.aluno_id,
-                documento.display_name,
-                documento.nome_arquivo, documento.caminho_arquivo, documento.extensao,
-                documento.tamanho_bytes, documento.ia_provider, documento.ia_modelo,
-                documento.prompt_usado, documento.prompt_versao, documento.tokens_usados,
-                documento.tempo_processamento_ms, documento.status.value,
-                documento.criado_em.isoformat(), documento.atualizado_em.isoformat(),
-                documento.criado_por, documento.versao, documento.documento_origem_id,
-                json.dumps(documento.metadata)
-            ))
-            conn.commit()
-            conn.close()
+            try:
+                # O primeiro upload vence; repetidos concorrentes não sobrescrevem
+                conn.execute(
+                    "INSERT OR IGNORE INTO blobs (sha256, remote_path, tamanho_bytes, criado_em) "
+                    "VALUES (:sha256, :remote_path, :tamanho_bytes, :criado_em)",
+                    row,
+                )
+                conn.commit()
+            finally:
+                conn.close()
+        with self._remote_blob_lock:
+            self._remote_blobs.setdefault(content_hash, remote_path)
 
-        # Upload para Supabase Storage (persistência de arquivos em cloud)
-        if SUPABASE_STORAGE_AVAILABLE and supabase_storage:
-            remote_path = str(caminho_relativo).replace("\\", "/")
-            success, msg = supabase_storage.upload(str(destino), remote_path)
-            if success:
-                print(f"[Supabase] Upload OK: {remote_path}")
-            else:
-                print(f"[Supabase] ERRO Upload: {msg}")
-                import logging
-                logging.getLogger("storage").error(f"[Supabase] Storage upload failed for {remote_path}: {msg}")
+    def caminhos_remotos_documento(self, documento: Documento) -> List[str]:
+        """Caminhos no bucket que servem o conteúdo do documento (próprio primeiro)."""
+        remote_path = documento.caminho_arquivo.replace("\\", "/")
+        if remote_path.startswith("data/"):
+            remote_path = remote_path[5:]
+        caminhos = [remote_path]
+        if documento.content_hash:
+            blob_path = self._blob_remote_path(documento.content_hash)
+            if blob_path and blob_path not in caminhos:
+                caminhos.append(blob_path)
+        return caminhos
+
+    def get_blob_stats(self) -> Dict[str, Any]:
+        """Contadores de deduplicação local (hardlinks) e remota (uploads pulados)."""
+        with self._remote_blob_lock:
+            remote = dict(self._remote_blob_stats)
+        return {
+            "enabled": self.blobs is not None,
+            "local": self.blobs.stats() if self.blobs is not None else {},
+            "remote": remote,
+        }
 
-        return documento
+    def coletar_blobs_orfaos(self, dry_run: bool = True,
+                             grace_seconds: float = 3600) -> Dict[str, Any]:
+        """
+        Remove blobs que nenhum documento referencia mais.
+
+        - local: ``data/blobs/<ab>/<sha256>`` sem documento com esse content_hash
+          e mais velho que ``grace_seconds`` (protege um salvar_documento em curso)
+        - remoto: objetos registrados em ``blobs`` cujo hash sumiu de documentos
+          e que não são mais o caminho próprio de nenhum documento
+
+        Cada candidato é reconfirmado com um COUNT antes de apagar, já que a
+        listagem em massa do PostgREST pode vir truncada.
+        """
+        referenciados = {
+            row["content_hash"]
+            for row in self._select_rows("documentos", columns=["content_hash"])
+            if row.get("content_hash")
+        }
+
+        def _orfao(content_hash: str) -> bool:
+            return (
+                content_hash not in referenciados
+                and self._count_rows("documentos", {"content_hash": content_hash}) == 0
+            )
+
+        resultado: Dict[str, Any] = {
+            "dry_run": dry_run,
+            "referenciados": len(referenciados),
+            "locais_removidos": [],
+            "bytes_liberados": 0,
+            "remotos_removidos": [],
+        }
+
+        if self.blobs is not None:
+            for content_hash, blob in list(self.blobs.iter_blobs()):
+                if self.blobs.age_seconds(content_hash) < grace_seconds or not _orfao(content_hash):
+                    continue
+                resultado["locais_removidos"].append(content_hash)
+                if dry_run:
+                    resultado["bytes_liberados"] += blob.stat().st_size
+                else:
+                    resultado["bytes_liberados"] += self.blobs.remove(content_hash)
+
+        if self._blobs_table_available():
+            for row in self._select_rows("blobs"):
+                content_hash = row["sha256"]
+                if not _orfao(content_hash):
+                    continue
+                resultado["remotos_removidos"].append(row["remote_path"])
+                if dry_run:
+                    continue
+                if SUPABASE_STORAGE_AVAILABLE and supabase_storage:
+                    supabase_storage.delete(row["remote_path"])
+                if self.use_postgresql:
+                    supabase_db.delete_where("blobs", {"sha256": content_hash})
+                else:
+                    conn = self._get_connection()
+                    try:
+                        conn.execute("DELETE FROM blobs WHERE sha256 = ?", (content_hash,))
+                        conn.commit()
+                    finally:
+                        conn.close()
+                with self._remote_blob_lock:
+                    self._remote_blobs.pop(content_hash, None)
+
+        return resultado
 
     def get_documento(self, documento_id: str) -> Optional[Documento]:
         """Busca documento por ID"""
@@ -1547,10 +2206,12 @@ class StorageManager:
             return Documento.from_dict(row)
         else:
             conn = self._get_connection()
-            c = conn.cursor()
-            c.execute('SELECT * FROM documentos WHERE id = ?', (documento_id,))
-            row = c.fetchone()
-            conn.close()
+            try:
+                c = conn.cursor()
+                c.execute('SELECT * FROM documentos WHERE id = ?', (documento_id,))
+                row = c.fetchone()
+            finally:
+                conn.close()
 
             if not row:
                 return None
@@ -1569,60 +2230,102 @@ class StorageManager:
         status: Optional[StatusProcessamento] = None,
         metadata_patch: Optional[Dict[str, Any]] = None,
     ) -> Optional[Documento]:
-        """Atualiza metadados de IA/custos de um documento já salvo."""
-        documento = self.get_documento(documento_id)
-        if not documento:
-            return None
-
-        metadata = documento.metadata if isinstance(documento.metadata, dict) else {}
-        if metadata_patch:
-            metadata.update(metadata_patch)
+        """
+        Atualiza metadados de IA/custos de um documento já salvo.
 
-        update_data: Dict[str, Any] = {"metadata": metadata}
+        Um único UPDATE atômico: ``metadata_patch`` é mesclado no servidor
+        (chaves de topo substituídas, demais preservadas — jsonb ``||`` no
+        PostgreSQL, ``json_set`` no SQLite) e a linha volta via RETURNING.
+        Patches concorrentes do mesmo documento (etapas em paralelo) não se
+        sobrescrevem.
+        """
+        campos: Dict[str, Any] = {}
         if ia_provider is not None:
-            update_data["ia_provider"] = ia_provider
+            campos["ia_provider"] = ia_provider
         if ia_modelo is not None:
-            update_data["ia_modelo"] = ia_modelo
+            campos["ia_modelo"] = ia_modelo
         if prompt_usado is not None:
-            update_data["prompt_usado"] = prompt_usado
+            campos["prompt_usado"] = prompt_usado
         if tokens_usados is not None:
-            update_data["tokens_usados"] = int(tokens_usados or 0)
+            campos["tokens_usados"] = int(tokens_usados or 0)
         if tempo_processamento_ms is not None:
-            update_data["tempo_processamento_ms"] = float(tempo_processamento_ms or 0)
+            campos["tempo_processamento_ms"] = float(tempo_processamento_ms or 0)
         if status is not None:
-            update_data["status"] = status.value if hasattr(status, "value") else str(status)
+            campos["status"] = status.value if hasattr(status, "value") else str(status)
+        metadata_patch = dict(metadata_patch or {})
 
         if self.use_postgresql:
-            supabase_db.update("documentos", documento_id, update_data)
+            row = self._patch_documento_postgres(documento_id, campos, metadata_patch)
         else:
-            campos = []
-            valores = []
-            for campo, valor in update_data.items():
-                campos.append(f"{campo} = ?")
-                if campo == "metadata":
-                    valores.append(json.dumps(valor))
-                else:
-                    valores.append(valor)
-            campos.append("atualizado_em = ?")
-            valores.append(datetime.now().isoformat())
-            valores.append(documento_id)
+            row = self._patch_documento_sqlite(documento_id, campos, metadata_patch)
+        if not row:
+            return None
 
-            conn = self._get_connection()
-            c = conn.cursor()
-            c.execute(
-                f"UPDATE documentos SET {', '.join(campos)} WHERE id = ?",
-                valores,
+        documento = Documento.from_dict(row)
+        alterados = list(campos) + (["metadata"] if metadata_patch else [])
+        self._emit(
+            StorageEventType.DOCUMENTO_ATUALIZADO, documento_id,
+            atividade_id=documento.atividade_id, aluno_id=documento.aluno_id,
+            dados={"tipo": documento.tipo.value, "campos": sorted(alterados)},
+        )
+        return documento
+
+    def _patch_documento_postgres(self, documento_id: str, campos: Dict[str, Any],
+                                  metadata_patch: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """RPC documento_patch (migration 006); sem ela, volta ao read-modify-write."""
+        rows = supabase_db.rpc("documento_patch", {
+            "p_id": documento_id,
+            "p_campos": campos,
+            "p_metadata": metadata_patch,
+        })
+        if rows is not None:
+            return rows[0] if rows else None
+
+        row = supabase_db.select_one("documentos", documento_id)
+        if not row:
+            return None
+        metadata = row.get("metadata") if isinstance(row.get("metadata"), dict) else {}
+        metadata.update(metadata_patch)
+        return supabase_db.update("documentos", documento_id, {**campos, "metadata": metadata})
+
+    def _patch_documento_sqlite(self, documento_id: str, campos: Dict[str, Any],
+                                metadata_patch: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        # json_set por chave (e não json_patch): mesma semântica do jsonb ||,
+        # sem remover chaves com valor None nem mesclar objetos aninhados.
+        atribuicoes = [f"{campo} = ?" for campo in campos]
+        valores: List[Any] = list(campos.values())
+        if metadata_patch:
+            caminhos = ", ".join("?, json(?)" for _ in metadata_patch)
+            atribuicoes.append(
+                "metadata = json_set(CASE WHEN json_valid(metadata) THEN metadata ELSE '{}' END, "
+                f"{caminhos})"
             )
+            for chave, valor in metadata_patch.items():
+                valores.append('$."' + str(chave).replace('"', '\\"') + '"')
+                valores.append(fast_json.dumps(valor, default=str))
+        atribuicoes.append("atualizado_em = ?")
+        valores.append(datetime.now().isoformat())
+        valores.append(documento_id)
+
+        conn = self._get_connection()
+        try:
+            row = conn.execute(
+                f"UPDATE documentos SET {', '.join(atribuicoes)} WHERE id = ? RETURNING *",
+                valores,
+            ).fetchone()
             conn.commit()
+        finally:
             conn.close()
-
-        return self.get_documento(documento_id)
+        return dict(row) if row else None
 
     def resolver_caminho_documento(self, documento: Documento, force_remote: bool = False) -> Path:
         """
         Resolve o caminho absoluto de um documento.
 
         Usa cache local primeiro e só baixa do Supabase quando necessário.
+        Downloads passam pelo FileCache (limite de bytes, LRU, checksum,
+        single-flight); dentro de ``file_cache.pin_scope()`` o arquivo fica
+        protegido do despejo.
         """
         logger = logging.getLogger("pipeline")
 
@@ -1636,51 +2339,115 @@ class StorageManager:
 
         # Definir caminho local para salvar
         local_path = self.base_path / remote_path
+        logger.debug(f"[resolver_caminho] Doc: {documento.id} | caminho_arquivo (BD): {documento.caminho_arquivo} | local_path: {local_path}")
 
-        logger.info(f"[resolver_caminho] Doc: {documento.id} | Nome: {documento.nome_arquivo}")
-        logger.info(f"[resolver_caminho] caminho_arquivo (BD): {documento.caminho_arquivo}")
-        logger.info(f"[resolver_caminho] remote_path: {remote_path}")
-        logger.info(f"[resolver_caminho] local_path: {local_path}")
-        logger.info(f"[resolver_caminho] SUPABASE_AVAILABLE: {SUPABASE_AVAILABLE}")
-        logger.info(f"[resolver_caminho] supabase_storage.enabled: {supabase_storage.enabled if supabase_storage else 'None'}")
+        if not force_remote and self.file_cache.lookup(local_path, documento.content_hash):
+            return local_path
 
-        if local_path.exists() and not force_remote:
-            logger.info(f"[resolver_caminho] Cache local hit: {local_path}")
+        # Mesmo conteúdo já presente em data/blobs (outro documento): só religar
+        if (not force_remote and documento.content_hash and self.blobs is not None
+                and self.blobs.exists(documento.content_hash)):
+            self.blobs.materialize(documento.content_hash, local_path)
+            self.file_cache.forget(local_path)
+            logger.debug(f"[resolver_caminho] Blob local: {local_path}")
             return local_path
 
         if SUPABASE_AVAILABLE and supabase_storage and supabase_storage.enabled:
-            logger.info(f"[resolver_caminho] Cache miss, tentando Supabase...")
-
-            # Criar diretório pai se não existir
-            local_path.parent.mkdir(parents=True, exist_ok=True)
-
-            success, msg = supabase_storage.download(remote_path, str(local_path))
-
-            if success:
+            candidatos = [remote_path]
+            # Tentar também com prefixo 'arquivos/' se não tiver
+            if not remote_path.startswith('arquivos/'):
+                candidatos.append(f"arquivos/{remote_path}")
+            # Upload pulado por deduplicação: o conteúdo mora no caminho de outro documento
+            candidatos.extend(self.caminhos_remotos_documento(documento)[1:])
+
+            def _baixar(destino: Path) -> bool:
+                for candidato in candidatos:
+                    success, msg = supabase_storage.download(candidato, str(destino))
+                    if success:
+                        return True
+                    logger.warning(f"[resolver_caminho] Supabase falhou ({candidato}): {msg}")
+                return False
+
+            if self.file_cache.fetch(local_path, _baixar, documento.content_hash):
                 logger.info(f"[resolver_caminho] Supabase OK: {local_path}")
                 return local_path
-            else:
-                logger.warning(f"[resolver_caminho] Supabase falhou: {msg}")
-
-                # Tentar também com prefixo 'arquivos/' se não tiver
-                if not remote_path.startswith('arquivos/'):
-                    alt_path = f"arquivos/{remote_path}"
-                    logger.info(f"[resolver_caminho] Tentando caminho alternativo: {alt_path}")
-                    success2, msg2 = supabase_storage.download(alt_path, str(local_path))
-                    if success2:
-                        logger.info(f"[resolver_caminho] Supabase OK (alt): {local_path}")
-                        return local_path
-                    else:
-                        logger.warning(f"[resolver_caminho] Supabase (alt) falhou: {msg2}")
         else:
-            logger.warning(f"[resolver_caminho] Supabase não disponível!")
+            logger.debug(f"[resolver_caminho] Supabase não disponível")
 
+        # Download de outro thread em curso: esperar em vez de ver um arquivo pela metade
+        self.file_cache.wait(local_path)
         if local_path.exists():
-            logger.info(f"[resolver_caminho] Usando cache local: {local_path}")
             return local_path
 
-        logger.error(f"[resolver_caminho] ERRO: Arquivo não encontrado em lugar nenhum!")
+        logger.error(f"[resolver_caminho] ERRO: Arquivo não encontrado em lugar nenhum: {documento.id} ({remote_path})")
         return local_path
+
+    def prefetch_documentos(self, documentos: List[Documento],
+                            max_workers: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Garante cópia local de vários documentos antes de um lote começar.
+
+        Os que faltam são baixados em paralelo (STORAGE_PREFETCH_WORKERS,
+        padrão 8) via ``resolver_caminho_documento`` — ou seja, pelo FileCache,
+        então quem pedir o mesmo arquivo depois só espera o download em curso.
+        Dentro de ``file_cache.pin_scope()`` os arquivos ficam pinados, tanto
+        os baixados quanto os que já estavam no disco. Falhas não interrompem nada: a etapa tenta resolver de novo sozinha.
+
+        Returns:
+            {"total", "locais", "baixados", "falhas", "duracao_ms"}
+        """
+        inicio = time.perf_counter()
+        unicos: Dict[str, Documento] = {}
+        for doc in documentos:
+            if doc.caminho_arquivo:
+                unicos.setdefault(doc.caminho_arquivo.replace('\\', '/'), doc)
+
+        pendentes = []
+        locais = 0
+        for doc in unicos.values():
+            caminho = doc.caminho_arquivo.replace('\\', '/')
+            if caminho.startswith('data/'):
+                caminho = caminho[5:]
+            # Pelo FileCache também para os locais: conta o hit, confere a
+            # integridade dos já baixados e pina dentro do pin_scope() de quem chamou
+            if self.file_cache.lookup(self.base_path / caminho, doc.content_hash):
+                locais += 1
+            else:
+                pendentes.append(doc)
+
+        baixados = 0
+        falhas: List[str] = []
+        if pendentes:
+            workers = max(1, min(len(pendentes), max_workers or _PREFETCH_WORKERS))
+
+            def _resolver(doc: Documento) -> bool:
+                try:
+                    return self.resolver_caminho_documento(doc).exists()
+                except Exception as exc:
+                    logging.getLogger("pipeline").warning(
+                        f"[prefetch] Falha ao baixar {doc.id}: {exc}"
+                    )
+                    return False
+
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="storage-prefetch") as pool:
+                # copy_context: pinagem do pin_scope() de quem chamou vale nas threads
+                futures = [
+                    (doc, pool.submit(contextvars.copy_context().run, _resolver, doc))
+                    for doc in pendentes
+                ]
+                for doc, future in futures:
+                    if future.result():
+                        baixados += 1
+                    else:
+                        falhas.append(doc.id)
+
+        return {
+            "total": len(unicos),
+            "locais": locais,
+            "baixados": baixados,
+            "falhas": falhas,
+            "duracao_ms": round((time.perf_counter() - inicio) * 1000, 1),
+        }
     
     def listar_documentos(self, atividade_id: str, aluno_id: str = None,
                           tipo: TipoDocumento = None) -> List[Documento]:
@@ -1719,29 +2486,151 @@ class StorageManager:
             return [Documento.from_dict(row) for row in rows]
         else:
             conn = self._get_connection()
-            c = conn.cursor()
+            try:
+                c = conn.cursor()
 
-            query = 'SELECT * FROM documentos WHERE atividade_id = ?'
-            params = [atividade_id]
+                query = 'SELECT * FROM documentos WHERE atividade_id = ?'
+                params = [atividade_id]
 
-            if aluno_id is not None:
-                query += ' AND (aluno_id = ? OR aluno_id IS NULL)'
-                params.append(aluno_id)
+                if aluno_id is not None:
+                    query += ' AND (aluno_id = ? OR aluno_id IS NULL)'
+                    params.append(aluno_id)
 
-            if tipo:
-                query += ' AND tipo = ?'
-                params.append(tipo.value)
+                if tipo:
+                    query += ' AND tipo = ?'
+                    params.append(tipo.value)
 
-            query += ' ORDER BY criado_em DESC'
+                query += ' ORDER BY criado_em DESC'
 
-            c.execute(query, params)
-            rows = c.fetchall()
-            conn.close()
+                c.execute(query, params)
+                rows = c.fetchall()
+            finally:
+                conn.close()
 
             return [Documento.from_dict(dict(row)) for row in rows]
 
-    def listar_todos_documentos(self, limit: Optional[int] = None) -> List[Documento]:
-        """Lista documentos de todas as atividades, mais recentes primeiro."""
+    def listar_documentos_atuais(self, atividade_id: str, aluno_id: Any = None,
+                                 tipo: TipoDocumento = None,
+                                 status: Any = None) -> List[Documento]:
+        """
+        Lista só a versão mais recente de cada artefato.
+
+        Um documento por (aluno_id, tipo, extensao): retries e versões antigas
+        ficam de fora. O JSON e o PDF são escolhidos cada um por si e podem
+        vir de execuções diferentes — se a última execução falhou depois de
+        gravar só o JSON, volta esse JSON com o PDF da execução anterior.
+        Quem precisa do par de uma mesma execução não deve contar com isso.
+        Com ``status`` (ex.: "concluido") retorna a versão mais recente NAQUELE
+        status, mesmo que exista uma tentativa mais nova com erro.
+
+        ``aluno_id`` segue a semântica de ``listar_documentos``: inclui os
+        documentos base (aluno_id NULL) da atividade. Uma lista de ids busca
+        vários alunos numa consulta só, sem os documentos base.
+        """
+        filters: Dict[str, Any] = {"atividade_id": atividade_id}
+        if tipo:
+            filters["tipo"] = tipo.value
+        if status is not None:
+            filters["status"] = getattr(status, "value", status)
+
+        if aluno_id is None:
+            aluno_filters = [None]
+        elif isinstance(aluno_id, (list, tuple, set)):
+            aluno_filters = [{"in": list(aluno_id)}]
+        else:
+            aluno_filters = [aluno_id, {"is": "null"}]
+        rows: List[Dict[str, Any]] = []
+
+        table = "documentos_atuais"
+        if self.use_postgresql and not supabase_db.relation_available(table):
+            # Migration 003 ainda não aplicada: resolve as versões em Python
+            table = "documentos"
+
+        for aluno_filter in aluno_filters:
+            query_filters = dict(filters)
+            if aluno_filter is not None:
+                query_filters["aluno_id"] = aluno_filter
+            rows.extend(self._select_rows(table, filters=query_filters))
+
+        # A view separa por status; aqui fica só o mais recente de cada artefato
+        atuais: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+        for row in rows:
+            key = (row.get("aluno_id"), row.get("tipo"), row.get("extensao") or "")
+            current = atuais.get(key)
+            if current is None or (
+                (row.get("criado_em") or "", row.get("id") or "")
+                > (current.get("criado_em") or "", current.get("id") or "")
+            ):
+                atuais[key] = row
+
+        ordered = sorted(
+            atuais.values(),
+            key=lambda row: row.get("criado_em") or "",
+            reverse=True,
+        )
+        return [Documento.from_dict(row) for row in ordered]
+
+    def listar_documentos_pagina(self, atividade_id: Optional[str] = None,
+                                 aluno_id: Optional[str] = None,
+                                 tipo: TipoDocumento = None,
+                                 cursor: Optional[str] = None,
+                                 limit: int = 500,
+                                 leve: bool = False) -> Dict[str, Any]:
+        """
+        Uma página de documentos, mais recentes primeiro (keyset em criado_em, id).
+
+        Mesma semântica de filtros de ``listar_documentos`` (``aluno_id`` inclui
+        os documentos base); sem ``atividade_id`` pagina a tabela inteira.
+        ``leve=True`` devolve ``DocumentoLeve`` (só leitura/serialização).
+
+        Returns:
+            {"documentos": List[Documento], "next_cursor": str | None}
+        """
+        filters: Dict[str, Any] = {}
+        if atividade_id:
+            filters["atividade_id"] = atividade_id
+        if aluno_id:
+            filters["aluno_id"] = {"or_null": aluno_id}
+        if tipo:
+            filters["tipo"] = tipo.value
+        limit = max(1, min(int(limit), _PAGE_SIZE_MAX))
+
+        rows = self._select_rows(
+            "documentos",
+            filters=filters or None,
+            order_by="criado_em",
+            order_desc=True,
+            limit=limit + 1,
+            after=_decode_cursor(cursor),
+            keyset=True,
+        )
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1])
+        modelo = DocumentoLeve if leve else Documento.from_dict
+        return {"documentos": [modelo(row) for row in rows], "next_cursor": next_cursor}
+
+    def iterar_documentos(self, atividade_id: Optional[str] = None,
+                          tipo: TipoDocumento = None,
+                          page_size: int = 500) -> Iterator[Documento]:
+        """Percorre documentos (mais recentes primeiro) buscando uma página por vez."""
+        cursor = None
+        while True:
+            pagina = self.listar_documentos_pagina(
+                atividade_id=atividade_id, tipo=tipo, cursor=cursor, limit=page_size,
+            )
+            yield from pagina["documentos"]
+            cursor = pagina["next_cursor"]
+            if cursor is None:
+                return
+
+    def listar_todos_documentos(self, limit: Optional[int] = None, leve: bool = False) -> List[Documento]:
+        """Lista documentos de todas as atividades, mais recentes primeiro.
+
+        ``leve=True`` devolve ``DocumentoLeve`` (sem hidratar o dataclass).
+        """
+        modelo = DocumentoLeve if leve else Documento.from_dict
         if self.use_postgresql:
             rows = self._select_rows(
                 "documentos",
@@ -1749,19 +2638,21 @@ class StorageManager:
                 order_desc=True,
                 limit=limit,
             )
-            return [Documento.from_dict(row) for row in rows]
+            return [modelo(row) for row in rows]
 
         conn = self._get_connection()
-        c = conn.cursor()
-        query = "SELECT * FROM documentos ORDER BY criado_em DESC"
-        params: List[Any] = []
-        if limit is not None:
-            query += " LIMIT ?"
-            params.append(limit)
-        c.execute(query, params)
-        rows = c.fetchall()
-        conn.close()
-        return [Documento.from_dict(dict(row)) for row in rows]
+        try:
+            c = conn.cursor()
+            query = "SELECT * FROM documentos ORDER BY criado_em DESC"
+            params: List[Any] = []
+            if limit is not None:
+                query += " LIMIT ?"
+                params.append(limit)
+            c.execute(query, params)
+            rows = c.fetchall()
+        finally:
+            conn.close()
+        return [modelo(dict(row)) for row in rows]
 
     def deletar_documento(self, documento_id: str) -> bool:
         """Deleta documento do banco e do sistema de arquivos (local e cloud)"""
@@ -1769,47 +2660,323 @@ class StorageManager:
         if not doc:
             return False
 
-        # Remover arquivo local
+        # Remover arquivo local (sem baixar do bucket só para apagar)
         if doc.caminho_arquivo:
-            arquivo = self.resolver_caminho_documento(doc)
+            remote_path = str(doc.caminho_arquivo).replace("\\", "/")
+            if remote_path.startswith('data/'):
+                remote_path = remote_path[5:]
+            arquivo = self.base_path / remote_path
             if arquivo.exists():
                 arquivo.unlink()
+            self.file_cache.forget(arquivo)
 
             # Remover do Supabase Storage também
             if SUPABASE_STORAGE_AVAILABLE and supabase_storage:
-                remote_path = str(doc.caminho_arquivo).replace("\\", "/")
-                if remote_path.startswith('data/'):
-                    remote_path = remote_path[5:]
-                success, msg = supabase_storage.delete(remote_path)
-                if success:
-                    print(f"[Supabase] Deletado: {remote_path}")
+                if self._upload_queue is not None:
+                    self._upload_queue.cancel(remote_path)
+                if doc.content_hash and self._blob_remote_path(doc.content_hash) == remote_path:
+                    # Outros documentos podem servir este conteúdo a partir daqui;
+                    # coletar_blobs_orfaos apaga quando não houver mais referência
+                    pass
+                else:
+                    success, msg = supabase_storage.delete(remote_path)
+                    if success:
+                        print(f"[Supabase] Deletado: {remote_path}")
 
         # Remover do banco
         if self.use_postgresql:
             supabase_db.delete("documentos", documento_id)
         else:
             conn = self._get_connection()
-            c = conn.cursor()
-            c.execute('DELETE FROM documentos WHERE id = ?', (documento_id,))
-            conn.commit()
-            conn.close()
+            try:
+                c = conn.cursor()
+                c.execute('DELETE FROM documentos WHERE id = ?', (documento_id,))
+                conn.commit()
+            finally:
+                conn.close()
 
+        self._emit(
+            StorageEventType.DOCUMENTO_DELETADO, documento_id,
+            atividade_id=doc.atividade_id, aluno_id=doc.aluno_id,
+            dados={"tipo": doc.tipo.value},
+        )
         return True
 
     def deletar_documentos_aluno_atividade(self, atividade_id: str, aluno_id: str) -> int:
         """Deleta todos os documentos de um aluno em uma atividade específica"""
-        rows = self._select_rows(
+        relatorio = self.excluir_em_cascata("aluno_atividade", (atividade_id, aluno_id))
+        return relatorio["linhas"].get("documentos", 0)
+
+    # ============================================================
+    # EXCLUSÃO EM CASCATA
+    # ============================================================
+
+    def excluir_em_cascata(self, escopo: str, ids: Any, dry_run: bool = False) -> Dict[str, Any]:
+        """
+        Apaga uma entidade e tudo abaixo dela de uma vez.
+
+        ``escopo``: materia | turma | atividade | aluno (``ids`` = id) ou
+        aluno_atividade (``ids`` = (atividade_id, aluno_id)).
+
+        - banco: SQLite apaga por conjunto (DELETE ... WHERE ... IN (SELECT))
+          numa única transação; PostgreSQL faz um DELETE na linha raiz e
+          deixa o ON DELETE CASCADE (migration 007) levar o resto (aluno:
+          RPC excluir_aluno_cascata, migration 008)
+        - arquivos: locais apagados, uploads pendentes cancelados e os
+          objetos do bucket removidos em lote (delete_many); conteúdo servido
+          como blob compartilhado fica para coletar_blobs_orfaos. Só depois
+          que as linhas saíram de fato: se o DELETE da raiz não apagou nada
+          (ex.: erro transitório do PostgREST), os arquivos ficam
+
+        ``dry_run=True`` não apaga nada e só conta linhas e arquivos.
+        No PostgreSQL, fora do dry-run, as linhas levadas pelo CASCADE não
+        entram em ``linhas`` (só a raiz e os documentos).
+        """
+        started_at = time.perf_counter()
+        params = tuple(ids) if isinstance(ids, (tuple, list)) else (ids,)
+        escopo_tabelas = _CASCATA_SQLITE[escopo]
+        diretorio, contexto = self._contexto_exclusao(escopo, params)
+
+        if self.use_postgresql:
+            linhas, documentos = self._cascata_postgres(escopo, params, dry_run)
+        else:
+            linhas, documentos = self._cascata_sqlite(escopo_tabelas, params, dry_run)
+
+        raiz = escopo_tabelas[-1][0]
+        encontrado = linhas.get(raiz, 0) > 0
+        # Arquivos só saem se as linhas saíram: no PostgreSQL delete_where
+        # devolve 0 em erro transitório e o bucket é a única cópia durável
+        apagado = dry_run or encontrado or (bool(documentos) and linhas.get("documentos") == len(documentos))
+        if not apagado and documentos:
+            logging.warning(
+                "[cascade-delete] escopo=%s ids=%s: nada apagado no banco; %s arquivo(s) mantido(s)",
+                escopo, list(params), len(documentos),
+            )
+        arquivos = self._remover_arquivos_documentos(documentos if apagado else [], dry_run)
+        if not dry_run and encontrado:
+            if diretorio is not None and diretorio.exists():
+                shutil.rmtree(diretorio)
+            self._emitir_exclusao(escopo, params, contexto, documentos)
+
+        relatorio = {
+            "escopo": escopo,
+            "ids": list(params),
+            "dry_run": dry_run,
+            "encontrado": encontrado,
+            "linhas": linhas,
+            **arquivos,
+            "duracao_ms": round((time.perf_counter() - started_at) * 1000, 2),
+        }
+        logging.info(
+            "[cascade-delete] escopo=%s ids=%s dry_run=%s linhas=%s arquivos_locais=%s arquivos_remotos=%s "
+            "duration_ms=%.2f",
+            escopo, list(params), dry_run, linhas, arquivos["arquivos_locais"],
+            arquivos["arquivos_remotos"], relatorio["duracao_ms"],
+        )
+        return relatorio
+
+    def _cascata_sqlite(self, tabelas: List[Tuple[str, str]], params: Tuple[Any, ...],
+                        dry_run: bool) -> Tuple[Dict[str, int], List[Dict[str, Any]]]:
+        where_documentos = next((where for tabela, where in tabelas if tabela == "documentos"), None)
+        linhas: Dict[str, int] = {}
+        conn = self._get_connection()
+        try:
+            documentos = []
+            if where_documentos:
+                documentos = [
+                    dict(row) for row in conn.execute(
+                        "SELECT id, atividade_id, aluno_id, tipo, caminho_arquivo, content_hash "
+                        f"FROM documentos WHERE {where_documentos}",
+                        params,
+                    ).fetchall()
+                ]
+            for tabela, where in tabelas:
+                if dry_run:
+                    row = conn.execute(f"SELECT COUNT(*) FROM {tabela} WHERE {where}", params).fetchone()
+                    linhas[tabela] = int(row[0])
+                else:
+                    linhas[tabela] = conn.execute(f"DELETE FROM {tabela} WHERE {where}", params).rowcount
+            if not dry_run:
+                conn.commit()
+        finally:
+            # close() desfaz a transação se algum DELETE falhou no meio
+            conn.close()
+        return linhas, documentos
+
+    def _cascata_postgres(self, escopo: str, params: Tuple[Any, ...],
+                          dry_run: bool) -> Tuple[Dict[str, int], List[Dict[str, Any]]]:
+        filtros = self._filtros_cascata_postgres(escopo, params)
+        documentos = self._select_rows(
             "documentos",
-            filters={"atividade_id": atividade_id, "aluno_id": aluno_id},
-            columns=["id"],
+            filters=filtros["documentos"],
+            columns=["id", "atividade_id", "aluno_id", "tipo", "caminho_arquivo", "content_hash"],
         )
+        if dry_run:
+            return {tabela: supabase_db.count(tabela, f) for tabela, f in filtros.items()}, documentos
+
+        if escopo == "aluno":
+            return self._excluir_aluno_postgres(params[0], filtros), documentos
+        raiz, filtro_raiz = list(filtros.items())[-1]
+        removidos = supabase_db.delete_where(raiz, filtro_raiz)
+        # Documentos saem pelo CASCADE da raiz: nenhuma raiz apagada, nenhum documento
+        linhas: Dict[str, int] = {"documentos": len(documentos) if removidos else 0}
+        linhas[raiz] = removidos
+        return linhas, documentos
+
+    def _excluir_aluno_postgres(self, aluno_id: str, filtros: Dict[str, Dict[str, Any]]) -> Dict[str, int]:
+        """
+        RPC excluir_aluno_cascata (migration 008): documentos e aluno numa transação.
 
-        count = 0
-        for row in rows:
-            if self.deletar_documento(row["id"]):
-                count += 1
+        Os documentos saem explicitamente porque documentos.aluno_id era SET
+        NULL antes da migration 007. Sem a função, volta aos dois DELETEs:
+        ambos idempotentes e o da raiz repetido até o aluno sumir, então uma
+        falha no meio deixa no máximo um aluno sem documentos (excluir de
+        novo termina o serviço), nunca documentos órfãos.
+        """
+        resultado = supabase_db.rpc("excluir_aluno_cascata", {"p_aluno_id": aluno_id})
+        if isinstance(resultado, dict):
+            return {"documentos": int(resultado.get("documentos") or 0), "alunos": int(resultado.get("alunos") or 0)}
+
+        documentos = supabase_db.delete_where("documentos", filtros["documentos"])
+        for tentativa in range(_CASCATA_TENTATIVAS):
+            removidos = supabase_db.delete_where("alunos", filtros["alunos"])
+            if removidos or supabase_db.select_one("alunos", aluno_id, columns=["id"]) is None:
+                break
+            time.sleep(0.2 * 2 ** tentativa)
+        else:
+            logging.warning(
+                "[cascade-delete] aluno %s ficou sem documentos mas não foi apagado; repita a exclusão", aluno_id,
+            )
+        return {"documentos": documentos, "alunos": removidos}
+
+    def _filtros_cascata_postgres(self, escopo: str, params: Tuple[Any, ...]) -> Dict[str, Dict[str, Any]]:
+        """Filtros PostgREST equivalentes a _CASCATA_SQLITE (ids resolvidos aqui, sem subquery)."""
+        if escopo == "aluno_atividade":
+            return {"documentos": {"atividade_id": params[0], "aluno_id": params[1]}}
+        if escopo == "aluno":
+            aluno = {"aluno_id": params[0]}
+            return {"alunos_turmas": aluno, "documentos": aluno, "resultados": aluno, "alunos": {"id": params[0]}}
+
+        if escopo == "atividade":
+            turma_ids: List[str] = []
+            atividade_ids = [params[0]]
+        else:
+            if escopo == "materia":
+                turma_ids = [row["id"] for row in self._select_rows(
+                    "turmas", filters={"materia_id": params[0]}, columns=["id"])]
+            else:
+                turma_ids = [params[0]]
+            atividade_ids = [row["id"] for row in self._select_rows(
+                "atividades", filters={"turma_id": turma_ids}, columns=["id"])] if turma_ids else []
 
-        return count
+        filtros: Dict[str, Dict[str, Any]] = {
+            "documentos": {"atividade_id": atividade_ids},
+            "resultados": {"atividade_id": atividade_ids},
+        }
+        if escopo != "atividade":
+            filtros["alunos_turmas"] = {"turma_id": turma_ids}
+            filtros["atividades"] = {"turma_id": turma_ids}
+        if escopo == "materia":
+            filtros["turmas"] = {"materia_id": params[0]}
+            filtros["materias"] = {"id": params[0]}
+        elif escopo == "turma":
+            filtros["turmas"] = {"id": params[0]}
+        else:
+            filtros["atividades"] = {"id": params[0]}
+        return filtros
+
+    def _contexto_exclusao(self, escopo: str,
+                           params: Tuple[Any, ...]) -> Tuple[Optional[Path], Dict[str, Any]]:
+        """Diretório local do escopo (None se não houver um só) e campos do evento de exclusão."""
+        if escopo == "materia":
+            return self.arquivos_path / params[0], {"materia_id": params[0]}
+        if escopo == "turma":
+            turma = self.get_turma(params[0])
+            if not turma:
+                return None, {"turma_id": params[0]}
+            return self.arquivos_path / turma.materia_id / turma.id, {
+                "turma_id": turma.id, "materia_id": turma.materia_id,
+            }
+        if escopo == "atividade":
+            atividade = self.get_atividade(params[0])
+            if not atividade:
+                return None, {"atividade_id": params[0]}
+            contexto = {"atividade_id": atividade.id, "turma_id": atividade.turma_id}
+            turma = self.get_turma(atividade.turma_id)
+            if not turma:
+                return None, contexto
+            return self.arquivos_path / turma.materia_id / turma.id / atividade.id, contexto
+        if escopo == "aluno":
+            return None, {"aluno_id": params[0]}
+        return None, {}
+
+    def _remover_arquivos_documentos(self, documentos: List[Dict[str, Any]],
+                                     dry_run: bool) -> Dict[str, Any]:
+        """Apaga arquivos locais e remove do bucket, em lote, os dos documentos excluídos."""
+        locais = 0
+        remotos: List[Tuple[str, Optional[str]]] = []
+        for doc in documentos:
+            if not doc.get("caminho_arquivo"):
+                continue
+            remote_path = str(doc["caminho_arquivo"]).replace("\\", "/")
+            if remote_path.startswith("data/"):
+                remote_path = remote_path[5:]
+            arquivo = self.base_path / remote_path
+            if arquivo.exists():
+                locais += 1
+                if not dry_run:
+                    arquivo.unlink()
+            if not dry_run:
+                self.file_cache.forget(arquivo)
+            remotos.append((remote_path, doc.get("content_hash")))
+
+        resultado: Dict[str, Any] = {"arquivos_locais": locais, "arquivos_remotos": 0, "erros_remotos": []}
+        if not remotos or not (SUPABASE_STORAGE_AVAILABLE and supabase_storage):
+            return resultado
+
+        # Caminhos que servem um blob compartilhado: outros documentos podem
+        # apontar para eles; coletar_blobs_orfaos apaga quando não houver referência
+        hashes = sorted({content_hash for _, content_hash in remotos if content_hash})
+        compartilhados = set()
+        if hashes:
+            with self._remote_blob_lock:
+                compartilhados = {self._remote_blobs[h] for h in hashes if h in self._remote_blobs}
+            if self._blobs_table_available():
+                compartilhados.update(
+                    row["remote_path"]
+                    for row in self._select_rows("blobs", filters={"sha256": hashes}, columns=["remote_path"])
+                )
+        caminhos = [path for path, content_hash in remotos if not (content_hash and path in compartilhados)]
+
+        if dry_run:
+            resultado["arquivos_remotos"] = len(caminhos)
+            return resultado
+        if self._upload_queue is not None:
+            self._upload_queue.cancel_many([path for path, _ in remotos])
+        removidos, erros = supabase_storage.delete_many(caminhos)
+        resultado["arquivos_remotos"] = removidos
+        resultado["erros_remotos"] = erros
+        for erro in erros:
+            print(f"[Supabase] Falha na remoção em lote: {erro}")
+        return resultado
+
+    def _emitir_exclusao(self, escopo: str, params: Tuple[Any, ...], contexto: Dict[str, Any],
+                         documentos: List[Dict[str, Any]]) -> None:
+        tipos = {
+            "materia": StorageEventType.MATERIA_DELETADA,
+            "turma": StorageEventType.TURMA_DELETADA,
+            "atividade": StorageEventType.ATIVIDADE_DELETADA,
+            "aluno": StorageEventType.ALUNO_DELETADO,
+        }
+        if escopo in tipos:
+            self._emit(tipos[escopo], params[0], **contexto)
+        else:
+            for doc in documentos:
+                self._emit(
+                    StorageEventType.DOCUMENTO_DELETADO, doc["id"],
+                    atividade_id=doc["atividade_id"], aluno_id=doc["aluno_id"],
+                    dados={"tipo": doc["tipo"]},
+                )
 
     def excluir_documentos_ai_aluno_atividade(self, atividade_id: str, aluno_id: str) -> int:
         """Deleta apenas os documentos gerados por IA de um aluno em uma atividade específica"""
@@ -1855,17 +3022,27 @@ class StorageManager:
         if arquivo_atual.exists():
             novo_caminho = arquivo_atual.parent / novo_nome
             arquivo_atual.rename(novo_caminho)
+            self.file_cache.forget(arquivo_atual)
+            self.file_cache.forget(novo_caminho)
             
             # Atualizar banco
             conn = self._get_connection()
-            c = conn.cursor()
-            c.execute('''
-                UPDATE documentos 
-                SET nome_arquivo = ?, caminho_arquivo = ?, atualizado_em = ?
-                WHERE id = ?
-            ''', (novo_nome, str(novo_caminho), datetime.now().isoformat(), documento_id))
-            conn.commit()
-            conn.close()
+            try:
+                c = conn.cursor()
+                c.execute('''
+                    UPDATE documentos 
+                    SET nome_arquivo = ?, caminho_arquivo = ?, atualizado_em = ?
+                    WHERE id = ?
+                ''', (novo_nome, str(novo_caminho), datetime.now().isoformat(), documento_id))
+                conn.commit()
+            finally:
+                conn.close()
+
+            self._emit(
+                StorageEventType.DOCUMENTO_RENOMEADO, documento_id,
+                atividade_id=doc.atividade_id, aluno_id=doc.aluno_id,
+                dados={"nome_arquivo": novo_nome},
+            )
         
         return self.get_documento(documento_id)
     
@@ -1877,7 +3054,20 @@ class StorageManager:
         """
         Retorna status completo de uma atividade.
         Inclui documentos existentes, faltantes, e status por aluno.
+
+        Cacheado por STORAGE_STATUS_CACHE_TTL_S; eventos de documento/atividade
+        invalidam a atividade, os de aluno/turma/matéria invalidam todas.
         """
+        cached = self._status_cache.get("status_atividade", atividade_id)
+        if cached is not None:
+            return cached
+        generation = self._status_cache.generation
+        status = self._calcular_status_atividade(atividade_id)
+        if "erro" not in status:
+            self._status_cache.put("status_atividade", atividade_id, status, generation=generation)
+        return status
+
+    def _calcular_status_atividade(self, atividade_id: str) -> Dict[str, Any]:
         atividade = self.get_atividade(atividade_id)
         if not atividade:
             return {"erro": "Atividade não encontrada"}
@@ -1968,7 +3158,7 @@ class StorageManager:
         Verifica se um tipo de documento pode ser gerado.
         Retorna o que está faltando.
         """
-        documentos = self.listar_documentos(atividade_id, aluno_id)
+        documentos = self.listar_documentos_atuais(atividade_id, aluno_id)
         tipos_existentes = [d.tipo for d in documentos]
         
         return verificar_dependencias(tipo_alvo, tipos_existentes)
@@ -1978,9 +3168,66 @@ class StorageManager:
     # ============================================================
 
     def get_estatisticas_gerais_fast(self) -> Dict[str, Any]:
-        """Returns dashboard statistics with batched reads instead of N+1 loops."""
+        """Returns dashboard statistics aggregated by the database.
+
+        SQLite runs one query over ``documento_contadores``; Postgres calls the
+        ``estatisticas_gerais()`` RPC. Without that migration it falls back to
+        reading one (atividade_id, tipo) row per document.
+        """
         started_at = time.perf_counter()
 
+        agregado = self._estatisticas_agregadas()
+        if agregado is None:
+            return self._estatisticas_por_linhas(started_at)
+
+        payload = {
+            "total_materias": int(agregado["total_materias"]),
+            "total_turmas": int(agregado["total_turmas"]),
+            "total_alunos": int(agregado["total_alunos"]),
+            "total_atividades": int(agregado["total_atividades"]),
+            "total_documentos": int(agregado["total_documentos"]),
+            "alertas": {
+                "atividades_sem_gabarito": int(agregado["atividades_sem_gabarito"])
+            }
+        }
+        self._log_hot_endpoint_profile(
+            "/api/estatisticas",
+            started_at,
+            {"agregado": 1},
+            {
+                "total_atividades": payload["total_atividades"],
+                "total_documentos": payload["total_documentos"],
+            },
+        )
+        return payload
+
+    def _estatisticas_agregadas(self) -> Optional[Dict[str, Any]]:
+        """Totais do dashboard numa única ida ao banco (None se indisponível)."""
+        if self.use_postgresql:
+            data = supabase_db.rpc("estatisticas_gerais")
+            if isinstance(data, list):
+                data = data[0] if data else None
+            return data if isinstance(data, dict) else None
+
+        conn = self._get_connection()
+        try:
+            row = conn.execute('''
+                SELECT
+                    (SELECT COUNT(*) FROM materias) AS total_materias,
+                    (SELECT COUNT(*) FROM turmas) AS total_turmas,
+                    (SELECT COUNT(*) FROM alunos) AS total_alunos,
+                    COUNT(a.id) AS total_atividades,
+                    COALESCE(SUM(c.total), 0) AS total_documentos,
+                    COALESCE(SUM(COALESCE(c.gabaritos, 0) = 0), 0) AS atividades_sem_gabarito
+                FROM atividades a
+                LEFT JOIN documento_contadores c ON c.atividade_id = a.id
+            ''').fetchone()
+            return dict(row)
+        finally:
+            conn.close()
+
+    def _estatisticas_por_linhas(self, started_at: float) -> Dict[str, Any]:
+        """Caminho antigo: conta no Python a partir de uma linha por documento."""
         total_materias = self._count_rows("materias")
         total_turmas = self._count_rows("turmas")
         total_alunos = self._count_rows("alunos")
@@ -2036,62 +3283,35 @@ class StorageManager:
         return payload
 
     def get_arvore_navegacao_fast(self) -> Dict[str, Any]:
-        """Returns the navigation tree with batched reads and merged duplicate matérias."""
-        started_at = time.perf_counter()
+        """Returns the navigation tree with batched reads and merged duplicate matérias.
 
-        materias_rows = self._select_rows(
-            "materias",
-            order_by="nome",
-            columns=["id", "nome"],
-        )
-        materia_ids = [row["id"] for row in materias_rows]
-
-        turmas_rows = (
-            self._select_rows(
-                "turmas",
-                filters={"materia_id": materia_ids},
-                order_by="nome",
-                columns=["id", "materia_id", "nome", "ano_letivo"],
-            )
-            if materia_ids
-            else []
-        )
-        turma_ids = [row["id"] for row in turmas_rows]
+        Cached for STORAGE_ARVORE_CACHE_TTL_S and dropped on any storage event.
+        """
+        cached = self._arvore_cache
+        if cached is not None and cached[0] > time.monotonic():
+            return copy.deepcopy(cached[1])
 
-        atividades_rows = (
-            self._select_rows(
-                "atividades",
-                filters={"turma_id": turma_ids},
-                order_by="nome",
-                columns=["id", "turma_id", "nome", "tipo"],
-            )
-            if turma_ids
-            else []
-        )
-        atividade_ids = [row["id"] for row in atividades_rows]
+        started_at = time.perf_counter()
+        generation = self._arvore_generation
 
-        documentos_rows = (
-            self._select_rows(
-                "documentos",
-                filters={"atividade_id": atividade_ids},
-                columns=["atividade_id"],
-            )
-            if atividade_ids
-            else []
-        )
-        vinculos_rows = (
-            self._select_rows(
-                "alunos_turmas",
-                filters={"turma_id": turma_ids, "ativo": True},
-                columns=["turma_id", "aluno_id"],
-            )
-            if turma_ids
-            else []
-        )
+        # As cinco leituras são independentes (o encadeamento materia -> turma
+        # -> atividade é feito aqui, não com filtros IN): saem juntas, em
+        # paralelo no pool HTTP do Supabase. Linhas órfãs somem no join abaixo.
+        if self._usar_contadores_documentos():
+            documentos_query = dict(table="documento_contadores", columns=["atividade_id", "total"])
+        else:
+            documentos_query = dict(table="documentos", columns=["atividade_id"])
+        materias_rows, turmas_rows, atividades_rows, documentos_rows, vinculos_rows = self._select_many([
+            dict(table="materias", order_by="nome", columns=["id", "nome"]),
+            dict(table="turmas", order_by="nome", columns=["id", "materia_id", "nome", "ano_letivo"]),
+            dict(table="atividades", order_by="nome", columns=["id", "turma_id", "nome", "tipo"]),
+            documentos_query,
+            dict(table="alunos_turmas", filters={"ativo": True}, columns=["turma_id", "aluno_id"]),
+        ])
 
         total_documentos_por_atividade: Dict[str, int] = defaultdict(int)
         for row in documentos_rows:
-            total_documentos_por_atividade[row["atividade_id"]] += 1
+            total_documentos_por_atividade[row["atividade_id"]] += row.get("total", 1)
 
         total_alunos_por_turma: Dict[str, set] = defaultdict(set)
         for row in vinculos_rows:
@@ -2143,6 +3363,8 @@ class StorageManager:
                 "materias": len(payload["materias"]),
             },
         )
+        if _ARVORE_CACHE_TTL_S > 0 and generation == self._arvore_generation:
+            self._arvore_cache = (time.monotonic() + _ARVORE_CACHE_TTL_S, copy.deepcopy(payload))
         return payload
 
     def listar_documentos_com_contexto_fast(self, filters: Dict[str, Any]) -> List[Dict[str, Any]]:
@@ -2150,11 +3372,98 @@ class StorageManager:
         started_at = time.perf_counter()
 
         filters = filters or {}
+        escopo = self._escopo_documentos_contexto(filters)
+        if escopo is None:
+            self._log_hot_endpoint_profile(
+                "/api/documentos/todos",
+                started_at,
+                {"materias": 0, "turmas": 0, "atividades": 0, "documentos": 0, "alunos": 0},
+                {"documentos": 0},
+            )
+            return []
+        turma_scope_rows, atividades_rows = escopo
+
+        documentos_filters: Dict[str, Any] = {"atividade_id": [row["id"] for row in atividades_rows]}
+        if filters.get("tipos"):
+            documentos_filters["tipo"] = filters["tipos"]
+        documentos_rows = self._select_rows(
+            "documentos",
+            filters=documentos_filters,
+            order_by="criado_em",
+            order_desc=True,
+            columns=_DOCUMENTO_CONTEXTO_COLUMNS,
+        )
+
+        aluno_ids = filters.get("aluno_ids") or None
+        if aluno_ids:
+            aluno_ids_set = set(aluno_ids)
+            documentos_rows = [
+                row for row in documentos_rows
+                if row.get("aluno_id") is None or row.get("aluno_id") in aluno_ids_set
+            ]
+
+        documentos, row_counts = self._montar_documentos_contexto(
+            documentos_rows, turma_scope_rows, atividades_rows, agrupar=True,
+        )
+        self._log_hot_endpoint_profile(
+            "/api/documentos/todos", started_at, row_counts, {"documentos": len(documentos)},
+        )
+        return documentos
+
+    def listar_documentos_com_contexto_pagina(self, filters: Dict[str, Any],
+                                              cursor: Optional[str] = None,
+                                              limit: int = 500) -> Dict[str, Any]:
+        """
+        Uma página de /api/documentos/todos, mais recentes primeiro.
+
+        Keyset em (criado_em, id): ``next_cursor`` volta como ``cursor`` na
+        próxima chamada (None = acabou). Memória e tempo por página não
+        dependem do tamanho da tabela documentos.
+        """
+        started_at = time.perf_counter()
+        after = _decode_cursor(cursor)
+        limit = max(1, min(int(limit), _PAGE_SIZE_MAX))
+
+        filters = filters or {}
+        escopo = self._escopo_documentos_contexto(filters)
+        if escopo is None:
+            return {"documentos": [], "next_cursor": None}
+        turma_scope_rows, atividades_rows = escopo
+
+        documentos_filters: Dict[str, Any] = {"atividade_id": [row["id"] for row in atividades_rows]}
+        if filters.get("tipos"):
+            documentos_filters["tipo"] = filters["tipos"]
+        if filters.get("aluno_ids"):
+            documentos_filters["aluno_id"] = {"or_null": filters["aluno_ids"]}
+        documentos_rows = self._select_rows(
+            "documentos",
+            filters=documentos_filters,
+            order_by="criado_em",
+            order_desc=True,
+            limit=limit + 1,
+            columns=_DOCUMENTO_CONTEXTO_COLUMNS,
+            after=after,
+            keyset=True,
+        )
+        next_cursor = None
+        if len(documentos_rows) > limit:
+            documentos_rows = documentos_rows[:limit]
+            next_cursor = _encode_cursor(documentos_rows[-1])
+
+        documentos, row_counts = self._montar_documentos_contexto(
+            documentos_rows, turma_scope_rows, atividades_rows, agrupar=False,
+        )
+        self._log_hot_endpoint_profile(
+            "/api/documentos/todos?cursor", started_at, row_counts, {"documentos": len(documentos)},
+        )
+        return {"documentos": documentos, "next_cursor": next_cursor}
+
+    def _escopo_documentos_contexto(self, filters: Dict[str, Any]
+                                    ) -> Optional[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]:
+        """(turmas do escopo, atividades do escopo) para os filtros; None se vazio."""
         materia_ids = filters.get("materia_ids") or None
         turma_ids = filters.get("turma_ids") or None
         atividade_ids_filter = filters.get("atividade_ids") or None
-        aluno_ids = filters.get("aluno_ids") or None
-        tipos = filters.get("tipos") or None
 
         turma_scope_rows: List[Dict[str, Any]] = []
         turma_scope_ids: List[str] = []
@@ -2172,41 +3481,14 @@ class StorageManager:
                 columns=["id", "materia_id", "nome"],
             )
             turma_scope_ids = [row["id"] for row in turma_scope_rows]
-
-            if (materia_ids or turma_ids) and not turma_scope_ids:
-                self._log_hot_endpoint_profile(
-                    "/api/documentos/todos",
-                    started_at,
-                    {
-                        "materias": 0,
-                        "turmas": 0,
-                        "atividades": 0,
-                        "documentos": 0,
-                        "alunos": 0,
-                    },
-                    {"documentos": 0},
-                )
-                return []
+            if not turma_scope_ids:
+                return None
 
         atividade_filters: Dict[str, Any] = {}
         if atividade_ids_filter:
             atividade_filters["id"] = atividade_ids_filter
         if turma_scope_ids:
             atividade_filters["turma_id"] = turma_scope_ids
-        elif materia_ids or turma_ids or not atividade_ids_filter:
-            self._log_hot_endpoint_profile(
-                "/api/documentos/todos",
-                started_at,
-                {
-                    "materias": 0,
-                    "turmas": len(turma_scope_rows),
-                    "atividades": 0,
-                    "documentos": 0,
-                    "alunos": 0,
-                },
-                {"documentos": 0},
-            )
-            return []
 
         atividades_rows = self._select_rows(
             "atividades",
@@ -2214,48 +3496,36 @@ class StorageManager:
             order_by="nome",
             columns=["id", "turma_id", "nome"],
         )
-        atividade_ids = [row["id"] for row in atividades_rows]
-        if not atividade_ids:
-            self._log_hot_endpoint_profile(
-                "/api/documentos/todos",
-                started_at,
-                {
-                    "materias": 0,
-                    "turmas": len(turma_scope_rows),
-                    "atividades": 0,
-                    "documentos": 0,
-                    "alunos": 0,
-                },
-                {"documentos": 0},
-            )
-            return []
+        if not atividades_rows:
+            return None
+        return turma_scope_rows, atividades_rows
 
-        documentos_filters: Dict[str, Any] = {"atividade_id": atividade_ids}
-        if tipos:
-            documentos_filters["tipo"] = tipos
-        documentos_rows = self._select_rows(
-            "documentos",
-            filters=documentos_filters,
-            order_by="criado_em",
-            order_desc=True,
-            columns=["id", "nome_arquivo", "tipo", "atividade_id", "aluno_id", "criado_em"],
-        )
+    def _montar_documentos_contexto(self, documentos_rows: List[Dict[str, Any]],
+                                    turma_scope_rows: List[Dict[str, Any]],
+                                    atividades_rows: List[Dict[str, Any]],
+                                    agrupar: bool) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        """
+        Junta matéria/turma/atividade/aluno a cada documento.
 
-        if aluno_ids:
-            aluno_ids_set = set(aluno_ids)
-            documentos_rows = [
-                row for row in documentos_rows
-                if row.get("aluno_id") is None or row.get("aluno_id") in aluno_ids_set
-            ]
+        ``agrupar=True`` ordena por matéria → turma → atividade (listagem
+        completa); ``False`` mantém a ordem de ``documentos_rows`` (páginas).
+        """
+        atividade_ids_relevantes = {row["atividade_id"] for row in documentos_rows}
+        if not agrupar:
+            atividades_rows = [row for row in atividades_rows if row["id"] in atividade_ids_relevantes]
 
         turma_ids_relevantes = sorted({row["turma_id"] for row in atividades_rows})
         turmas_rows = turma_scope_rows
         if not turmas_rows:
-            turmas_rows = self._select_rows(
-                "turmas",
-                filters={"id": turma_ids_relevantes},
-                order_by="nome",
-                columns=["id", "materia_id", "nome"],
+            turmas_rows = (
+                self._select_rows(
+                    "turmas",
+                    filters={"id": turma_ids_relevantes},
+                    order_by="nome",
+                    columns=["id", "materia_id", "nome"],
+                )
+                if turma_ids_relevantes
+                else []
             )
         else:
             turmas_rows = [row for row in turmas_rows if row["id"] in turma_ids_relevantes]
@@ -2287,6 +3557,42 @@ class StorageManager:
             else []
         )
         aluno_nome_por_id = {row["id"]: row["nome"] for row in alunos_rows}
+        row_counts = {
+            "materias": len(materias_rows),
+            "turmas": len(turmas_rows),
+            "atividades": len(atividades_rows),
+            "documentos": len(documentos_rows),
+            "alunos": len(alunos_rows),
+        }
+
+        def _linha(documento, materia, turma, atividade) -> Dict[str, Any]:
+            return {
+                "id": documento["id"],
+                "nome_arquivo": documento.get("nome_arquivo"),
+                "tipo": documento["tipo"],
+                "materia_id": materia["id"],
+                "materia_nome": materia["nome"],
+                "turma_id": turma["id"],
+                "turma_nome": turma["nome"],
+                "atividade_id": atividade["id"],
+                "atividade_nome": atividade["nome"],
+                "aluno_id": documento.get("aluno_id"),
+                "aluno_nome": aluno_nome_por_id.get(documento.get("aluno_id")),
+                "criado_em": documento.get("criado_em"),
+            }
+
+        if not agrupar:
+            atividade_por_id = {row["id"]: row for row in atividades_rows}
+            turma_por_id = {row["id"]: row for row in turmas_rows}
+            materia_por_id = {row["id"]: row for row in materias_rows}
+            documentos = []
+            for documento in documentos_rows:
+                atividade = atividade_por_id.get(documento["atividade_id"])
+                turma = turma_por_id.get(atividade["turma_id"]) if atividade else None
+                materia = materia_por_id.get(turma["materia_id"]) if turma else None
+                if materia is not None:
+                    documentos.append(_linha(documento, materia, turma, atividade))
+            return documentos, row_counts
 
         atividades_por_turma: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
         for atividade in atividades_rows:
@@ -2305,34 +3611,8 @@ class StorageManager:
             for turma in turmas_por_materia.get(materia["id"], []):
                 for atividade in atividades_por_turma.get(turma["id"], []):
                     for documento in documentos_por_atividade.get(atividade["id"], []):
-                        documentos.append({
-                            "id": documento["id"],
-                            "nome_arquivo": documento.get("nome_arquivo"),
-                            "tipo": documento["tipo"],
-                            "materia_id": materia["id"],
-                            "materia_nome": materia["nome"],
-                            "turma_id": turma["id"],
-                            "turma_nome": turma["nome"],
-                            "atividade_id": atividade["id"],
-                            "atividade_nome": atividade["nome"],
-                            "aluno_id": documento.get("aluno_id"),
-                            "aluno_nome": aluno_nome_por_id.get(documento.get("aluno_id")),
-                            "criado_em": documento.get("criado_em"),
-                        })
-
-        self._log_hot_endpoint_profile(
-            "/api/documentos/todos",
-            started_at,
-            {
-                "materias": len(materias_rows),
-                "turmas": len(turmas_rows),
-                "atividades": len(atividades_rows),
-                "documentos": len(documentos_rows),
-                "alunos": len(alunos_rows),
-            },
-            {"documentos": len(documentos)},
-        )
-        return documentos
+                        documentos.append(_linha(documento, materia, turma, atividade))
+        return documentos, row_counts
 
     def get_arvore_navegacao(self) -> Dict[str, Any]:
         """
@@ -2343,11 +3623,97 @@ class StorageManager:
         return self.get_arvore_navegacao_fast()
 
 
+# ============================================================
+# FACHADA ASSÍNCRONA
+# ============================================================
+
+_STORAGE_IO_POOL: Optional[ThreadPoolExecutor] = None
+_STORAGE_IO_POOL_LOCK = threading.Lock()
+
+
+def get_storage_io_pool() -> ThreadPoolExecutor:
+    """Pool limitado onde rodam as chamadas bloqueantes do storage (SQLite, PostgREST, Supabase Storage).
+
+    O tamanho vem de STORAGE_IO_WORKERS (padrão 8). É compartilhado por todas as
+    fachadas para que um pico de I/O não consuma o pool padrão do event loop.
+    """
+    global _STORAGE_IO_POOL
+    if _STORAGE_IO_POOL is None:
+        with _STORAGE_IO_POOL_LOCK:
+            if _STORAGE_IO_POOL is None:
+                max_workers = max(1, int(os.environ.get("STORAGE_IO_WORKERS", "8")))
+                _STORAGE_IO_POOL = ThreadPoolExecutor(
+                    max_workers=max_workers,
+                    thread_name_prefix="storage-io",
+                )
+    return _STORAGE_IO_POOL
+
+
+class AsyncStorageManager:
+    """
+    Fachada assíncrona do StorageManager para uso dentro de handlers async.
+
+    Expõe a mesma API do StorageManager, mas cada método vira uma coroutine que
+    executa a chamada síncrona no pool limitado de I/O. Assim uma consulta lenta
+    ao Supabase não congela o event loop (e o polling de /api/task-progress).
+
+    Atributos que não são métodos (base_path, use_postgresql, ...) são
+    devolvidos diretamente.
+
+    Uso:
+        astorage = AsyncStorageManager(storage)
+        materias = await astorage.listar_materias()
+
+    Com ``resolver`` o StorageManager é resolvido a cada chamada, o que mantém
+    ``patch("modulo.storage")`` funcionando nos testes das rotas.
+    """
+
+    def __init__(self, storage_manager: Optional["StorageManager"] = None, *,
+                 resolver: Optional[Callable[[], "StorageManager"]] = None):
+        if storage_manager is None and resolver is None:
+            raise ValueError("AsyncStorageManager requer storage_manager ou resolver")
+        self._storage_manager = storage_manager
+        self._resolver = resolver
+
+    @property
+    def sync(self) -> "StorageManager":
+        """Retorna o StorageManager síncrono por trás da fachada."""
+        if self._resolver is not None:
+            return self._resolver()
+        return self._storage_manager
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Executa qualquer função bloqueante no pool de I/O do storage.
+
+        Copia o contexto atual (como asyncio.to_thread) para que ContextVars do
+        executor — filtro de provider, source_document_ids — continuem visíveis.
+        """
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, func, *args, **kwargs)
+        return await loop.run_in_executor(get_storage_io_pool(), call)
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("__"):
+            raise AttributeError(name)
+        attr = getattr(self.sync, name)
+        if not callable(attr):
+            return attr
+
+        async def _call(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+
+        _call.__name__ = name
+        _call.__doc__ = getattr(attr, "__doc__", None)
+        return _call
+
+
 # ============================================================
 # INSTÂNCIA GLOBAL
 # ============================================================
 
 storage = StorageManager()
+async_storage = AsyncStorageManager(storage)
 
 # Alias para compatibilidade (remover após atualizar todos os imports)
 StorageManagerV2 = StorageManager
@@ -0,0 +1,374 @@
+"""
+Barramento de eventos de mudança do storage.
+
+O StorageManager publica um ``StorageEvent`` tipado DEPOIS do commit de cada
+escrita (documento salvo/atualizado/renomeado/deletado, aluno vinculado,
+atividade criada, ...). Qualquer cache se inscreve e invalida só o que
+mudou, em vez de adivinhar quando o dado ficou velho.
+
+Há um barramento por processo (``process_bus()``): StorageManager e
+PromptManager publicam nele e os caches (entidades, árvore de navegação,
+status da atividade, ranking) se inscrevem nele, então uma escrita de
+qualquer um chega a todos.
+
+Uso:
+    unsubscribe = storage.events.subscribe(
+        lambda event: cache.pop(event.atividade_id, None),
+        tipos={StorageEventType.DOCUMENTO_SALVO, StorageEventType.DOCUMENTO_DELETADO},
+    )
+
+Fan-out entre processos (opcional):
+    Com STORAGE_EVENTS_CROSS_PROCESS=1 cada evento também é gravado numa
+    tabela SQLite (``data/storage_events.db``). Uma thread de polling lê os
+    eventos de OUTROS processos e os entrega aos inscritos locais com
+    ``remoto=True``. Serve para vários workers uvicorn / processos de
+    pipeline na mesma máquina. Ligado por padrão quando o pipeline roda em
+    processos separados (TASK_WORKER_MODE=local ou external).
+
+Configuração (env):
+    STORAGE_EVENTS_CROSS_PROCESS=0        (1 com TASK_WORKER_MODE=local|external)
+    STORAGE_EVENTS_POLL_S=1.0
+    STORAGE_EVENTS_RETENTION_S=3600
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from enum import Enum
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from sqlite_pool import sqlite_pool
+
+
+logger = logging.getLogger("storage_events")
+
+_WORKERS_FORA_DO_PROCESSO = os.environ.get("TASK_WORKER_MODE", "").strip().lower() in ("local", "external")
+_CROSS_PROCESS = os.environ.get(
+    "STORAGE_EVENTS_CROSS_PROCESS", "1" if _WORKERS_FORA_DO_PROCESSO else "0"
+).lower() in ("1", "true", "yes")
+_POLL_S = float(os.environ.get("STORAGE_EVENTS_POLL_S", "1.0"))
+_RETENTION_S = float(os.environ.get("STORAGE_EVENTS_RETENTION_S", "3600"))
+
+# Identifica este processo no journal (pid sozinho pode repetir após restart)
+PROCESS_ORIGIN = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+class StorageEventType(Enum):
+    """Tipos de mudança publicados pelo storage (``<entidade>.<ação>``)."""
+    MATERIA_CRIADA = "materia.criada"
+    MATERIA_ATUALIZADA = "materia.atualizada"
+    MATERIA_DELETADA = "materia.deletada"
+
+    TURMA_CRIADA = "turma.criada"
+    TURMA_ATUALIZADA = "turma.atualizada"
+    TURMA_DELETADA = "turma.deletada"
+
+    ALUNO_CRIADO = "aluno.criado"
+    ALUNO_ATUALIZADO = "aluno.atualizado"
+    ALUNO_DELETADO = "aluno.deletado"
+    ALUNO_VINCULADO = "aluno.vinculado"
+    ALUNO_DESVINCULADO = "aluno.desvinculado"
+
+    ATIVIDADE_CRIADA = "atividade.criada"
+    ATIVIDADE_DELETADA = "atividade.deletada"
+
+    DOCUMENTO_SALVO = "documento.salvo"
+    DOCUMENTO_ATUALIZADO = "documento.atualizado"
+    DOCUMENTO_RENOMEADO = "documento.renomeado"
+    DOCUMENTO_DELETADO = "documento.deletado"
+
+    PROMPT_CRIADO = "prompt.criado"
+    PROMPT_ATUALIZADO = "prompt.atualizado"
+    PROMPT_DELETADO = "prompt.deletado"
+
+    @property
+    def entidade(self) -> str:
+        return self.value.split(".", 1)[0]
+
+
+@dataclass
+class StorageEvent:
+    """Uma mudança já commitada no banco."""
+    tipo: StorageEventType
+    entity_id: str
+    materia_id: Optional[str] = None
+    turma_id: Optional[str] = None
+    atividade_id: Optional[str] = None
+    aluno_id: Optional[str] = None
+    dados: Dict[str, Any] = field(default_factory=dict)
+    origem: str = PROCESS_ORIGIN
+    remoto: bool = False
+    criado_em: float = field(default_factory=time.time)
+
+    def atividades_afetadas(self) -> Optional[Set[str]]:
+        """Atividades cujas leituras derivadas (status, ranking) mudam; None = todas."""
+        entidade = self.tipo.entidade
+        if entidade == "prompt":
+            return set()
+        if entidade == "documento":
+            return {self.atividade_id} if self.atividade_id else None
+        if entidade == "atividade":
+            return {self.entity_id}
+        # Aluno, turma e matéria: alunos e nomes de várias atividades
+        return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "tipo": self.tipo.value,
+            "entity_id": self.entity_id,
+            "materia_id": self.materia_id,
+            "turma_id": self.turma_id,
+            "atividade_id": self.atividade_id,
+            "aluno_id": self.aluno_id,
+            "dados": self.dados,
+            "origem": self.origem,
+            "criado_em": self.criado_em,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], remoto: bool = False) -> "StorageEvent":
+        return cls(
+            tipo=StorageEventType(data["tipo"]),
+            entity_id=data["entity_id"],
+            materia_id=data.get("materia_id"),
+            turma_id=data.get("turma_id"),
+            atividade_id=data.get("atividade_id"),
+            aluno_id=data.get("aluno_id"),
+            dados=data.get("dados") or {},
+            origem=data.get("origem", ""),
+            remoto=remoto,
+            criado_em=data.get("criado_em", time.time()),
+        )
+
+
+Subscriber = Callable[[StorageEvent], None]
+
+
+class SQLiteEventJournal:
+    """Tabela append-only usada para o fan-out entre processos."""
+
+    def __init__(self, db_path: Union[str, Path], retention_seconds: float = None):
+        self.db_path = Path(db_path)
+        self.retention_seconds = _RETENTION_S if retention_seconds is None else retention_seconds
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite_pool.get(self.db_path)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS storage_events (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                tipo TEXT NOT NULL,
+                origem TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                criado_em REAL NOT NULL
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def append(self, event: StorageEvent) -> int:
+        conn = sqlite_pool.get(self.db_path)
+        try:
+            cursor = conn.execute(
+                "INSERT INTO storage_events (tipo, origem, payload, criado_em) VALUES (?, ?, ?, ?)",
+                (event.tipo.value, event.origem, json.dumps(event.to_dict()), event.criado_em),
+            )
+            conn.commit()
+            return int(cursor.lastrowid)
+        finally:
+            conn.close()
+
+    def last_seq(self) -> int:
+        conn = sqlite_pool.get(self.db_path)
+        try:
+            row = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM storage_events").fetchone()
+            return int(row[0])
+        finally:
+            conn.close()
+
+    def read_since(self, seq: int, exclude_origin: str = None,
+                   limit: int = 500) -> List[Tuple[int, StorageEvent]]:
+        """Eventos com seq > ``seq`` (opcionalmente sem os da própria origem)."""
+        conn = sqlite_pool.get(self.db_path)
+        try:
+            rows = conn.execute(
+                "SELECT seq, origem, payload FROM storage_events WHERE seq > ? ORDER BY seq LIMIT ?",
+                (seq, limit),
+            ).fetchall()
+        finally:
+            conn.close()
+
+        events = []
+        for row in rows:
+            if exclude_origin and row["origem"] == exclude_origin:
+                events.append((row["seq"], None))
+                continue
+            try:
+                events.append((row["seq"], StorageEvent.from_dict(json.loads(row["payload"]), remoto=True)))
+            except (ValueError, KeyError) as exc:
+                logger.warning("[storage-events] evento inválido seq=%s: %s", row["seq"], exc)
+                events.append((row["seq"], None))
+        return events
+
+    def prune(self) -> int:
+        cutoff = time.time() - self.retention_seconds
+        conn = sqlite_pool.get(self.db_path)
+        try:
+            cursor = conn.execute("DELETE FROM storage_events WHERE criado_em < ?", (cutoff,))
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+
+class StorageEventBus:
+    """Pub/sub síncrono em processo, com fan-out opcional via SQLiteEventJournal."""
+
+    def __init__(self):
+        self._subscribers: List[Tuple[Subscriber, Optional[Set[StorageEventType]]]] = []
+        self._lock = threading.Lock()
+        self._journal: Optional[SQLiteEventJournal] = None
+        self._poll_thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._last_seq = 0
+        self._published = 0
+        self._delivered = 0
+        self._remote_received = 0
+        self._errors = 0
+
+    def subscribe(self, callback: Subscriber,
+                  tipos: Iterable[StorageEventType] = None) -> Callable[[], None]:
+        """Inscreve ``callback``; retorna a função que cancela a inscrição."""
+        entry = (callback, set(tipos) if tipos else None)
+        with self._lock:
+            self._subscribers.append(entry)
+
+        def _unsubscribe() -> None:
+            with self._lock:
+                if entry in self._subscribers:
+                    self._subscribers.remove(entry)
+
+        return _unsubscribe
+
+    def publish(self, event: StorageEvent) -> None:
+        """Entrega aos inscritos locais e grava no journal (se habilitado)."""
+        self._published += 1
+        self._dispatch(event)
+        if self._journal is not None:
+            try:
+                self._journal.append(event)
+            except Exception as exc:
+                logger.warning("[storage-events] falha ao gravar journal: %s", exc)
+
+    def emit(self, tipo: StorageEventType, entity_id: str, **kwargs: Any) -> StorageEvent:
+        event = StorageEvent(tipo=tipo, entity_id=entity_id, **kwargs)
+        self.publish(event)
+        return event
+
+    def _dispatch(self, event: StorageEvent) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback, tipos in subscribers:
+            if tipos is not None and event.tipo not in tipos:
+                continue
+            try:
+                callback(event)
+                self._delivered += 1
+            except Exception as exc:
+                # Um cache com defeito não pode derrubar a escrita que já foi commitada
+                self._errors += 1
+                logger.warning("[storage-events] inscrito falhou em %s: %s", event.tipo.value, exc)
+
+    # ------------------------------------------------------------
+    # Fan-out entre processos
+    # ------------------------------------------------------------
+
+    def enable_cross_process(self, db_path: Union[str, Path],
+                             poll_interval: float = None) -> None:
+        """Liga o journal SQLite e a thread que entrega eventos de outros processos."""
+        if self._journal is not None:
+            return
+        self._journal = SQLiteEventJournal(db_path)
+        # Só interessa o que acontecer daqui para frente
+        self._last_seq = self._journal.last_seq()
+        interval = _POLL_S if poll_interval is None else poll_interval
+        self._stop.clear()
+        self._poll_thread = threading.Thread(
+            target=self._poll_loop,
+            args=(interval,),
+            name="storage-events-poll",
+            daemon=True,
+        )
+        self._poll_thread.start()
+
+    def poll_remote(self) -> int:
+        """Lê e entrega eventos de outros processos; retorna quantos entregou."""
+        if self._journal is None:
+            return 0
+        delivered = 0
+        for seq, event in self._journal.read_since(self._last_seq, exclude_origin=PROCESS_ORIGIN):
+            self._last_seq = seq
+            if event is None:
+                continue
+            self._remote_received += 1
+            self._dispatch(event)
+            delivered += 1
+        return delivered
+
+    def _poll_loop(self, interval: float) -> None:
+        last_prune = time.monotonic()
+        while not self._stop.wait(interval):
+            try:
+                self.poll_remote()
+                if time.monotonic() - last_prune > 60:
+                    self._journal.prune()
+                    last_prune = time.monotonic()
+            except Exception as exc:
+                logger.warning("[storage-events] polling falhou: %s", exc)
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._poll_thread is not None:
+            self._poll_thread.join(timeout=5)
+            self._poll_thread = None
+        self._journal = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            subscribers = len(self._subscribers)
+        return {
+            "subscribers": subscribers,
+            "published": self._published,
+            "delivered": self._delivered,
+            "subscriber_errors": self._errors,
+            "cross_process": self._journal is not None,
+            "remote_received": self._remote_received,
+            "last_seq": self._last_seq,
+        }
+
+
+def cross_process_enabled() -> bool:
+    return _CROSS_PROCESS
+
+
+_process_bus: Optional[StorageEventBus] = None
+_process_bus_lock = threading.Lock()
+
+
+def process_bus(data_dir: Union[str, Path] = None) -> StorageEventBus:
+    """O barramento único do processo.
+
+    Com o fan-out ligado, o journal fica em ``<data_dir>/storage_events.db``
+    (o primeiro ``data_dir`` informado vence).
+    """
+    global _process_bus
+    with _process_bus_lock:
+        if _process_bus is None:
+            _process_bus = StorageEventBus()
+        bus = _process_bus
+    if data_dir is not None and cross_process_enabled():
+        bus.enable_cross_process(Path(data_dir) / "storage_events.db")
+    return bus
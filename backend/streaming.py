@@ -0,0 +1,68 @@
+"""
+Respostas HTTP em streaming para listagens grandes.
+
+As listagens de documentos crescem com a base (dezenas de milhares de
+linhas por semestre). Em vez de montar um JSON único na memória, as rotas
+buscam uma página por vez (keyset em criado_em, id — ver
+``StorageManager._select_rows``) e mandam cada item como uma linha NDJSON
+assim que a página chega:
+
+    GET /api/documentos/todos?formato=ndjson
+    {"id": "...", "tipo": "correcao", ...}
+    {"id": "...", "tipo": "gabarito", ...}
+
+Memória e tempo até o primeiro byte ficam constantes: o cliente começa a
+receber depois da primeira página, e só uma página fica em memória.
+"""
+
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from fastapi.responses import StreamingResponse
+
+import fast_json
+
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# fetch_page(cursor) -> {"<chave>": [...], "next_cursor": str | None}
+FetchPage = Callable[[Optional[str]], Awaitable[Dict[str, Any]]]
+
+
+def wants_ndjson(formato: Optional[str], accept: Optional[str]) -> bool:
+    """True se o cliente pediu NDJSON (``?formato=ndjson`` ou header Accept)."""
+    if formato:
+        return formato.lower() == "ndjson"
+    return NDJSON_MEDIA_TYPE in (accept or "")
+
+
+async def iterar_paginas(primeira_pagina: Dict[str, Any], fetch_page: FetchPage,
+                         chave: str) -> AsyncIterator[List[Any]]:
+    """Segue ``next_cursor`` a partir de uma página já buscada, até o fim."""
+    pagina = primeira_pagina
+    while True:
+        itens = pagina.get(chave) or []
+        if itens:
+            yield itens
+        cursor = pagina.get("next_cursor")
+        if not cursor:
+            return
+        pagina = await fetch_page(cursor)
+
+
+def ndjson_response(primeira_pagina: Dict[str, Any], fetch_page: FetchPage, chave: str,
+                    serializar: Callable[[Any], Dict[str, Any]] = lambda item: item) -> StreamingResponse:
+    """
+    StreamingResponse NDJSON com um item por linha, página a página.
+
+    A primeira página vem pronta do handler: erros (cursor inválido, banco
+    fora) viram status HTTP antes de o 200 do streaming ser enviado.
+    """
+
+    async def _corpo() -> AsyncIterator[bytes]:
+        async for itens in iterar_paginas(primeira_pagina, fetch_page, chave):
+            yield b"".join(
+                fast_json.dumps_bytes(serializar(item), default=str) + b"\n"
+                for item in itens
+            )
+
+    return StreamingResponse(_corpo(), media_type=NDJSON_MEDIA_TYPE)
@@ -7,10 +7,26 @@ Replaces SQLite with persistent PostgreSQL storage.
 Configuration:
     SUPABASE_URL=https://xxxxx.supabase.co
     SUPABASE_SERVICE_KEY=eyJ...
+
+Connection pool (one shared keep-alive httpx client, HTTP/2 when ``h2`` is
+installed, so concurrent requests multiplex over the same connection):
+    SUPABASE_HTTP2=1
+    SUPABASE_POOL_MAX_CONNECTIONS=20
+    SUPABASE_POOL_MAX_KEEPALIVE=10
+    SUPABASE_POOL_KEEPALIVE_EXPIRY_S=30
+    SUPABASE_HTTP_TIMEOUT_S=30
+    SUPABASE_CONCURRENT_QUERIES=6   (select_many / chunked IN fan-out)
+    SUPABASE_IN_CHUNK_SIZE=150      (ids per IN filter before splitting the request)
 """
 
 import os
 import json
+import logging
+import time
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, List, Dict, Any, Tuple
 from datetime import datetime
 from dotenv import load_dotenv
@@ -27,6 +43,46 @@ except ImportError:
     create_client = None
     print("[SupabaseDB] supabase-py not installed. Run: pip install supabase")
 
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import h2  # noqa: F401 — httpx só fala HTTP/2 com o pacote h2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+logger = logging.getLogger("supabase_db")
+
+_HTTP2_ENABLED = os.environ.get("SUPABASE_HTTP2", "1").lower() in ("1", "true", "yes")
+_POOL_MAX_CONNECTIONS = int(os.environ.get("SUPABASE_POOL_MAX_CONNECTIONS", "20"))
+_POOL_MAX_KEEPALIVE = int(os.environ.get("SUPABASE_POOL_MAX_KEEPALIVE", "10"))
+_POOL_KEEPALIVE_EXPIRY_S = float(os.environ.get("SUPABASE_POOL_KEEPALIVE_EXPIRY_S", "30"))
+_HTTP_TIMEOUT_S = float(os.environ.get("SUPABASE_HTTP_TIMEOUT_S", "30"))
+_CONCURRENT_QUERIES = max(1, int(os.environ.get("SUPABASE_CONCURRENT_QUERIES", "6")))
+_IN_CHUNK_SIZE = max(1, int(os.environ.get("SUPABASE_IN_CHUNK_SIZE", "150")))
+
+# Tempos das requisições da chamada atual (lidos pelo profiler de hot endpoints)
+_timings_ctx: contextvars.ContextVar[Optional[deque]] = contextvars.ContextVar(
+    "supabase_request_timings", default=None
+)
+# Dentro de um worker do fan-out: sub-consultas rodam em série (sem pool aninhado)
+_in_fanout_ctx: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "supabase_in_fanout", default=False
+)
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, Any] = {
+    "requests": 0,
+    "errors": 0,
+    "total_ms": 0.0,
+    "chunked_queries": 0,
+    "concurrent_batches": 0,
+}
+
 
 class SupabaseDB:
     """
@@ -36,6 +92,9 @@ class SupabaseDB:
     JSON serialization for metadata fields.
     """
 
+    _http_client = None
+    _fanout_pool: Optional[ThreadPoolExecutor] = None
+
     def __init__(self):
         self.url = os.getenv("SUPABASE_URL", "").rstrip("/")
         self.key = os.getenv("SUPABASE_SERVICE_KEY", "")
@@ -45,7 +104,7 @@ class SupabaseDB:
 
         if SUPABASE_AVAILABLE and self.url and self.key:
             try:
-                self._client = create_client(self.url, self.key)
+                self._client = self._create_pooled_client()
                 self._enabled = True
                 print(f"[SupabaseDB] Connected to PostgreSQL: {self.url}")
             except Exception as e:
@@ -56,6 +115,31 @@ class SupabaseDB:
             elif not self.url or not self.key:
                 print("[SupabaseDB] Credentials not configured")
 
+    def _create_pooled_client(self):
+        """create_client com um httpx.Client compartilhado (keep-alive, HTTP/2)."""
+        if httpx is None:
+            return create_client(self.url, self.key)
+
+        self._http_client = httpx.Client(
+            http2=_HTTP2_ENABLED and HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=_POOL_MAX_KEEPALIVE,
+                keepalive_expiry=_POOL_KEEPALIVE_EXPIRY_S,
+            ),
+            timeout=_HTTP_TIMEOUT_S,
+            follow_redirects=True,
+        )
+        try:
+            from supabase import ClientOptions
+            options = ClientOptions(httpx_client=self._http_client)
+        except (ImportError, TypeError):
+            # supabase-py antigo sem httpx_client: cada cliente mantém o próprio pool
+            self._http_client.close()
+            self._http_client = None
+            return create_client(self.url, self.key)
+        return create_client(self.url, self.key, options=options)
+
     @property
     def enabled(self) -> bool:
         """Returns True if PostgreSQL connection is available"""
@@ -85,7 +169,7 @@ class SupabaseDB:
             if removed:
                 print(f"[SupabaseDB] WARNING: Filtered out columns from {table}: {removed}")
 
-            result = self._client.table(table).insert(data).execute()
+            result = self._execute(self._client.table(table).insert(data), table, "insert")
 
             if result.data and len(result.data) > 0:
                 return result.data[0]
@@ -95,13 +179,59 @@ class SupabaseDB:
             print(f"[SupabaseDB] Insert error in {table}: {e}")
             raise  # Re-raise so callers can see the actual error
 
+    def insert_many(self, table: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insert several rows with a single PostgREST request (all or nothing)"""
+        if not self._enabled or not rows:
+            return []
+
+        try:
+            payload = [
+                self._filter_allowed_columns(table, self._serialize_data(row))
+                for row in rows
+            ]
+            result = self._execute(self._client.table(table).insert(payload), table, "insert_many")
+            return result.data or []
+        except Exception as e:
+            print(f"[SupabaseDB] Bulk insert error in {table} ({len(rows)} rows): {e}")
+            raise
+
     def select(self, table: str, filters: Dict[str, Any] = None,
                order_by: str = None, order_desc: bool = False,
-               limit: int = None, columns: Any = None) -> List[Dict[str, Any]]:
-        """Select rows from a table with optional filters"""
+               limit: int = None, columns: Any = None,
+               after: Tuple[Any, Any] = None, keyset: bool = False) -> List[Dict[str, Any]]:
+        """Select rows from a table with optional filters.
+
+        ``keyset``/``after`` paginate on (order_by, id): ``after`` is the
+        (order_by, id) pair of the last row of the previous page.
+
+        An ``in`` filter longer than SUPABASE_IN_CHUNK_SIZE is split into
+        several requests (issued concurrently); results are merged, re-sorted
+        and cut to ``limit`` so callers see a single query.
+        """
         if not self._enabled:
             return []
 
+        chunked = self._split_in_filter(filters)
+        if chunked is not None:
+            self._count_stat("chunked_queries")
+            kwargs = dict(order_by=order_by, order_desc=order_desc, limit=limit,
+                          columns=columns, after=after, keyset=keyset)
+            partes = self.select_many([
+                dict(table=table, filters=chunk_filters, **kwargs) for chunk_filters in chunked
+            ])
+            rows = [row for parte in partes for row in parte]
+            if order_by:
+                tiebreak = keyset or after is not None
+
+                # Same as Postgres: NULLS LAST for ASC, NULLS FIRST for DESC (via reverse)
+                def _key(row):
+                    value = row.get(order_by)
+                    key = (value is None, value if value is not None else 0)
+                    return key + ((row.get("id") or "",) if tiebreak else ())
+
+                rows.sort(key=_key, reverse=order_desc)
+            return rows[:limit] if limit is not None else rows
+
         try:
             query = self._client.table(table).select(
                 self._normalize_select_columns(columns)
@@ -110,18 +240,49 @@ class SupabaseDB:
             if query is None:
                 return []
 
+            if after is not None:
+                op = "lt" if order_desc else "gt"
+                value, row_id = (self._quote_logic_value(v) for v in after)
+                query = query.or_(
+                    f"{order_by}.{op}.{value},and({order_by}.eq.{value},id.{op}.{row_id})"
+                )
+
             if order_by:
                 query = query.order(order_by, desc=order_desc)
+                if keyset or after is not None:
+                    query = query.order("id", desc=order_desc)
 
             if limit is not None:
                 query = query.limit(limit)
 
-            result = query.execute()
+            result = self._execute(query, table, "select")
             return result.data if result.data else []
         except Exception as e:
             print(f"[SupabaseDB] Select error in {table}: {e}")
             return []
 
+    def select_many(self, queries: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """Run independent selects concurrently over the shared connection pool.
+
+        Each item holds ``select`` kwargs (``table`` included); results come
+        back in the same order. With HTTP/2 the requests are multiplexed as
+        streams of the same connection instead of waiting one after another.
+        """
+        if not queries:
+            return []
+        if len(queries) == 1 or not self._enabled or _in_fanout_ctx.get():
+            return [self.select(**query) for query in queries]
+
+        self._count_stat("concurrent_batches")
+        pool = self._get_fanout_pool()
+
+        def _run(query: Dict[str, Any]) -> List[Dict[str, Any]]:
+            _in_fanout_ctx.set(True)
+            return self.select(**query)
+
+        futures = [pool.submit(contextvars.copy_context().run, _run, query) for query in queries]
+        return [future.result() for future in futures]
+
     def select_one(self, table: str, id: str, columns: Any = None) -> Optional[Dict[str, Any]]:
         """Select a single row by ID"""
         if not self._enabled:
@@ -133,8 +294,8 @@ class SupabaseDB:
                 .select(self._normalize_select_columns(columns))
                 .eq("id", id)
                 .limit(1)
-                .execute()
             )
+            result = self._execute(result, table, "select_one")
 
             if result.data and len(result.data) > 0:
                 return result.data[0]
@@ -153,7 +314,7 @@ class SupabaseDB:
             data["atualizado_em"] = datetime.now().isoformat()
             data = self._filter_allowed_columns(table, data)
 
-            result = self._client.table(table).update(data).eq("id", id).execute()
+            result = self._execute(self._client.table(table).update(data).eq("id", id), table, "update")
 
             if result.data and len(result.data) > 0:
                 return result.data[0]
@@ -168,7 +329,7 @@ class SupabaseDB:
             return False
 
         try:
-            result = self._client.table(table).delete().eq("id", id).execute()
+            result = self._execute(self._client.table(table).delete().eq("id", id), table, "delete")
             return True
         except Exception as e:
             print(f"[SupabaseDB] Delete error in {table}: {e}")
@@ -179,13 +340,18 @@ class SupabaseDB:
         if not self._enabled:
             return 0
 
+        chunked = self._split_in_filter(filters)
+        if chunked is not None:
+            self._count_stat("chunked_queries")
+            return sum(self.delete_where(table, chunk_filters) for chunk_filters in chunked)
+
         try:
             query = self._client.table(table).delete()
             query = self._apply_filters(query, filters)
             if query is None:
                 return 0
 
-            result = query.execute()
+            result = self._execute(query, table, "delete_where")
             return len(result.data) if result.data else 0
         except Exception as e:
             print(f"[SupabaseDB] Delete where error in {table}: {e}")
@@ -196,18 +362,49 @@ class SupabaseDB:
         if not self._enabled:
             return 0
 
+        chunked = self._split_in_filter(filters)
+        if chunked is not None:
+            self._count_stat("chunked_queries")
+            return sum(self.count(table, chunk_filters) for chunk_filters in chunked)
+
         try:
-            query = self._client.table(table).select("id", count="exact")
+            # head=True: só o Content-Range com o total, sem trafegar as linhas
+            query = self._client.table(table).select("id", count="exact", head=True)
             query = self._apply_filters(query, filters)
             if query is None:
                 return 0
 
-            result = query.execute()
+            result = self._execute(query, table, "count")
             return result.count if result.count else 0
         except Exception as e:
             print(f"[SupabaseDB] Count error in {table}: {e}")
             return 0
 
+    def rpc(self, function: str, params: Dict[str, Any] = None) -> Optional[Any]:
+        """Chama uma função SQL exposta pelo PostgREST; None se falhar ou não existir.
+
+        Funções ausentes (migration ainda não aplicada) ficam em cache para
+        que quem chama caia direto no caminho antigo nas próximas vezes;
+        erros transitórios não.
+        """
+        if not self._enabled:
+            return None
+
+        if not hasattr(self, "_missing_rpcs"):
+            self._missing_rpcs = set()
+        if function in self._missing_rpcs:
+            return None
+
+        try:
+            result = self._execute(self._client.rpc(function, params or {}), function, "rpc")
+            return result.data
+        except Exception as e:
+            print(f"[SupabaseDB] RPC {function} error: {e}")
+            # PGRST202 = função não encontrada no schema cache; 42883 = undefined_function
+            if getattr(e, "code", None) in ("PGRST202", "42883"):
+                self._missing_rpcs.add(function)
+            return None
+
     def execute_sql(self, sql: str, params: Dict[str, Any] = None) -> List[Dict[str, Any]]:
         """Execute raw SQL (via RPC function)"""
         if not self._enabled:
@@ -236,7 +433,7 @@ class SupabaseDB:
             if query is None:
                 return []
 
-            result = query.execute()
+            result = self._execute(query, table, "select_with_join")
             return result.data if result.data else []
         except Exception as e:
             print(f"[SupabaseDB] Join query error: {e}")
@@ -251,7 +448,7 @@ class SupabaseDB:
             data = self._serialize_data(data)
             data = self._filter_allowed_columns(table, data)
 
-            result = self._client.table(table).upsert(data, on_conflict=on_conflict).execute()
+            result = self._execute(self._client.table(table).upsert(data, on_conflict=on_conflict), table, "upsert")
 
             if result.data and len(result.data) > 0:
                 return result.data[0]
@@ -264,6 +461,91 @@ class SupabaseDB:
     # HELPERS
     # ============================================================
 
+    def _execute(self, query: Any, table: str, op: str) -> Any:
+        """Run a PostgREST request and record its timing."""
+        started_at = time.perf_counter()
+        ok = False
+        try:
+            result = query.execute()
+            ok = True
+            return result
+        finally:
+            elapsed_ms = (time.perf_counter() - started_at) * 1000
+            with _stats_lock:
+                _stats["requests"] += 1
+                _stats["total_ms"] += elapsed_ms
+                if not ok:
+                    _stats["errors"] += 1
+            journal = _timings_ctx.get()
+            if journal is None:
+                journal = deque(maxlen=256)
+                _timings_ctx.set(journal)
+            journal.append((started_at, table, op, round(elapsed_ms, 2), ok))
+
+    def request_timings(self, since: float = 0.0) -> List[Tuple[str, str, float, bool]]:
+        """(table, op, ms, ok) of the requests made in this context since ``since`` (perf_counter)."""
+        journal = _timings_ctx.get()
+        if not journal:
+            return []
+        return [(table, op, ms, ok) for started_at, table, op, ms, ok in list(journal) if started_at >= since]
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Request counters and pool configuration (debug endpoint)."""
+        with _stats_lock:
+            stats: Dict[str, Any] = dict(_stats)
+        stats["total_ms"] = round(stats["total_ms"], 1)
+        stats["avg_ms"] = round(stats["total_ms"] / stats["requests"], 2) if stats["requests"] else None
+        stats.update({
+            "pooled": self._http_client is not None,
+            "http2": self._http_client is not None and _HTTP2_ENABLED and HTTP2_AVAILABLE,
+            "max_connections": _POOL_MAX_CONNECTIONS,
+            "max_keepalive": _POOL_MAX_KEEPALIVE,
+            "concurrent_queries": _CONCURRENT_QUERIES,
+            "in_chunk_size": _IN_CHUNK_SIZE,
+        })
+        return stats
+
+    def close(self) -> None:
+        """Close the shared HTTP pool (lifespan shutdown)."""
+        if self._fanout_pool is not None:
+            self._fanout_pool.shutdown(wait=False)
+            self._fanout_pool = None
+        if self._http_client is not None:
+            self._http_client.close()
+
+    def _count_stat(self, name: str) -> None:
+        with _stats_lock:
+            _stats[name] += 1
+
+    def _get_fanout_pool(self) -> ThreadPoolExecutor:
+        if self._fanout_pool is None:
+            with _stats_lock:
+                if self._fanout_pool is None:
+                    self._fanout_pool = ThreadPoolExecutor(
+                        max_workers=_CONCURRENT_QUERIES,
+                        thread_name_prefix="supabase-query",
+                    )
+        return self._fanout_pool
+
+    def _split_in_filter(self, filters: Optional[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """Splits the largest oversized ``in`` filter into chunks (None = fits in one request)."""
+        if not filters:
+            return None
+
+        largest_key, largest_values = None, []
+        for key, value in filters.items():
+            if isinstance(value, dict) and "in" in value:
+                value = value["in"]
+            if isinstance(value, (list, tuple, set)) and len(value) > len(largest_values):
+                largest_key, largest_values = key, list(value)
+
+        if len(largest_values) <= _IN_CHUNK_SIZE:
+            return None
+        return [
+            {**filters, largest_key: largest_values[i:i + _IN_CHUNK_SIZE]}
+            for i in range(0, len(largest_values), _IN_CHUNK_SIZE)
+        ]
+
     def _normalize_select_columns(self, columns: Any) -> str:
         """Normalize select columns into the comma-separated PostgREST form."""
         if not columns:
@@ -272,6 +554,11 @@ class SupabaseDB:
             return columns
         return ",".join(str(column) for column in columns)
 
+    def _quote_logic_value(self, value: Any) -> str:
+        """Quote a value for or=/and= trees (timestamps carry ':' and '+')."""
+        text = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        return f'"{text}"'
+
     def _apply_filters(self, query: Any, filters: Optional[Dict[str, Any]]):
         """Apply eq/null/in filters to a Supabase query builder."""
         if not filters:
@@ -279,6 +566,15 @@ class SupabaseDB:
 
         for key, value in filters.items():
             if isinstance(value, dict):
+                if "or_null" in value:
+                    values = value["or_null"]
+                    values = list(values) if isinstance(values, (list, tuple, set)) else [values]
+                    if not values:
+                        query = query.is_(key, "null")
+                        continue
+                    quoted = ",".join(self._quote_logic_value(v) for v in values)
+                    query = query.or_(f"{key}.in.({quoted}),{key}.is.null")
+                    continue
                 if "in" in value:
                     values = list(value["in"])
                     if not values:
@@ -328,6 +624,28 @@ class SupabaseDB:
         except:
             return set()
 
+    def relation_available(self, name: str) -> bool:
+        """True se a tabela/view existe no schema do PostgREST (resultado em cache).
+
+        Usado para recursos criados por migrations opcionais (ex.: a view
+        documentos_atuais) — quem chama cai no caminho antigo se faltar.
+        """
+        if not self._enabled:
+            return False
+
+        if not hasattr(self, "_relations_cache"):
+            self._relations_cache = {}
+
+        if name not in self._relations_cache:
+            try:
+                # "*": tabelas sem coluna id (blobs, documento_contadores)
+                self._client.table(name).select("*").limit(1).execute()
+                self._relations_cache[name] = True
+            except Exception as e:
+                logger.info("[SupabaseDB] Relation %s unavailable: %s", name, e)
+                self._relations_cache[name] = False
+        return self._relations_cache[name]
+
     def _filter_allowed_columns(self, table: str, data: Dict[str, Any]) -> Dict[str, Any]:
         """Filter out keys that are not present in the database table"""
         allowed = self._get_table_columns(table)
@@ -8,17 +8,21 @@ Configuração:
     SUPABASE_URL=https://xxxxx.supabase.co
     SUPABASE_SERVICE_KEY=eyJ...
     SUPABASE_BUCKET=documentos
+    SUPABASE_BULK_DELETE_BATCH=1000   (caminhos por requisição em delete_many)
 """
 
 import os
 import httpx
+import tempfile
 import unicodedata
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 from dotenv import load_dotenv
 
 load_dotenv()
 
+_BULK_DELETE_BATCH = max(1, int(os.getenv("SUPABASE_BULK_DELETE_BATCH", "1000")))
+
 
 class SupabaseStorage:
     """Cliente para Supabase Storage"""
@@ -135,10 +139,20 @@ class SupabaseStorage:
 
             if response.status_code == 200:
                 # Criar diretório se não existir
-                Path(local_path).parent.mkdir(parents=True, exist_ok=True)
-
-                with open(local_path, "wb") as f:
-                    f.write(response.content)
+                destino = Path(local_path)
+                destino.parent.mkdir(parents=True, exist_ok=True)
+
+                # Nunca abrir o destino com "wb": ele pode ser um hardlink de
+                # data/blobs, e truncar o inode corromperia todas as cópias
+                # deduplicadas. Grava ao lado e troca a entrada de diretório.
+                fd, tmp = tempfile.mkstemp(dir=destino.parent, prefix=f".{destino.name}.", suffix=".part")
+                try:
+                    with os.fdopen(fd, "wb") as f:
+                        f.write(response.content)
+                    os.replace(tmp, destino)
+                except BaseException:
+                    Path(tmp).unlink(missing_ok=True)
+                    raise
 
                 return True, f"Download OK: {local_path}"
             elif response.status_code == 404:
@@ -189,6 +203,41 @@ class SupabaseStorage:
         except Exception as e:
             return False, f"Erro ao deletar: {str(e)}"
 
+    def delete_many(self, remote_paths: List[str]) -> Tuple[int, List[str]]:
+        """
+        Deleta vários arquivos com a API de remoção em lote do bucket.
+
+        Envia até SUPABASE_BULK_DELETE_BATCH caminhos por requisição (uma
+        conexão para todos os lotes). Retorna (quantidade removida, erros).
+        """
+        if not self._enabled or not remote_paths:
+            return 0, []
+
+        paths = list(dict.fromkeys(
+            self._sanitize_path(path.replace("\\", "/").lstrip("/")) for path in remote_paths
+        ))
+        url = f"{self.storage_url}/object/{self.bucket}"
+        removed = 0
+        errors: List[str] = []
+
+        try:
+            with httpx.Client(timeout=60) as client:
+                for i in range(0, len(paths), _BULK_DELETE_BATCH):
+                    batch = paths[i:i + _BULK_DELETE_BATCH]
+                    response = client.request("DELETE", url, headers=self.headers, json={"prefixes": batch})
+                    if response.status_code in (200, 204):
+                        # A API devolve os objetos removidos (caminhos inexistentes não contam)
+                        try:
+                            removed += len(response.json())
+                        except ValueError:
+                            removed += len(batch)
+                    else:
+                        errors.append(f"Erro {response.status_code}: {response.text}")
+        except Exception as e:
+            errors.append(f"Erro ao deletar: {str(e)}")
+
+        return removed, errors
+
     def get_public_url(self, remote_path: str) -> Optional[str]:
         """Retorna URL pública do arquivo (se bucket for público)"""
         if not self._enabled:
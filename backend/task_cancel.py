@@ -0,0 +1,217 @@
+"""
+Cancelamento cooperativo das tarefas de pipeline.
+
+``/api/task-cancel`` só marca ``cancel_requested``, e o pipeline checava a
+flag entre etapas: uma turma cancelada continuava pagando cada chamada
+multimodal, loop de tools e sandbox de código em andamento até terminarem.
+
+Agora o trabalho de uma tarefa roda dentro de um escopo cancelável:
+
+    try:
+        async with escopo_cancelavel(task_id):
+            resultado = await executar_etapa(...)
+    except TarefaCancelada:
+        ...  # etapa interrompida
+
+Quando a tarefa é cancelada a asyncio.Task do escopo é cancelada (como em
+``asyncio.timeout``) e o CancelledError aparece onde ela estiver esperando:
+
+    requisição httpx aberta        a conexão é fechada na hora
+    retry_com_backoff              o sleep do backoff é interrompido, sem nova tentativa
+    loop de tools (ChatClient)     a iteração em curso é abortada
+    code_executor                  o sandbox (Docker/E2B) é derrubado
+
+Escopos da mesma tarefa se aninham (desempenho de turma → cascata → etapa
+de cada aluno, inclusive em filhos de ``asyncio.gather``). ``cancelar`` só
+dispara os escopos mais internos: cada asyncio.Task recebe um único pedido
+de cancelamento e quem converte em TarefaCancelada é a etapa, que marca o
+skip. O escopo externo é disparado quando o último interno sai, e o resto
+do fluxo (ex.: o relatório da turma) não começa.
+
+``except Exception`` não captura CancelledError, então nenhuma camada
+converte o cancelamento em falha retryable. Custos: os tokens das chamadas
+que terminaram antes do cancelamento continuam registrados
+(executar_com_tools grava o parcial com status "cancelado"); a chamada
+interrompida não devolveu usage para registrar.
+
+Detecção:
+    mesmo processo   ``cancelar(task_id)`` (chamado pelo endpoint) dispara na hora
+    outro processo   uma thread relê ``is_cancel_requested`` das tarefas com
+                     escopos ativos (workers do modo local/external)
+
+Configuração (env):
+    TASK_CANCEL_POLL_S=1.0     intervalo de releitura do cancel_requested
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+logger = logging.getLogger("task_cancel")
+
+_POLL_S = float(os.environ.get("TASK_CANCEL_POLL_S", "1.0"))
+
+
+# Escopo aberto mais interno do contexto atual (herdado por tasks filhas)
+_escopo_atual: contextvars.ContextVar[Optional["EscopoCancelavel"]] = contextvars.ContextVar(
+    "task_cancel_escopo", default=None
+)
+
+
+class TarefaCancelada(Exception):
+    """O trabalho do escopo foi interrompido porque a tarefa foi cancelada."""
+
+    def __init__(self, task_id: str):
+        super().__init__(f"tarefa {task_id} cancelada")
+        self.task_id = task_id
+
+
+class EscopoCancelavel:
+    """Cancela a asyncio.Task corrente se a tarefa for cancelada enquanto o escopo está aberto."""
+
+    def __init__(self, task_id: Optional[str]):
+        self.task_id = task_id
+        self.cancelado = False
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ativo = False
+        self._pedido = False
+        self._aguardando = False  # cancelamento pedido, esperando os escopos internos saírem
+        self._pai: Optional[EscopoCancelavel] = None
+        self._token: Optional[contextvars.Token] = None
+
+    async def __aenter__(self) -> "EscopoCancelavel":
+        if not self.task_id:
+            return self
+        self._task = asyncio.current_task()
+        self._loop = asyncio.get_running_loop()
+        self._pai = _escopo_atual.get()
+        self._token = _escopo_atual.set(self)
+        self._ativo = True
+        _registrar(self)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if not self.task_id:
+            return
+        self._ativo = False
+        _escopo_atual.reset(self._token)
+        _remover(self)
+        if self.cancelado and exc_type is asyncio.CancelledError:
+            # Este escopo pediu o cancelamento: converte e desfaz o próprio pedido
+            self._task.uncancel()
+            raise TarefaCancelada(self.task_id) from exc
+
+    def _disparar(self) -> None:
+        # Roda no loop do escopo (call_soon_threadsafe)
+        if self._ativo and not self.cancelado:
+            self.cancelado = True
+            self._task.cancel()
+
+    def cancelar(self) -> None:
+        self._pedido = True
+        try:
+            self._loop.call_soon_threadsafe(self._disparar)
+        except RuntimeError:
+            pass  # loop já fechado: o escopo morreu junto
+
+
+def escopo_cancelavel(task_id: Optional[str]) -> EscopoCancelavel:
+    """Escopo ligado a ``task_id`` (sem task_id o escopo não faz nada)."""
+    return EscopoCancelavel(task_id)
+
+
+_lock = threading.Lock()
+_escopos: Dict[str, List[EscopoCancelavel]] = {}
+_vigia: Optional[threading.Thread] = None
+_cancelados = 0
+
+
+def _registrar(escopo: EscopoCancelavel) -> None:
+    global _vigia
+    with _lock:
+        _escopos.setdefault(escopo.task_id, []).append(escopo)
+        if _vigia is None:
+            _vigia = threading.Thread(target=_vigiar, name="task-cancel-watch", daemon=True)
+            _vigia.start()
+
+
+def _internos(abertos: List[EscopoCancelavel]) -> List[EscopoCancelavel]:
+    """Escopos ainda não disparados que não envolvem outro escopo aberto (chamar com _lock).
+
+    Quem envolve outro espera: o interno cancela a mesma asyncio.Task (ou uma
+    filha) e um segundo cancel escaparia da conversão em TarefaCancelada.
+    """
+    envolvem = set()
+    for escopo in abertos:
+        pai = escopo._pai
+        while pai is not None:
+            envolvem.add(pai)
+            pai = pai._pai
+    return [e for e in abertos if not e._pedido and e not in envolvem]
+
+
+def _remover(escopo: EscopoCancelavel) -> None:
+    global _cancelados
+    with _lock:
+        escopos = _escopos.get(escopo.task_id, [])
+        if escopo in escopos:
+            escopos.remove(escopo)
+        if not escopos:
+            _escopos.pop(escopo.task_id, None)
+        # O último interno saiu: o externo que esperava é disparado agora
+        prontos = [e for e in _internos(escopos) if e._aguardando]
+        _cancelados += len(prontos)
+    for pronto in prontos:
+        pronto.cancelar()
+
+
+def cancelar(task_id: str) -> int:
+    """Interrompe os escopos abertos de ``task_id`` neste processo; devolve quantos."""
+    global _cancelados
+    with _lock:
+        abertos = _escopos.get(task_id, [])
+        for escopo in abertos:
+            escopo._aguardando = True
+        escopos = _internos(abertos)
+        _cancelados += len(escopos)
+    for escopo in escopos:
+        escopo.cancelar()
+    if escopos:
+        logger.info("[cancel] tarefa %s: %s operação(ões) em andamento interrompida(s)", task_id, len(escopos))
+    return len(escopos)
+
+
+def verificar_pendentes() -> List[str]:
+    """Cancela os escopos das tarefas marcadas como canceladas (por este ou outro processo)."""
+    from routes_tasks import is_cancel_requested
+
+    with _lock:
+        task_ids = list(_escopos)
+    canceladas = [task_id for task_id in task_ids if is_cancel_requested(task_id)]
+    for task_id in canceladas:
+        cancelar(task_id)
+    return canceladas
+
+
+def _vigiar() -> None:
+    while True:
+        time.sleep(_POLL_S)
+        try:
+            verificar_pendentes()
+        except Exception as exc:
+            logger.warning("[cancel] falha ao verificar cancelamentos: %s", exc)
+
+
+def stats() -> Dict[str, int]:
+    with _lock:
+        return {
+            "tarefas_com_escopo": len(_escopos),
+            "escopos_abertos": sum(len(e) for e in _escopos.values()),
+            "escopos_cancelados": _cancelados,
+        }
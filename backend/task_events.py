@@ -0,0 +1,248 @@
+"""
+Deltas de progresso das tarefas (pub/sub em processo) para SSE.
+
+O frontend fazia polling de /api/task-progress/{id} a cada 3 s e de
+/api/tasks, que devolve a tarefa inteira (o mapa de etapas de cada aluno) a
+cada chamada, em cada aba aberta. Agora cada helper de ``routes_tasks``
+publica só o que mudou:
+
+    task        tarefa nova (snapshot completo)
+    students    alunos descobertos depois do registro
+    stage       {aluno_id, stage, status, error, skip}
+    coalesced   etapa reaproveitada de outro aluno (single-flight)
+    batch       progresso do lote registrado (batch inteiro)
+    batch_item  {id, status, counts}
+    status      {status, error, last_error, result, summary, finished_at, resumed}
+    cancel      cancel_requested
+    removed     tarefa apagada pela retenção
+
+Todo delta é idempotente (atribui estado, não incrementa), então reenviar
+um evento em uma reconexão não corrompe o estado do cliente.
+
+Seq:
+    Com a fila durável (task_queue) o evento é gravado na mesma transação do
+    snapshot e o seq é o AUTOINCREMENT de ``task_events``: global entre
+    processos (workers do modo local/external) e restarts. Uma thread lê os
+    eventos de outros processos e os entrega aos inscritos locais, como o
+    fan-out de storage_events. Sem a fila, o seq é um contador do processo e
+    os últimos TASK_EVENTS_BUFFER eventos ficam em memória.
+
+    ``since(seq)`` devolve os eventos posteriores ou sinaliza ``gap`` quando
+    o cliente ficou para trás demais (ou o seq é de outro boot): aí ele
+    recebe um snapshot novo.
+
+Configuração (env):
+    TASK_EVENTS_BUFFER=5000        eventos retidos em memória (sem a fila durável)
+    TASK_EVENTS_POLL_S=0.5         polling de eventos de outros processos
+    TASK_EVENTS_QUEUE_MAX=1000     eventos pendentes por inscrito antes de forçar resync
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from task_queue import get_task_store
+
+
+logger = logging.getLogger("task_events")
+
+_BUFFER = int(os.environ.get("TASK_EVENTS_BUFFER", "5000"))
+_POLL_S = float(os.environ.get("TASK_EVENTS_POLL_S", "0.5"))
+_QUEUE_MAX = int(os.environ.get("TASK_EVENTS_QUEUE_MAX", "1000"))
+_SINCE_LIMIT = 2000
+
+PROCESS_ORIGIN = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+@dataclass
+class TaskEvent:
+    seq: int
+    task_id: str
+    kind: str
+    data: Dict[str, Any]
+    origin: str = PROCESS_ORIGIN
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"seq": self.seq, "task_id": self.task_id, "kind": self.kind, "data": self.data}
+
+
+class TaskSubscription:
+    """Fila asyncio de um inscrito (uma conexão SSE); ``task_id=None`` recebe todas."""
+
+    def __init__(self, bus: "TaskEventBus", task_id: Optional[str], loop: asyncio.AbstractEventLoop):
+        self.bus = bus
+        self.task_id = task_id
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=_QUEUE_MAX)
+        self.overflowed = False
+
+    def _offer(self, event: TaskEvent) -> None:
+        # Roda no loop do inscrito (call_soon_threadsafe)
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout: float) -> Optional[TaskEvent]:
+        """Próximo evento, ou None se nada chegou em ``timeout`` segundos."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self) -> None:
+        self.bus._unsubscribe(self)
+
+
+class TaskEventBus:
+    """Pub/sub de deltas de tarefas com seq para retomada."""
+
+    def __init__(self, buffer_size: int = None):
+        self._lock = threading.Lock()
+        self._buffer: Deque[TaskEvent] = deque(maxlen=buffer_size or _BUFFER)
+        self._seq = 0
+        self._subscribers: List[TaskSubscription] = []
+        self._poll_thread: Optional[threading.Thread] = None
+        self._poll_cursor = 0
+        self._published = 0
+        self._remote_received = 0
+        self._dropped = 0
+
+    # ------------------------------------------------------------
+    # Publicação
+    # ------------------------------------------------------------
+
+    def publish(self, task_id: str, kind: str, data: Dict[str, Any], seq: int = None) -> TaskEvent:
+        """Entrega o delta aos inscritos; ``seq`` vem do store quando o evento já foi gravado."""
+        with self._lock:
+            if seq is None:
+                self._seq += 1
+                seq = self._seq
+                event = TaskEvent(seq, task_id, kind, data)
+                self._buffer.append(event)
+            else:
+                event = TaskEvent(seq, task_id, kind, data)
+            self._published += 1
+        self._dispatch(event)
+        return event
+
+    def _dispatch(self, event: TaskEvent) -> None:
+        with self._lock:
+            subscribers = [s for s in self._subscribers if s.task_id in (None, event.task_id)]
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._offer, event)
+            except RuntimeError:
+                # Loop da conexão já fechou sem cancelar a inscrição
+                self._dropped += 1
+                self._unsubscribe(subscription)
+
+    # ------------------------------------------------------------
+    # Inscrição e retomada
+    # ------------------------------------------------------------
+
+    def subscribe(self, task_id: str = None) -> TaskSubscription:
+        """Inscreve o loop corrente (chamar de dentro de uma corrotina)."""
+        subscription = TaskSubscription(self, task_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.append(subscription)
+        if get_task_store() is not None:
+            self._ensure_polling()
+        return subscription
+
+    def _unsubscribe(self, subscription: TaskSubscription) -> None:
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def last_seq(self) -> int:
+        """Seq do último evento emitido (capturar ANTES de montar um snapshot)."""
+        store = get_task_store()
+        if store is not None:
+            return store.event_seq_range()[1]
+        with self._lock:
+            return self._seq
+
+    def since(self, after: int, task_id: str = None) -> Tuple[List[TaskEvent], bool]:
+        """(eventos com seq > ``after``, gap). Com gap o cliente precisa de um snapshot."""
+        store = get_task_store()
+        if store is not None:
+            first, last = store.event_seq_range()
+            if after > last or (after < last and (not first or after < first - 1)):
+                return [], True
+            rows = store.read_events(after, task_id=task_id, limit=_SINCE_LIMIT + 1)
+            events = [TaskEvent(r["seq"], r["task_id"], r["kind"], r["data"], r["origin"]) for r in rows]
+        else:
+            with self._lock:
+                if after > self._seq or (self._buffer and after < self._buffer[0].seq - 1):
+                    return [], True
+                events = [e for e in self._buffer if e.seq > after and task_id in (None, e.task_id)]
+        if len(events) > _SINCE_LIMIT:
+            return [], True
+        return events, False
+
+    # ------------------------------------------------------------
+    # Eventos de outros processos (workers fora da API)
+    # ------------------------------------------------------------
+
+    def _ensure_polling(self) -> None:
+        with self._lock:
+            if self._poll_thread is not None:
+                return
+            self._poll_cursor = get_task_store().event_seq_range()[1]
+            self._poll_thread = threading.Thread(target=self._poll_loop, name="task-events-poll", daemon=True)
+            self._poll_thread.start()
+
+    def poll_remote(self) -> int:
+        """Entrega aos inscritos locais os eventos gravados por outros processos."""
+        store = get_task_store()
+        if store is None:
+            return 0
+        delivered = 0
+        for row in store.read_events(self._poll_cursor, limit=500):
+            self._poll_cursor = row["seq"]
+            if row["origin"] == PROCESS_ORIGIN:
+                continue
+            self._remote_received += 1
+            self._dispatch(TaskEvent(row["seq"], row["task_id"], row["kind"], row["data"], row["origin"]))
+            delivered += 1
+        return delivered
+
+    def _poll_loop(self) -> None:
+        while True:
+            time.sleep(_POLL_S)
+            store = get_task_store()
+            if store is None:
+                continue
+            try:
+                with self._lock:
+                    ocioso = not self._subscribers
+                if ocioso:
+                    # Ninguém assistindo: não acumular eventos velhos para o próximo inscrito
+                    self._poll_cursor = store.event_seq_range()[1]
+                    continue
+                self.poll_remote()
+            except Exception as exc:
+                logger.warning("[task-events] polling falhou: %s", exc)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            subscribers = len(self._subscribers)
+            buffered = len(self._buffer)
+        return {
+            "subscribers": subscribers,
+            "published": self._published,
+            "remote_received": self._remote_received,
+            "dropped_subscribers": self._dropped,
+            "buffered": buffered,
+            "last_seq": self.last_seq(),
+        }
+
+
+bus = TaskEventBus()
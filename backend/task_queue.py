@@ -0,0 +1,867 @@
+"""
+Fila durável das tarefas do pipeline (task_registry persistido em SQLite).
+
+Antes o progresso vivia só em ``routes_tasks.task_registry`` e as execuções
+em threads soltas: um deploy ou crash no Render perdia tudo o que estava
+rodando ou na fila, e o dict crescia para sempre. Agora:
+
+    tasks       snapshot JSON de cada tarefa (o mesmo dict servido por
+                /api/tasks e /api/task-progress). ``cancel_requested`` fica
+                numa coluna própria: o snapshot gravado pelo worker nunca
+                desfaz um cancelamento pedido pela API.
+    task_units  uma linha por (tarefa, atividade, aluno, etapa) com status,
+                tentativas e o worker que a executa.
+    task_runs   a execução em si (nome do handler + kwargs JSON) com lease.
+    task_events deltas de progresso (task_events.py / SSE); o seq é o
+                AUTOINCREMENT, global entre processos e restarts.
+
+Lease:
+    Um worker reserva a execução por TASK_LEASE_SECONDS e renova a cada
+    terço do prazo enquanto ela roda. Se o processo morre, o lease vence e
+    qualquer worker (inclusive o do próximo boot) retoma a execução.
+
+Retomada:
+    A execução retomada roda o handler de novo com os mesmos kwargs; as
+    unidades já concluídas nesta tarefa são puladas
+    (``routes_tasks.stage_completed_before`` em ``_should_run``), então
+    etapas prontas não são refeitas. Depois de TASK_MAX_ATTEMPTS reservas a
+    tarefa é marcada como falha; a devolução no shutdown gracioso
+    (``release_runs``) não conta. O shutdown só devolve execuções cujo
+    handler já saiu: as que ainda rodam ficam com o lease. Exceção no
+    handler não é repetida: é erro de execução, não queda do processo.
+
+Progresso:
+    Atualizações de etapa/lote (``routes_tasks._persist``) vão para
+    ``TaskStore.save_task_later``: uma thread do store grava em lote, uma
+    transação por rodada e só o snapshot mais recente de cada tarefa, e
+    publica os deltas depois do commit. Registro, status e cancelamento
+    continuam síncronos (e esperam a fila antes, preservando a ordem dos seqs).
+
+Handlers são registrados por nome (``register_handler``); as rotas enfileiram
+com ``routes_prompts._start_detached_task``.
+
+Quem consome a fila (TASK_WORKER_MODE):
+    inline    threads no próprio processo da API (padrão)
+    local     a API sobe TASK_WORKER_PROCESSES processos worker.py na mesma
+              máquina e só enfileira/reporta
+    external  a API só enfileira; os workers rodam à parte com
+              ``python -m worker`` (mesmo disco: a fila é um arquivo SQLite)
+
+Retenção: tarefas terminadas há mais de TASK_RETENTION_HOURS saem do banco e
+do task_registry em memória.
+
+Configuração (env):
+    TASK_QUEUE_DB=data/task_queue.db   ("" desliga: threads em memória, como antes;
+                                        padrão em testes)
+    TASK_WORKER_MODE=inline            inline | local | external
+    TASK_WORKER_CONCURRENCY=2          execuções simultâneas por processo
+    TASK_LEASE_SECONDS=60
+    TASK_MAX_ATTEMPTS=3
+    TASK_RETENTION_HOURS=72
+"""
+
+import contextvars
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import ai_http
+import fast_json
+from sqlite_pool import sqlite_pool
+
+
+logger = logging.getLogger("task_queue")
+
+WORKER_CONCURRENCY = int(os.environ.get("TASK_WORKER_CONCURRENCY", "2"))
+_LEASE_SECONDS = float(os.environ.get("TASK_LEASE_SECONDS", "60"))
+_MAX_ATTEMPTS = int(os.environ.get("TASK_MAX_ATTEMPTS", "3"))
+RETENTION_SECONDS = float(os.environ.get("TASK_RETENTION_HOURS", "72")) * 3600
+_PRUNE_INTERVAL_S = 600.0
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+WORKER_MODES = ("inline", "local", "external")
+
+RUN_QUEUED = "queued"
+RUN_RUNNING = "running"
+RUN_DONE = "done"
+RUN_FAILED = "failed"
+
+# Worker dono da execução corrente (gravado em task_units.lease_owner)
+_worker_ctx: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("task_worker", default=None)
+
+_HANDLERS: Dict[str, Callable[..., Awaitable[Any]]] = {}
+
+
+def register_handler(name: str, func: Callable[..., Awaitable[Any]]) -> None:
+    """Registra a corrotina que executa as tarefas enfileiradas com ``name``."""
+    _HANDLERS[name] = func
+
+
+def current_worker_id() -> Optional[str]:
+    return _worker_ctx.get()
+
+
+def worker_mode() -> str:
+    """Onde a fila é consumida: inline (threads da API), local (processos filhos) ou external."""
+    mode = os.environ.get("TASK_WORKER_MODE", "inline").strip().lower()
+    if mode not in WORKER_MODES:
+        logger.warning("[task-queue] TASK_WORKER_MODE=%r inválido; usando inline", mode)
+        return "inline"
+    return mode
+
+
+def _default_db_path() -> str:
+    testing = os.getenv("PROVA_AI_TESTING", "").lower() in ("1", "true", "yes")
+    return "" if testing else str(Path(__file__).parent / "data" / "task_queue.db")
+
+
+class TaskStore:
+    """Tarefas, unidades (tarefa, atividade, aluno, etapa) e execuções com lease em SQLite."""
+
+    def __init__(self, db_path: str):
+        self.db_path = Path(db_path)
+        self._setup()
+
+        # Gravação em segundo plano do progresso (save_task_later)
+        self._write_cond = threading.Condition()
+        self._write_queue: List[Tuple] = []
+        self._write_pending: Dict[str, int] = {}
+        self._writer: Optional[threading.Thread] = None
+        self._write_batches = 0
+        self._snapshots_written = 0
+        self._snapshots_coalesced = 0
+        self._write_failures = 0
+
+    def _setup(self) -> None:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite_pool.get(self.db_path)
+        try:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS tasks (
+                    task_id TEXT PRIMARY KEY,
+                    type TEXT,
+                    status TEXT NOT NULL,
+                    snapshot TEXT NOT NULL,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    created_at TEXT,
+                    updated_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_tasks_status_updated ON tasks(status, updated_at);
+
+                CREATE TABLE IF NOT EXISTS task_units (
+                    task_id TEXT NOT NULL,
+                    atividade_id TEXT NOT NULL DEFAULT '',
+                    aluno_id TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_owner TEXT,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (task_id, atividade_id, aluno_id, stage)
+                );
+
+                CREATE TABLE IF NOT EXISTS task_runs (
+                    task_id TEXT PRIMARY KEY,
+                    handler TEXT NOT NULL,
+                    kwargs TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_owner TEXT,
+                    lease_expires_at REAL,
+                    enqueued_at REAL NOT NULL,
+                    last_error TEXT,
+                    releases INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS idx_task_runs_status ON task_runs(status, enqueued_at);
+
+                CREATE TABLE IF NOT EXISTS task_events (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    task_id TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    origin TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_task_events_task ON task_events(task_id, seq);
+            ''')
+            colunas = {row[1] for row in conn.execute("PRAGMA table_info(task_runs)")}
+            if "releases" not in colunas:  # bancos criados antes da coluna
+                conn.execute("ALTER TABLE task_runs ADD COLUMN releases INTEGER NOT NULL DEFAULT 0")
+            conn.commit()
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------------
+    # Tarefas (snapshot servido pela API)
+    # ------------------------------------------------------------
+
+    _UPSERT_TASK = (
+        "INSERT INTO tasks (task_id, type, status, snapshot, cancel_requested, created_at, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(task_id) DO UPDATE SET type = excluded.type, status = excluded.status, "
+        "snapshot = excluded.snapshot, updated_at = excluded.updated_at, "
+        "cancel_requested = MAX(tasks.cancel_requested, excluded.cancel_requested)"
+    )
+
+    @staticmethod
+    def _task_row(task: Dict[str, Any]) -> Tuple:
+        return (
+            task["task_id"], task.get("type"), task.get("status") or "running",
+            fast_json.dumps(task, default=str), int(bool(task.get("cancel_requested"))),
+            task.get("created_at"), time.time(),
+        )
+
+    def save_task(self, task: Dict[str, Any], event: Tuple[str, Dict[str, Any], str] = None) -> Optional[int]:
+        """Grava o snapshot; ``event=(kind, delta, origin)`` entra na mesma transação e devolve o seq.
+
+        Espera as gravações em segundo plano deste store antes, para que os
+        seqs saiam na ordem em que o processo produziu os eventos.
+        """
+        self.flush_writes()
+        seq = None
+        conn = sqlite_pool.get(self.db_path)
+        try:
+            conn.execute(self._UPSERT_TASK, self._task_row(task))
+            if event is not None:
+                seq = self._insert_event(conn, task["task_id"], *event)
+            conn.commit()
+        finally:
+            conn.close()
+        return seq
+
+    # ------------------------------------------------------------
+    # Gravação em segundo plano (progresso de etapas)
+    # ------------------------------------------------------------
+
+    def save_task_later(self, task: Dict[str, Any], event: Tuple[str, Dict[str, Any], str] = None,
+                        unit: Tuple[Optional[str], str, str, str, Optional[str]] = None,
+                        on_saved: Callable[[Optional[int]], None] = None) -> None:
+        """Como ``save_task`` (+ ``save_unit`` com ``unit=(atividade, aluno, etapa,
+        status, lease_owner)``), mas gravado por uma thread do store.
+
+        Cada atualização de etapa fazia um commit SQLite com o snapshot inteiro
+        no event loop. Aqui o snapshot só é serializado (o dict continua
+        mudando depois); a thread grava o que acumulou numa transação, com
+        todos os eventos e unidades em ordem e só o snapshot mais recente de
+        cada tarefa. ``on_saved(seq)`` roda na thread depois do commit.
+        """
+        task_id = task["task_id"]
+        item = (task_id, self._task_row(task), event, unit, on_saved)
+        with self._write_cond:
+            self._write_queue.append(item)
+            self._write_pending[task_id] = self._write_pending.get(task_id, 0) + 1
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="task-store-writer", daemon=True)
+                self._writer.start()
+            self._write_cond.notify_all()
+
+    def _write_loop(self) -> None:
+        while True:
+            with self._write_cond:
+                while not self._write_queue:
+                    self._write_cond.wait()
+                lote, self._write_queue = self._write_queue, []
+            try:
+                seqs = self._write_batch(lote)
+            except Exception as exc:
+                # Sem seq não há o que publicar; o próximo save_task regrava o snapshot inteiro
+                logger.warning("[task-queue] falha gravando %s atualização(ões) de progresso: %s", len(lote), exc)
+                seqs = None
+                self._write_failures += 1
+            for (_, _, _, _, on_saved), seq in zip(lote, seqs or []):
+                if on_saved is not None:
+                    try:
+                        on_saved(seq)
+                    except Exception as exc:
+                        logger.warning("[task-queue] falha publicando progresso gravado: %s", exc)
+            with self._write_cond:
+                for task_id, *_ in lote:
+                    restantes = self._write_pending[task_id] - 1
+                    if restantes:
+                        self._write_pending[task_id] = restantes
+                    else:
+                        del self._write_pending[task_id]
+                self._write_cond.notify_all()
+
+    def _write_batch(self, lote: List[Tuple]) -> List[Optional[int]]:
+        seqs: List[Optional[int]] = []
+        ultimos: Dict[str, Tuple] = {}
+        conn = sqlite_pool.get(self.db_path)
+        try:
+            for task_id, row, event, unit, _ in lote:
+                ultimos[task_id] = row
+                seqs.append(self._insert_event(conn, task_id, *event) if event is not None else None)
+                if unit is not None:
+                    self._upsert_unit(conn, task_id, *unit)
+            for row in ultimos.values():
+                conn.execute(self._UPSERT_TASK, row)
+            conn.commit()
+        finally:
+            conn.close()
+        self._write_batches += 1
+        self._snapshots_written += len(ultimos)
+        self._snapshots_coalesced += len(lote) - len(ultimos)
+        return seqs
+
+    def flush_writes(self, timeout: float = 10.0) -> bool:
+        """Espera as gravações em segundo plano pendentes; False se o prazo venceu."""
+        if threading.current_thread() is self._writer:
+            return True
+        prazo = time.monotonic() + timeout
+        with self._write_cond:
+            while self._write_pending:
+                restante = prazo - time.monotonic()
+                if restante <= 0:
+                    logger.warning("[task-queue] %s gravação(ões) de progresso ainda pendentes",
+                                   sum(self._write_pending.values()))
+                    return False
+                self._write_cond.wait(restante)
+        return True
+
+    def has_pending_writes(self, task_id: str = None) -> bool:
+        """True enquanto há progresso da tarefa (ou de qualquer uma) esperando a thread de gravação."""
+        with self._write_cond:
+            return bool(self._write_pending) if task_id is None else task_id in self._write_pending
+
+    def _flush_for(self, task_id: str = None) -> None:
+        # Leituras deste processo enxergam o que ele mesmo pôs na fila de gravação
+        if self.has_pending_writes(task_id):
+            self.flush_writes()
+
+    @staticmethod
+    def _from_row(row) -> Dict[str, Any]:
+        task = fast_json.loads(row["snapshot"])
+        task["cancel_requested"] = bool(row["cancel_requested"])
+        return task
+
+    def load_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        self._flush_for(task_id)
+        conn = sqlite_pool.get(self.db_path)
+        try:
+            row = conn.execute(
+                "SELECT snapshot, cancel_requested FROM tasks WHERE task_id = ?", (task_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return self._from_row(row) if row else None
+
+    def list_tasks(self, flush: bool = True) -> List[Dict[str, Any]]:
+        if flush:
+            self._flush_for()
+        conn = sqlite_pool.get(self.db_path)
+        try:
+            rows = conn.execute(
+                "SELECT snapshot, cancel_requested FROM tasks ORDER BY created_at, rowid"
+            ).fetchall()
+        finally:
+            conn.close()
+        return [self._from_row(row) for row in rows]
+
+    def request_cancel(self, task_id: str, event: Tuple[str, Dict[str, Any], str] = None) -> Optional[int]:
+        """Marca o cancelamento; devolve o seq do evento (0 sem evento, None se a tarefa não existe)."""
+        self.flush_writes()
+        conn = sqlite_pool.get(self.db_path)
+        try:
+            updated = conn.execute(
+                "UPDATE tasks SET cancel_requested = 1, updated_at = ? WHERE task_id = ?",
+                (time.time(), task_id),
+            ).rowcount
+            seq = self._insert_event(conn, task_id, *event) if updated and event is not None else 0
+            conn.commit()
+        finally:
+            conn.close()
+        return seq if updated else None
+
+    def is_cancel_requested(self, task_id: str) -> bool:
+        conn = sqlite_pool.get(self.db_path)
+        try:
+            row = conn.execute("SELECT cancel_requested FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        finally:
+            conn.close()
+        return bool(row and row[0])
+
+    # ------------------------------------------------------------
+    # Eventos (deltas para SSE / ?since=)
+    # ------------------------------------------------------------
+
+    @staticmethod
+    def _insert_event(conn, task_id: str, kind: str, data: Dict[str, Any], origin: str) -> int:
+        cursor = conn.execute(
+            "INSERT INTO task_events (task_id, kind, origin, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+            (task_id, kind, origin, fast_json.dumps(data, default=str), time.time()),
+        )
+        return int(cursor.lastrowid)
+
+    def append_event(self, task_id: str, kind: str, data: Dict[str, Any], origin: str) -> int:
+        self.flush_writes()
+        conn = sqlite_pool.get(self.db_path)
+        try:
+            seq = self._insert_event(conn, task_id, kind, data, origin)
+            conn.commit()
+        finally:
+            conn.close()
+        return seq
+
+    def read_events(self, after: int, task_id: str = None, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Eventos com seq > ``after`` em ordem (opcionalmente de uma tarefa só)."""
+        sql = "SELECT seq, task_id, kind, origin, payload FROM task_events WHERE seq > ?"
+        params: List[Any] = [after]
+        if task_id:
+            sql += " AND task_id = ?"
+            params.append(task_id)
+        sql += " ORDER BY seq LIMIT ?"
+        params.append(limit)
+        conn = sqlite_pool.get(self.db_path)
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+        return [
+            {"seq": row["seq"], "task_id": row["task_id"], "kind": row["kind"],
+             "origin": row["origin"], "data": fast_json.loads(row["payload"])}
+            for row in rows
+        ]
+
+    def event_seq_range(self) -> Tuple[int, int]:
+        """(menor seq retido, maior seq já emitido); (0, 0) sem eventos."""
+        conn = sqlite_pool.get(self.db_path)
+        try:
+            first = conn.execute("SELECT COALESCE(MIN(seq), 0) FROM task_events").fetchone()[0]
+            row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'task_events'").fetchone()
+        finally:
+            conn.close()
+        return int(first), int(row[0]) if row else 0
+
+    # ------------------------------------------------------------
+    # Unidades (tarefa, atividade, aluno, etapa)
+    # ------------------------------------------------------------
+
+    @staticmethod
+    def _upsert_unit(conn, task_id: str, atividade_id: Optional[str], aluno_id: str, stage: str,
+                     status: str, lease_owner: Optional[str] = None) -> None:
+        started = 1 if status == "running" else 0
+        conn.execute(
+            "INSERT INTO task_units (task_id, atividade_id, aluno_id, stage, status, attempts, "
+            "lease_owner, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(task_id, atividade_id, aluno_id, stage) DO UPDATE SET "
+            "status = excluded.status, attempts = task_units.attempts + ?, "
+            "lease_owner = excluded.lease_owner, updated_at = excluded.updated_at",
+            (task_id, atividade_id or "", aluno_id, stage, status, started,
+             lease_owner if status == "running" else None, time.time(), started),
+        )
+
+    def save_unit(self, task_id: str, atividade_id: Optional[str], aluno_id: str, stage: str,
+                  status: str, lease_owner: Optional[str] = None) -> None:
+        """Grava o status da unidade; cada ``running`` conta uma tentativa."""
+        conn = sqlite_pool.get(self.db_path)
+        try:
+            self._upsert_unit(conn, task_id, atividade_id, aluno_id, stage, status, lease_owner)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def unit_completed(self, task_id: str, atividade_id: Optional[str], aluno_id: str, stage: str) -> bool:
+        self._flush_for(task_id)
+        conn = sqlite_pool.get(self.db_path)
+        try:
+            row = conn.execute(
+                "SELECT 1 FROM task_units WHERE task_id = ? AND atividade_id = ? AND aluno_id = ? "
+                "AND stage = ? AND status = 'completed'",
+                (task_id, atividade_id or "", aluno_id, stage),
+            ).fetchone()
+        finally:
+            conn.close()
+        return row is not None
+
+    def list_units(self, task_id: str) -> List[Dict[str, Any]]:
+        self._flush_for(task_id)
+        conn = sqlite_pool.get(self.db_path)
+        try:
+            rows = conn.execute(
+                "SELECT * FROM task_units WHERE task_id = ? ORDER BY rowid", (task_id,)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [dict(row) for row in rows]
+
+    # ------------------------------------------------------------
+    # Execuções com lease
+    # ------------------------------------------------------------
+
+    def enqueue_run(self, task_id: str, handler: str, kwargs: Dict[str, Any]) -> None:
+        conn = sqlite_pool.get(self.db_path)
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO task_runs (task_id, handler, kwargs, status, attempts, "
+                "lease_owner, lease_expires_at, enqueued_at) VALUES (?, ?, ?, ?, 0, NULL, NULL, ?)",
+                (task_id, handler, fast_json.dumps(kwargs), RUN_QUEUED, time.time()),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def claim_run(self, worker_id: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        """Reserva a próxima execução na fila ou com lease vencido (processo que morreu)."""
+        now = time.time()
+        disponivel = "(status = ? OR (status = ? AND lease_expires_at < ?))"
+        conn = sqlite_pool.get(self.db_path)
+        try:
+            row = conn.execute(
+                f"SELECT task_id FROM task_runs WHERE {disponivel} ORDER BY enqueued_at LIMIT 1",
+                (RUN_QUEUED, RUN_RUNNING, now),
+            ).fetchone()
+            if row is None:
+                return None
+            claimed = conn.execute(
+                "UPDATE task_runs SET status = ?, lease_owner = ?, lease_expires_at = ?, "
+                f"attempts = attempts + 1 WHERE task_id = ? AND {disponivel}",
+                (RUN_RUNNING, worker_id, now + lease_seconds, row["task_id"], RUN_QUEUED, RUN_RUNNING, now),
+            ).rowcount
+            conn.commit()
+            if not claimed:
+                return None  # outro worker pegou primeiro
+            run = dict(conn.execute("SELECT * FROM task_runs WHERE task_id = ?", (row["task_id"],)).fetchone())
+        finally:
+            conn.close()
+        run["kwargs"] = fast_json.loads(run["kwargs"])
+        return run
+
+    def renew_lease(self, task_id: str, worker_id: str, lease_seconds: float) -> bool:
+        conn = sqlite_pool.get(self.db_path)
+        try:
+            renewed = conn.execute(
+                "UPDATE task_runs SET lease_expires_at = ? WHERE task_id = ? AND lease_owner = ? AND status = ?",
+                (time.time() + lease_seconds, task_id, worker_id, RUN_RUNNING),
+            ).rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        return bool(renewed)
+
+    def finish_run(self, task_id: str, worker_id: str, status: str, error: str = None) -> None:
+        conn = sqlite_pool.get(self.db_path)
+        try:
+            conn.execute(
+                "UPDATE task_runs SET status = ?, lease_owner = NULL, lease_expires_at = NULL, last_error = ? "
+                "WHERE task_id = ? AND lease_owner = ?",
+                (status, (error or "")[:500] or None, task_id, worker_id),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def release_runs(self, worker_id: str, manter: Iterable[str] = ()) -> int:
+        """Devolve à fila as execuções deste worker (shutdown): o próximo boot retoma sem esperar o lease.
+
+        Devolução voluntária não gasta tentativa: ``attempts`` volta ao valor
+        de antes da reserva e ``releases`` marca que a próxima é retomada.
+        Só queda do processo (lease vencido) conta para TASK_MAX_ATTEMPTS.
+        ``manter``: task_ids cujo handler ainda roda — continuam reservados.
+        """
+        manter = list(manter)
+        filtro = f" AND task_id NOT IN ({', '.join('?' * len(manter))})" if manter else ""
+        conn = sqlite_pool.get(self.db_path)
+        try:
+            released = conn.execute(
+                "UPDATE task_runs SET status = ?, lease_owner = NULL, lease_expires_at = NULL, "
+                "attempts = MAX(attempts - 1, 0), releases = releases + 1 "
+                "WHERE lease_owner = ? AND status = ?" + filtro,
+                (RUN_QUEUED, worker_id, RUN_RUNNING, *manter),
+            ).rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        return released
+
+    def get_run(self, task_id: str) -> Optional[Dict[str, Any]]:
+        conn = sqlite_pool.get(self.db_path)
+        try:
+            row = conn.execute("SELECT * FROM task_runs WHERE task_id = ?", (task_id,)).fetchone()
+        finally:
+            conn.close()
+        return dict(row) if row else None
+
+    # ------------------------------------------------------------
+    # Retenção e métricas
+    # ------------------------------------------------------------
+
+    def prune(self, retention_seconds: float) -> List[str]:
+        """Apaga tarefas terminadas há mais de ``retention_seconds``; retorna os ids removidos."""
+        self.flush_writes()
+        limite = time.time() - retention_seconds
+        placeholders = ", ".join("?" for _ in TERMINAL_STATUSES)
+        conn = sqlite_pool.get(self.db_path)
+        try:
+            ids = [
+                row[0] for row in conn.execute(
+                    f"SELECT task_id FROM tasks WHERE status IN ({placeholders}) AND updated_at < ?",
+                    (*TERMINAL_STATUSES, limite),
+                )
+            ]
+            conn.execute("DELETE FROM task_events WHERE created_at < ?", (limite,))
+            for task_id in ids:
+                conn.execute("DELETE FROM task_events WHERE task_id = ?", (task_id,))
+                conn.execute("DELETE FROM task_units WHERE task_id = ?", (task_id,))
+                conn.execute("DELETE FROM task_runs WHERE task_id = ? AND status != ?", (task_id, RUN_RUNNING))
+                conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+            conn.commit()
+        finally:
+            conn.close()
+        return ids
+
+    def stats(self) -> Dict[str, Any]:
+        conn = sqlite_pool.get(self.db_path)
+        try:
+            runs = {row[0]: row[1] for row in conn.execute("SELECT status, COUNT(*) FROM task_runs GROUP BY status")}
+            tasks = {row[0]: row[1] for row in conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status")}
+            units = conn.execute("SELECT COUNT(*) FROM task_units").fetchone()[0]
+        finally:
+            conn.close()
+        with self._write_cond:
+            escrita = {
+                "pending": sum(self._write_pending.values()),
+                "batches": self._write_batches,
+                "snapshots_written": self._snapshots_written,
+                "snapshots_coalesced": self._snapshots_coalesced,
+                "failures": self._write_failures,
+            }
+        return {"db_path": str(self.db_path), "runs": runs, "tasks": tasks, "units": units, "write_behind": escrita}
+
+
+_store: Optional[TaskStore] = None
+_store_lock = threading.Lock()
+
+
+def get_task_store() -> Optional[TaskStore]:
+    """Store do processo (None quando TASK_QUEUE_DB="")."""
+    global _store
+    if _store is None:
+        db_path = os.environ.get("TASK_QUEUE_DB", _default_db_path())
+        if not db_path:
+            return None
+        with _store_lock:
+            if _store is None:
+                _store = TaskStore(db_path)
+    return _store
+
+
+def set_task_store(store: Optional[TaskStore]) -> None:
+    """Troca o store do processo (testes e worker externo)."""
+    global _store
+    with _store_lock:
+        _store = store
+
+
+class TaskWorker:
+    """Threads que reservam execuções em ``task_runs`` e rodam o handler com lease renovado."""
+
+    def __init__(self, store: TaskStore, concurrency: int = None, lease_seconds: float = None,
+                 max_attempts: int = None, poll_interval: float = 1.0):
+        self.store = store
+        self.concurrency = WORKER_CONCURRENCY if concurrency is None else max(1, concurrency)
+        self.lease_seconds = _LEASE_SECONDS if lease_seconds is None else lease_seconds
+        self.max_attempts = _MAX_ATTEMPTS if max_attempts is None else max_attempts
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._stop = False
+        self._in_flight = 0
+        self._rodando: Set[str] = set()
+        self._completed = 0
+        self._failed = 0
+        self._resumed = 0
+        self._last_prune = 0.0
+
+    def start(self) -> None:
+        with self._cond:
+            if self._threads or self._stop:
+                return
+            for i in range(self.concurrency):
+                thread = threading.Thread(target=self._loop, name=f"task-worker-{i}", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+        logger.info("[task-queue] worker %s iniciado (%s execuções simultâneas)", self.worker_id, self.concurrency)
+
+    def notify(self) -> None:
+        """Acorda os workers (execução enfileirada neste processo)."""
+        with self._cond:
+            self._cond.notify()
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                if self._stop:
+                    return
+            self._maybe_prune()
+            try:
+                run = self.store.claim_run(self.worker_id, self.lease_seconds)
+            except Exception as exc:
+                logger.warning("[task-queue] falha lendo a fila: %s", exc)
+                run = None
+            if run is None:
+                with self._cond:
+                    if not self._stop:
+                        self._cond.wait(self.poll_interval)
+                continue
+
+            with self._cond:
+                self._in_flight += 1
+                self._rodando.add(run["task_id"])
+            try:
+                self._process(run)
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    self._rodando.discard(run["task_id"])
+                    self._cond.notify_all()
+
+    def _maybe_prune(self) -> None:
+        if time.monotonic() - self._last_prune < _PRUNE_INTERVAL_S:
+            return
+        self._last_prune = time.monotonic()
+        try:
+            from routes_tasks import prune_tasks
+            prune_tasks()
+        except Exception as exc:
+            logger.warning("[task-queue] falha na retenção: %s", exc)
+
+    def _process(self, run: Dict[str, Any]) -> None:
+        from routes_tasks import complete_pipeline_task, prepare_task_resume
+
+        task_id = run["task_id"]
+        if run["attempts"] > self.max_attempts:
+            erro = f"Execução abandonada após {run['attempts'] - 1} tentativa(s) (processo reiniciado no meio)"
+            self.store.finish_run(task_id, self.worker_id, RUN_FAILED, erro)
+            complete_pipeline_task(task_id, "failed", error=erro)
+            self._failed += 1
+            return
+        handler = _HANDLERS.get(run["handler"])
+        if handler is None:
+            erro = f"Handler de tarefa desconhecido: {run['handler']}"
+            self.store.finish_run(task_id, self.worker_id, RUN_FAILED, erro)
+            complete_pipeline_task(task_id, "failed", error=erro)
+            self._failed += 1
+            return
+        if run["attempts"] > 1 or run.get("releases"):
+            self._resumed += 1
+            logger.info("[task-queue] retomando %s (tentativa %s)", task_id, run["attempts"])
+            prepare_task_resume(task_id)
+
+        parar_lease = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat, args=(task_id, parar_lease), name=f"task-lease-{task_id}", daemon=True,
+        )
+        heartbeat.start()
+        token = _worker_ctx.set(self.worker_id)
+        try:
+            ai_http.run(handler(**run["kwargs"]))
+        except Exception as exc:
+            logger.exception("[task-queue] tarefa %s falhou", task_id)
+            self.store.finish_run(task_id, self.worker_id, RUN_FAILED, str(exc))
+            complete_pipeline_task(task_id, "failed", error=str(exc))
+            self._failed += 1
+        else:
+            self.store.finish_run(task_id, self.worker_id, RUN_DONE)
+            self._completed += 1
+        finally:
+            _worker_ctx.reset(token)
+            parar_lease.set()
+            heartbeat.join(timeout=1)
+
+    def _heartbeat(self, task_id: str, parar: threading.Event) -> None:
+        while not parar.wait(self.lease_seconds / 3):
+            try:
+                if not self.store.renew_lease(task_id, self.worker_id, self.lease_seconds):
+                    logger.warning("[task-queue] lease de %s perdido", task_id)
+                    return
+            except Exception as exc:
+                logger.warning("[task-queue] falha renovando lease de %s: %s", task_id, exc)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """
+        Para de reservar execuções, espera até ``timeout`` as em andamento e
+        devolve à fila as reservadas cujo handler já saiu.
+
+        Handler que ainda roda mantém o lease (o heartbeat segue renovando):
+        devolvê-lo deixaria outro worker reservar e rodar a mesma tarefa em
+        paralelo. Se o processo morrer antes, o lease vence normalmente.
+        """
+        prazo = time.monotonic() + timeout
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+            while self._in_flight and time.monotonic() < prazo:
+                self._cond.wait(max(0.0, prazo - time.monotonic()))
+            rodando = set(self._rodando)
+        self.store.flush_writes()
+        released = self.store.release_runs(self.worker_id, manter=rodando)
+        if released:
+            logger.info("[task-queue] %s execução(ões) devolvida(s) à fila no shutdown", released)
+        if rodando:
+            logger.warning("[task-queue] %s execução(ões) ainda rodando no shutdown; lease mantido: %s",
+                           len(rodando), sorted(rodando))
+        for thread in self._threads:
+            thread.join(timeout=max(0.0, prazo - time.monotonic()) if not rodando else 0.1)
+        self._threads = []
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "worker_id": self.worker_id,
+            "concurrency": self.concurrency,
+            "in_flight": self._in_flight,
+            "completed": self._completed,
+            "failed": self._failed,
+            "resumed": self._resumed,
+            **self.store.stats(),
+        }
+
+
+_worker: Optional[TaskWorker] = None
+
+
+def enqueue(task_id: str, handler: str, kwargs: Dict[str, Any]) -> bool:
+    """Enfileira a execução; False se a fila durável está desligada ou o handler não é registrado."""
+    store = get_task_store()
+    if store is None or handler not in _HANDLERS:
+        return False
+    store.enqueue_run(task_id, handler, kwargs)
+    if _worker is not None:
+        _worker.notify()
+    return True
+
+
+def start_worker() -> Optional[TaskWorker]:
+    """Sobe o worker deste processo (retoma execuções interrompidas de boots anteriores)."""
+    global _worker
+    store = get_task_store()
+    if store is None:
+        return None
+    if _worker is None:
+        _worker = TaskWorker(store)
+        _worker.start()
+    return _worker
+
+
+def stop_worker() -> None:
+    global _worker
+    if _worker is not None:
+        _worker.close()
+        _worker = None
+    store = _store
+    if store is not None:
+        store.flush_writes()
+
+
+def queue_stats() -> Dict[str, Any]:
+    if _worker is not None:
+        return {"mode": worker_mode(), **_worker.stats()}
+    store = get_task_store()
+    return {"mode": worker_mode(), **store.stats()} if store else {"enabled": False}
@@ -0,0 +1,144 @@
+"""Tests for the shared per-host HTTP client pool used by AI provider calls (ai_http.py)."""
+
+import functools
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+import pytest
+
+
+BACKEND_DIR = Path(__file__).parent.parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("PROVA_AI_TESTING", "1")
+os.environ.setdefault("PROVA_AI_DISABLE_LOCAL_LLM", "1")
+
+import ai_http  # noqa: E402
+from chat_service import ChatClient, ModelConfig, ProviderType  # noqa: E402
+
+
+class _OpenAIMock(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    conexoes = 0
+
+    def setup(self):
+        super().setup()
+        type(self).conexoes += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps({
+            "choices": [{"message": {"content": "ok"}}],
+            "usage": {"prompt_tokens": 3, "completion_tokens": 1, "total_tokens": 4},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def servidor():
+    _OpenAIMock.conexoes = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _OpenAIMock)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    ai_http.reset_stats()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1"
+    server.shutdown()
+    server.server_close()
+
+
+def _chat_client(base_url):
+    config = ModelConfig(id="m", nome="m", tipo=ProviderType.OPENAI, modelo="gpt-4o", base_url=base_url)
+    return ChatClient(config, "sk-test")
+
+
+def _mock_httpx(monkeypatch, handler):
+    real = httpx.AsyncClient
+    monkeypatch.setattr(ai_http.httpx, "AsyncClient", functools.partial(real, transport=httpx.MockTransport(handler)))
+
+
+async def test_sequential_stages_reuse_one_connection(servidor):
+    client = _chat_client(servidor)
+    try:
+        for _ in range(3):
+            assert (await client._chat_openai("oi", [], "sistema"))["tokens"] == 4
+        stats = ai_http.stats()["hosts"]["127.0.0.1"]
+    finally:
+        await ai_http.aclose()
+
+    assert _OpenAIMock.conexoes == 1
+    assert stats["requisicoes"] == 3 and stats["erros"] == 0
+    assert stats["conexoes_tcp"] == 1 and stats["requisicoes_por_conexao"] == 3
+    assert stats["conexoes_abertas"] == 1
+    assert stats["http_versions"] == {"HTTP/1.1": 3}
+
+
+async def test_leaving_the_context_keeps_the_client_and_aclose_closes_it(servidor):
+    abertos = ai_http.stats()["clientes_abertos"]
+    async with ai_http.cliente(timeout=120.0) as client:
+        await client.post(f"{servidor}/chat/completions", json={})
+    assert ai_http.stats()["clientes_abertos"] == abertos + 1
+
+    assert await ai_http.aclose() == 1
+    assert ai_http.stats()["clientes_abertos"] == abertos
+    async with ai_http.cliente() as client:
+        await client.post(f"{servidor}/chat/completions", json={})
+    await ai_http.aclose()
+    assert _OpenAIMock.conexoes == 2
+
+
+async def test_each_provider_host_gets_its_own_client(monkeypatch):
+    _mock_httpx(monkeypatch, lambda request: httpx.Response(200, json={}))
+    criados = ai_http.stats()["clientes_criados"]
+    try:
+        async with ai_http.cliente() as client:
+            await client.post("https://api.openai.com/v1/chat/completions", json={})
+            await client.post("https://api.anthropic.com/v1/messages", json={})
+            await client.post("https://api.openai.com/v1/responses", json={})
+        assert ai_http.stats()["clientes_criados"] - criados == 2
+    finally:
+        await ai_http.aclose()
+
+
+async def test_timeout_is_forwarded_only_when_it_differs_from_the_pool_default(monkeypatch):
+    timeouts = []
+
+    def handler(request):
+        timeouts.append(request.extensions["timeout"]["read"])
+        return httpx.Response(200, json={})
+
+    _mock_httpx(monkeypatch, handler)
+    try:
+        async with ai_http.cliente(timeout=ai_http._TIMEOUT_S) as client:
+            await client.post("https://api.openai.com/v1/chat/completions", json={})
+        async with ai_http.cliente(timeout=5.0) as client:
+            await client.post("https://api.openai.com/v1/chat/completions", json={})
+            await client.post("https://api.openai.com/v1/chat/completions", json={}, timeout=7.0)
+    finally:
+        await ai_http.aclose()
+
+    assert timeouts == [ai_http._TIMEOUT_S, 5.0, 7.0]
+
+
+def test_run_closes_the_clients_of_its_loop(servidor):
+    client = _chat_client(servidor)
+    antes = ai_http.stats()
+
+    ai_http.run(client._chat_openai("oi", [], "sistema"))
+    ai_http.run(client._chat_openai("oi", [], "sistema"))
+
+    depois = ai_http.stats()
+    assert depois["clientes_criados"] - antes["clientes_criados"] == 2  # one per loop
+    assert depois["clientes_fechados"] - antes["clientes_fechados"] == 2
+    assert depois["clientes_abertos"] == antes["clientes_abertos"]
@@ -34,7 +34,7 @@ async def test_anthropic_json_pipeline_prompt_uses_output_config(monkeypatch):
     from anexos import ClienteAPIMultimodal
 
     _FakeAsyncClient.captured_payloads.clear()
-    monkeypatch.setattr("anexos.httpx.AsyncClient", _FakeAsyncClient)
+    monkeypatch.setattr("ai_http.httpx.AsyncClient", _FakeAsyncClient)
 
     cliente = ClienteAPIMultimodal(
         {
@@ -75,7 +75,7 @@ async def test_anthropic_free_text_prompt_does_not_use_output_config(monkeypatch
     from anexos import ClienteAPIMultimodal
 
     _FakeAsyncClient.captured_payloads.clear()
-    monkeypatch.setattr("anexos.httpx.AsyncClient", _FakeAsyncClient)
+    monkeypatch.setattr("ai_http.httpx.AsyncClient", _FakeAsyncClient)
 
     cliente = ClienteAPIMultimodal(
         {
@@ -102,7 +102,7 @@ async def test_anthropic_unknown_json_prompt_does_not_use_generic_schema(monkeyp
     from anexos import ClienteAPIMultimodal
 
     _FakeAsyncClient.captured_payloads.clear()
-    monkeypatch.setattr("anexos.httpx.AsyncClient", _FakeAsyncClient)
+    monkeypatch.setattr("ai_http.httpx.AsyncClient", _FakeAsyncClient)
 
     cliente = ClienteAPIMultimodal(
         {
@@ -0,0 +1,119 @@
+"""Tests for AsyncStorageManager: storage I/O must not block the event loop."""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+
+BACKEND_DIR = Path(__file__).parent.parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("PROVA_AI_TESTING", "1")
+os.environ.setdefault("PROVA_AI_DISABLE_LOCAL_LLM", "1")
+
+
+def _make_storage(tmp_path: Path):
+    with patch("storage.SUPABASE_DB_AVAILABLE", False):
+        from storage import StorageManager
+
+        return StorageManager(base_path=str(tmp_path))
+
+
+@pytest.mark.asyncio
+async def test_facade_exposes_same_api_as_storage_manager(tmp_path):
+    from storage import AsyncStorageManager
+
+    sync = _make_storage(tmp_path)
+    astorage = AsyncStorageManager(sync)
+
+    materia = await astorage.criar_materia("Física")
+    materias = await astorage.listar_materias()
+
+    assert [m.id for m in materias] == [materia.id]
+    assert astorage.base_path == sync.base_path
+    assert astorage.use_postgresql is False
+
+
+@pytest.mark.asyncio
+async def test_facade_runs_calls_off_the_event_loop_thread():
+    from storage import AsyncStorageManager
+
+    loop_thread = threading.get_ident()
+    seen = {}
+
+    def _get_materia(materia_id):
+        seen["thread"] = threading.get_ident()
+        return materia_id
+
+    sync = MagicMock()
+    sync.get_materia.side_effect = _get_materia
+
+    result = await AsyncStorageManager(sync).get_materia("m1")
+
+    assert result == "m1"
+    assert seen["thread"] != loop_thread
+
+
+@pytest.mark.asyncio
+async def test_slow_storage_call_does_not_freeze_other_coroutines():
+    from storage import AsyncStorageManager
+
+    sync = MagicMock()
+    sync.listar_documentos.side_effect = lambda *_: time.sleep(0.3) or []
+    astorage = AsyncStorageManager(sync)
+
+    ticks = []
+
+    async def _heartbeat():
+        for _ in range(5):
+            ticks.append(time.perf_counter())
+            await asyncio.sleep(0.02)
+
+    await asyncio.gather(astorage.listar_documentos("a1"), _heartbeat())
+
+    gaps = [b - a for a, b in zip(ticks, ticks[1:])]
+    assert max(gaps) < 0.2
+
+
+@pytest.mark.asyncio
+async def test_resolver_is_evaluated_per_call():
+    from storage import AsyncStorageManager
+
+    first, second = MagicMock(), MagicMock()
+    first.get_aluno.return_value = "first"
+    second.get_aluno.return_value = "second"
+    current = {"storage": first}
+
+    astorage = AsyncStorageManager(resolver=lambda: current["storage"])
+    assert await astorage.get_aluno("x") == "first"
+
+    current["storage"] = second
+    assert await astorage.get_aluno("x") == "second"
+
+
+@pytest.mark.asyncio
+async def test_run_propagates_context_vars():
+    import contextvars
+
+    from storage import AsyncStorageManager
+
+    var = contextvars.ContextVar("var", default=None)
+    var.set("pipeline-run")
+
+    result = await AsyncStorageManager(MagicMock()).run(var.get)
+
+    assert result == "pipeline-run"
+
+
+def test_facade_requires_a_backend():
+    from storage import AsyncStorageManager
+
+    with pytest.raises(ValueError):
+        AsyncStorageManager()
@@ -0,0 +1,144 @@
+"""Tests for the bounded-concurrency batch runner (batch_runner.executar_em_lote)."""
+
+import asyncio
+import os
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+
+BACKEND_DIR = Path(__file__).parent.parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("PROVA_AI_TESTING", "1")
+os.environ.setdefault("PROVA_AI_DISABLE_LOCAL_LLM", "1")
+
+import routes_tasks  # noqa: E402
+from batch_runner import POLITICA_FALHA_RAPIDA, executar_em_lote, pipeline_sucesso  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    monkeypatch.setattr(routes_tasks, "task_registry", {})
+    return routes_tasks.task_registry
+
+
+async def test_concurrency_is_bounded_and_results_keep_input_order():
+    ativos = 0
+    pico = 0
+
+    async def executar(n):
+        nonlocal ativos, pico
+        ativos += 1
+        pico = max(pico, ativos)
+        await asyncio.sleep(0.01 * (5 - n))
+        ativos -= 1
+        return n * 10
+
+    itens = await executar_em_lote(list(range(5)), executar, concorrencia=2)
+
+    assert pico == 2
+    assert [i.chave for i in itens] == ["0", "1", "2", "3", "4"]
+    assert [i.resultado for i in itens] == [0, 10, 20, 30, 40]
+    assert all(i.sucesso for i in itens)
+
+
+async def test_continue_policy_records_exceptions_and_failed_results():
+    async def executar(n):
+        if n == 1:
+            raise RuntimeError("boom")
+        return {"sucesso": n != 2}
+
+    itens = await executar_em_lote([0, 1, 2, 3], executar, sucesso=lambda r: r["sucesso"])
+
+    assert [i.status for i in itens] == ["completed", "failed", "failed", "completed"]
+    assert str(itens[1].erro) == "boom"
+
+
+async def test_fail_fast_stops_scheduling_and_reports_progress_in_order():
+    task_id = routes_tasks.register_pipeline_task("pipeline_todos_os_alunos", "ativ", ["a", "b", "c", "d"])
+
+    async def executar(aluno):
+        await asyncio.sleep(0.01)
+        return aluno != "a"
+
+    itens = await executar_em_lote(
+        ["a", "b", "c", "d"], executar, sucesso=bool,
+        concorrencia=2, politica=POLITICA_FALHA_RAPIDA, task_id=task_id,
+    )
+
+    assert [i.status for i in itens] == ["failed", "completed", "cancelled", "cancelled"]
+    batch = routes_tasks.task_registry[task_id]["batch"]
+    assert batch["concurrency"] == 2 and batch["policy"] == POLITICA_FALHA_RAPIDA
+    assert [item["id"] for item in batch["items"]] == ["a", "b", "c", "d"]
+    assert batch["counts"] == {"pending": 0, "running": 0, "completed": 1, "failed": 1, "cancelled": 2}
+
+
+async def test_cancel_requested_stops_new_items():
+    task_id = routes_tasks.register_pipeline_task("pipeline_todos_os_alunos", "ativ", ["a", "b"])
+
+    async def executar(aluno):
+        routes_tasks.task_registry[task_id]["cancel_requested"] = True
+        return True
+
+    itens = await executar_em_lote(["a", "b"], executar, concorrencia=1, task_id=task_id)
+
+    assert [i.status for i in itens] == ["completed", "cancelled"]
+
+
+async def test_invalid_policy_is_rejected():
+    with pytest.raises(ValueError):
+        await executar_em_lote([1], AsyncMock(), politica="tanto_faz")
+
+
+def test_pipeline_sucesso():
+    assert pipeline_sucesso({"corrigir": SimpleNamespace(sucesso=True)})
+    assert not pipeline_sucesso({"corrigir": SimpleNamespace(sucesso=False)})
+    assert not pipeline_sucesso({"_pipeline_erro": {"sucesso": False}})
+
+
+async def test_todos_os_alunos_background_runs_students_concurrently(monkeypatch):
+    import executor as executor_module
+    import routes_prompts
+
+    aluno_ids = [f"a{i}" for i in range(4)]
+    task_id = routes_tasks.register_pipeline_task("pipeline_todos_os_alunos", "ativ", aluno_ids)
+    ativos = 0
+    pico = 0
+
+    async def pipeline(**kwargs):
+        nonlocal ativos, pico
+        ativos += 1
+        pico = max(pico, ativos)
+        await asyncio.sleep(0.01)
+        ativos -= 1
+        falhou = kwargs["aluno_id"] == "a0"
+        for stage in routes_tasks.PIPELINE_STAGES:
+            routes_tasks.update_stage_progress(
+                kwargs["task_id"], kwargs["aluno_id"], stage, "failed" if falhou else "completed",
+            )
+        if falhou:
+            return {"_pipeline_erro": {"sucesso": False}}
+        return {"gerar_relatorio": SimpleNamespace(sucesso=True)}
+
+    fake = MagicMock()
+    fake.prefetch_atividade = AsyncMock()
+    fake.executar_pipeline_completo = pipeline
+    monkeypatch.setattr(executor_module, "executor", fake)
+
+    await routes_prompts._executar_pipeline_todos_os_alunos_background(
+        task_id=task_id, aluno_ids=aluno_ids, atividade_id="ativ",
+        model_id="m", provider=None, providers_map={}, models_per_stage={},
+        source_document_ids={}, prompt_id=None, prompts_map=None, steps_list=None,
+        force_rerun=False, max_concorrencia=2, politica_falha=POLITICA_FALHA_RAPIDA,
+    )
+
+    task = routes_tasks.task_registry[task_id]
+    assert pico == 2
+    assert [item["status"] for item in task["batch"]["items"]] == ["failed", "completed", "cancelled", "cancelled"]
+    assert set(task["students"]["a3"]["stages"].values()) == {"skipped"}
+    assert task["status"] == "failed"
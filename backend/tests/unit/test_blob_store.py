@@ -0,0 +1,189 @@
+"""Tests for the content-addressed blob store behind salvar_documento."""
+
+import os
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+
+BACKEND_DIR = Path(__file__).parent.parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("PROVA_AI_TESTING", "1")
+os.environ.setdefault("PROVA_AI_DISABLE_LOCAL_LLM", "1")
+
+from blob_store import BlobStore, sha256_file  # noqa: E402
+from models import TipoDocumento  # noqa: E402
+
+
+def _make_storage(tmp_path: Path):
+    with patch("storage.SUPABASE_DB_AVAILABLE", False), \
+         patch("storage.SUPABASE_STORAGE_AVAILABLE", False):
+        from storage import StorageManager
+
+        return StorageManager(base_path=str(tmp_path / "data"))
+
+
+@pytest.fixture
+def env(tmp_path):
+    storage = _make_storage(tmp_path)
+    materia = storage.criar_materia("Matemática")
+    turma = storage.criar_turma(materia.id, "9A")
+    atividades = [storage.criar_atividade(turma.id, f"Prova {i}") for i in (1, 2)]
+    gabarito = tmp_path / "gabarito.pdf"
+    gabarito.write_bytes(b"%PDF-1.4 gabarito" * 100)
+    return storage, atividades, gabarito
+
+
+def test_put_is_idempotent_and_materialize_hardlinks(tmp_path):
+    store = BlobStore(tmp_path / "blobs")
+    origem = tmp_path / "a.json"
+    origem.write_text('{"nota": 10}', encoding="utf-8")
+
+    digest, blob, novo = store.put(origem)
+    _, _, de_novo = store.put(origem)
+    destino = tmp_path / "docs" / "a.json"
+    modo = store.materialize(digest, destino)
+
+    assert digest == sha256_file(origem)
+    assert (novo, de_novo) == (True, False)
+    assert destino.read_text(encoding="utf-8") == '{"nota": 10}'
+    assert modo == "hardlink"
+    assert os.path.samefile(blob, destino)
+    assert store.stats()["dedup_hits"] == 1
+
+
+def test_same_content_is_stored_once(env):
+    storage, atividades, gabarito = env
+
+    docs = [
+        storage.salvar_documento(str(gabarito), TipoDocumento.GABARITO, atividade.id)
+        for atividade in atividades
+    ]
+
+    assert docs[0].content_hash == docs[1].content_hash == sha256_file(gabarito)
+    assert storage.get_documento(docs[0].id).content_hash == docs[0].content_hash
+    caminhos = [storage.base_path / d.caminho_arquivo for d in docs]
+    assert caminhos[0] != caminhos[1]
+    assert os.path.samefile(caminhos[0], caminhos[1])
+    assert len(list(storage.blobs.iter_blobs())) == 1
+
+
+def test_remote_upload_is_skipped_for_known_content(env, monkeypatch):
+    import storage as storage_module
+
+    storage, atividades, gabarito = env
+    fake_remote = MagicMock()
+    fake_remote.upload.return_value = (True, "ok")
+    monkeypatch.setattr(storage_module, "SUPABASE_STORAGE_AVAILABLE", True)
+    monkeypatch.setattr(storage_module, "supabase_storage", fake_remote)
+
+    primeiro = storage.salvar_documento(str(gabarito), TipoDocumento.GABARITO, atividades[0].id)
+    segundo = storage.salvar_documento(str(gabarito), TipoDocumento.GABARITO, atividades[1].id)
+
+    assert fake_remote.upload.call_count == 1
+    assert storage.get_blob_stats()["remote"]["uploads_skipped"] == 1
+    assert storage.caminhos_remotos_documento(segundo) == [
+        segundo.caminho_arquivo,
+        primeiro.caminho_arquivo,
+    ]
+
+    # Apagar o documento dono do caminho não apaga o conteúdo que o outro usa
+    storage.deletar_documento(primeiro.id)
+    fake_remote.delete.assert_not_called()
+
+
+def test_resolver_relinks_missing_file_from_local_blob(env):
+    storage, atividades, gabarito = env
+    doc = storage.salvar_documento(str(gabarito), TipoDocumento.GABARITO, atividades[0].id)
+    local = storage.base_path / doc.caminho_arquivo
+    local.unlink()
+
+    resolvido = storage.resolver_caminho_documento(doc)
+
+    assert resolvido == local
+    assert local.read_bytes() == gabarito.read_bytes()
+
+
+def test_gc_removes_only_unreferenced_blobs(env):
+    storage, atividades, gabarito = env
+    outro = gabarito.parent / "enunciado.pdf"
+    outro.write_bytes(b"%PDF-1.4 enunciado")
+    mantido = storage.salvar_documento(str(gabarito), TipoDocumento.GABARITO, atividades[0].id)
+    apagado = storage.salvar_documento(str(outro), TipoDocumento.ENUNCIADO, atividades[0].id)
+    storage.deletar_documento(apagado.id)
+
+    simulacao = storage.coletar_blobs_orfaos(dry_run=True, grace_seconds=0)
+    assert simulacao["locais_removidos"] == [apagado.content_hash]
+    assert storage.blobs.exists(apagado.content_hash)
+
+    resultado = storage.coletar_blobs_orfaos(dry_run=False, grace_seconds=0)
+    assert resultado["locais_removidos"] == [apagado.content_hash]
+    assert resultado["bytes_liberados"] == outro.stat().st_size
+    assert not storage.blobs.exists(apagado.content_hash)
+    assert storage.blobs.exists(mantido.content_hash)
+
+    # Blob recém-criado fica protegido pelo período de carência
+    storage.deletar_documento(mantido.id)
+    assert storage.coletar_blobs_orfaos(dry_run=False)["locais_removidos"] == []
+
+
+def test_redownloading_one_document_does_not_touch_the_shared_blob(env, monkeypatch):
+    import storage as storage_module
+
+    storage, atividades, gabarito = env
+    original = gabarito.read_bytes()
+    docs = [
+        storage.salvar_documento(str(gabarito), TipoDocumento.GABARITO, atividade.id)
+        for atividade in atividades
+    ]
+    caminhos = [storage.base_path / d.caminho_arquivo for d in docs]
+    assert os.path.samefile(caminhos[0], caminhos[1])
+
+    def download_truncado(remoto, destino):
+        with open(destino, "wb") as f:  # como o supabase_storage grava
+            f.write(b"%PDF-1.4 trunc")
+        return True, "ok"
+
+    remote = MagicMock(enabled=True)
+    remote.download.side_effect = download_truncado
+    monkeypatch.setattr(storage_module, "SUPABASE_AVAILABLE", True)
+    monkeypatch.setattr(storage_module, "supabase_storage", remote)
+
+    storage.resolver_caminho_documento(docs[0], force_remote=True)
+
+    assert remote.download.called
+    assert caminhos[1].read_bytes() == original
+    assert storage.blobs.path_for(docs[1].content_hash).read_bytes() == original
+
+
+def test_supabase_download_replaces_a_hardlinked_path_instead_of_truncating_it(tmp_path, monkeypatch):
+    import functools
+
+    import httpx
+
+    import supabase_storage as supabase_storage_module
+
+    store = BlobStore(tmp_path / "blobs")
+    origem = tmp_path / "gabarito.pdf"
+    origem.write_bytes(b"%PDF-1.4 original")
+    digest, blob, _ = store.put(origem)
+    destino = tmp_path / "docs" / "gabarito.pdf"
+    store.materialize(digest, destino)
+
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, content=b"%PDF-1.4 nova versao"))
+    monkeypatch.setattr(supabase_storage_module.httpx, "Client", functools.partial(httpx.Client, transport=transport))
+    monkeypatch.setenv("SUPABASE_URL", "https://exemplo.supabase.co")
+    monkeypatch.setenv("SUPABASE_SERVICE_KEY", "chave")
+    cliente = supabase_storage_module.SupabaseStorage()
+
+    ok, _ = cliente.download("arquivos/gabarito.pdf", str(destino))
+
+    assert ok
+    assert destino.read_bytes() == b"%PDF-1.4 nova versao"
+    assert blob.read_bytes() == b"%PDF-1.4 original"
+    assert not os.path.samefile(blob, destino)
+    assert list(destino.parent.glob("*.part")) == []
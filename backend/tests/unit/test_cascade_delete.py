@@ -0,0 +1,200 @@
+"""Tests for set-based cascade deletes (excluir_em_cascata)."""
+
+import os
+import sqlite3
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+
+BACKEND_DIR = Path(__file__).parent.parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("PROVA_AI_TESTING", "1")
+os.environ.setdefault("PROVA_AI_DISABLE_LOCAL_LLM", "1")
+
+from models import TipoDocumento  # noqa: E402
+
+
+@pytest.fixture
+def arvore(tmp_path):
+    import storage as storage_module
+
+    with patch("storage.SUPABASE_DB_AVAILABLE", False), \
+         patch("storage.SUPABASE_STORAGE_AVAILABLE", False):
+        storage = storage_module.StorageManager(base_path=str(tmp_path / "data"))
+    materia = storage.criar_materia("Matemática")
+    turma = storage.criar_turma(materia.id, "9A")
+    atividade = storage.criar_atividade(turma.id, "Prova 1")
+    aluno = storage.criar_aluno("Ana")
+    storage.vincular_aluno_turma(aluno.id, turma.id)
+
+    docs = []
+    for i, (tipo, aluno_id) in enumerate([
+        (TipoDocumento.ENUNCIADO, None),
+        (TipoDocumento.PROVA_RESPONDIDA, aluno.id),
+        (TipoDocumento.CORRECAO, aluno.id),
+    ]):
+        arquivo = tmp_path / f"doc-{i}.pdf"
+        arquivo.write_bytes(f"%PDF-1.4 {i}".encode())
+        docs.append(storage.salvar_documento(str(arquivo), tipo, atividade.id, aluno_id=aluno_id))
+
+    yield storage, materia, turma, atividade, aluno, docs
+    storage.close()
+
+
+def _contar(storage, tabela):
+    conn = storage._get_connection()
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {tabela}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_dry_run_counts_without_deleting(arvore):
+    storage, materia, _, _, _, docs = arvore
+
+    relatorio = storage.excluir_em_cascata("materia", materia.id, dry_run=True)
+
+    assert relatorio["encontrado"]
+    assert relatorio["linhas"] == {
+        "documentos": 3, "resultados": 0, "alunos_turmas": 1,
+        "atividades": 1, "turmas": 1, "materias": 1,
+    }
+    assert relatorio["arquivos_locais"] == 3
+    assert _contar(storage, "documentos") == 3
+    assert all(storage.resolver_caminho_documento(doc).exists() for doc in docs)
+
+
+def test_deletar_materia_removes_whole_subtree_and_files(arvore):
+    storage, materia, turma, atividade, aluno, docs = arvore
+    caminhos = [storage.resolver_caminho_documento(doc) for doc in docs]
+
+    assert storage.deletar_materia(materia.id)
+
+    for tabela in ("materias", "turmas", "atividades", "alunos_turmas", "documentos"):
+        assert _contar(storage, tabela) == 0, tabela
+    assert storage.get_aluno(aluno.id) is not None
+    assert not any(caminho.exists() for caminho in caminhos)
+    assert storage.get_arvore_navegacao_fast() == {"materias": []}
+    assert not storage.deletar_materia(materia.id)
+
+
+def test_failed_cascade_rolls_back_everything(arvore):
+    storage, materia, *_ = arvore
+    conn = storage._get_connection()
+    conn.execute(
+        "CREATE TRIGGER bloquear_turmas BEFORE DELETE ON turmas "
+        "BEGIN SELECT RAISE(ABORT, 'bloqueado'); END"
+    )
+    conn.commit()
+    conn.close()
+
+    with pytest.raises(sqlite3.IntegrityError):
+        storage.deletar_materia(materia.id)
+
+    assert _contar(storage, "documentos") == 3
+    assert _contar(storage, "atividades") == 1
+
+
+def test_remote_files_are_removed_in_one_batch(arvore, monkeypatch):
+    import storage as storage_module
+
+    storage, _, _, atividade, aluno, docs = arvore
+    remote = MagicMock()
+    remote.delete_many.return_value = (2, [])
+    monkeypatch.setattr(storage_module, "SUPABASE_STORAGE_AVAILABLE", True)
+    monkeypatch.setattr(storage_module, "supabase_storage", remote)
+
+    assert storage.deletar_documentos_aluno_atividade(atividade.id, aluno.id) == 2
+
+    remote.delete_many.assert_called_once()
+    enviados = sorted(remote.delete_many.call_args.args[0])
+    assert enviados == sorted(doc.caminho_arquivo.replace("\\", "/") for doc in docs[1:])
+    remote.delete.assert_not_called()
+    assert _contar(storage, "documentos") == 1
+
+
+def test_postgres_deletes_only_the_root_row(arvore, monkeypatch):
+    import storage as storage_module
+
+    storage, materia, *_ = arvore
+    fake_db = MagicMock()
+    fake_db.select.side_effect = lambda table, **kwargs: {
+        "turmas": [{"id": "t1"}, {"id": "t2"}],
+        "atividades": [{"id": "a1"}],
+        "documentos": [],
+    }[table]
+    fake_db.delete_where.return_value = 1
+    fake_db.count.return_value = 4
+    monkeypatch.setattr(storage_module, "supabase_db", fake_db)
+    monkeypatch.setattr(storage, "use_postgresql", True)
+
+    relatorio = storage.excluir_em_cascata("materia", materia.id, dry_run=True)
+    assert relatorio["linhas"]["documentos"] == 4
+    fake_db.delete_where.assert_not_called()
+    assert ("documentos", {"atividade_id": ["a1"]}) in [c.args for c in fake_db.count.call_args_list]
+
+    assert storage.deletar_materia(materia.id)
+    fake_db.delete_where.assert_called_once_with("materias", {"id": materia.id})
+
+
+def test_postgres_aluno_delete_is_one_rpc_with_an_idempotent_fallback(arvore, monkeypatch):
+    import storage as storage_module
+
+    storage, *_, aluno, _ = arvore
+    fake_db = MagicMock()
+    fake_db.select.return_value = []
+    fake_db.rpc.return_value = {"documentos": 2, "alunos": 1}
+    monkeypatch.setattr(storage_module, "supabase_db", fake_db)
+    monkeypatch.setattr(storage, "use_postgresql", True)
+
+    relatorio = storage.excluir_em_cascata("aluno", aluno.id)
+    fake_db.rpc.assert_called_once_with("excluir_aluno_cascata", {"p_aluno_id": aluno.id})
+    fake_db.delete_where.assert_not_called()
+    assert relatorio["encontrado"] and relatorio["linhas"] == {"documentos": 2, "alunos": 1}
+
+    # Without migration 008: documentos first, then the root delete is retried until the aluno is gone
+    fake_db.rpc.return_value = None
+    fake_db.delete_where.side_effect = lambda table, filters: {"documentos": [2], "alunos": raiz}[table].pop(0)
+    raiz = [0, 1]
+    fake_db.select_one.return_value = {"id": aluno.id}
+    monkeypatch.setattr(storage_module.time, "sleep", lambda s: None)
+
+    relatorio = storage.excluir_em_cascata("aluno", aluno.id)
+    assert [c.args[0] for c in fake_db.delete_where.call_args_list] == ["documentos", "alunos", "alunos"]
+    assert relatorio["encontrado"] and relatorio["linhas"] == {"documentos": 2, "alunos": 1}
+
+
+def test_postgres_failed_root_delete_keeps_files(arvore, monkeypatch):
+    import storage as storage_module
+
+    storage, materia, _, atividade, _, docs = arvore
+    fake_db = MagicMock()
+    fake_db.select.side_effect = lambda table, **kwargs: {
+        "turmas": [{"id": "t1"}],
+        "atividades": [{"id": atividade.id}],
+        "documentos": [
+            {"id": doc.id, "atividade_id": doc.atividade_id, "aluno_id": doc.aluno_id,
+             "tipo": doc.tipo.value, "caminho_arquivo": doc.caminho_arquivo, "content_hash": None}
+            for doc in docs
+        ],
+    }[table]
+    fake_db.delete_where.return_value = 0  # erro transitório engolido pelo delete_where
+    remote = MagicMock()
+    monkeypatch.setattr(storage_module, "supabase_db", fake_db)
+    monkeypatch.setattr(storage_module, "SUPABASE_STORAGE_AVAILABLE", True)
+    monkeypatch.setattr(storage_module, "supabase_storage", remote)
+    monkeypatch.setattr(storage, "use_postgresql", True)
+
+    relatorio = storage.excluir_em_cascata("materia", materia.id)
+
+    assert not relatorio["encontrado"]
+    assert relatorio["linhas"] == {"documentos": 0, "materias": 0}
+    assert (relatorio["arquivos_locais"], relatorio["arquivos_remotos"]) == (0, 0)
+    remote.delete_many.assert_not_called()
+    for doc in docs:
+        assert (storage.base_path / doc.caminho_arquivo).exists()
@@ -0,0 +1,112 @@
+"""Tests for the DocumentoLeve listing projection."""
+
+import json
+import os
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+
+BACKEND_DIR = Path(__file__).parent.parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("PROVA_AI_TESTING", "1")
+os.environ.setdefault("PROVA_AI_DISABLE_LOCAL_LLM", "1")
+
+from models import Documento, DocumentoLeve, StatusProcessamento, TipoDocumento  # noqa: E402
+
+
+def _row(**overrides):
+    row = {
+        "id": "doc-1",
+        "tipo": "correcao",
+        "atividade_id": "ativ-1",
+        "aluno_id": "aluno-1",
+        "display_name": "Correção - Ana",
+        "nome_arquivo": "correcao.json",
+        "caminho_arquivo": "arquivos/m/t/a/correcao.json",
+        "extensao": ".json",
+        "tamanho_bytes": 42,
+        "ia_provider": "openai",
+        "ia_modelo": "gpt-5-nano",
+        "prompt_usado": "p1",
+        "prompt_versao": None,
+        "tokens_usados": 30,
+        "tempo_processamento_ms": 12.5,
+        "status": "concluido",
+        "criado_em": "2026-03-14T12:00:00",
+        "atualizado_em": "2026-03-14T12:05:00",
+        "criado_por": None,
+        "versao": 1,
+        "documento_origem_id": None,
+        "metadata": json.dumps({"tokens_entrada": 20, "tokens_saida": 10}),
+        "content_hash": "abc",
+    }
+    row.update(overrides)
+    return row
+
+
+def test_to_dict_matches_the_full_model():
+    row = _row()
+
+    assert DocumentoLeve(row).to_dict() == Documento.from_dict(row).to_dict()
+
+
+def test_sqlite_timestamps_and_defaults_are_normalized():
+    leve = DocumentoLeve(_row(criado_em="2026-03-14 12:00:00", metadata=None, status=None, tamanho_bytes=None))
+
+    assert leve.criado_em == "2026-03-14T12:00:00"
+    assert leve.metadata == {}
+    assert leve.status == StatusProcessamento.CONCLUIDO
+    assert leve.tamanho_bytes == 0
+    assert leve.tipo == TipoDocumento.CORRECAO
+    assert not hasattr(leve, "__dict__")
+    assert leve.to_documento().criado_em.isoformat() == "2026-03-14T12:00:00"
+
+
+def test_postgres_timestamps_match_the_full_model():
+    for criado_em in (
+        "2024-01-01T10:00:00.12+00:00",
+        "2024-01-01T10:00:00.000000+00:00",
+        "2024-01-01T10:00:00.123456+00:00",
+        "2024-01-01T10:00:00+00:00",
+        "2024-01-01 10:00:00.5",
+    ):
+        row = _row(criado_em=criado_em, atualizado_em=criado_em)
+        assert DocumentoLeve(row).to_dict() == Documento.from_dict(row).to_dict(), criado_em
+
+    assert DocumentoLeve(_row(criado_em="2024-01-01T10:00:00.12+00:00")).criado_em == \
+        "2024-01-01T10:00:00.120000+00:00"
+
+
+def test_listings_and_cost_summary_use_the_projection(tmp_path):
+    import storage as storage_module
+    from cost_tracking import build_cost_summary
+
+    with patch("storage.SUPABASE_DB_AVAILABLE", False), \
+         patch("storage.SUPABASE_STORAGE_AVAILABLE", False):
+        storage = storage_module.StorageManager(base_path=str(tmp_path / "data"))
+    materia = storage.criar_materia("Matemática")
+    turma = storage.criar_turma(materia.id, "9A")
+    atividade = storage.criar_atividade(turma.id, "Prova 1")
+    arquivo = tmp_path / "gabarito.json"
+    arquivo.write_text("{}", encoding="utf-8")
+    doc = storage.salvar_documento(
+        str(arquivo), TipoDocumento.GABARITO, atividade.id,
+        ia_provider="openai", ia_modelo="gpt-5-nano", tokens_usados=30,
+        metadata={"tokens_entrada": 20, "tokens_saida": 10},
+    )
+
+    pagina = storage.listar_documentos_pagina(atividade.id, leve=True)
+    assert [type(d) for d in pagina["documentos"]] == [DocumentoLeve]
+    assert pagina["documentos"][0].to_dict() == storage.get_documento(doc.id).to_dict()
+
+    with patch("cost_tracking.storage", storage), \
+         patch("cost_tracking.token_usage_store.list_records", return_value=[]):
+        leve = build_cost_summary(limit=10)
+    completo = build_cost_summary(documentos=storage.listar_todos_documentos(limit=10), token_usage_records=[])
+    assert leve["documentos_analisados"] == 1
+    assert leve["custo_usd"] == completo["custo_usd"]
+    assert leve["amostras"] == completo["amostras"]
+    storage.close()
@@ -0,0 +1,106 @@
+"""Tests for the atomic atualizar_documento_processamento metadata patch."""
+
+import os
+import sys
+import threading
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+
+BACKEND_DIR = Path(__file__).parent.parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("PROVA_AI_TESTING", "1")
+os.environ.setdefault("PROVA_AI_DISABLE_LOCAL_LLM", "1")
+
+from models import StatusProcessamento, TipoDocumento  # noqa: E402
+
+
+def _storage_com_documento(tmp_path):
+    import storage as storage_module
+
+    with patch("storage.SUPABASE_DB_AVAILABLE", False), \
+         patch("storage.SUPABASE_STORAGE_AVAILABLE", False):
+        storage = storage_module.StorageManager(base_path=str(tmp_path / "data"))
+    materia = storage.criar_materia("Matemática")
+    turma = storage.criar_turma(materia.id, "9A")
+    atividade = storage.criar_atividade(turma.id, "Prova 1")
+    arquivo = tmp_path / "gabarito.json"
+    arquivo.write_text("{}", encoding="utf-8")
+    doc = storage.salvar_documento(
+        str(arquivo), TipoDocumento.GABARITO, atividade.id,
+        metadata={"cost_run_id": "run-1", "nested": {"a": 1}},
+    )
+    return storage, doc
+
+
+def test_concurrent_patches_do_not_clobber_each_other(tmp_path):
+    storage, doc = _storage_com_documento(tmp_path)
+    barreira = threading.Barrier(8)
+
+    def _patch(i):
+        barreira.wait()
+        storage.atualizar_documento_processamento(doc.id, metadata_patch={f"etapa_{i}": i})
+
+    threads = [threading.Thread(target=_patch, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    metadata = storage.get_documento(doc.id).metadata
+    assert {f"etapa_{i}" for i in range(8)} <= set(metadata)
+    assert metadata["cost_run_id"] == "run-1"
+    storage.close()
+
+
+def test_patch_replaces_top_level_keys_like_jsonb_concat(tmp_path):
+    storage, doc = _storage_com_documento(tmp_path)
+
+    updated = storage.atualizar_documento_processamento(
+        doc.id,
+        status=StatusProcessamento.ERRO,
+        metadata_patch={"nested": {"b": 2}, "erro_pipeline": None},
+    )
+
+    assert updated.status == StatusProcessamento.ERRO
+    assert updated.metadata["nested"] == {"b": 2}
+    assert "erro_pipeline" in updated.metadata and updated.metadata["erro_pipeline"] is None
+    assert storage.atualizar_documento_processamento("nao-existe", metadata_patch={"x": 1}) is None
+    storage.close()
+
+
+def test_postgres_patch_is_a_single_rpc(tmp_path, monkeypatch):
+    import storage as storage_module
+
+    storage, doc = _storage_com_documento(tmp_path)
+    row = {**doc.to_dict(), "status": "erro", "metadata": {"cost_run_id": "run-1", "tokens_entrada": 5}}
+    fake_db = MagicMock()
+    fake_db.rpc.return_value = [row]
+    monkeypatch.setattr(storage_module, "supabase_db", fake_db)
+    monkeypatch.setattr(storage, "use_postgresql", True)
+
+    updated = storage.atualizar_documento_processamento(
+        doc.id, tokens_usados=7, status=StatusProcessamento.ERRO, metadata_patch={"tokens_entrada": 5},
+    )
+
+    fake_db.rpc.assert_called_once_with("documento_patch", {
+        "p_id": doc.id,
+        "p_campos": {"tokens_usados": 7, "status": "erro"},
+        "p_metadata": {"tokens_entrada": 5},
+    })
+    fake_db.select_one.assert_not_called()
+    fake_db.update.assert_not_called()
+    assert updated.metadata["tokens_entrada"] == 5
+
+    # Migration 006 ausente: read-modify-write
+    fake_db.rpc.return_value = None
+    fake_db.select_one.return_value = {**doc.to_dict(), "metadata": {"cost_run_id": "run-1"}}
+    fake_db.update.return_value = row
+
+    storage.atualizar_documento_processamento(doc.id, metadata_patch={"tokens_entrada": 5})
+
+    dados = fake_db.update.call_args.args[2]
+    assert dados["metadata"] == {"cost_run_id": "run-1", "tokens_entrada": 5}
+    storage.close()
@@ -0,0 +1,139 @@
+"""Tests for the documentos composite indexes and the documentos_atuais view."""
+
+import os
+import sqlite3
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+
+BACKEND_DIR = Path(__file__).parent.parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("PROVA_AI_TESTING", "1")
+os.environ.setdefault("PROVA_AI_DISABLE_LOCAL_LLM", "1")
+
+from models import TipoDocumento  # noqa: E402
+
+
+def _make_storage(tmp_path: Path):
+    with patch("storage.SUPABASE_DB_AVAILABLE", False):
+        from storage import StorageManager
+
+        return StorageManager(base_path=str(tmp_path))
+
+
+def _insert_documento(db_path: Path, documento_id: str, tipo: str, criado_em: str,
+                      aluno_id: str = None, extensao: str = ".json",
+                      status: str = "concluido") -> None:
+    conn = sqlite3.connect(str(db_path))
+    conn.execute(
+        """
+        INSERT INTO documentos (
+            id, tipo, atividade_id, aluno_id, display_name, nome_arquivo, caminho_arquivo,
+            extensao, tamanho_bytes, status, criado_em, atualizado_em, criado_por, versao, metadata
+        )
+        VALUES (?, ?, 'ativ-1', ?, '', ?, '', ?, 100, ?, ?, ?, 'teste', 1, '{}')
+        """,
+        (documento_id, tipo, aluno_id, f"{documento_id}{extensao}", extensao,
+         status, criado_em, criado_em),
+    )
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def versioned_storage(tmp_path):
+    storage = _make_storage(tmp_path)
+    db = tmp_path / "database.db"
+
+    _insert_documento(db, "enun-v1", "enunciado", "2026-03-01T09:00:00", extensao=".pdf")
+    _insert_documento(db, "enun-v2", "enunciado", "2026-03-02T09:00:00", extensao=".pdf")
+
+    # aluno-1: duas execuções concluídas (JSON + PDF) e um retry com erro
+    _insert_documento(db, "corr-1-old-json", "correcao", "2026-03-03T10:00:00", "aluno-1")
+    _insert_documento(db, "corr-1-old-pdf", "correcao", "2026-03-03T10:00:01", "aluno-1", ".pdf")
+    _insert_documento(db, "corr-1-new-json", "correcao", "2026-03-04T10:00:00", "aluno-1")
+    _insert_documento(db, "corr-1-new-pdf", "correcao", "2026-03-04T10:00:01", "aluno-1", ".pdf")
+    _insert_documento(db, "corr-1-retry", "correcao", "2026-03-05T10:00:00", "aluno-1",
+                      status="erro")
+
+    _insert_documento(db, "corr-2-json", "correcao", "2026-03-04T11:00:00", "aluno-2")
+    return storage
+
+
+def test_latest_version_per_artifact(versioned_storage):
+    docs = versioned_storage.listar_documentos_atuais("ativ-1", "aluno-1")
+
+    # Cada extensão é escolhida por si: o retry com erro gravou só o JSON,
+    # então o PDF que volta é o da execução anterior (não formam um par)
+    assert [d.id for d in docs] == [
+        "corr-1-retry",
+        "corr-1-new-pdf",
+        "enun-v2",
+    ]
+
+
+def test_status_filter_returns_latest_version_in_that_status(versioned_storage):
+    docs = versioned_storage.listar_documentos_atuais(
+        "ativ-1", "aluno-1", tipo=TipoDocumento.CORRECAO, status="concluido",
+    )
+
+    assert [d.id for d in docs] == ["corr-1-new-pdf", "corr-1-new-json"]
+
+
+def test_aluno_list_fetches_many_students_without_base_docs(versioned_storage):
+    docs = versioned_storage.listar_documentos_atuais(
+        "ativ-1", ["aluno-1", "aluno-2"], status="concluido",
+    )
+
+    assert {d.id for d in docs} == {"corr-1-new-pdf", "corr-1-new-json", "corr-2-json"}
+
+
+def test_composite_indexes_are_used(versioned_storage):
+    conn = versioned_storage._get_connection()
+    try:
+        indexes = {
+            row[0]
+            for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'documentos'"
+            )
+        }
+        plan = " ".join(
+            str(row[3])
+            for row in conn.execute(
+                "EXPLAIN QUERY PLAN SELECT * FROM documentos "
+                "WHERE atividade_id = ? AND aluno_id = ? AND tipo = ? ORDER BY criado_em DESC",
+                ("ativ-1", "aluno-1", "correcao"),
+            )
+        )
+    finally:
+        conn.close()
+
+    assert "idx_documentos_ativ_aluno_tipo_criado" in indexes
+    assert "idx_documentos_ativ_tipo_status_criado" in indexes
+    assert "idx_documentos_ativ_aluno_tipo_criado" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_postgresql_without_view_falls_back_to_documentos(versioned_storage, monkeypatch):
+    import storage as storage_module
+
+    rows = versioned_storage._select_rows("documentos", filters={"aluno_id": "aluno-1"})
+    tables = []
+
+    def fake_select_rows(table, filters=None, **kwargs):
+        tables.append(table)
+        return rows if filters.get("aluno_id") == "aluno-1" else []
+
+    monkeypatch.setattr(versioned_storage, "use_postgresql", True)
+    monkeypatch.setattr(versioned_storage, "_select_rows", fake_select_rows)
+    monkeypatch.setattr(storage_module.supabase_db, "relation_available", lambda name: False)
+
+    docs = versioned_storage.listar_documentos_atuais("ativ-1", "aluno-1")
+
+    assert set(tables) == {"documentos"}
+    assert [d.id for d in docs] == ["corr-1-retry", "corr-1-new-pdf"]
@@ -0,0 +1,141 @@
+"""Tests for the StorageManager entity cache (LRU + TTL, invalidation, stats)."""
+
+import os
+import sys
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+
+BACKEND_DIR = Path(__file__).parent.parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("PROVA_AI_TESTING", "1")
+os.environ.setdefault("PROVA_AI_DISABLE_LOCAL_LLM", "1")
+
+from entity_cache import EntityCache  # noqa: E402
+
+
+def _make_storage(tmp_path: Path):
+    with patch("storage.SUPABASE_DB_AVAILABLE", False):
+        from storage import StorageManager
+
+        return StorageManager(base_path=str(tmp_path))
+
+
+def test_lru_evicts_least_recently_used():
+    cache = EntityCache(max_entries=2, ttl_seconds=60)
+    cache.put("materias", "a", {"id": "a"})
+    cache.put("materias", "b", {"id": "b"})
+    cache.get("materias", "a")
+    cache.put("materias", "c", {"id": "c"})
+
+    assert cache.get("materias", "b") is None
+    assert cache.get("materias", "a") == {"id": "a"}
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl():
+    cache = EntityCache(max_entries=10, ttl_seconds=0.05)
+    cache.put("turmas", "t1", {"id": "t1"})
+    time.sleep(0.08)
+
+    assert cache.get("turmas", "t1") is None
+
+
+def test_hits_return_independent_copies():
+    cache = EntityCache(max_entries=10, ttl_seconds=60)
+    cache.put("atividades", "x", {"id": "x", "metadata": {"k": 1}})
+
+    cache.get("atividades", "x")["metadata"]["k"] = 99
+
+    assert cache.get("atividades", "x")["metadata"] == {"k": 1}
+
+
+def test_put_after_invalidation_is_discarded():
+    cache = EntityCache(max_entries=10, ttl_seconds=60)
+    generation = cache.generation
+    cache.invalidate("alunos", "a1")
+    cache.put("alunos", "a1", {"id": "a1", "nome": "velho"}, generation=generation)
+
+    assert cache.get("alunos", "a1") is None
+
+
+def test_repeated_lookups_hit_the_cache(tmp_path):
+    storage = _make_storage(tmp_path)
+    materia = storage.criar_materia("Matemática")
+    turma = storage.criar_turma(materia.id, "9A")
+    atividade = storage.criar_atividade(turma.id, "Prova 1")
+    storage.clear_entity_cache(reset_stats=True)
+
+    for _ in range(5):
+        ativ = storage.get_atividade(atividade.id)
+        storage.get_materia(storage.get_turma(ativ.turma_id).materia_id)
+
+    stats = storage.get_entity_cache_stats()
+    assert stats["misses"] == 3
+    assert stats["hits"] == 12
+    assert stats["by_table"]["atividades"] == {"hits": 4, "misses": 1}
+
+
+def test_supabase_round_trips_drop_to_one_per_entity(tmp_path, monkeypatch):
+    import storage as storage_module
+
+    storage = _make_storage(tmp_path)
+    calls = []
+
+    def fake_select_one(table, entity_id, columns=None):
+        calls.append((table, entity_id))
+        return {"id": entity_id, "nome": "Física"}
+
+    monkeypatch.setattr(storage, "use_postgresql", True)
+    monkeypatch.setattr(storage_module.supabase_db, "select_one", fake_select_one)
+
+    for _ in range(10):
+        assert storage.get_materia("m1").nome == "Física"
+
+    assert calls == [("materias", "m1")]
+
+
+def test_update_and_delete_invalidate(tmp_path):
+    storage = _make_storage(tmp_path)
+    materia = storage.criar_materia("Química")
+    turma = storage.criar_turma(materia.id, "9B")
+    aluno = storage.criar_aluno("Ana")
+
+    assert storage.get_materia(materia.id).nome == "Química"
+    storage.atualizar_materia(materia.id, nome="Química Orgânica")
+    assert storage.get_materia(materia.id).nome == "Química Orgânica"
+
+    assert storage.get_aluno(aluno.id).nome == "Ana"
+    storage.atualizar_aluno(aluno.id, nome="Ana Maria")
+    assert storage.get_aluno(aluno.id).nome == "Ana Maria"
+
+    assert storage.get_turma(turma.id) is not None
+    storage.deletar_turma(turma.id)
+    assert storage.get_turma(turma.id) is None
+
+    storage.deletar_aluno(aluno.id)
+    assert storage.get_aluno(aluno.id) is None
+
+
+@pytest.mark.asyncio
+async def test_debug_endpoint_exposes_stats(tmp_path):
+    import main_v2
+
+    storage = _make_storage(tmp_path)
+    materia = storage.criar_materia("História")
+    storage.get_materia(materia.id)
+    storage.get_materia(materia.id)
+
+    with patch("main_v2.storage", storage):
+        result = await main_v2.debug_storage_cache()
+        cleared = await main_v2.debug_storage_cache_clear(reset_stats=True)
+
+    assert result["backend"] == "sqlite"
+    assert result["entity_cache"]["hits"] >= 1
+    assert cleared["entity_cache"]["entries"] == 0
+    assert cleared["entity_cache"]["hits"] == 0
@@ -705,7 +705,7 @@ class TestExtrairRespostasContextoQuestoes:
                 captured["payload"] = json
                 return FakeResponse()
 
-        monkeypatch.setattr("anexos.httpx.AsyncClient", FakeClient)
+        monkeypatch.setattr("ai_http.httpx.AsyncClient", FakeClient)
 
         cliente = ClienteAPIMultimodal({
             "tipo": "openai",
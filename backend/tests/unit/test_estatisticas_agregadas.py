@@ -0,0 +1,113 @@
+"""Tests for the database-side aggregation behind /api/estatisticas."""
+
+import os
+import sqlite3
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+
+BACKEND_DIR = Path(__file__).parent.parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("PROVA_AI_TESTING", "1")
+os.environ.setdefault("PROVA_AI_DISABLE_LOCAL_LLM", "1")
+
+from models import TipoDocumento  # noqa: E402
+
+
+def _make_storage(tmp_path: Path):
+    with patch("storage.SUPABASE_DB_AVAILABLE", False), \
+         patch("storage.SUPABASE_STORAGE_AVAILABLE", False):
+        from storage import StorageManager
+
+        return StorageManager(base_path=str(tmp_path / "data"))
+
+
+@pytest.fixture
+def env(tmp_path):
+    storage = _make_storage(tmp_path)
+    materia = storage.criar_materia("Matemática")
+    turma = storage.criar_turma(materia.id, "9A")
+    atividades = [storage.criar_atividade(turma.id, f"Prova {i}") for i in (1, 2)]
+    arquivo = tmp_path / "doc.pdf"
+    arquivo.write_bytes(b"%PDF-1.4")
+    return storage, atividades, arquivo
+
+
+def _contadores(storage):
+    conn = sqlite3.connect(str(storage.db_path))
+    rows = conn.execute("SELECT atividade_id, total, gabaritos FROM documento_contadores").fetchall()
+    conn.close()
+    return {row[0]: (row[1], row[2]) for row in rows}
+
+
+def test_counters_follow_inserts_and_deletes(env):
+    storage, atividades, arquivo = env
+    gabarito = storage.salvar_documento(str(arquivo), TipoDocumento.GABARITO, atividades[0].id)
+    storage.salvar_documento(str(arquivo), TipoDocumento.ENUNCIADO, atividades[0].id)
+    storage.salvar_documentos_lote([
+        {"arquivo_origem": str(arquivo), "tipo": TipoDocumento.ENUNCIADO, "atividade_id": atividades[1].id},
+        {"arquivo_origem": str(arquivo), "tipo": TipoDocumento.CRITERIOS_CORRECAO, "atividade_id": atividades[1].id},
+    ])
+
+    assert _contadores(storage) == {atividades[0].id: (2, 1), atividades[1].id: (2, 0)}
+    stats = storage.get_estatisticas_gerais_fast()
+    assert stats["total_documentos"] == 4
+    assert stats["alertas"]["atividades_sem_gabarito"] == 1
+
+    storage.deletar_documento(gabarito.id)
+
+    assert _contadores(storage)[atividades[0].id] == (1, 0)
+    assert storage.get_estatisticas_gerais_fast()["alertas"]["atividades_sem_gabarito"] == 2
+
+
+def test_counters_are_backfilled_for_existing_databases(env, tmp_path):
+    storage, atividades, arquivo = env
+    storage.salvar_documento(str(arquivo), TipoDocumento.GABARITO, atividades[0].id)
+    esperado = storage.get_estatisticas_gerais_fast()
+
+    conn = sqlite3.connect(str(storage.db_path))
+    conn.execute("DROP TABLE documento_contadores")
+    conn.commit()
+    conn.close()
+
+    reaberto = _make_storage(tmp_path)
+
+    assert reaberto.get_estatisticas_gerais_fast() == esperado
+    assert reaberto._estatisticas_por_linhas(0.0) == esperado
+
+
+def test_postgres_uses_rpc_and_falls_back_without_it(env, monkeypatch):
+    import storage as storage_module
+
+    storage, _, _ = env
+    fake_db = MagicMock()
+    fake_db.rpc.return_value = {
+        "total_materias": 1, "total_turmas": 1, "total_alunos": 0,
+        "total_atividades": 2, "total_documentos": 7, "atividades_sem_gabarito": 2,
+    }
+    monkeypatch.setattr(storage_module, "supabase_db", fake_db)
+    monkeypatch.setattr(storage, "use_postgresql", True)
+
+    stats = storage.get_estatisticas_gerais_fast()
+
+    fake_db.rpc.assert_called_once_with("estatisticas_gerais")
+    fake_db.select.assert_not_called()
+    assert stats["total_documentos"] == 7
+    assert stats["alertas"] == {"atividades_sem_gabarito": 2}
+
+    # Migration ainda não aplicada: volta a contar a partir das linhas
+    fake_db.rpc.return_value = None
+    fake_db.count.return_value = 1
+    fake_db.select.side_effect = lambda table, **kw: (
+        [{"id": "a1"}] if table == "atividades" else [{"atividade_id": "a1", "tipo": "gabarito"}]
+    )
+
+    stats = storage.get_estatisticas_gerais_fast()
+
+    assert stats["total_documentos"] == 1
+    assert stats["alertas"] == {"atividades_sem_gabarito": 0}
@@ -0,0 +1,104 @@
+"""Tests for the shared fast_json serialization helpers."""
+
+import json
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+
+BACKEND_DIR = Path(__file__).parent.parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("PROVA_AI_TESTING", "1")
+os.environ.setdefault("PROVA_AI_DISABLE_LOCAL_LLM", "1")
+
+import fast_json  # noqa: E402
+from models import TipoDocumento  # noqa: E402
+
+
+PAYLOAD = {
+    "nome": "Correção – Ana",
+    "nota": 7.5,
+    "questoes": [{"n": 1, "ok": True}, {"n": 2, "ok": None}],
+    1: "chave int",
+    "quando": datetime(2026, 3, 14, 12, 0, 5),
+    "tipo": TipoDocumento.CORRECAO,
+}
+
+
+@pytest.fixture(params=[True, False], ids=["orjson", "stdlib"])
+def backend(request):
+    if request.param and not fast_json.ORJSON_AVAILABLE:
+        pytest.skip("orjson not installed")
+    with patch.object(fast_json, "ORJSON_AVAILABLE", request.param):
+        yield request.param
+
+
+def test_dumps_matches_stdlib_semantics(backend):
+    texto = fast_json.dumps(PAYLOAD)
+
+    assert "Correção" in texto
+    assert "\n" not in texto
+    assert fast_json.loads(texto) == {
+        "nome": "Correção – Ana",
+        "nota": 7.5,
+        "questoes": [{"n": 1, "ok": True}, {"n": 2, "ok": None}],
+        "1": "chave int",
+        "quando": "2026-03-14T12:00:05",
+        "tipo": "correcao",
+    }
+    assert fast_json.dumps({"a": [1]}, indent=True) == json.dumps({"a": [1]}, indent=2)
+
+
+def test_loads_accepts_bytes_and_raises_json_decode_error(backend):
+    assert fast_json.loads(b'{"a": "\xc3\xa7"}') == {"a": "ç"}
+    assert fast_json.loads("[NaN]")[0] != fast_json.loads("[NaN]")[0]
+    with pytest.raises(json.JSONDecodeError):
+        fast_json.loads("{")
+
+
+def test_default_hook_and_big_ints_fall_back(backend):
+    class Ponto:
+        pass
+
+    assert fast_json.loads(fast_json.dumps({"p": Ponto()}, default=lambda o: "ponto")) == {"p": "ponto"}
+    assert fast_json.loads(fast_json.dumps({"n": 2 ** 70})) == {"n": 2 ** 70}
+    with pytest.raises(TypeError):
+        fast_json.dumps({"p": Ponto()})
+    with pytest.raises(TypeError):
+        fast_json.dumps({"m": MagicMock()})
+
+
+def test_write_json_is_atomic_and_compact(tmp_path, backend):
+    destino = tmp_path / "usage.json"
+    destino.write_text("[]", encoding="utf-8")
+
+    fast_json.write_json(destino, [{"a": 1}])
+
+    assert destino.read_text(encoding="utf-8") == '[{"a":1}]'
+    assert fast_json.read_json(destino) == [{"a": 1}]
+    assert list(tmp_path.iterdir()) == [destino]
+
+
+def test_fast_json_response_renders_utf8(backend):
+    response = fast_json.FastJSONResponse({"nome": "Ç", "quando": datetime(2026, 1, 2)})
+
+    assert response.media_type == "application/json"
+    assert json.loads(response.body) == {"nome": "Ç", "quando": "2026-01-02T00:00:00"}
+
+
+def test_ler_json_tolerates_trailing_data(tmp_path):
+    from visualizador import VisualizadorResultados
+
+    arquivo = tmp_path / "resultado.json"
+    arquivo.write_text('{"nota": 8}\n{"nota": 9}', encoding="utf-8")
+    visualizador = VisualizadorResultados.__new__(VisualizadorResultados)
+    visualizador.storage = MagicMock()
+    visualizador.storage.resolver_caminho_documento.return_value = arquivo
+
+    assert visualizador._ler_json(MagicMock()) == {"nota": 8}
@@ -0,0 +1,275 @@
+"""Tests for the bounded LRU cache behind resolver_caminho_documento."""
+
+import hashlib
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+
+BACKEND_DIR = Path(__file__).parent.parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("PROVA_AI_TESTING", "1")
+os.environ.setdefault("PROVA_AI_DISABLE_LOCAL_LLM", "1")
+
+from file_cache import FileCache, pin_scope  # noqa: E402
+from models import Documento, TipoDocumento  # noqa: E402
+
+
+def _baixar_conteudo(conteudo: bytes):
+    def download(destino: Path) -> bool:
+        destino.write_bytes(conteudo)
+        return True
+    return download
+
+
+def test_lru_eviction_respects_byte_budget(tmp_path):
+    cache = FileCache(tmp_path, max_bytes=250)
+    a, b, c = (tmp_path / "arquivos" / nome for nome in ("a.pdf", "b.pdf", "c.pdf"))
+
+    assert cache.fetch(a, _baixar_conteudo(b"a" * 100))
+    assert cache.fetch(b, _baixar_conteudo(b"b" * 100))
+    assert cache.lookup(a)  # a passa a ser o mais recente
+    assert cache.fetch(c, _baixar_conteudo(b"c" * 100))
+
+    assert a.exists() and c.exists()
+    assert not b.exists()
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["used_bytes"] == 200
+
+
+def test_pinned_files_survive_eviction(tmp_path):
+    cache = FileCache(tmp_path, max_bytes=150)
+    a, b = tmp_path / "a.pdf", tmp_path / "b.pdf"
+
+    with pin_scope():
+        assert cache.fetch(a, _baixar_conteudo(b"a" * 100))
+        assert cache.fetch(b, _baixar_conteudo(b"b" * 100))
+        # Acima do orçamento, mas os dois estão em uso
+        assert a.exists() and b.exists()
+        assert cache.stats()["pinned"] == 2
+
+    assert cache.stats()["pinned"] == 0
+    cache.fetch(tmp_path / "c.pdf", _baixar_conteudo(b"c" * 10))
+    assert not a.exists()
+
+
+def test_checksum_mismatch_is_rejected_and_redownloaded(tmp_path):
+    cache = FileCache(tmp_path)
+    conteudo = b"%PDF-1.4 prova"
+    esperado = hashlib.sha256(conteudo).hexdigest()
+    path = tmp_path / "prova.pdf"
+
+    assert not cache.fetch(path, _baixar_conteudo(b"truncado"), esperado)
+    assert not path.exists()
+
+    assert cache.fetch(path, _baixar_conteudo(conteudo), esperado)
+    path.write_bytes(b"corrompido em disco")
+    assert not cache.lookup(path, esperado)
+    # Não são os bytes que o cache gravou: só a entrada sai, o fetch substitui
+    assert path.exists()
+    assert cache.stats()["entries"] == 0
+    assert cache.fetch(path, _baixar_conteudo(conteudo), esperado)
+    assert path.read_bytes() == conteudo
+    assert cache.stats()["checksum_failures"] == 1
+
+
+def test_lookup_keeps_a_file_rewritten_outside_the_cache(tmp_path):
+    cache = FileCache(tmp_path, max_bytes=150)
+    path = tmp_path / "prova.pdf"
+    assert cache.fetch(path, _baixar_conteudo(b"v1" * 10))
+
+    path.write_bytes(b"local, ainda nao enviado" * 4)
+    assert cache.lookup(path)
+    assert path.exists()
+    assert cache.stats()["entries"] == 0
+
+    # Despejo também não apaga um arquivo que mudou depois de indexado
+    outro = tmp_path / "b.pdf"
+    assert cache.fetch(outro, _baixar_conteudo(b"b" * 100))
+    outro.write_bytes(b"b" * 10)
+    assert cache.fetch(tmp_path / "c.pdf", _baixar_conteudo(b"c" * 100))
+    assert outro.exists()
+    assert cache.stats()["evictions"] == 1
+
+
+def test_concurrent_fetches_share_one_download(tmp_path):
+    cache = FileCache(tmp_path)
+    path = tmp_path / "grande.pdf"
+    liberar = threading.Event()
+    chamadas = []
+
+    def download(destino: Path) -> bool:
+        chamadas.append(destino)
+        liberar.wait(5)
+        destino.write_bytes(b"x" * 10)
+        return True
+
+    resultados = []
+    threads = [threading.Thread(target=lambda: resultados.append(cache.fetch(path, download)))
+               for _ in range(4)]
+    for t in threads:
+        t.start()
+    deadline = time.time() + 5
+    while cache.stats()["coalesced"] < 3 and time.time() < deadline:
+        time.sleep(0.001)
+    liberar.set()
+    for t in threads:
+        t.join(5)
+
+    assert resultados == [True] * 4
+    assert len(chamadas) == 1
+    assert cache.stats()["downloads"] == 1
+
+
+def test_lookups_wait_for_a_slow_download_that_fails(tmp_path):
+    cache = FileCache(tmp_path)
+    path = tmp_path / "grande.pdf"
+    escrevendo = threading.Event()
+    falhar = threading.Event()
+
+    def download(destino: Path) -> bool:
+        with open(destino, "wb") as f:
+            f.write(b"%PDF-1.4 metade")
+            f.flush()
+            escrevendo.set()
+            falhar.wait(5)
+        raise ConnectionError("conexão caiu no meio")
+
+    resultados = {}
+    baixador = threading.Thread(target=lambda: resultados.setdefault("fetch", cache.fetch(path, download)))
+    baixador.start()
+    assert escrevendo.wait(5)
+    leitores = [threading.Thread(target=lambda i=i: resultados.setdefault(i, cache.lookup(path))) for i in range(2)]
+    for t in leitores:
+        t.start()
+    time.sleep(0.05)
+    assert not any(i in resultados for i in range(2))  # bloqueados no download em curso
+    falhar.set()
+    for t in [baixador, *leitores]:
+        t.join(5)
+
+    assert resultados == {"fetch": False, 0: False, 1: False}
+    assert not path.exists()
+    assert list(tmp_path.glob("*.part")) == []  # nenhum arquivo truncado deixado para trás
+    assert cache.stats()["download_failures"] == 1
+
+
+def test_index_survives_restart(tmp_path):
+    cache = FileCache(tmp_path, max_bytes=1000)
+    cache.fetch(tmp_path / "a.pdf", _baixar_conteudo(b"a" * 100))
+
+    reaberto = FileCache(tmp_path, max_bytes=1000)
+
+    assert reaberto.stats()["used_bytes"] == 100
+    assert reaberto.stats()["entries"] == 1
+
+
+def test_resolver_downloads_once_and_counts_hits(tmp_path, monkeypatch):
+    import storage as storage_module
+
+    with patch("storage.SUPABASE_DB_AVAILABLE", False), \
+         patch("storage.SUPABASE_STORAGE_AVAILABLE", False):
+        storage = storage_module.StorageManager(base_path=str(tmp_path / "data"))
+
+    conteudo = b"%PDF-1.4 remoto"
+    remote = MagicMock()
+    remote.enabled = True
+    remote.download.side_effect = lambda remoto, destino: (Path(destino).write_bytes(conteudo), (True, "ok"))[1]
+    monkeypatch.setattr(storage_module, "SUPABASE_AVAILABLE", True)
+    monkeypatch.setattr(storage_module, "supabase_storage", remote)
+
+    doc = Documento(
+        id="doc1",
+        tipo=TipoDocumento.ENUNCIADO,
+        atividade_id="a1",
+        nome_arquivo="prova.pdf",
+        caminho_arquivo="arquivos/m/t/a/prova.pdf",
+        content_hash=hashlib.sha256(conteudo).hexdigest(),
+    )
+
+    primeiro = storage.resolver_caminho_documento(doc)
+    segundo = storage.resolver_caminho_documento(doc)
+
+    assert primeiro == segundo
+    assert primeiro.read_bytes() == conteudo
+    assert remote.download.call_count == 1
+    stats = storage.get_file_cache_stats()
+    assert (stats["hits"], stats["misses"], stats["downloads"]) == (1, 1, 1)
+    storage.close()
+
+
+def test_prefetch_pins_files_that_were_already_local(tmp_path, monkeypatch):
+    import storage as storage_module
+
+    with patch("storage.SUPABASE_DB_AVAILABLE", False), \
+         patch("storage.SUPABASE_STORAGE_AVAILABLE", False):
+        storage = storage_module.StorageManager(base_path=str(tmp_path / "data"))
+
+    remote = MagicMock()
+    remote.enabled = True
+    remote.download.side_effect = lambda remoto, destino: (Path(destino).write_bytes(b"x" * 100), (True, "ok"))[1]
+    monkeypatch.setattr(storage_module, "SUPABASE_AVAILABLE", True)
+    monkeypatch.setattr(storage_module, "supabase_storage", remote)
+
+    docs = [
+        Documento(id=f"doc{i}", tipo=TipoDocumento.PROVA_RESPONDIDA, atividade_id="a1",
+                  nome_arquivo=f"p{i}.pdf", caminho_arquivo=f"arquivos/a1/p{i}.pdf")
+        for i in (1, 2)
+    ]
+    local = storage.resolver_caminho_documento(docs[0])  # baixado num lote anterior
+    storage.file_cache.max_bytes = 150  # só cabe um dos dois
+
+    with pin_scope():
+        resumo = storage.prefetch_documentos(docs)
+        assert (resumo["locais"], resumo["baixados"]) == (1, 1)
+        assert storage.get_file_cache_stats()["pinned"] == 2
+        # O arquivo que já estava no disco não é despejado pelo download do outro
+        assert local.exists()
+
+    assert storage.get_file_cache_stats()["pinned"] == 0
+    storage.close()
+
+
+def test_local_save_over_a_cached_path_is_not_deleted(tmp_path, monkeypatch):
+    """Salvar localmente por cima de um caminho já baixado não perde o arquivo."""
+    import storage as storage_module
+
+    with patch("storage.SUPABASE_DB_AVAILABLE", False), \
+         patch("storage.SUPABASE_STORAGE_AVAILABLE", False):
+        storage = storage_module.StorageManager(base_path=str(tmp_path / "data"))
+    storage.blobs = None  # STORAGE_BLOBS_ENABLED=0
+    materia = storage.criar_materia("Matemática")
+    turma = storage.criar_turma(materia.id, "9A")
+    atividade = storage.criar_atividade(turma.id, "Prova 1")
+
+    origem = tmp_path / "uploads"
+    origem.mkdir()
+    (origem / "v1.pdf").write_bytes(b"%PDF-1.4 v1")
+    (origem / "v2.pdf").write_bytes(b"%PDF-1.4 segunda versao, maior")
+
+    d1 = storage.salvar_documento(str(origem / "v1.pdf"), TipoDocumento.ENUNCIADO,
+                                  atividade.id, display_name="Prova")
+    caminho = storage.base_path / d1.caminho_arquivo
+    caminho.unlink()  # disco efêmero: volta pelo bucket
+
+    remote = MagicMock()
+    remote.enabled = True
+    remote.download.side_effect = lambda remoto, destino: (Path(destino).write_bytes(b"%PDF-1.4 v1"), (True, "ok"))[1]
+    monkeypatch.setattr(storage_module, "SUPABASE_AVAILABLE", True)
+    monkeypatch.setattr(storage_module, "supabase_storage", remote)
+    assert storage.resolver_caminho_documento(d1).exists()
+
+    d2 = storage.salvar_documento(str(origem / "v2.pdf"), TipoDocumento.ENUNCIADO,
+                                  atividade.id, display_name="Prova")
+    assert d2.caminho_arquivo == d1.caminho_arquivo
+
+    resolvido = storage.resolver_caminho_documento(d2)
+    assert resolvido.read_bytes() == b"%PDF-1.4 segunda versao, maior"
+    assert remote.download.call_count == 1
+    storage.close()
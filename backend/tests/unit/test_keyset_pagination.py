@@ -0,0 +1,179 @@
+"""Tests for keyset pagination and NDJSON streaming of document listings."""
+
+import json
+import os
+import sqlite3
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+
+BACKEND_DIR = Path(__file__).parent.parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("PROVA_AI_TESTING", "1")
+os.environ.setdefault("PROVA_AI_DISABLE_LOCAL_LLM", "1")
+
+from models import TipoDocumento  # noqa: E402
+
+
+@pytest.fixture
+def seeded(tmp_path):
+    with patch("storage.SUPABASE_DB_AVAILABLE", False), \
+         patch("storage.SUPABASE_STORAGE_AVAILABLE", False):
+        from storage import StorageManager
+
+        storage = StorageManager(base_path=str(tmp_path / "data"))
+    materia = storage.criar_materia("Matemática")
+    turma = storage.criar_turma(materia.id, "9A")
+    atividade = storage.criar_atividade(turma.id, "Prova 1")
+    aluno = storage.criar_aluno("Ana")
+
+    conn = sqlite3.connect(str(storage.db_path))
+    for i in range(25):
+        # Vários documentos com o mesmo criado_em: o desempate por id é obrigatório
+        conn.execute(
+            "INSERT INTO documentos (id, tipo, atividade_id, aluno_id, nome_arquivo, caminho_arquivo, "
+            "extensao, status, criado_em, atualizado_em, metadata) "
+            "VALUES (?, ?, ?, ?, ?, ?, '.json', 'concluido', ?, ?, '{}')",
+            (
+                f"doc-{i:02d}",
+                "correcao" if i % 2 else "gabarito",
+                atividade.id,
+                aluno.id if i % 3 == 0 else None,
+                f"doc-{i:02d}.json",
+                f"arquivos/doc-{i:02d}.json",
+                f"2026-03-0{i // 10 + 1}T10:00:00",
+                f"2026-03-0{i // 10 + 1}T10:00:00",
+            ),
+        )
+    conn.commit()
+    conn.close()
+    return storage, atividade, aluno
+
+
+def _todas_as_paginas(fetch, limit):
+    ids, cursor, paginas = [], None, 0
+    while True:
+        pagina = fetch(cursor=cursor, limit=limit)
+        ids.extend(d.id if hasattr(d, "id") else d["id"] for d in pagina["documentos"])
+        paginas += 1
+        cursor = pagina["next_cursor"]
+        if cursor is None:
+            return ids, paginas
+
+
+def test_keyset_pages_cover_every_row_once_in_order(seeded):
+    storage, atividade, _ = seeded
+
+    ids, paginas = _todas_as_paginas(
+        lambda **kw: storage.listar_documentos_pagina(atividade.id, **kw), limit=4,
+    )
+
+    esperado = [d.id for d in sorted(
+        storage.listar_documentos(atividade.id),
+        key=lambda d: (d.criado_em, d.id),
+        reverse=True,
+    )]
+    assert ids == esperado
+    assert len(ids) == 25
+    assert paginas == 7
+
+
+def test_page_filters_keep_listar_documentos_semantics(seeded):
+    storage, atividade, aluno = seeded
+
+    ids, _ = _todas_as_paginas(
+        lambda **kw: storage.listar_documentos_pagina(
+            atividade.id, aluno.id, TipoDocumento.GABARITO, **kw
+        ),
+        limit=3,
+    )
+
+    esperado = {d.id for d in storage.listar_documentos(atividade.id, aluno.id, TipoDocumento.GABARITO)}
+    assert set(ids) == esperado
+    assert len(ids) == len(esperado)
+
+
+def test_context_pages_match_full_listing(seeded):
+    storage, _, _ = seeded
+
+    ids, _ = _todas_as_paginas(
+        lambda **kw: storage.listar_documentos_com_contexto_pagina({}, **kw), limit=10,
+    )
+
+    assert sorted(ids) == sorted(d["id"] for d in storage.listar_documentos_com_contexto_fast({}))
+
+
+def test_invalid_cursor_is_rejected(seeded):
+    storage, atividade, _ = seeded
+
+    with pytest.raises(ValueError):
+        storage.listar_documentos_pagina(atividade.id, cursor="não-é-cursor")
+
+
+def test_supabase_select_builds_keyset_filter():
+    from supabase_db import SupabaseDB
+
+    query = MagicMock()
+    for method in ("eq", "or_", "order", "limit"):
+        getattr(query, method).return_value = query
+    query.execute.return_value = SimpleNamespace(data=[], count=0)
+    client = MagicMock()
+    client.table.return_value.select.return_value = query
+    db = SupabaseDB.__new__(SupabaseDB)
+    db._client = client
+    db._enabled = True
+
+    db.select(
+        "documentos",
+        filters={"atividade_id": "a1"},
+        order_by="criado_em",
+        order_desc=True,
+        limit=51,
+        after=("2026-03-01T10:00:00+00:00", "doc-9"),
+    )
+
+    query.or_.assert_called_once_with(
+        'criado_em.lt."2026-03-01T10:00:00+00:00",'
+        'and(criado_em.eq."2026-03-01T10:00:00+00:00",id.lt."doc-9")'
+    )
+    assert [c.args for c in query.order.call_args_list] == [("criado_em",), ("id",)]
+
+
+def test_documentos_todos_streams_ndjson(seeded):
+    from fastapi.testclient import TestClient
+    from main_v2 import app
+
+    storage, _, _ = seeded
+    with patch("routes_extras.storage", storage):
+        response = TestClient(app).get("/api/documentos/todos?formato=ndjson&limit=7")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    linhas = [json.loads(linha) for linha in response.text.splitlines()]
+    assert len(linhas) == 25
+    assert {"id", "atividade_nome", "turma_nome", "materia_nome"} <= set(linhas[0])
+
+
+def test_documentos_endpoint_pages_with_cursor(seeded):
+    from fastapi.testclient import TestClient
+    from main_v2 import app
+
+    storage, atividade, _ = seeded
+    client = TestClient(app)
+    with patch("main_v2.storage", storage):
+        primeira = client.get(f"/api/documentos?atividade_id={atividade.id}&limit=20").json()
+        segunda = client.get(
+            f"/api/documentos?atividade_id={atividade.id}&limit=20&cursor={primeira['next_cursor']}"
+        ).json()
+        invalido = client.get(f"/api/documentos?atividade_id={atividade.id}&cursor=xyz")
+
+    assert len(primeira["documentos"]) == 20
+    assert len(segunda["documentos"]) == 5
+    assert segunda["next_cursor"] is None
+    assert invalido.status_code == 400
@@ -0,0 +1,136 @@
+"""Tests for the dependency-graph scheduler of executar_pipeline_completo."""
+
+import asyncio
+import os
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+
+BACKEND_DIR = Path(__file__).parent.parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("PROVA_AI_TESTING", "1")
+os.environ.setdefault("PROVA_AI_DISABLE_LOCAL_LLM", "1")
+
+from executor import (  # noqa: E402
+    GRAFO_ETAPAS_PIPELINE,
+    PipelineExecutor,
+    ResultadoExecucao,
+    SingleFlight,
+    executar_grafo_etapas,
+)
+from prompts import EtapaProcessamento as E  # noqa: E402
+
+
+def test_graph_is_derived_from_document_dependencies():
+    assert GRAFO_ETAPAS_PIPELINE == {
+        E.EXTRAIR_QUESTOES: [],
+        E.EXTRAIR_GABARITO: [],
+        E.EXTRAIR_RESPOSTAS: [E.EXTRAIR_QUESTOES],
+        E.CORRIGIR: [E.EXTRAIR_RESPOSTAS, E.EXTRAIR_GABARITO],
+        E.ANALISAR_HABILIDADES: [E.CORRIGIR],
+        E.GERAR_RELATORIO: [E.CORRIGIR, E.ANALISAR_HABILIDADES],
+    }
+
+
+async def test_scheduler_stops_starting_nodes_after_a_failure():
+    grafo = {"a": [], "b": [], "c": ["a"], "d": ["b"]}
+    iniciadas = []
+
+    async def executar(no):
+        iniciadas.append(no)
+        await asyncio.sleep(0.01 if no == "b" else 0)
+        return "falhou" if no == "a" else "ok"
+
+    estado = await executar_grafo_etapas(grafo, executar)
+
+    assert estado == {"a": "falhou", "b": "ok"}
+    assert iniciadas == ["a", "b"]
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    import routes_tasks
+
+    executor = PipelineExecutor.__new__(PipelineExecutor)
+    executor.storage = MagicMock()
+    executor.storage.listar_documentos.return_value = []
+    executor._validar_prova_respondida_para_extracao = MagicMock(return_value=(True, None, None))
+    monkeypatch.setattr(PipelineExecutor, "_etapas_atividade", SingleFlight())
+    monkeypatch.setattr(routes_tasks, "task_registry", {})
+    linha_do_tempo = []
+
+    def etapa_fake(stage, falhar=False):
+        async def _executar(*args, **kwargs):
+            linha_do_tempo.append(("inicio", stage.value))
+            await asyncio.sleep(0.06 if stage == E.EXTRAIR_GABARITO else 0.02)
+            linha_do_tempo.append(("fim", stage.value))
+            return ResultadoExecucao(sucesso=not falhar, etapa=stage, erro="falhou" if falhar else None)
+        return _executar
+
+    async def executar_etapa(stage, *args, **kwargs):
+        return await etapa_fake(stage, falhar=getattr(executor, "_falhar", None) == stage)()
+
+    executor.executar_etapa = executar_etapa
+    executor.corrigir = etapa_fake(E.CORRIGIR)
+    executor.analisar_habilidades = etapa_fake(E.ANALISAR_HABILIDADES)
+    executor.gerar_relatorio = etapa_fake(E.GERAR_RELATORIO)
+    return executor, linha_do_tempo, routes_tasks
+
+
+async def test_independent_branches_overlap_and_results_keep_stage_order(pipeline):
+    executor, linha_do_tempo, routes_tasks = pipeline
+    task_id = routes_tasks.register_pipeline_task("pipeline", "ativ", ["aluno"])
+
+    resultados = await executor.executar_pipeline_completo("ativ", "aluno", model_id="m", task_id=task_id)
+
+    assert list(resultados) == [
+        "extrair_questoes", "extrair_gabarito", "extrair_respostas",
+        "corrigir", "analisar_habilidades", "gerar_relatorio",
+    ]
+    assert linha_do_tempo[:2] == [("inicio", "extrair_questoes"), ("inicio", "extrair_gabarito")]
+    assert linha_do_tempo.index(("inicio", "extrair_respostas")) < linha_do_tempo.index(("fim", "extrair_gabarito"))
+    assert linha_do_tempo.index(("inicio", "corrigir")) > linha_do_tempo.index(("fim", "extrair_gabarito"))
+    task = routes_tasks.task_registry[task_id]
+    assert set(task["students"]["aluno"]["stages"].values()) == {"completed"}
+    assert task["status"] == "completed"
+
+
+async def test_failure_blocks_dependents_and_lets_running_branch_finish(pipeline):
+    executor, linha_do_tempo, routes_tasks = pipeline
+    executor._falhar = E.EXTRAIR_QUESTOES
+    task_id = routes_tasks.register_pipeline_task("pipeline", "ativ", ["aluno"])
+
+    resultados = await executor.executar_pipeline_completo("ativ", "aluno", model_id="m", task_id=task_id)
+
+    assert resultados["_pipeline_erro"]["etapa_falha"] == "extrair_questoes"
+    assert resultados["extrair_gabarito"].sucesso
+    assert "extrair_respostas" not in resultados
+    stages = routes_tasks.task_registry[task_id]["students"]["aluno"]["stages"]
+    assert stages == {
+        "extrair_questoes": "failed",
+        "extrair_gabarito": "completed",
+        "extrair_respostas": "skipped",
+        "corrigir": "skipped",
+        "analisar_habilidades": "skipped",
+        "gerar_relatorio": "skipped",
+    }
+    assert routes_tasks.task_registry[task_id]["status"] == "failed"
+
+
+async def test_selected_steps_and_cancellation(pipeline):
+    executor, linha_do_tempo, routes_tasks = pipeline
+    task_id = routes_tasks.register_pipeline_task("pipeline", "ativ", ["aluno"])
+
+    resultados = await executor.executar_pipeline_completo(
+        "ativ", "aluno", model_id="m", task_id=task_id, selected_steps=["extrair_gabarito", "corrigir"],
+    )
+    assert list(resultados) == ["extrair_gabarito", "corrigir"]
+
+    routes_tasks.task_registry[task_id]["cancel_requested"] = True
+    assert await executor.executar_pipeline_completo("ativ", "aluno", model_id="m", task_id=task_id) == {}
+    assert routes_tasks.task_registry[task_id]["status"] == "cancelled"
@@ -0,0 +1,121 @@
+"""Tests for the document prefetch that runs before the per-student fan-out."""
+
+import os
+import shutil
+import sys
+import threading
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+
+BACKEND_DIR = Path(__file__).parent.parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("PROVA_AI_TESTING", "1")
+os.environ.setdefault("PROVA_AI_DISABLE_LOCAL_LLM", "1")
+
+from file_cache import pin_scope  # noqa: E402
+from models import TipoDocumento  # noqa: E402
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    import storage as storage_module
+
+    with patch("storage.SUPABASE_DB_AVAILABLE", False), \
+         patch("storage.SUPABASE_STORAGE_AVAILABLE", False):
+        storage = storage_module.StorageManager(base_path=str(tmp_path / "data"))
+    materia = storage.criar_materia("Matemática")
+    turma = storage.criar_turma(materia.id, "9A")
+    atividade = storage.criar_atividade(turma.id, "Prova 1")
+    alunos = [storage.criar_aluno(f"Aluno {i}") for i in range(3)]
+
+    def _salvar(nome, tipo, aluno_id=None):
+        origem = tmp_path / nome
+        origem.write_bytes(f"%PDF-1.4 {nome}".encode())
+        return storage.salvar_documento(str(origem), tipo, atividade.id, aluno_id=aluno_id)
+
+    docs = [
+        _salvar("enunciado.pdf", TipoDocumento.ENUNCIADO),
+        _salvar("gabarito.pdf", TipoDocumento.GABARITO),
+        _salvar("material.pdf", TipoDocumento.MATERIAL_APOIO),
+    ] + [
+        _salvar(f"prova_{i}.pdf", TipoDocumento.PROVA_RESPONDIDA, aluno.id)
+        for i, aluno in enumerate(alunos)
+    ]
+    conteudos = {d.caminho_arquivo: (storage.base_path / d.caminho_arquivo).read_bytes() for d in docs}
+
+    # Simula o disco efêmero do Render: só o bucket tem os arquivos
+    for d in docs:
+        (storage.base_path / d.caminho_arquivo).unlink()
+    shutil.rmtree(storage.blobs.root)
+
+    baixados = []
+    lock = threading.Lock()
+
+    def download(remoto, destino):
+        if remoto not in conteudos:
+            return False, "404"
+        with lock:
+            baixados.append(remoto)
+        Path(destino).write_bytes(conteudos[remoto])
+        return True, "ok"
+
+    remote = MagicMock()
+    remote.enabled = True
+    remote.download.side_effect = download
+    monkeypatch.setattr(storage_module, "SUPABASE_AVAILABLE", True)
+    monkeypatch.setattr(storage_module, "supabase_storage", remote)
+
+    from executor import PipelineExecutor
+
+    executor = PipelineExecutor()
+    executor.storage = storage
+    yield executor, storage, atividade, alunos, docs, baixados
+    storage.close()
+
+
+@pytest.mark.asyncio
+async def test_prefetch_downloads_inputs_of_selected_students(env):
+    executor, storage, atividade, alunos, docs, baixados = env
+
+    resumo = await executor.prefetch_atividade(atividade.id, [alunos[0].id, alunos[1].id])
+
+    # enunciado + gabarito + 2 provas; material de apoio não é entrada de etapa
+    assert resumo["total"] == 4
+    assert resumo["baixados"] == 4
+    assert resumo["falhas"] == []
+    enunciado, gabarito, material, prova_0, prova_1, prova_2 = docs
+    for doc in (enunciado, gabarito, prova_0, prova_1):
+        assert (storage.base_path / doc.caminho_arquivo).exists()
+    assert not (storage.base_path / prova_2.caminho_arquivo).exists()
+    assert not (storage.base_path / material.caminho_arquivo).exists()
+
+
+@pytest.mark.asyncio
+async def test_stages_reuse_prefetched_files(env):
+    executor, storage, atividade, alunos, docs, baixados = env
+
+    with pin_scope():
+        await executor.prefetch_atividade(atividade.id)
+        antes = len(baixados)
+        for doc in docs:
+            if doc.tipo != TipoDocumento.MATERIAL_APOIO:
+                assert storage.resolver_caminho_documento(doc).exists()
+        assert len(baixados) == antes
+        assert storage.get_file_cache_stats()["pinned"] == 5
+
+    assert storage.get_file_cache_stats()["pinned"] == 0
+
+
+@pytest.mark.asyncio
+async def test_prefetch_failures_do_not_raise(env):
+    executor, storage, atividade, alunos, docs, baixados = env
+    storage.listar_documentos = MagicMock(side_effect=RuntimeError("supabase fora"))
+
+    resumo = await executor.prefetch_atividade(atividade.id)
+
+    assert resumo["total"] == 0
@@ -0,0 +1,142 @@
+"""Tests for StorageManager.salvar_documentos_lote (bulk document save)."""
+
+import os
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+
+BACKEND_DIR = Path(__file__).parent.parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("PROVA_AI_TESTING", "1")
+os.environ.setdefault("PROVA_AI_DISABLE_LOCAL_LLM", "1")
+
+from models import TipoDocumento  # noqa: E402
+from storage_events import StorageEventType  # noqa: E402
+
+
+def _make_storage(tmp_path: Path):
+    with patch("storage.SUPABASE_DB_AVAILABLE", False), \
+         patch("storage.SUPABASE_STORAGE_AVAILABLE", False):
+        from storage import StorageManager
+
+        return StorageManager(base_path=str(tmp_path))
+
+
+@pytest.fixture
+def env(tmp_path):
+    storage = _make_storage(tmp_path)
+    materia = storage.criar_materia("Matemática")
+    turma = storage.criar_turma(materia.id, "9A")
+    atividade = storage.criar_atividade(turma.id, "Prova 1")
+    alunos = [storage.criar_aluno(nome) for nome in ("Ana", "Bruno", "Carla")]
+    for aluno in alunos:
+        storage.vincular_aluno_turma(aluno.id, turma.id)
+
+    origem = tmp_path / "uploads"
+    origem.mkdir()
+    arquivos = []
+    for aluno in alunos:
+        path = origem / f"{aluno.nome}.pdf"
+        path.write_bytes(b"%PDF-1.4 " + aluno.nome.encode())
+        arquivos.append(str(path))
+    return storage, atividade, alunos, arquivos
+
+
+def _items(atividade, alunos, arquivos):
+    return [
+        {
+            "arquivo_origem": arquivo,
+            "tipo": TipoDocumento.PROVA_RESPONDIDA,
+            "atividade_id": atividade.id,
+            "aluno_id": aluno.id,
+        }
+        for aluno, arquivo in zip(alunos, arquivos)
+    ]
+
+
+def test_lote_saves_all_documents_in_order(env):
+    storage, atividade, alunos, arquivos = env
+    events = []
+    storage.events.subscribe(events.append, tipos={StorageEventType.DOCUMENTO_SALVO})
+
+    docs = storage.salvar_documentos_lote(_items(atividade, alunos, arquivos))
+
+    assert [d.aluno_id for d in docs] == [a.id for a in alunos]
+    assert "Ana" in docs[0].display_name
+    for doc in docs:
+        saved = storage.get_documento(doc.id)
+        assert saved is not None
+        assert (storage.base_path / saved.caminho_arquivo).exists()
+    assert [e.entity_id for e in events] == [d.id for d in docs]
+
+
+def test_lote_validates_everything_before_writing(env):
+    storage, atividade, alunos, arquivos = env
+    items = _items(atividade, alunos, arquivos)
+    items[2]["aluno_id"] = "aluno-inexistente"
+
+    with pytest.raises(ValueError, match="Aluno não encontrado"):
+        storage.salvar_documentos_lote(items)
+
+    assert storage.listar_documentos(atividade.id) == []
+
+
+def test_lote_insert_failure_rolls_back_and_removes_copies(env, monkeypatch):
+    storage, atividade, alunos, arquivos = env
+    items = _items(atividade, alunos, arquivos)
+    params = storage._documento_insert_params
+
+    def _duplicate_id(documento):
+        # Dois documentos com o mesmo id: o segundo INSERT viola a PK
+        documento.id = "doc-duplicado"
+        return params(documento)
+
+    monkeypatch.setattr(storage, "_documento_insert_params", _duplicate_id)
+
+    with pytest.raises(Exception):
+        storage.salvar_documentos_lote(items)
+
+    assert storage.listar_documentos(atividade.id) == []
+    assert list(storage.arquivos_path.rglob("*.pdf")) == []
+
+
+def test_lote_uses_one_supabase_insert_and_uploads_every_file(env, monkeypatch):
+    import storage as storage_module
+
+    storage, atividade, alunos, arquivos = env
+    turma = storage.get_turma(atividade.turma_id)
+    materia = storage.get_materia(turma.materia_id)
+    fake_db = MagicMock()
+    fake_db.select.return_value = []
+    fake_storage = MagicMock()
+    fake_storage.upload.return_value = (True, "ok")
+
+    monkeypatch.setattr(storage, "use_postgresql", True)
+    monkeypatch.setattr(storage_module, "supabase_db", fake_db)
+    monkeypatch.setattr(storage_module, "supabase_storage", fake_storage)
+    monkeypatch.setattr(storage_module, "SUPABASE_STORAGE_AVAILABLE", True)
+    # Leituras de contexto vêm do SQLite local já populado
+    monkeypatch.setattr(storage, "get_atividade", lambda _id: atividade)
+    monkeypatch.setattr(storage, "get_turma", lambda _id: turma)
+    monkeypatch.setattr(storage, "get_materia", lambda _id: materia)
+    monkeypatch.setattr(storage, "get_aluno", lambda _id: next(a for a in alunos if a.id == _id))
+
+    docs = storage.salvar_documentos_lote(_items(atividade, alunos, arquivos))
+
+    fake_db.insert_many.assert_called_once()
+    table, rows = fake_db.insert_many.call_args.args
+    assert table == "documentos"
+    assert [r["id"] for r in rows] == [d.id for d in docs]
+    assert all("display_name" not in r for r in rows)
+    fake_db.insert.assert_not_called()
+    assert fake_storage.upload.call_count == len(alunos)
+
+
+def test_empty_lote_is_a_noop(env):
+    storage, *_ = env
+    assert storage.salvar_documentos_lote([]) == []
@@ -0,0 +1,240 @@
+"""Tests for single-flight execution of atividade-level pipeline stages."""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+
+BACKEND_DIR = Path(__file__).parent.parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("PROVA_AI_TESTING", "1")
+os.environ.setdefault("PROVA_AI_DISABLE_LOCAL_LLM", "1")
+
+from executor import PipelineExecutor, ResultadoExecucao, SingleFlight  # noqa: E402
+
+
+async def test_concurrent_callers_share_one_execution():
+    voo = SingleFlight()
+    chamadas = []
+
+    async def fabrica():
+        chamadas.append(1)
+        await asyncio.sleep(0.01)
+        return "doc-1"
+
+    resultados = await asyncio.gather(*[voo.executar(("a", "q"), fabrica) for _ in range(5)])
+
+    assert len(chamadas) == 1
+    assert sorted(resultados) == [("doc-1", False)] + [("doc-1", True)] * 4
+    assert voo.coalescidos == 4
+    assert voo.em_andamento() == []
+
+    assert await voo.executar(("a", "q"), fabrica) == ("doc-1", False)
+    assert len(chamadas) == 2
+
+
+async def test_different_keys_and_errors_are_not_mixed():
+    voo = SingleFlight()
+
+    async def falha():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("provider fora")
+
+    async def ok():
+        return "ok"
+
+    resultados = await asyncio.gather(
+        voo.executar(("a", "q", "m1"), falha),
+        voo.executar(("a", "q", "m1"), falha),
+        voo.executar(("a", "q", "m2"), ok),
+        return_exceptions=True,
+    )
+
+    assert [type(r) for r in resultados[:2]] == [RuntimeError, RuntimeError]
+    assert resultados[2] == ("ok", False)
+
+
+async def test_follower_takes_over_when_leader_is_cancelled():
+    voo = SingleFlight()
+    iniciado = asyncio.Event()
+
+    async def lento():
+        iniciado.set()
+        await asyncio.sleep(10)
+
+    async def rapido():
+        return "seguidor"
+
+    lider = asyncio.create_task(voo.executar("k", lento))
+    await iniciado.wait()
+    seguidor = asyncio.create_task(voo.executar("k", rapido))
+    await asyncio.sleep(0)
+    lider.cancel()
+
+    assert await seguidor == ("seguidor", False)
+    with pytest.raises(asyncio.CancelledError):
+        await lider
+
+
+async def test_cancelling_the_task_does_not_rerun_the_stage_for_followers(monkeypatch):
+    import routes_tasks
+    import task_cancel
+    from task_cancel import TarefaCancelada, escopo_cancelavel
+
+    monkeypatch.setattr(routes_tasks, "task_registry", {})
+    voo = SingleFlight()
+    chamadas = []
+    iniciado = asyncio.Event()
+
+    async def extrair():
+        chamadas.append(1)
+        iniciado.set()
+        await asyncio.sleep(10)  # a slow LLM call
+        return "doc-1"
+
+    async def aluno():
+        try:
+            async with escopo_cancelavel("t1"):
+                return await voo.executar(("ativ", "extrair_questoes"), extrair)
+        except TarefaCancelada:
+            return "cancelado"
+
+    alunos = [asyncio.create_task(aluno()) for _ in range(3)]
+    await iniciado.wait()
+    await asyncio.sleep(0)
+    assert task_cancel.cancelar("t1") == 3
+
+    resultados = await asyncio.wait_for(asyncio.gather(*alunos), 5)
+
+    assert resultados == ["cancelado"] * 3
+    assert len(chamadas) == 1
+    assert voo.em_andamento() == []
+
+
+def test_runs_on_different_threads_and_loops_share_one_execution():
+    # Execuções destacadas / workers da fila: cada thread roda o seu asyncio.run
+    voo = SingleFlight()
+    iniciado = threading.Event()
+    liberar = threading.Event()
+    chamadas = []
+
+    async def fabrica():
+        chamadas.append(threading.current_thread().name)
+        iniciado.set()
+        while not liberar.is_set():
+            await asyncio.sleep(0.005)
+        return "doc-1"
+
+    resultados = {}
+    erros = []
+
+    def rodar(nome):
+        try:
+            resultados[nome] = asyncio.run(voo.executar(("a", "q"), fabrica))
+        except BaseException as exc:
+            erros.append(exc)
+
+    lider = threading.Thread(target=rodar, args=("lider",), name="lider")
+    lider.start()
+    assert iniciado.wait(5)
+    seguidor = threading.Thread(target=rodar, args=("seguidor",), name="seguidor")
+    seguidor.start()
+    time.sleep(0.05)  # seguidor já esperando o futuro do líder
+    liberar.set()
+    lider.join(5)
+    seguidor.join(5)
+
+    assert erros == []
+    assert resultados == {"lider": ("doc-1", False), "seguidor": ("doc-1", True)}
+    assert chamadas == ["lider"]
+    assert voo.em_andamento() == []
+
+
+async def test_pipeline_students_coalesce_extraction_stages(monkeypatch):
+    import routes_tasks
+
+    executor = PipelineExecutor.__new__(PipelineExecutor)
+    executor.storage = MagicMock()
+    executor.storage.listar_documentos.return_value = []
+    monkeypatch.setattr(PipelineExecutor, "_etapas_atividade", SingleFlight())
+    monkeypatch.setattr(routes_tasks, "task_registry", {})
+    chamadas = []
+
+    async def executar_etapa(stage, atividade_id, aluno_id, **kwargs):
+        chamadas.append(stage)
+        await asyncio.sleep(0.01)
+        return ResultadoExecucao(sucesso=True, etapa=stage)
+
+    executor.executar_etapa = executar_etapa
+    alunos = ["a1", "a2", "a3"]
+    task_id = routes_tasks.register_pipeline_task("pipeline_todos_os_alunos", "ativ-1", alunos)
+
+    await asyncio.gather(*[
+        executor.executar_pipeline_completo(
+            "ativ-1", aluno, model_id="m1",
+            selected_steps=["extrair_questoes", "extrair_gabarito"], task_id=task_id,
+        )
+        for aluno in alunos
+    ])
+
+    assert sorted(c.value for c in chamadas) == ["extrair_gabarito", "extrair_questoes"]
+    task = routes_tasks.task_registry[task_id]
+    assert task["coalesced"] == {"extrair_questoes": 2, "extrair_gabarito": 2}
+    for aluno in alunos:
+        assert task["students"][aluno]["stages"]["extrair_questoes"] == "completed"
+    assert routes_tasks._summarize_task_stages(task)["coalesced_stages"] == 4
+
+
+async def test_student_with_a_stale_snapshot_does_not_rerun_the_stage(monkeypatch):
+    import routes_tasks
+    from models import Documento, TipoDocumento
+
+    salvos = []
+    snapshot_tirado = threading.Event()
+    lider_terminou = threading.Event()
+
+    def listar_documentos(atividade_id, aluno_id=None, *args, **kwargs):
+        if aluno_id == "a2":
+            # a2 já leu os documentos base (vazios) e só segue depois que a1 termina
+            snapshot_tirado.set()
+            lider_terminou.wait(5)
+        return [] if aluno_id else list(salvos)
+
+    executor = PipelineExecutor.__new__(PipelineExecutor)
+    executor.storage = MagicMock()
+    executor.storage.listar_documentos.side_effect = listar_documentos
+    monkeypatch.setattr(PipelineExecutor, "_etapas_atividade", SingleFlight())
+    monkeypatch.setattr(routes_tasks, "task_registry", {})
+    chamadas = []
+
+    async def executar_etapa(stage, atividade_id, aluno_id, **kwargs):
+        chamadas.append(stage)
+        salvos.append(Documento(id="q1", tipo=TipoDocumento.EXTRACAO_QUESTOES, atividade_id=atividade_id))
+        return ResultadoExecucao(sucesso=True, etapa=stage)
+
+    executor.executar_etapa = executar_etapa
+    task_id = routes_tasks.register_pipeline_task("pipeline_todos_os_alunos", "ativ-1", ["a1", "a2"])
+
+    def pipeline(aluno):
+        return executor.executar_pipeline_completo(
+            "ativ-1", aluno, model_id="m1", selected_steps=["extrair_questoes"], task_id=task_id,
+        )
+
+    atrasado = asyncio.create_task(pipeline("a2"))
+    await asyncio.to_thread(snapshot_tirado.wait, 5)
+    await pipeline("a1")
+    lider_terminou.set()
+    await atrasado
+
+    assert len(chamadas) == 1
+    task = routes_tasks.task_registry[task_id]
+    assert task["students"]["a1"]["stages"]["extrair_questoes"] == "completed"
+    assert task["students"]["a2"]["stages"]["extrair_questoes"] == "skipped"
@@ -0,0 +1,181 @@
+"""Tests for the shared SQLite connection pool (WAL, busy_timeout, per-thread reuse)."""
+
+import os
+import sys
+import threading
+from pathlib import Path
+from unittest.mock import patch
+
+
+BACKEND_DIR = Path(__file__).parent.parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("PROVA_AI_TESTING", "1")
+os.environ.setdefault("PROVA_AI_DISABLE_LOCAL_LLM", "1")
+
+from sqlite_pool import SQLiteConnectionPool
+
+
+def test_connection_is_reused_within_a_thread(tmp_path):
+    pool = SQLiteConnectionPool()
+    db = tmp_path / "db.sqlite"
+
+    assert pool.get(db) is pool.get(db)
+    pool.close_all()
+
+
+def test_each_thread_gets_its_own_connection(tmp_path):
+    pool = SQLiteConnectionPool()
+    db = tmp_path / "db.sqlite"
+    main_conn = pool.get(db)
+    other = {}
+
+    thread = threading.Thread(target=lambda: other.setdefault("conn", pool.get(db)))
+    thread.start()
+    thread.join()
+
+    assert other["conn"] is not main_conn
+    assert pool.stats()["open_connections"] == 2
+    pool.close_all()
+
+
+def test_connections_use_wal_and_busy_timeout(tmp_path):
+    pool = SQLiteConnectionPool()
+    db = tmp_path / "db.sqlite"
+    conn = pool.get(db)
+
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal"
+    assert conn.execute("PRAGMA busy_timeout").fetchone()[0] > 0
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    assert pool.journal_mode(db) == "wal"
+    pool.close_all()
+
+
+def test_close_returns_connection_and_rolls_back_pending_work(tmp_path):
+    pool = SQLiteConnectionPool()
+    db = tmp_path / "db.sqlite"
+    conn = pool.get(db)
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.commit()
+
+    conn.execute("INSERT INTO t VALUES (1)")
+    conn.close()
+
+    again = pool.get(db)
+    assert again is conn
+    assert again.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+    pool.close_all()
+
+
+def test_deleted_database_file_is_reopened(tmp_path):
+    pool = SQLiteConnectionPool()
+    db = tmp_path / "db.sqlite"
+    first = pool.get(db)
+    first.execute("CREATE TABLE t (x INTEGER)")
+    first.commit()
+
+    for suffix in ("", "-wal", "-shm"):
+        path = Path(str(db) + suffix)
+        if path.exists():
+            path.unlink()
+
+    second = pool.get(db)
+    assert second is not first
+    assert second.execute("SELECT name FROM sqlite_master").fetchall() == []
+    pool.close_all()
+
+
+def test_storage_and_prompt_manager_share_the_pool(tmp_path):
+    with patch("storage.SUPABASE_DB_AVAILABLE", False):
+        from storage import StorageManager
+        from prompts import PromptManager
+        from sqlite_pool import sqlite_pool
+
+        storage = StorageManager(base_path=str(tmp_path))
+        prompts = PromptManager(db_path=str(storage.db_path))
+
+        assert storage._get_connection() is prompts._get_connection()
+        assert sqlite_pool.journal_mode(storage.db_path) == "wal"
+
+
+def test_concurrent_writers_do_not_hit_database_locked(tmp_path):
+    with patch("storage.SUPABASE_DB_AVAILABLE", False):
+        from storage import StorageManager
+
+        storage = StorageManager(base_path=str(tmp_path))
+
+    errors = []
+
+    def _writer(n):
+        try:
+            for i in range(20):
+                storage.criar_aluno(f"Aluno {n}-{i}")
+        except Exception as exc:  # pragma: no cover - reported below
+            errors.append(exc)
+
+    threads = [threading.Thread(target=_writer, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(storage.listar_alunos()) == 160
+
+
+def test_get_rolls_back_a_transaction_left_open_by_an_exception(tmp_path):
+    pool = SQLiteConnectionPool()
+    db = tmp_path / "db.sqlite"
+    conn = pool.get(db)
+    conn.execute("CREATE TABLE t (x INTEGER PRIMARY KEY)")
+    conn.commit()
+
+    conn.execute("INSERT INTO t VALUES (1)")
+    assert conn.in_transaction  # quem usou saiu sem close()
+
+    again = pool.get(db)
+    assert not again.in_transaction
+    assert again.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+    pool.close_all()
+
+
+def test_failed_insert_does_not_lock_writers_on_other_threads(tmp_path):
+    import sqlite3
+
+    with patch("storage.SUPABASE_DB_AVAILABLE", False), \
+         patch("storage.SUPABASE_STORAGE_AVAILABLE", False):
+        from storage import StorageManager
+
+        storage = StorageManager(base_path=str(tmp_path))
+    storage.blobs = None
+    materia = storage.criar_materia("Matemática")
+    turma = storage.criar_turma(materia.id, "9A")
+    atividade = storage.criar_atividade(turma.id, "Prova 1")
+    arquivo = tmp_path / "prova.pdf"
+    arquivo.write_bytes(b"%PDF-1.4")
+
+    from models import TipoDocumento
+
+    with patch.object(storage, "_generate_id", return_value="doc-repetido"):
+        storage.salvar_documento(str(arquivo), TipoDocumento.ENUNCIADO, atividade.id)
+        try:
+            storage.salvar_documento(str(arquivo), TipoDocumento.ENUNCIADO, atividade.id)
+        except sqlite3.IntegrityError:
+            pass
+
+    assert not storage._get_connection().in_transaction
+
+    errors = []
+
+    def _writer():
+        try:
+            storage.criar_aluno("Outra thread")
+        except Exception as exc:  # pragma: no cover - reported below
+            errors.append(exc)
+
+    thread = threading.Thread(target=_writer)
+    thread.start()
+    thread.join()
+
+    assert errors == []
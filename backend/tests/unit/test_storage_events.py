@@ -0,0 +1,223 @@
+"""Tests for the storage change-event bus and the caches it invalidates."""
+
+import os
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+
+BACKEND_DIR = Path(__file__).parent.parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("PROVA_AI_TESTING", "1")
+os.environ.setdefault("PROVA_AI_DISABLE_LOCAL_LLM", "1")
+
+from models import TipoDocumento  # noqa: E402
+from storage_events import StorageEvent, StorageEventBus, StorageEventType, process_bus  # noqa: E402
+
+
+def _make_storage(tmp_path: Path, events: StorageEventBus = None):
+    with patch("storage.SUPABASE_DB_AVAILABLE", False), \
+         patch("storage.SUPABASE_STORAGE_AVAILABLE", False):
+        from storage import StorageManager
+
+        # Barramento próprio: o do processo é compartilhado entre os testes
+        return StorageManager(base_path=str(tmp_path), events=events or StorageEventBus())
+
+
+def _seed(storage):
+    materia = storage.criar_materia("Matemática")
+    turma = storage.criar_turma(materia.id, "9A")
+    atividade = storage.criar_atividade(turma.id, "Prova 1")
+    return materia, turma, atividade
+
+
+def test_subscribers_filter_by_type_and_can_unsubscribe():
+    bus = StorageEventBus()
+    seen, docs_only = [], []
+    unsubscribe = bus.subscribe(seen.append)
+    bus.subscribe(docs_only.append, tipos={StorageEventType.DOCUMENTO_SALVO})
+
+    bus.emit(StorageEventType.ALUNO_CRIADO, "a1", aluno_id="a1")
+    bus.emit(StorageEventType.DOCUMENTO_SALVO, "d1", atividade_id="x")
+    unsubscribe()
+    bus.emit(StorageEventType.DOCUMENTO_SALVO, "d2", atividade_id="x")
+
+    assert [e.entity_id for e in seen] == ["a1", "d1"]
+    assert [e.entity_id for e in docs_only] == ["d1", "d2"]
+
+
+def test_failing_subscriber_does_not_break_publish():
+    bus = StorageEventBus()
+    received = []
+
+    def _broken(event):
+        raise RuntimeError("boom")
+
+    bus.subscribe(_broken)
+    bus.subscribe(received.append)
+    bus.emit(StorageEventType.TURMA_CRIADA, "t1")
+
+    assert len(received) == 1
+    assert bus.stats()["subscriber_errors"] == 1
+
+
+def test_documento_events_are_emitted_after_commit(tmp_path):
+    storage = _make_storage(tmp_path)
+    _, _, atividade = _seed(storage)
+    origem = tmp_path / "enunciado.pdf"
+    origem.write_bytes(b"%PDF-1.4")
+    visible = []
+
+    def _check_committed(event):
+        # A linha já precisa estar visível para outra leitura quando o evento chega
+        visible.append((event.tipo, storage.get_documento(event.entity_id) is not None))
+
+    storage.events.subscribe(_check_committed, tipos={
+        StorageEventType.DOCUMENTO_SALVO,
+        StorageEventType.DOCUMENTO_DELETADO,
+    })
+
+    doc = storage.salvar_documento(str(origem), TipoDocumento.ENUNCIADO, atividade.id)
+    storage.deletar_documento(doc.id)
+
+    assert visible == [
+        (StorageEventType.DOCUMENTO_SALVO, True),
+        (StorageEventType.DOCUMENTO_DELETADO, False),
+    ]
+
+
+def test_vinculo_events_carry_context(tmp_path):
+    storage = _make_storage(tmp_path)
+    _, turma, _ = _seed(storage)
+    aluno = storage.criar_aluno("Ana")
+    events = []
+    storage.events.subscribe(events.append, tipos={
+        StorageEventType.ALUNO_VINCULADO,
+        StorageEventType.ALUNO_DESVINCULADO,
+    })
+
+    storage.vincular_aluno_turma(aluno.id, turma.id)
+    storage.desvincular_aluno_turma(aluno.id, turma.id)
+
+    assert [(e.tipo, e.aluno_id, e.turma_id) for e in events] == [
+        (StorageEventType.ALUNO_VINCULADO, aluno.id, turma.id),
+        (StorageEventType.ALUNO_DESVINCULADO, aluno.id, turma.id),
+    ]
+
+
+def test_navigation_tree_is_cached_until_a_change(tmp_path):
+    storage = _make_storage(tmp_path)
+    _, _, atividade = _seed(storage)
+    origem = tmp_path / "gabarito.pdf"
+    origem.write_bytes(b"%PDF-1.4")
+
+    first = storage.get_arvore_navegacao_fast()
+    with patch.object(storage, "_select_rows", side_effect=AssertionError("cache miss")):
+        assert storage.get_arvore_navegacao_fast() == first
+
+    storage.salvar_documento(str(origem), TipoDocumento.GABARITO, atividade.id)
+    arvore = storage.get_arvore_navegacao_fast()
+
+    ativ = arvore["materias"][0]["turmas"][0]["atividades"][0]
+    assert ativ["total_documentos"] == 1
+
+
+def test_remote_events_invalidate_local_caches(tmp_path):
+    storage = _make_storage(tmp_path)
+    materia, _, _ = _seed(storage)
+    journal_path = tmp_path / "storage_events.db"
+    storage.events.enable_cross_process(journal_path, poll_interval=3600)
+
+    # Outro processo: mesmo journal, origem diferente
+    other = StorageEventBus()
+    other.enable_cross_process(journal_path, poll_interval=3600)
+
+    assert storage.get_materia(materia.id).nome == "Matemática"
+    conn = storage._get_connection()
+    conn.execute("UPDATE materias SET nome = 'Álgebra' WHERE id = ?", (materia.id,))
+    conn.commit()
+    conn.close()
+    assert storage.get_materia(materia.id).nome == "Matemática"  # ainda em cache
+
+    other.publish(StorageEvent(
+        tipo=StorageEventType.MATERIA_ATUALIZADA,
+        entity_id=materia.id,
+        origem="outro-processo",
+    ))
+    assert storage.events.poll_remote() == 1
+    assert storage.get_materia(materia.id).nome == "Álgebra"
+
+    storage.events.close()
+    other.close()
+
+
+def test_prompt_manager_emits_prompt_events(tmp_path):
+    from prompts import EtapaProcessamento, PromptManager
+
+    manager = PromptManager(db_path=str(tmp_path / "database.db"))
+    events = []
+    manager.events.subscribe(events.append)
+
+    prompt = manager.criar_prompt("Teste", EtapaProcessamento.CORRIGIR, "Corrija {{resposta}}")
+    manager.atualizar_prompt(prompt.id, texto="Corrija melhor {{resposta}}")
+    manager.deletar_prompt(prompt.id)
+
+    assert [e.tipo for e in events] == [
+        StorageEventType.PROMPT_CRIADO,
+        StorageEventType.PROMPT_ATUALIZADO,
+        StorageEventType.PROMPT_DELETADO,
+    ]
+
+
+def test_storage_and_prompt_manager_share_the_process_bus(tmp_path):
+    from prompts import EtapaProcessamento, PromptManager
+
+    storage = _make_storage(tmp_path, events=process_bus())
+    manager = PromptManager(db_path=str(tmp_path / "database.db"))
+    assert manager.events is storage.events is process_bus()
+
+    events = []
+    unsubscribe = storage.events.subscribe(events.append, tipos={StorageEventType.PROMPT_CRIADO})
+    try:
+        manager.criar_prompt("Teste", EtapaProcessamento.CORRIGIR, "Corrija {{resposta}}")
+    finally:
+        unsubscribe()
+        storage.close()
+    assert [e.tipo for e in events] == [StorageEventType.PROMPT_CRIADO]
+
+
+def test_status_and_ranking_caches_follow_storage_events(tmp_path):
+    from visualizador import VisualizadorResultados
+
+    storage = _make_storage(tmp_path)
+    _, turma, atividade = _seed(storage)
+    outra = storage.criar_atividade(turma.id, "Prova 2")
+    aluno = storage.criar_aluno("Ana")
+    storage.vincular_aluno_turma(aluno.id, turma.id)
+    vis = VisualizadorResultados(storage)
+    origem = tmp_path / "gabarito.pdf"
+    origem.write_bytes(b"%PDF-1.4")
+
+    status = storage.get_status_atividade(atividade.id)
+    assert status["documentos_base"]["faltando"] == ["enunciado", "gabarito"]
+    storage.get_status_atividade(outra.id)
+    assert [r["aluno_id"] for r in vis.get_ranking_turma(atividade.id)] == [aluno.id]
+    with patch.object(storage, "_calcular_status_atividade", side_effect=AssertionError("cache miss")), \
+         patch.object(vis, "_calcular_ranking_turma", side_effect=AssertionError("cache miss")):
+        assert storage.get_status_atividade(atividade.id) == status
+        assert vis.get_ranking_turma(atividade.id)[0]["aluno_nome"] == "Ana"
+
+    # Documento salvo: só a atividade dele é recalculada
+    storage.salvar_documento(str(origem), TipoDocumento.GABARITO, atividade.id)
+    with patch.object(storage, "_calcular_status_atividade", side_effect=AssertionError("cache miss")):
+        storage.get_status_atividade(outra.id)
+    assert storage.get_status_atividade(atividade.id)["documentos_base"]["faltando"] == ["enunciado"]
+
+    # Vínculo de aluno muda o ranking e o status de todas as atividades da turma
+    novo = storage.criar_aluno("Bruno")
+    storage.vincular_aluno_turma(novo.id, turma.id)
+    assert storage.get_status_atividade(outra.id)["alunos"]["total"] == 2
+    assert {r["aluno_nome"] for r in vis.get_ranking_turma(atividade.id)} == {"Ana", "Bruno"}
+    storage.close()
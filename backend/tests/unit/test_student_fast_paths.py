@@ -119,32 +119,38 @@ def test_listar_documentos_postgresql_fetches_student_and_base_docs_only(seeded_
     ]
 
 
-def test_deletar_documentos_aluno_atividade_postgresql_uses_row_selection_and_delete(seeded_storage, monkeypatch):
+def test_deletar_documentos_aluno_atividade_postgresql_deletes_in_one_request(seeded_storage, monkeypatch):
+    import storage as storage_module
+
     seeded_storage.use_postgresql = True
     select_calls = []
-    deleted_ids = []
 
     def fake_select_rows(table, filters=None, order_by=None, order_desc=False, limit=None, columns=None):
-        select_calls.append((table, dict(filters or {}), columns))
+        select_calls.append((table, dict(filters or {})))
         assert table == "documentos"
         return [
-            {"id": "doc-1"},
-            {"id": "doc-2"},
+            {"id": "doc-1", "atividade_id": "ativ-1", "aluno_id": "aluno-1", "tipo": "correcao"},
+            {"id": "doc-2", "atividade_id": "ativ-1", "aluno_id": "aluno-1", "tipo": "correcao"},
         ]
 
+    fake_db = MagicMock()
+    fake_db.delete_where.return_value = 2
+    monkeypatch.setattr(storage_module, "supabase_db", fake_db)
     monkeypatch.setattr(seeded_storage, "_select_rows", fake_select_rows)
     monkeypatch.setattr(
         seeded_storage,
         "deletar_documento",
-        lambda documento_id: deleted_ids.append(documento_id) or True,
+        MagicMock(side_effect=AssertionError("row-by-row delete")),
     )
 
     deleted_count = seeded_storage.deletar_documentos_aluno_atividade("ativ-1", "aluno-1")
 
     assert deleted_count == 2
-    assert deleted_ids == ["doc-1", "doc-2"]
+    fake_db.delete_where.assert_called_once_with(
+        "documentos", {"atividade_id": "ativ-1", "aluno_id": "aluno-1"}
+    )
     assert select_calls == [
-        ("documentos", {"atividade_id": "ativ-1", "aluno_id": "aluno-1"}, ["id"])
+        ("documentos", {"atividade_id": "ativ-1", "aluno_id": "aluno-1"})
     ]
 
 
@@ -447,20 +453,19 @@ def test_visualizador_ranking_turma_batches_corrections(monkeypatch):
         _doc_row("doc-dani-invalid", "ativ-1", "aluno-invalido", criado_em="2026-03-14T09:00:00"),
     ]
 
-    def fake_select_rows(table, filters=None, order_by=None, order_desc=False, limit=None, columns=None):
-        select_calls.append((table, dict(filters or {}), order_by, order_desc))
-        assert table == "documentos"
-        assert filters == {
-            "atividade_id": "ativ-1",
-            "aluno_id": ["aluno-zero", "aluno-oito", "aluno-sem-doc", "aluno-invalido"],
-            "tipo": "correcao",
-            "status": "concluido",
-        }
-        assert order_by == "criado_em"
-        assert order_desc is True
-        return correction_rows
+    def fake_listar_documentos_atuais(atividade_id, aluno_id=None, tipo=None, status=None):
+        select_calls.append((atividade_id, list(aluno_id), tipo, status))
+        assert atividade_id == "ativ-1"
+        assert aluno_id == ["aluno-zero", "aluno-oito", "aluno-sem-doc", "aluno-invalido"]
+        assert tipo == TipoDocumento.CORRECAO
+        assert status == "concluido"
+        return [
+            Documento.from_dict(row)
+            for row in correction_rows
+            if row["status"] == status
+        ]
 
-    fake_storage._select_rows = fake_select_rows
+    fake_storage.listar_documentos_atuais = fake_listar_documentos_atuais
 
     visualizador = VisualizadorResultados()
     visualizador.storage = fake_storage
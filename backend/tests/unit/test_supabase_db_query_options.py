@@ -53,6 +53,6 @@ def test_count_returns_zero_without_query_when_in_filter_is_empty():
     total = db.count("documentos", filters={"atividade_id": []})
 
     client.table.assert_called_once_with("documentos")
-    table.select.assert_called_once_with("id", count="exact")
+    table.select.assert_called_once_with("id", count="exact", head=True)
     query.execute.assert_not_called()
     assert total == 0
@@ -0,0 +1,189 @@
+"""Tests for the pooled SupabaseDB client: IN chunking, concurrent selects and timings."""
+
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+
+BACKEND_DIR = Path(__file__).parent.parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("PROVA_AI_TESTING", "1")
+os.environ.setdefault("PROVA_AI_DISABLE_LOCAL_LLM", "1")
+
+import supabase_db as supabase_db_module  # noqa: E402
+from supabase_db import SupabaseDB  # noqa: E402
+
+
+class _FakeQuery:
+    """PostgREST query builder stub: records the IN values, answers one row per id."""
+
+    def __init__(self, table: str, on_execute=None):
+        self.table = table
+        self.in_values = None
+        self.on_execute = on_execute
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def in_(self, column, values):
+        self.in_values = list(values)
+        return self
+
+    def eq(self, *args):
+        return self
+
+    def is_(self, *args):
+        return self
+
+    def order(self, *args, **kwargs):
+        return self
+
+    def limit(self, *args):
+        return self
+
+    def execute(self):
+        if self.on_execute:
+            self.on_execute(self)
+        ids = self.in_values or [f"{self.table}-1"]
+        return SimpleNamespace(data=[{"id": i, "nome": i} for i in ids], count=len(ids))
+
+
+def _make_db(on_execute=None):
+    queries = []
+    client = MagicMock()
+
+    def _table(name):
+        query = _FakeQuery(name, on_execute)
+        queries.append(query)
+        return query
+
+    client.table.side_effect = _table
+    db = SupabaseDB.__new__(SupabaseDB)
+    db._client = client
+    db._enabled = True
+    return db, queries
+
+
+def test_large_in_filter_is_split_and_merged_in_order():
+    db, queries = _make_db()
+    ids = [f"doc-{i:04d}" for i in range(350)]
+
+    with patch.object(supabase_db_module, "_IN_CHUNK_SIZE", 100):
+        rows = db.select("documentos", filters={"id": list(reversed(ids))}, order_by="nome", limit=250)
+
+    assert [len(query.in_values) for query in queries] == [100, 100, 100, 50]
+    assert [row["id"] for row in rows] == ids[:250]
+
+
+def test_chunked_merge_orders_nulls_like_postgres():
+    db, _ = _make_db()
+
+    def _execute(query):
+        rows = [{"id": i, "nome": None if i in ("a", "c") else i} for i in query.in_values]
+        return SimpleNamespace(data=rows, count=len(rows))
+
+    with patch.object(supabase_db_module, "_IN_CHUNK_SIZE", 2), patch.object(_FakeQuery, "execute", _execute):
+        asc = db.select("alunos", filters={"id": ["a", "b", "c", "d"]}, order_by="nome", keyset=True)
+        desc = db.select("alunos", filters={"id": ["a", "b", "c", "d"]}, order_by="nome",
+                         order_desc=True, keyset=True)
+    db.close()
+
+    # ORDER BY nome, id: NULLS LAST ascending, NULLS FIRST descending
+    assert [row["id"] for row in asc] == ["b", "d", "a", "c"]
+    assert [row["id"] for row in desc] == ["c", "a", "d", "b"]
+
+
+def test_count_sums_chunks():
+    db, queries = _make_db()
+
+    with patch.object(supabase_db_module, "_IN_CHUNK_SIZE", 2):
+        total = db.count("documentos", filters={"atividade_id": {"in": ["a", "b", "c", "d", "e"]}})
+
+    assert total == 5
+    assert len(queries) == 3
+
+
+def test_select_many_runs_requests_concurrently_and_keeps_order():
+    em_voo = []
+    maximo = [0]
+    lock = threading.Lock()
+
+    def _lento(query):
+        with lock:
+            em_voo.append(query.table)
+            maximo[0] = max(maximo[0], len(em_voo))
+        time.sleep(0.05)
+        with lock:
+            em_voo.remove(query.table)
+
+    db, _ = _make_db(on_execute=_lento)
+    tabelas = ["materias", "turmas", "atividades", "alunos_turmas"]
+
+    try:
+        resultados = db.select_many([{"table": tabela} for tabela in tabelas])
+    finally:
+        db.close()
+
+    assert [rows[0]["id"] for rows in resultados] == [f"{tabela}-1" for tabela in tabelas]
+    assert maximo[0] > 1
+
+
+def test_request_timings_cover_the_current_call():
+    db, _ = _make_db()
+    started_at = time.perf_counter()
+
+    db.select("materias")
+    db.select_one("turmas", "turma-1")
+
+    timings = db.request_timings(started_at)
+    assert [(table, op, ok) for table, op, _, ok in timings] == [
+        ("materias", "select", True),
+        ("turmas", "select_one", True),
+    ]
+    assert db.request_timings(time.perf_counter()) == []
+    assert db.pool_stats()["requests"] >= 2
+
+
+def test_relation_available_does_not_require_an_id_column():
+    db, _ = _make_db()
+    db._client = MagicMock()
+
+    assert db.relation_available("documento_contadores")
+    db._client.table.return_value.select.assert_called_once_with("*")
+
+
+def test_arvore_reads_document_totals_from_counters(tmp_path):
+    import storage as storage_module
+
+    with patch("storage.SUPABASE_DB_AVAILABLE", False), \
+         patch("storage.SUPABASE_STORAGE_AVAILABLE", False):
+        storage = storage_module.StorageManager(base_path=str(tmp_path / "data"))
+    materia = storage.criar_materia("Matemática")
+    turma = storage.criar_turma(materia.id, "9A")
+    atividade = storage.criar_atividade(turma.id, "Prova 1")
+    arquivo = tmp_path / "enunciado.pdf"
+    arquivo.write_bytes(b"%PDF-1.4 enunciado")
+    from models import TipoDocumento
+    storage.salvar_documento(str(arquivo), TipoDocumento.ENUNCIADO, atividade.id)
+
+    tabelas = []
+    original = storage._select_rows
+
+    def _spy(table, **kwargs):
+        tabelas.append(table)
+        return original(table, **kwargs)
+
+    with patch.object(storage, "_select_rows", side_effect=_spy):
+        arvore = storage.get_arvore_navegacao_fast()
+
+    assert "documentos" not in tabelas
+    assert "documento_contadores" in tabelas
+    atividades = arvore["materias"][0]["turmas"][0]["atividades"]
+    assert atividades == [{"id": atividade.id, "nome": "Prova 1", "tipo": atividade.tipo, "total_documentos": 1}]
+    storage.close()
@@ -0,0 +1,307 @@
+"""Tests for cooperative cancellation of in-flight pipeline work (task_cancel.py)."""
+
+import asyncio
+import functools
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import httpx
+import pytest
+
+
+BACKEND_DIR = Path(__file__).parent.parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("PROVA_AI_TESTING", "1")
+os.environ.setdefault("PROVA_AI_DISABLE_LOCAL_LLM", "1")
+
+import routes_tasks  # noqa: E402
+import task_cancel  # noqa: E402
+import task_queue  # noqa: E402
+from task_cancel import TarefaCancelada, escopo_cancelavel  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    monkeypatch.setattr(routes_tasks, "task_registry", {})
+
+
+def _mock_httpx(monkeypatch, module, handler):
+    """Route every httpx.AsyncClient created by ``module`` through ``handler``."""
+    real = httpx.AsyncClient
+    monkeypatch.setattr(module.httpx, "AsyncClient", functools.partial(real, transport=httpx.MockTransport(handler)))
+
+
+async def _cancel_when(condicao, task_id):
+    while not condicao():
+        await asyncio.sleep(0.01)
+    await routes_tasks.cancel_task(task_id)
+
+
+async def test_cancel_aborts_the_open_multimodal_request(monkeypatch):
+    import ai_http
+    import anexos
+
+    abortada = asyncio.Event()
+    enviada = asyncio.Event()
+
+    async def handler(request):
+        enviada.set()
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            abortada.set()
+            raise
+        return httpx.Response(200, json={})
+
+    _mock_httpx(monkeypatch, ai_http, handler)
+    task_id = routes_tasks.register_pipeline_task("pipeline", "ativ", ["aluno"])
+    cliente = anexos.ClienteAPIMultimodal({"tipo": "openai", "api_key": "k", "modelo": "gpt-4o"})
+
+    async def chamar():
+        async with escopo_cancelavel(task_id):
+            return await cliente.enviar_com_anexos("oi", [])
+
+    inicio = time.monotonic()
+    with pytest.raises(TarefaCancelada):
+        await asyncio.gather(chamar(), _cancel_when(enviada.is_set, task_id))
+    assert abortada.is_set()
+    assert time.monotonic() - inicio < 5
+
+
+async def test_cancel_stops_the_retry_backoff_without_another_attempt():
+    from utils.retry import RetryConfig, retry_com_backoff
+
+    task_id = routes_tasks.register_pipeline_task("pipeline", "ativ", ["aluno"])
+    tentativas = []
+
+    async def chamada():
+        tentativas.append(1)
+        return MagicMock(sucesso=False, erro="Erro API: 429", erro_codigo=429, retry_after=None)
+
+    async def chamar():
+        async with escopo_cancelavel(task_id):
+            await retry_com_backoff(chamada, RetryConfig(max_tentativas=3, backoff_base=30))
+
+    with pytest.raises(TarefaCancelada):
+        await asyncio.wait_for(asyncio.gather(chamar(), _cancel_when(lambda: tentativas, task_id)), 5)
+    assert len(tentativas) == 1
+
+
+async def test_tool_loop_keeps_the_usage_of_iterations_already_answered(monkeypatch):
+    import chat_service
+    from chat_service import ChatClient, ModelConfig, ProviderType
+    from tools import ToolRegistry
+
+    chamadas = []
+
+    async def handler(request):
+        chamadas.append(request)
+        if len(chamadas) == 1:
+            return httpx.Response(200, json={
+                "stop_reason": "tool_use",
+                "usage": {"input_tokens": 1200, "output_tokens": 300},
+                "content": [{"type": "tool_use", "id": "t1", "name": "create_document", "input": {}}],
+            })
+        await asyncio.sleep(60)
+
+    _mock_httpx(monkeypatch, chat_service, handler)
+    task_id = routes_tasks.register_pipeline_task("pipeline", "ativ", ["aluno"])
+    client = ChatClient(ModelConfig(id="m", nome="m", tipo=ProviderType.ANTHROPIC, modelo="claude"), "k")
+
+    async def chamar():
+        async with escopo_cancelavel(task_id):
+            await client.chat_with_tools("oi", tools=[], tool_registry=ToolRegistry())
+
+    with pytest.raises(TarefaCancelada):
+        await asyncio.gather(chamar(), _cancel_when(lambda: len(chamadas) == 2, task_id))
+    assert client.uso_acumulado == {"tokens": 1500, "input_tokens": 1200, "output_tokens": 300}
+
+
+async def test_cancel_tears_down_the_code_sandbox():
+    from code_executor import E2BExecutor
+
+    iniciada = threading.Event()
+    morto = threading.Event()
+    sandbox = MagicMock()
+    sandbox.kill.side_effect = morto.set
+
+    def execucao_bloqueante(handle):
+        handle["sandbox"] = sandbox
+        iniciada.set()
+        morto.wait(30)  # the code keeps running until the sandbox dies
+
+    task_id = routes_tasks.register_pipeline_task("pipeline", "ativ", ["aluno"])
+    executor = E2BExecutor()
+
+    async def chamar():
+        async with escopo_cancelavel(task_id):
+            await executor._run_sandbox(execucao_bloqueante)
+
+    with pytest.raises(TarefaCancelada):
+        await asyncio.gather(chamar(), _cancel_when(iniciada.is_set, task_id))
+    assert await asyncio.to_thread(morto.wait, 5)
+    sandbox.kill.assert_called_once()
+
+
+async def test_cancel_written_by_another_process_is_picked_up_by_the_poll(tmp_path):
+    store = task_queue.TaskStore(str(tmp_path / "task_queue.db"))
+    task_queue.set_task_store(store)
+    try:
+        task_id = routes_tasks.register_pipeline_task("pipeline", "ativ", ["aluno"])
+        routes_tasks.task_registry.clear()  # the API process wrote the flag, not this one
+        escopo = escopo_cancelavel(task_id)
+
+        async def chamar():
+            async with escopo:
+                await asyncio.sleep(60)
+
+        tarefa = asyncio.create_task(chamar())
+        await asyncio.sleep(0.01)
+        assert task_cancel.verificar_pendentes() == []
+        store.request_cancel(task_id)
+        assert await asyncio.to_thread(task_cancel.verificar_pendentes) == [task_id]
+        with pytest.raises(TarefaCancelada):
+            await asyncio.wait_for(tarefa, 5)
+    finally:
+        task_queue.set_task_store(None)
+
+
+async def test_an_outer_cancel_is_not_swallowed_by_the_scope():
+    task_id = routes_tasks.register_pipeline_task("pipeline", "ativ", ["aluno"])
+
+    async def chamar():
+        async with escopo_cancelavel(task_id):
+            await asyncio.sleep(60)
+
+    tarefa = asyncio.create_task(chamar())
+    await asyncio.sleep(0.01)
+    tarefa.cancel()  # e.g. shutdown, not a task cancel
+    with pytest.raises(asyncio.CancelledError):
+        await tarefa
+    assert task_cancel.stats()["escopos_abertos"] == 0
+
+
+async def test_nested_scopes_in_one_task_convert_the_inner_cancel():
+    task_id = routes_tasks.register_pipeline_task("pipeline", "ativ", ["aluno"])
+    eventos = []
+    dentro = asyncio.Event()
+
+    async def chamar():
+        async with escopo_cancelavel(task_id):
+            try:
+                async with escopo_cancelavel(task_id):
+                    dentro.set()
+                    await asyncio.sleep(60)
+            except TarefaCancelada:
+                eventos.append("interno")
+            await asyncio.sleep(60)  # the outer flow would carry on
+
+    tarefa = asyncio.create_task(chamar())
+    await dentro.wait()
+    assert task_cancel.cancelar(task_id) == 1
+    with pytest.raises(TarefaCancelada):
+        await asyncio.wait_for(tarefa, 5)
+    assert eventos == ["interno"]
+    assert task_cancel.stats()["escopos_abertos"] == 0
+
+
+async def test_cancelling_a_running_pipeline_interrupts_the_stage(monkeypatch):
+    from executor import PipelineExecutor, ResultadoExecucao, SingleFlight
+    from prompts import EtapaProcessamento as E
+
+    executor = PipelineExecutor.__new__(PipelineExecutor)
+    executor.storage = MagicMock()
+    executor.storage.listar_documentos.return_value = []
+    executor._validar_prova_respondida_para_extracao = MagicMock(return_value=(True, None, None))
+    monkeypatch.setattr(PipelineExecutor, "_etapas_atividade", SingleFlight())
+    em_execucao = asyncio.Event()
+
+    async def executar_etapa(stage, *args, **kwargs):
+        if stage == E.EXTRAIR_RESPOSTAS:
+            em_execucao.set()
+            await asyncio.sleep(60)  # a slow multimodal call
+        return ResultadoExecucao(sucesso=True, etapa=stage)
+
+    executor.executar_etapa = executar_etapa
+    task_id = routes_tasks.register_pipeline_task("pipeline", "ativ", ["aluno"])
+
+    inicio = time.monotonic()
+    await asyncio.gather(
+        executor.executar_pipeline_completo("ativ", "aluno", model_id="m", task_id=task_id),
+        _cancel_when(em_execucao.is_set, task_id),
+    )
+
+    assert time.monotonic() - inicio < 5
+    task = routes_tasks.get_task(task_id)
+    stages = task["students"]["aluno"]["stages"]
+    assert task["status"] == "cancelled"
+    assert stages["extrair_respostas"] == "skipped"
+    assert task["students"]["aluno"]["stage_skips"]["extrair_respostas"]["tipo"] == "task_cancelled"
+    assert stages["corrigir"] == "pending"
+
+
+async def test_nested_scopes_cancel_each_stage_once(monkeypatch):
+    """Desempenho de turma: escopo externo → cascata → etapa de cada aluno (filhos do gather)."""
+    import executor as executor_module
+    import routes_prompts
+    from executor import PipelineExecutor, ResultadoExecucao, SingleFlight
+    from prompts import EtapaProcessamento as E
+    from routes_tasks import add_task_students
+
+    atividade = MagicMock(id="ativ", turma_id="turma")
+    alunos = [MagicMock(id="a1", nome="Ana"), MagicMock(id="a2", nome="Bruno")]
+    storage = MagicMock()
+    storage.listar_atividades.return_value = [atividade]
+    storage.listar_documentos.return_value = []
+    storage.get_atividade.return_value = atividade
+    storage.listar_alunos.return_value = alunos
+
+    executor = PipelineExecutor.__new__(PipelineExecutor)
+    executor.storage = storage
+    executor._validar_prova_respondida_para_extracao = MagicMock(return_value=(True, None, None))
+    executor.gerar_relatorio_desempenho_tarefa = MagicMock()
+    executor.gerar_relatorio_desempenho_turma = MagicMock()
+
+    async def prefetch_atividade(*args, **kwargs):
+        return {}
+
+    em_execucao = set()
+
+    async def executar_etapa(stage, atividade_id, aluno_id=None, *args, **kwargs):
+        if stage == E.EXTRAIR_RESPOSTAS:
+            em_execucao.add(aluno_id)
+            await asyncio.sleep(60)  # a slow multimodal call
+        return ResultadoExecucao(sucesso=True, etapa=stage)
+
+    executor.prefetch_atividade = prefetch_atividade
+    executor.executar_etapa = executar_etapa
+    monkeypatch.setattr(PipelineExecutor, "_etapas_atividade", SingleFlight())
+    monkeypatch.setattr(executor_module, "executor", executor)
+    monkeypatch.setattr(routes_prompts, "astorage", executor.astorage)
+
+    task_id = routes_tasks.register_pipeline_task("pipeline_desempenho_turma", "turma", [])
+    add_task_students(task_id, {aluno.id: aluno.nome for aluno in alunos})
+
+    inicio = time.monotonic()
+    await asyncio.gather(
+        routes_prompts._executar_desempenho_turma_background(
+            task_id=task_id, turma_id="turma", model_id="m", provider_id=None, models_per_stage=None,
+        ),
+        _cancel_when(lambda: em_execucao == {"a1", "a2"}, task_id),
+    )
+
+    assert time.monotonic() - inicio < 5
+    task = routes_tasks.get_task(task_id)
+    assert task["status"] == "cancelled"
+    for aluno in alunos:
+        estado = task["students"][aluno.id]
+        assert estado["stages"]["extrair_respostas"] == "skipped"
+        assert estado["stage_skips"]["extrair_respostas"]["tipo"] == "task_cancelled"
+    executor.gerar_relatorio_desempenho_turma.assert_not_called()
+    assert task_cancel.stats()["escopos_abertos"] == 0
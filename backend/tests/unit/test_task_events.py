@@ -0,0 +1,197 @@
+"""Tests for task progress deltas (task_events.py) and the SSE / ?since= endpoints."""
+
+import asyncio
+import os
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+
+BACKEND_DIR = Path(__file__).parent.parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("PROVA_AI_TESTING", "1")
+os.environ.setdefault("PROVA_AI_DISABLE_LOCAL_LLM", "1")
+
+import fast_json  # noqa: E402
+import routes_tasks  # noqa: E402
+import task_events  # noqa: E402
+import task_queue  # noqa: E402
+from task_events import TaskEventBus  # noqa: E402
+from task_queue import TaskStore  # noqa: E402
+
+
+@pytest.fixture
+def bus(monkeypatch):
+    bus = TaskEventBus(buffer_size=50)
+    monkeypatch.setattr(task_events, "bus", bus)
+    monkeypatch.setattr(routes_tasks, "task_registry", {})
+    return bus
+
+
+@pytest.fixture
+def store(tmp_path, bus):
+    store = TaskStore(str(tmp_path / "task_queue.db"))
+    task_queue.set_task_store(store)
+    yield store
+    task_queue.set_task_store(None)
+
+
+class _FakeRequest:
+    def __init__(self, last_event_id=None):
+        self.headers = {"last-event-id": last_event_id} if last_event_id else {}
+
+    async def is_disconnected(self):
+        return False
+
+
+def _parse(chunk):
+    campos = dict(line.split(": ", 1) for line in chunk.decode().strip().splitlines())
+    return campos.get("event"), int(campos["id"]), fast_json.loads(campos["data"])
+
+
+def test_helpers_publish_idempotent_deltas(bus):
+    task_id = routes_tasks.register_pipeline_task("pipeline", "ativ", ["aluno"])
+    routes_tasks.update_stage_progress(task_id, "aluno", "corrigir", "failed", error="timeout")
+    routes_tasks.register_batch_progress(task_id, ["aluno"], 1, "continuar")
+    routes_tasks.update_batch_item(task_id, "aluno", "failed")
+    routes_tasks.complete_pipeline_task(task_id, "failed", error="timeout")
+
+    events, gap = bus.since(0)
+    assert not gap
+    assert [e.kind for e in events] == ["task", "stage", "batch", "batch_item", "status"]
+    assert [e.seq for e in events] == [1, 2, 3, 4, 5]
+    assert events[1].data == {
+        "aluno_id": "aluno", "nome": "", "stage": "corrigir", "status": "failed",
+        "error": {"mensagem": "timeout", "etapa": "corrigir", "status": "failed"}, "skip": None,
+    }
+    assert events[4].data["status"] == "failed" and events[4].data["finished_at"]
+    # Deltas are copies: the registration event still shows the stage as pending
+    assert events[0].data["students"]["aluno"]["stages"]["corrigir"] == "pending"
+
+
+def test_since_reports_a_gap_when_the_client_fell_behind(bus):
+    for i in range(60):
+        bus.publish("t", "stage", {"i": i})
+
+    assert bus.since(5) == ([], True)          # evicted from the 50-event buffer
+    assert bus.since(999) == ([], True)        # seq from another boot
+    events, gap = bus.since(55)
+    assert not gap and [e.seq for e in events] == [56, 57, 58, 59, 60]
+
+
+async def test_tasks_endpoint_since_returns_deltas_or_resync(bus):
+    task_id = routes_tasks.register_pipeline_task("pipeline", "ativ", ["aluno"])
+    routes_tasks.update_stage_progress(task_id, "aluno", "corrigir", "running")
+
+    delta = await routes_tasks.list_all_tasks(since=1)
+    assert delta["seq"] == 2 and not delta["resync"]
+    assert [e["kind"] for e in delta["events"]] == ["stage"]
+    assert (await routes_tasks.list_all_tasks(since=2))["events"] == []
+
+    resync = await routes_tasks.list_all_tasks(since=50)
+    assert resync["resync"] and [t["task_id"] for t in resync["tasks"]] == [task_id]
+    assert isinstance(await routes_tasks.list_all_tasks(), list)  # legacy clients
+
+
+async def test_sse_stream_sends_snapshot_then_live_deltas_and_ends(bus):
+    task_id = routes_tasks.register_pipeline_task("pipeline", "ativ", ["aluno"])
+    response = routes_tasks._sse_response(_FakeRequest(), task_id, None)
+    stream = response.body_iterator
+
+    event, seq, snapshot = _parse(await stream.__anext__())
+    assert (event, seq, snapshot["task_id"]) == ("snapshot", 1, task_id)
+
+    # Pipeline threads publish from outside the event loop
+    worker = threading.Thread(
+        target=lambda: (
+            routes_tasks.update_stage_progress(task_id, "aluno", "corrigir", "completed"),
+            routes_tasks.complete_pipeline_task(task_id, "completed"),
+        )
+    )
+    worker.start()
+    worker.join()
+
+    event, seq, delta = _parse(await asyncio.wait_for(stream.__anext__(), 5))
+    assert (event, seq, delta["kind"], delta["data"]["status"]) == ("delta", 2, "stage", "completed")
+    event, seq, delta = _parse(await asyncio.wait_for(stream.__anext__(), 5))
+    assert (seq, delta["kind"], delta["data"]["status"]) == (3, "status", "completed")
+    with pytest.raises(StopAsyncIteration):
+        await stream.__anext__()
+    assert bus.stats()["subscribers"] == 0
+
+
+async def test_sse_resyncs_a_slow_client_with_a_new_snapshot(bus, monkeypatch):
+    monkeypatch.setattr(task_events, "_QUEUE_MAX", 2)
+    task_id = routes_tasks.register_pipeline_task("pipeline", "ativ", ["aluno"])
+    response = routes_tasks._sse_response(_FakeRequest(), task_id, None)
+    stream = response.body_iterator
+    assert _parse(await stream.__anext__())[0] == "snapshot"
+
+    # More deltas than the subscriber queue holds before the client reads again
+    for stage in ("extrair_questoes", "extrair_gabarito", "extrair_respostas", "corrigir"):
+        routes_tasks.update_stage_progress(task_id, "aluno", stage, "completed")
+
+    event, seq, snapshot = _parse(await asyncio.wait_for(stream.__anext__(), 5))
+    assert (event, seq) == ("snapshot", 5)
+    assert snapshot["students"]["aluno"]["stages"]["corrigir"] == "completed"
+
+    routes_tasks.complete_pipeline_task(task_id, "completed")
+    event, seq, delta = _parse(await asyncio.wait_for(stream.__anext__(), 5))
+    assert (event, seq, delta["kind"]) == ("delta", 6, "status")
+    with pytest.raises(StopAsyncIteration):
+        await stream.__anext__()
+
+
+async def test_sse_resumes_from_last_event_id(bus):
+    task_id = routes_tasks.register_pipeline_task("pipeline", "ativ", ["aluno"])
+    routes_tasks.update_stage_progress(task_id, "aluno", "extrair_questoes", "running")
+    routes_tasks.update_stage_progress(task_id, "aluno", "extrair_questoes", "completed")
+
+    response = routes_tasks._sse_response(_FakeRequest(last_event_id="2"), None, None)
+    event, seq, delta = _parse(await response.body_iterator.__anext__())
+    await response.body_iterator.aclose()
+
+    assert (event, seq, delta["data"]["status"]) == ("delta", 3, "completed")
+
+
+def test_store_seq_survives_a_restart_and_includes_cancel(store, bus, monkeypatch):
+    task_id = routes_tasks.register_pipeline_task("pipeline", "ativ", ["aluno"])
+    routes_tasks.update_stage_progress(task_id, "aluno", "corrigir", "running")
+    asyncio.run(routes_tasks.cancel_task(task_id))
+
+    # New process: fresh bus, same SQLite file
+    monkeypatch.setattr(task_events, "bus", TaskEventBus())
+    events, gap = task_events.bus.since(1, task_id=task_id)
+    assert not gap
+    assert [(e.seq, e.kind) for e in events] == [(2, "stage"), (3, "cancel")]
+    assert task_events.bus.last_seq() == 3
+
+
+def test_prune_journals_removed_in_the_store_seq_space(store, bus):
+    task_id = routes_tasks.register_pipeline_task("pipeline", "ativ", ["aluno"])
+    routes_tasks.complete_pipeline_task(task_id, "completed")
+    outra = routes_tasks.register_pipeline_task("pipeline", "ativ", ["aluno"])
+
+    assert routes_tasks.prune_tasks(retention_seconds=-1) == [task_id]
+
+    # retention -1 also drops every older event; "removed" continues the store's seq
+    assert [(r["seq"], r["task_id"], r["kind"]) for r in store.read_events(0)] == [(4, task_id, "removed")]
+    events, gap = bus.since(3)
+    assert not gap and [(e.seq, e.kind) for e in events] == [(4, "removed")]
+    assert outra not in routes_tasks.prune_tasks(retention_seconds=-1)
+
+
+async def test_events_written_by_another_process_reach_local_subscribers(store, bus):
+    subscription = bus.subscribe("t1")
+    store.append_event("t1", "stage", {"aluno_id": "a", "stage": "corrigir", "status": "running"}, "worker-9")
+    store.append_event("t2", "stage", {}, "worker-9")
+
+    assert bus.poll_remote() == 2
+    event = await subscription.get(1)
+    assert (event.seq, event.task_id, event.origin) == (1, "t1", "worker-9")
+    assert await subscription.get(0.05) is None  # t2 filtered out
+    subscription.close()
@@ -0,0 +1,318 @@
+"""Tests for the durable task queue (task_queue.py + routes_tasks persistence)."""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+
+BACKEND_DIR = Path(__file__).parent.parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("PROVA_AI_TESTING", "1")
+os.environ.setdefault("PROVA_AI_DISABLE_LOCAL_LLM", "1")
+
+import routes_tasks  # noqa: E402
+import task_queue  # noqa: E402
+from task_queue import TaskStore, TaskWorker  # noqa: E402
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = TaskStore(str(tmp_path / "task_queue.db"))
+    task_queue.set_task_store(store)
+    monkeypatch.setattr(routes_tasks, "task_registry", {})
+    yield store
+    task_queue.set_task_store(None)
+
+
+def _restart():
+    """Simulate a new process: the in-memory cache is gone, the SQLite file stays."""
+    routes_tasks.task_registry.clear()
+
+
+def test_progress_survives_a_restart_and_is_served_from_the_store(store):
+    task_id = routes_tasks.register_pipeline_task("pipeline", "ativ", ["aluno"], student_names={"aluno": "Ana"})
+    routes_tasks.update_stage_progress(task_id, "aluno", "extrair_questoes", "completed")
+    routes_tasks.register_batch_progress(task_id, ["aluno"], 2, "continuar")
+    routes_tasks.update_batch_item(task_id, "aluno", "running")
+    _restart()
+
+    task = asyncio.run(routes_tasks.get_task_progress(task_id))
+    assert task["students"]["aluno"]["nome"] == "Ana"
+    assert task["students"]["aluno"]["stages"]["extrair_questoes"] == "completed"
+    assert task["batch"]["counts"]["running"] == 1
+    assert [t["task_id"] for t in asyncio.run(routes_tasks.list_all_tasks())] == [task_id]
+
+    # Helpers keep working on a task this process has not seen
+    routes_tasks.complete_pipeline_task(task_id, "completed")
+    assert store.load_task(task_id)["status"] == "completed"
+    assert store.load_task(task_id)["finished_at"]
+
+
+def test_cancel_is_not_undone_by_a_later_snapshot(store):
+    task_id = routes_tasks.register_pipeline_task("pipeline", "ativ", ["aluno"])
+    _restart()  # the API process cancels a task owned by another process
+
+    assert asyncio.run(routes_tasks.cancel_task(task_id)) == {"task_id": task_id, "cancel_requested": True}
+    routes_tasks.update_stage_progress(task_id, "aluno", "extrair_questoes", "running")
+
+    assert routes_tasks.is_cancel_requested(task_id)
+    assert store.load_task(task_id)["cancel_requested"] is True
+
+
+def test_units_count_attempts_and_remember_completion(store):
+    task_id = routes_tasks.register_pipeline_task("pipeline_desempenho_turma", "turma", [])
+    for status in ("running", "failed", "running", "completed"):
+        routes_tasks.update_stage_progress(task_id, "aluno", "corrigir", status, atividade_id="ativ-2")
+
+    [unit] = store.list_units(task_id)
+    assert (unit["atividade_id"], unit["status"], unit["attempts"]) == ("ativ-2", "completed", 2)
+    assert routes_tasks.stage_completed_before(task_id, "ativ-2", "aluno", "corrigir")
+    assert not routes_tasks.stage_completed_before(task_id, "turma", "aluno", "corrigir")
+
+
+def test_expired_lease_is_claimed_by_another_worker(store):
+    store.enqueue_run("t1", "handler", {"task_id": "t1"})
+
+    assert store.claim_run("morto", lease_seconds=0.05)["attempts"] == 1
+    assert store.claim_run("vivo", lease_seconds=60) is None
+    time.sleep(0.1)
+    run = store.claim_run("vivo", lease_seconds=60)
+    assert (run["lease_owner"], run["attempts"], run["kwargs"]) == ("vivo", 2, {"task_id": "t1"})
+
+
+def test_worker_resumes_an_interrupted_run_without_redoing_finished_units(store):
+    task_id = routes_tasks.register_pipeline_task("pipeline", "ativ", ["aluno"])
+    executadas = []
+
+    async def handler(task_id, etapas):
+        for etapa in etapas:
+            if routes_tasks.stage_completed_before(task_id, "ativ", "aluno", etapa):
+                continue
+            routes_tasks.update_stage_progress(task_id, "aluno", etapa, "running")
+            executadas.append(etapa)
+            routes_tasks.update_stage_progress(task_id, "aluno", etapa, "completed")
+        routes_tasks.complete_pipeline_task(task_id, "completed")
+
+    task_queue.register_handler("handler_teste", handler)
+    store.enqueue_run(task_id, "handler_teste", {"task_id": task_id, "etapas": ["extrair_questoes", "corrigir"]})
+    # First process finished one stage, then died holding the lease
+    store.claim_run("morto", lease_seconds=0.05)
+    routes_tasks.update_stage_progress(task_id, "aluno", "extrair_questoes", "completed")
+    _restart()
+    time.sleep(0.1)
+
+    worker = TaskWorker(store, concurrency=1, lease_seconds=1, poll_interval=0.02)
+    worker.start()
+    try:
+        for _ in range(200):
+            if store.get_run(task_id)["status"] == "done":
+                break
+            time.sleep(0.01)
+    finally:
+        worker.close()
+
+    assert executadas == ["corrigir"]
+    task = store.load_task(task_id)
+    assert task["status"] == "completed"
+    assert task["resumed"] == 1
+    assert worker.stats()["resumed"] == 1
+
+
+def test_run_is_failed_after_max_attempts(store):
+    task_id = routes_tasks.register_pipeline_task("pipeline", "ativ", ["aluno"])
+    store.enqueue_run(task_id, "handler_teste", {"task_id": task_id})
+    worker = TaskWorker(store, concurrency=1, lease_seconds=0.01, max_attempts=1)
+    for owner in ("morto", worker.worker_id):
+        time.sleep(0.02)
+        run = store.claim_run(owner, worker.lease_seconds)
+
+    worker._process(run)
+
+    assert store.get_run(task_id)["status"] == "failed"
+    assert store.load_task(task_id)["status"] == "failed"
+
+
+def test_start_detached_task_enqueues_registered_handlers(store, monkeypatch):
+    import routes_prompts
+
+    worker = MagicMock()
+    monkeypatch.setattr(task_queue, "_worker", worker)
+    func = MagicMock(__name__="_executar_desempenho_materia_background")
+
+    assert routes_prompts._start_detached_task(func, task_id="t1", materia_id="m1") is None
+    assert store.get_run("t1")["handler"] == "_executar_desempenho_materia_background"
+    func.assert_not_called()
+    worker.notify.assert_called_once()
+
+
+def test_prune_drops_old_finished_tasks(store):
+    antiga = routes_tasks.register_pipeline_task("pipeline", "ativ", ["aluno"])
+    routes_tasks.complete_pipeline_task(antiga, "completed")
+    rodando = routes_tasks.register_pipeline_task("pipeline", "ativ", ["aluno"])
+
+    assert routes_tasks.prune_tasks(retention_seconds=-1) == [antiga]
+    assert store.load_task(antiga) is None
+    assert antiga not in routes_tasks.task_registry
+    assert store.load_task(rodando) is not None
+
+
+@pytest.fixture
+def pipeline(store, monkeypatch):
+    from executor import PipelineExecutor, ResultadoExecucao, SingleFlight
+    from prompts import EtapaProcessamento as E
+
+    executor = PipelineExecutor.__new__(PipelineExecutor)
+    executor.storage = MagicMock()
+    executor.storage.listar_documentos.return_value = []
+    executor._validar_prova_respondida_para_extracao = MagicMock(return_value=(True, None, None))
+    monkeypatch.setattr(PipelineExecutor, "_etapas_atividade", SingleFlight())
+    executadas = []
+
+    async def executar_etapa(stage, *args, **kwargs):
+        executadas.append(stage.value)
+        return ResultadoExecucao(sucesso=True, etapa=stage)
+
+    executor.executar_etapa = executar_etapa
+    executor.corrigir = lambda *args: executar_etapa(E.CORRIGIR)
+    executor.analisar_habilidades = lambda *args: executar_etapa(E.ANALISAR_HABILIDADES)
+    executor.gerar_relatorio = lambda *args: executar_etapa(E.GERAR_RELATORIO)
+    return executor, executadas
+
+
+async def test_resumed_pipeline_skips_units_completed_in_the_task(pipeline):
+    executor, executadas = pipeline
+    task_id = routes_tasks.register_pipeline_task("pipeline", "ativ", ["aluno"])
+    for etapa in ("extrair_questoes", "extrair_gabarito", "extrair_respostas"):
+        routes_tasks.update_stage_progress(task_id, "aluno", etapa, "completed")
+    _restart()
+
+    await executor.executar_pipeline_completo("ativ", "aluno", model_id="m", task_id=task_id, force_rerun=True)
+
+    assert executadas == ["corrigir", "analisar_habilidades", "gerar_relatorio"]
+    task = routes_tasks.get_task(task_id)
+    assert set(task["students"]["aluno"]["stages"].values()) == {"completed"}
+    assert task["status"] == "completed"
+
+
+def test_graceful_release_does_not_spend_attempts(store):
+    task_id = routes_tasks.register_pipeline_task("pipeline", "ativ", ["aluno"])
+    executadas = []
+
+    async def handler(task_id):
+        executadas.append(task_id)
+        routes_tasks.complete_pipeline_task(task_id, "completed")
+
+    task_queue.register_handler("handler_teste", handler)
+    store.enqueue_run(task_id, "handler_teste", {"task_id": task_id})
+    worker = TaskWorker(store, concurrency=1, max_attempts=2)
+    for _ in range(4):  # deploys in a row, each one shutting down cleanly mid-run
+        store.claim_run(worker.worker_id, worker.lease_seconds)
+        assert store.release_runs(worker.worker_id) == 1
+
+    run = store.claim_run(worker.worker_id, worker.lease_seconds)
+    assert (run["attempts"], run["releases"]) == (1, 4)
+    worker._process(run)
+
+    assert executadas == [task_id]
+    assert store.get_run(task_id)["status"] == "done"
+    assert store.load_task(task_id)["resumed"] == 1
+
+
+def test_stage_progress_is_written_off_the_caller_and_coalesced(store, monkeypatch):
+    task_id = routes_tasks.register_pipeline_task("pipeline", "ativ", ["aluno"])
+    gravar = store._write_batch
+    liberado = threading.Event()
+
+    def _write_batch_lento(lote):
+        liberado.wait(5)
+        return gravar(lote)
+
+    monkeypatch.setattr(store, "_write_batch", _write_batch_lento)
+    publicados = []
+    monkeypatch.setattr(routes_tasks.task_events.bus, "publish",
+                        lambda task_id, kind, delta, seq=None: publicados.append((kind, seq)))
+
+    inicio = time.monotonic()
+    for etapa in ("extrair_questoes", "corrigir"):
+        for status in ("running", "completed"):
+            routes_tasks.update_stage_progress(task_id, "aluno", etapa, status)
+    assert time.monotonic() - inicio < 1  # nothing waited for the blocked writer
+    assert store.has_pending_writes(task_id)
+    # The API serves the cached copy instead of waiting for the writer
+    assert routes_tasks.get_task(task_id)["students"]["aluno"]["stages"]["corrigir"] == "completed"
+    assert routes_tasks.list_tasks()[0]["students"]["aluno"]["stages"]["corrigir"] == "completed"
+
+    liberado.set()
+    assert store.flush_writes(timeout=5)
+
+    assert store.load_task(task_id)["students"]["aluno"]["stages"]["corrigir"] == "completed"
+    assert [u["status"] for u in store.list_units(task_id)] == ["completed", "completed"]
+    eventos = [(e["kind"], e["seq"]) for e in store.read_events(0, task_id) if e["kind"] == "stage"]
+    assert publicados == eventos and len(eventos) == 4
+    escrita = store.stats()["write_behind"]
+    assert escrita["snapshots_written"] + escrita["snapshots_coalesced"] == 4
+    assert escrita["snapshots_written"] < 4 and escrita["pending"] == 0
+
+    # A synchronous write waits for the queued progress, so seqs stay in order
+    routes_tasks.update_stage_progress(task_id, "aluno", "gerar_relatorio", "completed")
+    routes_tasks.complete_pipeline_task(task_id, "completed")
+    kinds = [e["kind"] for e in store.read_events(0, task_id)]
+    assert kinds[-2:] == ["stage", "status"]
+
+
+def test_close_keeps_the_lease_of_a_run_still_executing(store):
+    task_id = routes_tasks.register_pipeline_task("pipeline", "ativ", ["aluno"])
+    iniciado = threading.Event()
+    liberar = threading.Event()
+
+    async def handler(task_id):
+        iniciado.set()
+        await asyncio.to_thread(liberar.wait, 5)
+        routes_tasks.complete_pipeline_task(task_id, "completed")
+
+    task_queue.register_handler("handler_teste", handler)
+    store.enqueue_run(task_id, "handler_teste", {"task_id": task_id})
+    worker = TaskWorker(store, concurrency=1, lease_seconds=30, poll_interval=0.02)
+    worker.start()
+    assert iniciado.wait(5)
+
+    worker.close(timeout=0.1)
+
+    # Another worker process must not pick the same task while it still runs
+    assert store.get_run(task_id)["lease_owner"] == worker.worker_id
+    assert store.claim_run("outro", lease_seconds=30) is None
+
+    liberar.set()
+    for _ in range(200):
+        if store.get_run(task_id)["status"] == "done":
+            break
+        time.sleep(0.01)
+    assert store.get_run(task_id)["status"] == "done"
+
+
+def test_close_waits_for_a_run_that_finishes_within_the_timeout(store):
+    task_id = routes_tasks.register_pipeline_task("pipeline", "ativ", ["aluno"])
+    iniciado = threading.Event()
+
+    async def handler(task_id):
+        iniciado.set()
+        await asyncio.sleep(0.2)
+        routes_tasks.complete_pipeline_task(task_id, "completed")
+
+    task_queue.register_handler("handler_teste", handler)
+    store.enqueue_run(task_id, "handler_teste", {"task_id": task_id})
+    worker = TaskWorker(store, concurrency=1, lease_seconds=30, poll_interval=0.02)
+    worker.start()
+    assert iniciado.wait(5)
+
+    worker.close(timeout=5)
+
+    assert store.get_run(task_id)["status"] == "done"
@@ -0,0 +1,190 @@
+"""Tests for the write-behind Supabase Storage upload queue."""
+
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+
+BACKEND_DIR = Path(__file__).parent.parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("PROVA_AI_TESTING", "1")
+os.environ.setdefault("PROVA_AI_DISABLE_LOCAL_LLM", "1")
+
+from models import TipoDocumento  # noqa: E402
+from sqlite_pool import sqlite_pool  # noqa: E402
+from upload_queue import STATUS_ENVIANDO, UploadQueue  # noqa: E402
+
+
+def _arquivo(tmp_path: Path, nome: str = "a.pdf") -> Path:
+    path = tmp_path / nome
+    path.write_bytes(b"%PDF-1.4 " + nome.encode())
+    return path
+
+
+def test_failed_uploads_are_retried_with_backoff(tmp_path):
+    respostas = iter([(False, "503"), (False, "timeout"), (True, "ok")])
+    queue = UploadQueue(tmp_path / "q.db", uploader=lambda job: next(respostas),
+                        workers=1, base_delay=0.01, max_delay=0.05)
+
+    queue.enqueue(_arquivo(tmp_path), "arquivos/a.pdf")
+
+    assert queue.flush(timeout=5)
+    stats = queue.stats()
+    assert stats["uploaded"] == 1
+    assert stats["retries"] == 2
+    assert stats["depth"] == 0
+    queue.close()
+
+
+def test_exhausted_jobs_are_kept_and_can_be_retried(tmp_path):
+    falhar = threading.Event()
+    falhar.set()
+    queue = UploadQueue(
+        tmp_path / "q.db",
+        uploader=lambda job: (False, "403") if falhar.is_set() else (True, "ok"),
+        workers=1, max_attempts=2, base_delay=0.01,
+    )
+
+    queue.enqueue(_arquivo(tmp_path), "arquivos/a.pdf")
+    assert queue.flush(timeout=5)
+    assert queue.stats()["failed"] == 1
+
+    falhar.clear()
+    assert queue.retry_failed() == 1
+    assert queue.flush(timeout=5)
+    assert queue.stats()["failed"] == 0
+    assert queue.stats()["uploaded"] == 1
+    queue.close()
+
+
+def test_interrupted_uploads_resume_after_restart(tmp_path):
+    journal = tmp_path / "q.db"
+    arquivo = _arquivo(tmp_path)
+    UploadQueue(journal, uploader=lambda job: (True, "ok"), workers=1)
+    conn = sqlite_pool.get(journal)
+    conn.execute(
+        "INSERT INTO pending_uploads (local_path, remote_path, status, tentativas, proximo_em, criado_em) "
+        "VALUES (?, 'arquivos/a.pdf', ?, 0, 0, 0)",
+        (str(arquivo), STATUS_ENVIANDO),
+    )
+    conn.commit()
+    conn.close()
+
+    enviados = []
+    queue = UploadQueue(journal, uploader=lambda job: (enviados.append(job.remote_path) or (True, "ok")),
+                        workers=1)
+    queue.start()
+
+    assert queue.flush(timeout=5)
+    assert enviados == ["arquivos/a.pdf"]
+    queue.close()
+
+
+def test_a_new_process_does_not_take_over_uploads_a_live_one_is_sending(tmp_path):
+    journal = tmp_path / "q.db"
+    enviando = threading.Event()
+    liberar = threading.Event()
+
+    def lento(job):
+        enviando.set()
+        liberar.wait(5)
+        return True, "ok"
+
+    vivo = UploadQueue(journal, uploader=lento, workers=1, lease_seconds=0.3)
+    vivo.enqueue(_arquivo(tmp_path), "arquivos/a.pdf")
+    assert enviando.wait(5)
+
+    # Worker respawnado pelo supervisor: mesmo journal, outro dono
+    novo_uploader = MagicMock(return_value=(True, "ok"))
+    novo = UploadQueue(journal, uploader=novo_uploader, workers=1, lease_seconds=0.3)
+    novo.start()
+    time.sleep(1.0)  # mais de três leases: o processo vivo continua renovando
+
+    novo_uploader.assert_not_called()
+    liberar.set()
+    assert vivo.flush(timeout=5)
+    assert vivo.stats()["uploaded"] == 1
+    assert novo.stats()["reclaimed"] == 0
+    vivo.close()
+    novo.close()
+
+
+def test_only_expired_leases_are_reclaimed(tmp_path):
+    journal = tmp_path / "q.db"
+    morto, vivo = _arquivo(tmp_path, "morto.pdf"), _arquivo(tmp_path, "vivo.pdf")
+    UploadQueue(journal, uploader=lambda job: (True, "ok"), workers=1)
+    conn = sqlite_pool.get(journal)
+    conn.executemany(
+        "INSERT INTO pending_uploads (local_path, remote_path, status, tentativas, proximo_em, criado_em, "
+        "lease_owner, lease_expires_at) VALUES (?, ?, ?, 0, 0, 0, ?, ?)",
+        [
+            (str(morto), "arquivos/morto.pdf", STATUS_ENVIANDO, "101-morto", time.time() - 1),
+            (str(vivo), "arquivos/vivo.pdf", STATUS_ENVIANDO, "202-vivo", time.time() + 60),
+        ],
+    )
+    conn.commit()
+    conn.close()
+
+    enviados = []
+    queue = UploadQueue(journal, uploader=lambda job: (enviados.append(job.remote_path) or (True, "ok")),
+                        workers=1)
+    queue.start()
+    deadline = time.time() + 5
+    while not enviados and time.time() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.05)
+
+    assert enviados == ["arquivos/morto.pdf"]
+    assert queue.stats()["reclaimed"] == 1
+    assert queue.stats()["depth"] == 1  # o do processo vivo continua com ele
+    queue.close()
+
+
+def test_missing_local_file_cancels_job(tmp_path):
+    uploader = MagicMock(return_value=(True, "ok"))
+    queue = UploadQueue(tmp_path / "q.db", uploader=uploader, workers=1)
+
+    queue.enqueue(tmp_path / "sumiu.pdf", "arquivos/sumiu.pdf")
+
+    assert queue.flush(timeout=5)
+    uploader.assert_not_called()
+    assert queue.stats()["cancelled"] == 1
+    queue.close()
+
+
+def test_salvar_documento_returns_before_upload_finishes(tmp_path, monkeypatch):
+    import storage as storage_module
+
+    with patch("storage.SUPABASE_DB_AVAILABLE", False), \
+         patch("storage.SUPABASE_STORAGE_AVAILABLE", False):
+        storage = storage_module.StorageManager(base_path=str(tmp_path / "data"))
+    storage.upload_mode = "background"
+    materia = storage.criar_materia("Matemática")
+    turma = storage.criar_turma(materia.id, "9A")
+    atividade = storage.criar_atividade(turma.id, "Prova 1")
+
+    liberar = threading.Event()
+    remote = MagicMock()
+    remote.upload.side_effect = lambda local, remote_path: liberar.wait(5) and (True, "ok")
+    monkeypatch.setattr(storage_module, "SUPABASE_STORAGE_AVAILABLE", True)
+    monkeypatch.setattr(storage_module, "supabase_storage", remote)
+
+    doc = storage.salvar_documento(str(_arquivo(tmp_path)), TipoDocumento.ENUNCIADO, atividade.id)
+
+    # Linha e arquivo local já valem; o upload ainda está em andamento
+    assert storage.get_documento(doc.id) is not None
+    assert storage.resolver_caminho_documento(doc).exists()
+    assert storage.get_upload_queue_stats()["depth"] == 1
+
+    liberar.set()
+    assert storage.flush_uploads(timeout=5)
+    stats = storage.get_upload_queue_stats()
+    assert stats["depth"] == 0
+    assert stats["uploaded"] == 1
+    assert remote.upload.call_args.args[1] == doc.caminho_arquivo.replace("\\", "/")
+    storage.close()
@@ -0,0 +1,85 @@
+"""Tests for the out-of-process pipeline worker (worker.py)."""
+
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+
+BACKEND_DIR = Path(__file__).parent.parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+os.environ.setdefault("PROVA_AI_TESTING", "1")
+os.environ.setdefault("PROVA_AI_DISABLE_LOCAL_LLM", "1")
+
+import task_queue  # noqa: E402
+import worker  # noqa: E402
+from task_queue import TaskStore  # noqa: E402
+
+
+def _esperar(condicao, timeout=30.0):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if condicao():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_python_m_worker_consumes_the_queue_in_another_process(tmp_path):
+    db_path = tmp_path / "task_queue.db"
+    store = TaskStore(str(db_path))
+    store.enqueue_run("t1", "handler_inexistente", {"task_id": "t1"})
+
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "worker", "--processes", "1", "--concurrency", "1"],
+        cwd=str(BACKEND_DIR),
+        env={**os.environ, "TASK_QUEUE_DB": str(db_path)},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        assert _esperar(lambda: store.get_run("t1")["status"] != "queued")
+        assert store.get_run("t1")["status"] == "failed"
+        assert "handler_inexistente" in store.get_run("t1")["last_error"]
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        assert proc.wait(timeout=30) == 0
+
+
+def test_pool_recreates_a_dead_worker_process(tmp_path, monkeypatch):
+    monkeypatch.setenv("TASK_QUEUE_DB", str(tmp_path / "task_queue.db"))
+    monkeypatch.setattr(worker, "_SUPERVISE_INTERVAL_S", 0.1)
+    pool = worker.WorkerPool(processes=1, concurrency=1).start()
+    try:
+        [pid] = pool.stats()["pids"]
+        os.kill(pid, signal.SIGKILL)
+
+        assert _esperar(lambda: pool.stats()["pids"] != [pid] and pool.stats()["alive"] == 1)
+        assert pool.stats()["restarts"] == 1
+    finally:
+        pool.close()
+    assert pool.stats()["alive"] == 0
+
+
+def test_only_one_web_process_starts_the_local_pool(tmp_path, monkeypatch):
+    monkeypatch.setattr(worker, "_LOCK_PATH", tmp_path / "task_worker.lock")
+    monkeypatch.setattr(worker, "_lock_file", None)
+
+    assert worker._adquirir_lock_local()
+    primeiro = worker._lock_file
+    try:
+        # Another uvicorn worker opens its own file description on the same lock
+        assert not worker._adquirir_lock_local()
+    finally:
+        primeiro.close()
+
+
+def test_unknown_worker_mode_falls_back_to_inline(monkeypatch):
+    monkeypatch.setenv("TASK_WORKER_MODE", "kubernetes")
+    assert task_queue.worker_mode() == "inline"
+    monkeypatch.setenv("TASK_WORKER_MODE", "External")
+    assert task_queue.worker_mode() == "external"
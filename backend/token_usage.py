@@ -8,7 +8,6 @@ without inventing a Documento.
 
 from __future__ import annotations
 
-import json
 import re
 import uuid
 from dataclasses import asdict, dataclass, field
@@ -16,6 +15,7 @@ from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
+import fast_json
 from storage import storage
 
 try:
@@ -166,9 +166,8 @@ class TokenUsageStore:
         path = self._path_for(record.criado_em)
         records = [item.to_dict() for item in self._read_file(path)]
         records.append(record.to_dict())
-        tmp_path = path.with_suffix(".json.tmp")
-        tmp_path.write_text(json.dumps(records, ensure_ascii=False, indent=2), encoding="utf-8")
-        tmp_path.replace(path)
+        # Arquivo só lido pela máquina: compacto
+        fast_json.write_json(path, records)
         return record
 
     def list_records(self, limit: Optional[int] = None) -> List[TokenUsageRecord]:
@@ -202,7 +201,7 @@ class TokenUsageStore:
     def _read_file(self, path: Path) -> List[TokenUsageRecord]:
         if not path.exists():
             return []
-        data = json.loads(path.read_text(encoding="utf-8"))
+        data = fast_json.read_json(path)
         if not isinstance(data, list):
             raise ValueError(f"Token usage file must contain a list: {path}")
         return [TokenUsageRecord.from_dict(item) for item in data if isinstance(item, dict)]
@@ -10,6 +10,7 @@ Each handler returns:
 """
 
 from typing import Dict, Any, Optional, List
+import itertools
 import json
 import logging
 import re
@@ -489,6 +490,7 @@ async def handle_search_documents(
 
     Searches documents by text content.
     """
+    from models import TipoDocumento
     from storage import storage
 
     query = input_data.get("query", "")
@@ -503,17 +505,23 @@ async def handle_search_documents(
         )
 
     try:
-        # Get all documents and filter
-        all_docs = storage.listar_todos_documentos()
-
+        tipo = None
         if document_type and document_type != "all":
-            all_docs = [d for d in all_docs if d.tipo.value == document_type]
+            try:
+                tipo = TipoDocumento(document_type)
+            except ValueError:
+                return ToolResult(
+                    tool_use_id="",
+                    content=f"No documents found matching '{query}'",
+                    is_error=False
+                )
 
-        # Simple text search in filenames and content
+        # Simple text search in filenames and content; the type filter runs in
+        # the database and only the 100 most recent documents are read
         results = []
         query_lower = query.lower()
 
-        for doc in all_docs[:100]:  # Limit search scope
+        for doc in itertools.islice(storage.iterar_documentos(tipo=tipo, page_size=100), 100):
             if query_lower in doc.nome_arquivo.lower():
                 results.append(doc)
                 continue
@@ -0,0 +1,473 @@
+"""
+Fila write-behind de uploads para o Supabase Storage.
+
+``salvar_documento`` grava o arquivo local e a linha no banco e retorna; o
+envio ao bucket acontece em threads de fundo. O arquivo local continua sendo
+a fonte da verdade (resolver_caminho_documento sempre tenta o local primeiro)
+até o upload ser confirmado.
+
+Durabilidade:
+    Cada upload pendente é uma linha em ``data/upload_queue.db``, que vários
+    processos compartilham (API + workers do modo local, cada um com o seu
+    StorageManager). Quem reserva uma linha grava ``lease_owner`` (pid + id
+    do boot) e ``lease_expires_at``; uma thread renova o lease das linhas em
+    envio a cada terço do prazo. Um processo que morre no meio do envio deixa
+    a linha em ``enviando`` com o lease vencendo: depois de
+    SUPABASE_UPLOAD_LEASE_S qualquer processo a retoma (upload usa x-upsert,
+    então repetir é seguro). Um processo novo ou reiniciado não toca nas
+    linhas que outro processo vivo ainda está enviando.
+
+Retry:
+    Falhas são reagendadas com backoff exponencial + jitter
+    (base * 2^tentativas, limitado a SUPABASE_UPLOAD_MAX_DELAY_S). Depois de
+    SUPABASE_UPLOAD_MAX_ATTEMPTS a linha fica em ``falhou`` para inspeção e
+    ``retry_failed()`` a recoloca na fila. Arquivo local apagado antes do
+    envio (documento deletado) cancela o job.
+
+Métricas (``stats()``): profundidade, falhas, lag (idade do pendente mais
+antigo), uploads, retries e latência média.
+
+Configuração (env):
+    SUPABASE_UPLOAD_MODE=background   (sync = envio inline, como antes)
+    SUPABASE_UPLOAD_WORKERS=8
+    SUPABASE_UPLOAD_MAX_ATTEMPTS=8
+    SUPABASE_UPLOAD_BASE_DELAY_S=2
+    SUPABASE_UPLOAD_MAX_DELAY_S=300
+    SUPABASE_UPLOAD_LEASE_S=120
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from sqlite_pool import sqlite_pool
+
+
+logger = logging.getLogger("upload_queue")
+
+_WORKERS = int(os.environ.get("SUPABASE_UPLOAD_WORKERS", "8"))
+_MAX_ATTEMPTS = int(os.environ.get("SUPABASE_UPLOAD_MAX_ATTEMPTS", "8"))
+_BASE_DELAY_S = float(os.environ.get("SUPABASE_UPLOAD_BASE_DELAY_S", "2"))
+_MAX_DELAY_S = float(os.environ.get("SUPABASE_UPLOAD_MAX_DELAY_S", "300"))
+_LEASE_S = float(os.environ.get("SUPABASE_UPLOAD_LEASE_S", "120"))
+
+STATUS_PENDENTE = "pendente"
+STATUS_ENVIANDO = "enviando"
+STATUS_FALHOU = "falhou"
+
+
+def upload_mode() -> str:
+    """``background`` (padrão) ou ``sync``; testes usam sync por padrão."""
+    default = "sync" if os.getenv("PROVA_AI_TESTING", "").lower() in ("1", "true", "yes") else "background"
+    return os.environ.get("SUPABASE_UPLOAD_MODE", default).lower()
+
+
+@dataclass
+class UploadJob:
+    id: int
+    local_path: str
+    remote_path: str
+    content_hash: Optional[str]
+    tentativas: int
+    criado_em: float
+
+
+Uploader = Callable[[UploadJob], Tuple[bool, str]]
+
+
+class UploadQueue:
+    """Fila persistente em SQLite com um pool de threads enviando em paralelo."""
+
+    def __init__(self, journal_path: Union[str, Path], uploader: Uploader,
+                 workers: int = None, max_attempts: int = None,
+                 base_delay: float = None, max_delay: float = None,
+                 lease_seconds: float = None):
+        self.journal_path = Path(journal_path)
+        self.uploader = uploader
+        self.workers = _WORKERS if workers is None else max(1, workers)
+        self.max_attempts = _MAX_ATTEMPTS if max_attempts is None else max_attempts
+        self.base_delay = _BASE_DELAY_S if base_delay is None else base_delay
+        self.max_delay = _MAX_DELAY_S if max_delay is None else max_delay
+        self.lease_seconds = _LEASE_S if lease_seconds is None else lease_seconds
+        # Dono dos leases deste processo/instância (outro boot = outro dono)
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._stop = False
+        self._in_flight = 0
+        self._uploaded = 0
+        self._retries = 0
+        self._cancelled = 0
+        self._reclaimed = 0
+        self._upload_ms_total = 0.0
+
+        self._setup_journal()
+
+    # ------------------------------------------------------------
+    # Journal
+    # ------------------------------------------------------------
+
+    def _setup_journal(self) -> None:
+        self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite_pool.get(self.journal_path)
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS pending_uploads (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    local_path TEXT NOT NULL,
+                    remote_path TEXT NOT NULL,
+                    content_hash TEXT,
+                    status TEXT NOT NULL DEFAULT 'pendente',
+                    tentativas INTEGER NOT NULL DEFAULT 0,
+                    proximo_em REAL NOT NULL,
+                    criado_em REAL NOT NULL,
+                    ultimo_erro TEXT,
+                    lease_owner TEXT,
+                    lease_expires_at REAL
+                )
+            ''')
+            colunas = {row["name"] for row in conn.execute("PRAGMA table_info(pending_uploads)")}
+            for coluna, tipo in (("lease_owner", "TEXT"), ("lease_expires_at", "REAL")):
+                if coluna not in colunas:
+                    conn.execute(f"ALTER TABLE pending_uploads ADD COLUMN {coluna} {tipo}")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_pending_uploads_status_proximo "
+                "ON pending_uploads(status, proximo_em)"
+            )
+            conn.commit()
+            # Não devolve ``enviando`` à fila aqui: a linha pode ser de outro
+            # processo vivo. Só o lease vencido (ou ausente) libera a retomada.
+            orfaos = conn.execute(
+                "SELECT COUNT(*) FROM pending_uploads WHERE status = ? "
+                "AND (lease_expires_at IS NULL OR lease_expires_at < ?)",
+                (STATUS_ENVIANDO, time.time()),
+            ).fetchone()[0]
+        finally:
+            conn.close()
+        if orfaos:
+            logger.info("[upload-queue] %s upload(s) interrompido(s) no journal serão retomados", orfaos)
+
+    def enqueue(self, local_path: Union[str, Path], remote_path: str,
+                content_hash: str = None) -> int:
+        """Agenda o upload e retorna o id do job."""
+        now = time.time()
+        conn = sqlite_pool.get(self.journal_path)
+        try:
+            cursor = conn.execute(
+                "INSERT INTO pending_uploads (local_path, remote_path, content_hash, status, "
+                "tentativas, proximo_em, criado_em) VALUES (?, ?, ?, ?, 0, ?, ?)",
+                (str(local_path), remote_path, content_hash, STATUS_PENDENTE, now, now),
+            )
+            conn.commit()
+            job_id = int(cursor.lastrowid)
+        finally:
+            conn.close()
+
+        self.start()
+        with self._cond:
+            self._cond.notify()
+        return job_id
+
+    def cancel(self, remote_path: str) -> int:
+        """Remove jobs ainda não enviados para ``remote_path`` (documento deletado)."""
+        conn = sqlite_pool.get(self.journal_path)
+        try:
+            removed = conn.execute(
+                "DELETE FROM pending_uploads WHERE remote_path = ? AND status != ?",
+                (remote_path, STATUS_ENVIANDO),
+            ).rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        self._cancelled += removed
+        return removed
+
+    def cancel_many(self, remote_paths: List[str]) -> int:
+        """``cancel`` para vários caminhos numa única transação (exclusão em cascata)."""
+        if not remote_paths:
+            return 0
+        conn = sqlite_pool.get(self.journal_path)
+        try:
+            removed = 0
+            for remote_path in remote_paths:
+                removed += conn.execute(
+                    "DELETE FROM pending_uploads WHERE remote_path = ? AND status != ?",
+                    (remote_path, STATUS_ENVIANDO),
+                ).rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        self._cancelled += removed
+        return removed
+
+    def retry_failed(self) -> int:
+        """Recoloca na fila os jobs que esgotaram as tentativas."""
+        conn = sqlite_pool.get(self.journal_path)
+        try:
+            count = conn.execute(
+                "UPDATE pending_uploads SET status = ?, tentativas = 0, proximo_em = ? WHERE status = ?",
+                (STATUS_PENDENTE, time.time(), STATUS_FALHOU),
+            ).rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        if count:
+            self.start()
+            with self._cond:
+                self._cond.notify_all()
+        return count
+
+    def _claim(self) -> Tuple[Optional[UploadJob], Optional[float]]:
+        """Reserva o próximo job vencido (ou com lease vencido); senão devolve quando o próximo vence."""
+        now = time.time()
+        conn = sqlite_pool.get(self.journal_path)
+        try:
+            row = conn.execute(
+                "SELECT * FROM pending_uploads WHERE status = ? AND "
+                "(lease_expires_at IS NULL OR lease_expires_at < ?) ORDER BY id LIMIT 1",
+                (STATUS_ENVIANDO, now),
+            ).fetchone()
+            reclaimed = row is not None
+            if row is None:
+                row = conn.execute(
+                    "SELECT * FROM pending_uploads WHERE status = ? ORDER BY proximo_em, id LIMIT 1",
+                    (STATUS_PENDENTE,),
+                ).fetchone()
+                if row is None:
+                    return None, self._next_lease_expiry(conn)
+                if row["proximo_em"] > now:
+                    lease = self._next_lease_expiry(conn)
+                    return None, row["proximo_em"] if lease is None else min(row["proximo_em"], lease)
+            # Mesma condição do SELECT: se outro processo reservou antes, rowcount = 0
+            claimed = conn.execute(
+                "UPDATE pending_uploads SET status = ?, lease_owner = ?, lease_expires_at = ? "
+                "WHERE id = ? AND status = ? AND (lease_expires_at IS NULL OR lease_expires_at < ?)",
+                (STATUS_ENVIANDO, self.owner, now + self.lease_seconds, row["id"], row["status"], now),
+            ).rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        if not claimed:
+            # Outro worker pegou primeiro
+            return None, now
+        if reclaimed:
+            self._reclaimed += 1
+            logger.info("[upload-queue] retomando %s (lease de %s vencido)", row["remote_path"], row["lease_owner"])
+        return UploadJob(
+            id=row["id"],
+            local_path=row["local_path"],
+            remote_path=row["remote_path"],
+            content_hash=row["content_hash"],
+            tentativas=row["tentativas"],
+            criado_em=row["criado_em"],
+        ), None
+
+    @staticmethod
+    def _next_lease_expiry(conn) -> Optional[float]:
+        return conn.execute(
+            "SELECT MIN(lease_expires_at) FROM pending_uploads WHERE status = ?", (STATUS_ENVIANDO,)
+        ).fetchone()[0]
+
+    def _renew_leases(self) -> int:
+        """Estende o lease das linhas que este processo está enviando."""
+        conn = sqlite_pool.get(self.journal_path)
+        try:
+            renewed = conn.execute(
+                "UPDATE pending_uploads SET lease_expires_at = ? WHERE lease_owner = ? AND status = ?",
+                (time.time() + self.lease_seconds, self.owner, STATUS_ENVIANDO),
+            ).rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        return renewed
+
+    def _finish(self, job: UploadJob) -> None:
+        conn = sqlite_pool.get(self.journal_path)
+        try:
+            conn.execute("DELETE FROM pending_uploads WHERE id = ?", (job.id,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _reschedule(self, job: UploadJob, erro: str) -> None:
+        tentativas = job.tentativas + 1
+        if tentativas >= self.max_attempts:
+            status, proximo_em = STATUS_FALHOU, time.time()
+            logger.error("[upload-queue] desistindo de %s após %s tentativas: %s",
+                         job.remote_path, tentativas, erro)
+        else:
+            delay = min(self.base_delay * (2 ** job.tentativas), self.max_delay)
+            status, proximo_em = STATUS_PENDENTE, time.time() + delay * random.uniform(0.8, 1.2)
+            self._retries += 1
+            logger.warning("[upload-queue] falha em %s (tentativa %s), nova tentativa em %.1fs: %s",
+                           job.remote_path, tentativas, delay, erro)
+        conn = sqlite_pool.get(self.journal_path)
+        try:
+            conn.execute(
+                "UPDATE pending_uploads SET status = ?, tentativas = ?, proximo_em = ?, ultimo_erro = ?, "
+                "lease_owner = NULL, lease_expires_at = NULL WHERE id = ? AND lease_owner = ?",
+                (status, tentativas, proximo_em, erro[:500], job.id, self.owner),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------
+
+    def start(self) -> None:
+        with self._cond:
+            if self._threads or self._stop:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(
+                    target=self._worker_loop,
+                    name=f"upload-queue-{i}",
+                    daemon=True,
+                )
+                self._threads.append(thread)
+                thread.start()
+            heartbeat = threading.Thread(target=self._heartbeat_loop, name="upload-queue-lease", daemon=True)
+            self._threads.append(heartbeat)
+            heartbeat.start()
+
+    def _heartbeat_loop(self) -> None:
+        intervalo = self.lease_seconds / 3
+        proxima = time.monotonic() + intervalo
+        while True:
+            with self._cond:
+                if self._stop:
+                    return
+                # O cond também é notificado a cada job: só renova no intervalo
+                self._cond.wait(max(0.0, proxima - time.monotonic()))
+                if self._stop:
+                    return
+                if time.monotonic() < proxima:
+                    continue
+                proxima = time.monotonic() + intervalo
+                ocioso = self._in_flight == 0
+            if ocioso:
+                continue
+            try:
+                self._renew_leases()
+            except Exception as exc:
+                logger.warning("[upload-queue] falha renovando leases: %s", exc)
+
+    def _worker_loop(self) -> None:
+        while True:
+            with self._cond:
+                if self._stop:
+                    return
+            try:
+                job, proximo_em = self._claim()
+            except Exception as exc:
+                logger.warning("[upload-queue] falha lendo journal: %s", exc)
+                job, proximo_em = None, time.time() + 1
+
+            if job is None:
+                timeout = 5.0 if proximo_em is None else max(0.0, min(5.0, proximo_em - time.time()))
+                with self._cond:
+                    if not self._stop:
+                        self._cond.wait(timeout)
+                continue
+
+            with self._cond:
+                self._in_flight += 1
+            try:
+                self._process(job)
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    self._cond.notify_all()
+
+    def _process(self, job: UploadJob) -> None:
+        if not os.path.exists(job.local_path):
+            # Documento deletado antes do envio: nada a fazer
+            self._finish(job)
+            self._cancelled += 1
+            return
+
+        started = time.perf_counter()
+        try:
+            success, msg = self.uploader(job)
+        except Exception as exc:
+            success, msg = False, f"{type(exc).__name__}: {exc}"
+
+        if not success:
+            self._reschedule(job, msg or "upload falhou")
+            return
+
+        self._upload_ms_total += (time.perf_counter() - started) * 1000
+        self._uploaded += 1
+        self._finish(job)
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """Espera a fila esvaziar (inclusive retries agendados). True se esvaziou no prazo."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._pending_count() == 0 and self._in_flight == 0:
+                return True
+            with self._cond:
+                self._cond.notify_all()
+                self._cond.wait(0.05)
+        return False
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Para os workers; pendentes ficam no journal para a próxima inicialização."""
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+
+    # ------------------------------------------------------------
+    # Métricas
+    # ------------------------------------------------------------
+
+    def _pending_count(self) -> int:
+        conn = sqlite_pool.get(self.journal_path)
+        try:
+            row = conn.execute(
+                "SELECT COUNT(*) FROM pending_uploads WHERE status != ?", (STATUS_FALHOU,)
+            ).fetchone()
+            return int(row[0])
+        finally:
+            conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        conn = sqlite_pool.get(self.journal_path)
+        try:
+            por_status = {
+                row["status"]: row["total"]
+                for row in conn.execute(
+                    "SELECT status, COUNT(*) AS total FROM pending_uploads GROUP BY status"
+                )
+            }
+            oldest = conn.execute(
+                "SELECT MIN(criado_em) FROM pending_uploads WHERE status != ?",
+                (STATUS_FALHOU,),
+            ).fetchone()[0]
+        finally:
+            conn.close()
+        depth = por_status.get(STATUS_PENDENTE, 0) + por_status.get(STATUS_ENVIANDO, 0)
+        return {
+            "depth": depth,
+            "in_flight": self._in_flight,
+            "failed": por_status.get(STATUS_FALHOU, 0),
+            "lag_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+            "uploaded": self._uploaded,
+            "retries": self._retries,
+            "cancelled": self._cancelled,
+            "reclaimed": self._reclaimed,
+            "avg_upload_ms": round(self._upload_ms_total / self._uploaded, 1) if self._uploaded else None,
+            "workers": self.workers,
+        }
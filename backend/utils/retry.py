@@ -81,6 +81,9 @@ async def retry_com_backoff(
     Raises:
         ErroRetryable: Se todas tentativas falharam com erro retryable
         Exception: Se erro não retryable ocorrer
+
+    Cancelamento (task_cancel): um CancelledError durante a chamada ou o
+    sleep do backoff é propagado na hora, sem nova tentativa.
     """
     config = config or RetryConfig()
     ultima_excecao = None
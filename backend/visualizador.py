@@ -14,10 +14,17 @@ from typing import Optional, Dict, Any, List
 from pathlib import Path
 import json
 import logging
+import os
 import time
 
+import fast_json
+from entity_cache import EntityCache
 from models import TipoDocumento, Documento
 from storage import storage
+from storage_events import StorageEvent
+
+
+_RANKING_CACHE_TTL_S = float(os.environ.get("RESULTADOS_RANKING_CACHE_TTL_S", "30"))
 
 
 # ============================================================
@@ -156,8 +163,19 @@ class VisaoAluno:
 class VisualizadorResultados:
     """Serviço para visualização de resultados"""
     
-    def __init__(self):
-        self.storage = storage
+    def __init__(self, storage_manager=None):
+        self.storage = storage_manager or storage
+        # Ranking por atividade (lê o JSON de correção de cada aluno); invalidado
+        # pelos eventos do barramento do storage, inclusive de outros processos
+        self._ranking_cache = EntityCache(ttl_seconds=_RANKING_CACHE_TTL_S)
+        self.storage.events.subscribe(self._on_storage_event)
+
+    def _on_storage_event(self, event: StorageEvent) -> None:
+        atividades = event.atividades_afetadas()
+        if atividades is None:
+            self._ranking_cache.clear()
+        for atividade_id in atividades or ():
+            self._ranking_cache.invalidate("ranking", atividade_id)
 
     def _safe_float(self, value: Any, default: Optional[float] = None) -> Optional[float]:
         try:
@@ -266,21 +284,16 @@ class VisualizadorResultados:
         if not aluno_ids:
             return {}
 
-        rows = self.storage._select_rows(
-            "documentos",
-            filters={
-                "atividade_id": atividade_id,
-                "aluno_id": aluno_ids,
-                "tipo": TipoDocumento.CORRECAO.value,
-                "status": "concluido",
-            },
-            order_by="criado_em",
-            order_desc=True,
+        # Correção concluída mais recente de cada aluno; o JSON decide, PDF só na falta dele
+        documentos = self.storage.listar_documentos_atuais(
+            atividade_id,
+            list(aluno_ids),
+            tipo=TipoDocumento.CORRECAO,
+            status="concluido",
         )
 
         docs_por_aluno: Dict[str, List[Documento]] = {}
-        for row in rows:
-            documento = Documento.from_dict(row)
+        for documento in documentos:
             if not documento.aluno_id:
                 continue
             docs_por_aluno.setdefault(documento.aluno_id, []).append(documento)
@@ -406,15 +419,14 @@ class VisualizadorResultados:
         try:
             arquivo = self.storage.resolver_caminho_documento(documento)
             if arquivo.exists():
-                with open(arquivo, 'r', encoding='utf-8') as f:
-                    content = f.read()
+                content = arquivo.read_bytes()
                 try:
-                    return json.loads(content)
-                except json.JSONDecodeError:
+                    return fast_json.loads(content)
+                except fast_json.JSONDecodeError:
                     # Handle files with extra data after the JSON object
                     # (e.g., two concatenated JSON objects from pipeline)
                     decoder = json.JSONDecoder()
-                    obj, _ = decoder.raw_decode(content.lstrip())
+                    obj, _ = decoder.raw_decode(content.decode("utf-8").lstrip())
                     if isinstance(obj, dict):
                         return obj
         except:
@@ -691,7 +703,20 @@ class VisualizadorResultados:
         """
         Retorna ranking dos alunos em uma atividade.
         Ordenado por nota (maior para menor).
+
+        Cacheado por RESULTADOS_RANKING_CACHE_TTL_S; uma correção salva ou um
+        aluno vinculado/desvinculado invalida o ranking.
         """
+        cached = self._ranking_cache.get("ranking", atividade_id)
+        if cached is not None:
+            return cached["ranking"]
+        generation = self._ranking_cache.generation
+        ranking = self._calcular_ranking_turma(atividade_id)
+        if ranking:
+            self._ranking_cache.put("ranking", atividade_id, {"ranking": ranking}, generation=generation)
+        return ranking
+
+    def _calcular_ranking_turma(self, atividade_id: str) -> List[Dict[str, Any]]:
         started_at = time.perf_counter()
         atividade = self.storage.get_atividade(atividade_id)
         if not atividade:
@@ -1001,7 +1026,7 @@ class VisualizadorResultados:
         resultado = self.get_resultado_aluno(atividade_id, aluno_id)
         if not resultado:
             return "{}"
-        return json.dumps(resultado.to_dict(), ensure_ascii=False, indent=2)
+        return fast_json.dumps(resultado.to_dict(), indent=True)
     
     def exportar_resultado_markdown(self, atividade_id: str, aluno_id: str) -> str:
         """Exporta resultado em Markdown"""
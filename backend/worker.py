@@ -0,0 +1,198 @@
+"""
+Workers de pipeline fora do processo da API.
+
+O pipeline tem muito trabalho de CPU (render de PDF com PyMuPDF, reportlab /
+xhtml2pdf, validação pydantic, parse do JSON grande devolvido pelo LLM). No
+processo do uvicorn isso disputa o mesmo núcleo com as requisições da UI.
+Aqui N processos consomem a fila durável (task_queue) e a API só enfileira e
+reporta o progresso (lido do mesmo banco).
+
+Uso (a partir de backend/, como o ``uvicorn main_v2:app``):
+    python -m worker                      # TASK_WORKER_PROCESSES processos
+    python -m worker --processes 4 --concurrency 2
+
+Modo local (TASK_WORKER_MODE=local): o lifespan da API sobe o pool sozinho.
+Com vários workers uvicorn, só o primeiro que pegar ``data/task_worker.lock``
+sobe o pool; o número de processos de pipeline escala separado dos workers
+web (TASK_WORKER_PROCESSES vs ``uvicorn --workers``).
+
+Cada processo filho é supervisionado: se morrer (OOM, segfault em lib
+nativa) é recriado, e o lease vencido devolve a execução interrompida à fila.
+A unidade distribuída é a execução inteira da tarefa, então o single-flight de
+etapas por atividade continua valendo dentro de um lote; entre lotes em
+processos diferentes só vale o "documento já existe" de ``_should_run``.
+
+Configuração (env):
+    TASK_WORKER_PROCESSES=2      processos worker
+    TASK_WORKER_CONCURRENCY=2    execuções simultâneas por processo (task_queue)
+    TASK_QUEUE_DB                precisa apontar para o mesmo arquivo da API
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import task_queue
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem lock, o modo local assume um único processo web
+    fcntl = None
+
+
+logger = logging.getLogger("task_worker")
+
+_SUPERVISE_INTERVAL_S = 2.0
+_LOCK_PATH = Path(__file__).parent / "data" / "task_worker.lock"
+
+
+def worker_processes() -> int:
+    return max(1, int(os.environ.get("TASK_WORKER_PROCESSES", "2")))
+
+
+def _processo_worker(concurrency: Optional[int]) -> None:
+    """Corpo de cada processo filho: consome a fila até receber SIGTERM/SIGINT."""
+    parar = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: parar.set())
+    signal.signal(signal.SIGINT, lambda *_: parar.set())
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(processName)s] %(name)s: %(message)s")
+
+    store = task_queue.get_task_store()
+    if store is None:
+        logger.error("TASK_QUEUE_DB vazio: não há fila para consumir")
+        return
+
+    from ai_providers import setup_providers_from_env
+    try:
+        setup_providers_from_env()
+    except Exception as exc:
+        logger.error("Erro ao carregar providers: %s", exc)
+    import routes_prompts  # noqa: F401  registra os handlers da fila
+    from storage import storage
+
+    worker = task_queue.TaskWorker(store, concurrency=concurrency)
+    worker.start()
+    while not parar.wait(1.0):
+        pass
+    worker.close()
+    storage.close()
+    storage.events.close()
+
+
+class WorkerPool:
+    """Sobe e supervisiona ``processes`` processos worker (recria os que morrem)."""
+
+    def __init__(self, processes: int = None, concurrency: int = None):
+        self.processes = processes or worker_processes()
+        self.concurrency = concurrency
+        self._ctx = multiprocessing.get_context("spawn")
+        self._procs: List[Any] = []
+        self._restarts = 0
+        self._stop = threading.Event()
+        self._monitor: Optional[threading.Thread] = None
+
+    def _spawn(self, slot: int):
+        proc = self._ctx.Process(
+            target=_processo_worker, args=(self.concurrency,), name=f"task-worker-{slot}", daemon=True,
+        )
+        proc.start()
+        return proc
+
+    def start(self) -> "WorkerPool":
+        self._procs = [self._spawn(slot) for slot in range(self.processes)]
+        self._monitor = threading.Thread(target=self._supervise, name="task-worker-pool", daemon=True)
+        self._monitor.start()
+        logger.info("[worker] %s processo(s) iniciado(s): %s", self.processes, [p.pid for p in self._procs])
+        return self
+
+    def _supervise(self) -> None:
+        while not self._stop.wait(_SUPERVISE_INTERVAL_S):
+            for slot, proc in enumerate(self._procs):
+                if proc.is_alive() or self._stop.is_set():
+                    continue
+                logger.warning("[worker] %s saiu (exitcode=%s); recriando", proc.name, proc.exitcode)
+                self._restarts += 1
+                self._procs[slot] = self._spawn(slot)
+
+    def close(self, timeout: float = 10.0) -> None:
+        """SIGTERM nos filhos (cada um espera as execuções em curso; as que não terminam mantêm o lease) e espera."""
+        self._stop.set()
+        for proc in self._procs:
+            if proc.is_alive():
+                proc.terminate()
+        deadline = time.monotonic() + timeout
+        for proc in self._procs:
+            proc.join(max(0.0, deadline - time.monotonic()))
+            if proc.is_alive():
+                proc.kill()
+                proc.join(1.0)
+        if self._monitor is not None:
+            self._monitor.join(timeout=1.0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "processes": self.processes,
+            "alive": sum(1 for p in self._procs if p.is_alive()),
+            "pids": [p.pid for p in self._procs],
+            "restarts": self._restarts,
+            "concurrency_per_process": self.concurrency or task_queue.WORKER_CONCURRENCY,
+        }
+
+
+_lock_file = None
+
+
+def _adquirir_lock_local() -> bool:
+    """Um pool por máquina mesmo com vários workers uvicorn."""
+    global _lock_file
+    if fcntl is None:
+        return True
+    _LOCK_PATH.parent.mkdir(parents=True, exist_ok=True)
+    lock_file = open(_LOCK_PATH, "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _lock_file = lock_file  # mantido aberto: o lock vale enquanto o processo vive
+    return True
+
+
+def start_local_pool() -> Optional[WorkerPool]:
+    """Pool do modo local (lifespan da API); None se outro processo web já tem o pool."""
+    if task_queue.get_task_store() is None:
+        return None
+    if not _adquirir_lock_local():
+        logger.info("[worker] pool local já iniciado por outro processo web")
+        return None
+    return WorkerPool().start()
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Consome a fila de pipeline em processos separados da API.")
+    parser.add_argument("--processes", type=int, default=None, help="processos worker (TASK_WORKER_PROCESSES)")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="execuções simultâneas por processo (TASK_WORKER_CONCURRENCY)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
+
+    if task_queue.get_task_store() is None:
+        parser.error("TASK_QUEUE_DB vazio: defina o arquivo da fila compartilhado com a API")
+
+    parar = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: parar.set())
+    signal.signal(signal.SIGINT, lambda *_: parar.set())
+    pool = WorkerPool(args.processes, args.concurrency).start()
+    while not parar.wait(1.0):
+        pass
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()